@@ -1,9 +1,17 @@
 # coding: utf-8
 """elaphe -- A Python binding for Barcode Writer In Pure Postscrpt.
 """
+import sys, types, importlib
 from base import Barcode
 from __version__ import VERSION
 
+# names the package takes from other modules, which are imported on
+# first access (see _Package) so that importing elaphe stays cheap.
+LAZY_ATTRIBUTES = dict(
+    WorkerPool='gsworker', configure_default_pool='gsworker',
+    render_batch='batch', render_parallel='parallel', RenderCache='cache',
+    DiskStore='store', encode_states_bulk='postal')
+
 DEFAULT_PLUGINS = [
     'elaphe.ean', 'elaphe.upc', 'elaphe.code128', 'elaphe.code39',
     'elaphe.code93', 'elaphe.i2of5', 'elaphe.rss', 'elaphe.pharmacode',
@@ -13,23 +21,118 @@ DEFAULT_PLUGINS = [
     'elaphe.symbol', 'elaphe.pdf417', 'elaphe.datamatrix', 'elaphe.qrcode',
     'elaphe.maxicode', 'elaphe.azteccode', 'elaphe.gs1-128']
 
+# codetypes and aliases of each plugin, so that plugins are imported on
+# first use.  Plugins missing here are imported by register_plugins().
+PLUGIN_CODETYPES = {
+    'ean': ('ean13', 'ean_13', 'ean-13', 'ean 13', 'jan', 'isbn', 'ismn', 'issn',
+            'ean8', 'ean_8', 'ean-8', 'ean 8', 'ean5', 'ean_5', 'ean-5', 'ean 5',
+            'ean2', 'ean_2', 'ean-2', 'ean 2'),
+    'upc': ('upca', 'upc_a', 'upc-a', 'upc a', 'upce', 'upc_e', 'upc-e', 'upc e'),
+    'code128': ('code128', 'code_128', 'code-128', 'code 128'),
+    'code39': ('code39', 'code_39', 'code-39', 'code 39', 'code39ext',
+               'code39 extended', 'code_39_extended', 'code-39-extended'),
+    'code93': ('code93', 'code_93', 'code-93', 'code 93', 'code93ext',
+               'code93 extended', 'code_93_extended', 'code-93-extended'),
+    'i2of5': ('interleaved2of5', 'interleaved_2_of_5', 'interleaved 2of5',
+              'interleaved_2of5', 'interleaved 2 of 5', 'interleaved-2of5',
+              'i2of5', 'i-2of5', 'itf14', 'itf-14', 'itf_14', 'itf 14',
+              'identcode', 'ident code', 'ident_code', 'ident-code',
+              'leitcode', 'leit code', 'leit_code', 'leit-code'),
+    'rss': ('databaromni', 'rss14', 'rss-14', 'rss_14', 'rss 14',
+            'databarlimited', 'rsslimited', 'rss limited', 'rss_limited',
+            'rss-limited', 'rss14limited', 'rss14 limited', 'rss14_limited',
+            'rss14-limited', 'databarexpanded', 'rssexpanded', 'rss expanded',
+            'rss_expanded', 'rss-expanded', 'rss14expanded', 'rss14 expanded',
+            'rss14_expanded', 'rss14-expanded', 'databartruncated',
+            'rss14truncated', 'rss14 truncated', 'rss14_truncated',
+            'rss14-truncated', 'databarstacked', 'rss14stacked',
+            'rss14 stacked', 'rss14_stacked', 'rss14-stacked',
+            'databarstackedomni', 'rss14stackedomni', 'rss14 stacked omni',
+            'rss14_stacked_omni', 'rss14-stacked-omni',
+            'databarexpandedstacked', 'rssexpandedstacked',
+            'rss expanded stacked', 'rss_expanded_stacked',
+            'rss-expanded-stacked', 'rss14expandedstacked',
+            'rss14 expanded stacked', 'rss14_expanded_stacked',
+            'rss14-expanded-stacked'),
+    'pharmacode': ('pharmacode',),
+    'code25': ('code2of5', 'code_2_of_5', 'code 2of5', 'code_2of5', 'code 2 of 5',
+               'code-2of5', 'c2of5', 'c-2of5', 'code25', 'code 25', 'code_25',
+               'code-25'),
+    'code11': ('code11', 'code 11', 'code_11', 'code-11'),
+    'codabar': ('rationalizedcodabar', 'rationalized codabar'),
+    'onecode': ('onecode', 'usps onecode', 'uspsonecode', 'usps-onecode',
+                'usps_onecode'),
+    'postnet': ('postnet', 'post net', 'post-net', 'post_net', 'us-postnet',
+                'us postnet', 'us_postnet', 'planet', 'usps planet',
+                'usps-planet', 'usps_planet'),
+    'royalmail': ('royalmail', 'royal mail', 'royal-mail', 'royal_mail', 'rm4scc'),
+    'auspost': ('auspost',),
+    'kix': ('kix', 'dutch kix', 'dutch-kix', 'dutch_kix'),
+    'japanpost': ('japanpost',),
+    'msi': ('msi', 'msi-plessey', 'msi plessey', 'msi_plessey', 'msiplessey'),
+    'plessey': ('plessey',),
+    'raw': ('raw',),
+    'symbol': ('symbol', 'symbols', 'fimsymbols', 'fim symbols', 'fim-symbols',
+               'fim_symbols'),
+    'pdf417': ('pdf417', 'pdf-417', 'pdf_417', 'pdf 417', 'micropdf417',
+               'micro pdf417', 'micro-pdf417', 'micro_pdf417'),
+    'datamatrix': ('datamatrix', 'data matrix', 'data-matrix', 'data_matrix'),
+    'qrcode': ('qrcode', 'qr', 'qr_code', 'qr-code', 'qr code'),
+    'maxicode': ('maxicode', 'maxi-code', 'maxi code', 'maxi_code', 'maxi'),
+    'azteccode': ('azteccode', 'aztec code', 'aztec-code', 'aztec_code', 'aztec'),
+    'gs1-128': ('gs1-128', 'gs1128'),
+    }
+
 if __name__=="__main__":
     DEFAULT_PLUGINS = [s.replace('elaphe.', '') for s in DEFAULT_PLUGINS]
     
 
 def load_plugins():
+    """Imports all the plugins at once.
+    """
     for PL in DEFAULT_PLUGINS:
-        try:
-            __import__(PL, fromlist=[PL])
-        except ImportError, e:
-            import sys
-            sys.stdout.write(u'Warning: %s\n' %e)
-    Barcode.update_codetype_registry()
-load_plugins()
+        Barcode.load_plugin(PL)
 
 
-def barcode(codetype, codestring, options=None, **kw):
+def register_plugins():
+    """Registers plugins by codetype, to be imported on first use.
+
+    PLUGIN_CODETYPES has to list what the plugin classes register:
+
+    >>> load_plugins()
+    >>> registered = set((codetype, subclass.__module__.split('.')[-1])
+    ...                  for codetype, subclass in Barcode.registry.items())
+    >>> listed = set((codetype, name) for name, codetypes in PLUGIN_CODETYPES.items()
+    ...              for codetype in codetypes)
+    >>> sorted(listed-registered), sorted(
+    ...     (codetype, name) for codetype, name in registered-listed
+    ...     if name in PLUGIN_CODETYPES)
+    ([], [])
+    >>> Barcode.resolve_codetype('rationalized codabar').codetype
+    'rationalizedCodabar'
+    >>> Barcode.resolve_codetype('gs1128').codetype
+    'gs1-128'
     """
+    for PL in DEFAULT_PLUGINS:
+        codetypes = PLUGIN_CODETYPES.get(PL.split('.')[-1])
+        if codetypes:
+            Barcode.register_plugin(PL, codetypes)
+        else:
+            Barcode.load_plugin(PL)
+register_plugins()
+
+
+def barcode(codetype, codestring, options=None, **kw):
+    """Renders codestring as a codetype symbol and returns a PIL image.
+
+    Render options such as margin or scale are given as keywords.
+    pool=True renders with the shared pool of long-lived Ghostscript
+    workers (sized by configure_default_pool(size=..., max_jobs=...)),
+    and pool=WorkerPool(...) uses the given pool.  cache=True keeps
+    rendered images in cache.DEFAULT_CACHE and cache=RenderCache(...) in
+    another cache; callers get copies of cached images.
+    store=DiskStore(path) (or just the path) also keeps renders on disk,
+    where other processes using the same directory find them.
 
     >>> barcode('nonexistent', '977147396801')
     Traceback (most recent call last):
@@ -154,6 +257,128 @@ def barcode(codetype, codestring, options=None, **kw):
     raise ValueError(u'No renderer for codetype %s' %codetype)
 
 
+def encode(codetype, codestring, options=None, **kw):
+    """Encodes codestring as a codetype symbol and returns its geometry.
+
+    The result is a geometry.LinearGeometry, MatrixGeometry or
+    MaxiCodeGeometry that can be rasterized without Ghostscript.
+
+    >>> encode('nonexistent', '977147396801')
+    Traceback (most recent call last):
+    ...
+    ValueError: No renderer for codetype nonexistent
+    """
+    renderer = Barcode.resolve_codetype(codetype)
+    if renderer:
+        return renderer().encode(codestring, options=options, **kw)
+    raise ValueError(u'No renderer for codetype %s' %codetype)
+
+
+def rasterize(codetype, codestring, options=None, as_array=False, **kw):
+    """Encodes codestring and paints its geometry with NumPy.
+
+    Honors scale and margin render options like barcode(); returns a
+    grayscale PIL image, or a uint8 array if as_array is True.
+    """
+    renderer = Barcode.resolve_codetype(codetype)
+    if renderer:
+        return renderer().rasterize(
+            codestring, options=options, as_array=as_array, **kw)
+    raise ValueError(u'No renderer for codetype %s' %codetype)
+
+
+def barcode_batch(items, **kw):
+    """Renders many symbols in a single Ghostscript run.
+
+    items are (codetype, codestring) or (codetype, codestring, options)
+    tuples; render options given as keywords apply to all items.
+    Returns a list of PIL images in order of items.
+
+    >>> barcode_batch([('ean13', '977147396801'), ('nonexistent', '1')])
+    Traceback (most recent call last):
+    ...
+    ValueError: No renderer for codetype nonexistent
+    """
+    jobs = []
+    for item in items:
+        codetype, codestring, options = (tuple(item)+(None,))[:3]
+        renderer = Barcode.resolve_codetype(codetype)
+        if not renderer:
+            raise ValueError(u'No renderer for codetype %s' %codetype)
+        jobs.append((renderer().get_renderer(options, **kw), codestring))
+    from batch import render_batch
+    return render_batch(jobs)
+
+
+def barcode_parallel(items, max_workers=None, ordered=True, **kw):
+    """Renders many symbols on a pool of max_workers processes.
+
+    items are as in barcode_batch().  Yields (index, result) pairs, in
+    order of items unless ordered is False; result is a PIL image or the
+    exception that item raised.  chunk_size=... sets the number of items
+    each process renders in one Ghostscript run.
+    """
+    from parallel import render_parallel
+    return render_parallel(items, max_workers=max_workers, ordered=ordered, **kw)
+
+
+def barcode_async(codetype, codestring, options=None, **kw):
+    """Coroutine rendering a symbol without blocking the event loop.
+
+    See aio.barcode_async(); trollius is imported on first call.
+    """
+    import aio
+    return aio.barcode_async(codetype, codestring, options, **kw)
+
+
+def barcode_batch_async(items, **kw):
+    """Coroutine rendering many symbols in concurrent Ghostscript runs.
+
+    See aio.barcode_batch_async().
+    """
+    import aio
+    return aio.barcode_batch_async(items, **kw)
+
+
+class _Package(types.ModuleType):
+    """The elaphe package, importing the modules behind LAZY_ATTRIBUTES
+    on first access.
+
+    >>> import elaphe
+    >>> elaphe.RenderCache.__module__
+    'elaphe.cache'
+    >>> elaphe.nonexistent
+    Traceback (most recent call last):
+    ...
+    AttributeError: 'module' object has no attribute 'nonexistent'
+    """
+    def __getattr__(self, name):
+        module = LAZY_ATTRIBUTES.get(name)
+        if module is None:
+            raise AttributeError(
+                u"'module' object has no attribute '%s'" %name)
+        value = getattr(importlib.import_module('elaphe.'+module), name)
+        setattr(self, name, value)
+        return value
+
+
+def _install_package():
+    """Puts a _Package holding this module's names in its place.
+    """
+    package = _Package(__name__, __doc__)
+    package.__dict__.update(globals())
+    # functions here keep this module's dictionary as their globals, which
+    # Python 2 clears when the module object goes away
+    package._module = sys.modules[__name__]
+    # doctest takes functions of other globals from __test__
+    package.__test__ = dict(
+        (name, value) for name, value in globals().items()
+        if isinstance(value, types.FunctionType)
+        and value.func_globals is globals())
+    sys.modules[__name__] = package
+
 if __name__=="__main__":
     from doctest import testmod
     testmod()
+else:
+    _install_package()
@@ -0,0 +1,201 @@
+# coding: utf-8
+"""Non-blocking rendering for asyncio event loops.
+
+This is Python 2 code, so coroutines are written in trollius style
+(yield From(...), raise Return(...)) and need the trollius package.
+Interpreter jobs run through asyncio subprocess pipes, or on a
+gsworker.WorkerPool in the loop's executor.  A semaphore per event
+loop bounds the number of Ghostscript processes running at a time.
+"""
+import os, shutil, tempfile, weakref
+try:
+    import trollius as asyncio
+    from trollius import From, Return
+except ImportError:
+    asyncio = None
+import batch, cache, gsworker
+from base import Barcode
+from parallel import _chunks, DEFAULT_CHUNK_SIZE
+
+__all__ = ['DEFAULT_CONCURRENCY', 'get_semaphore', 'run_ghostscript_async',
+           'render_batch_async', 'barcode_async', 'barcode_batch_async']
+
+
+DEFAULT_CONCURRENCY = 4
+
+
+def _require_asyncio():
+    if asyncio is None:
+        raise ImportError(u'trollius is required for asynchronous rendering.')
+
+
+def coroutine(func):
+    """asyncio.coroutine, or func itself if trollius is missing.
+    """
+    if asyncio is None:
+        return func
+    return asyncio.coroutine(func)
+
+
+_semaphores = weakref.WeakKeyDictionary()
+
+def get_semaphore(loop=None, concurrency=DEFAULT_CONCURRENCY):
+    """Returns the semaphore bounding interpreter jobs on loop.
+
+    The semaphore is created with concurrency slots on first use.
+
+    >>> loop = asyncio.new_event_loop()
+    >>> get_semaphore(loop) is get_semaphore(loop)
+    True
+    >>> loop.close()
+    """
+    _require_asyncio()
+    loop = loop or asyncio.get_event_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(concurrency, loop=loop)
+    return semaphore
+
+
+@coroutine
+def run_ghostscript_async(ps_code, gs_options, gs_binary=None, loop=None):
+    """Runs ps_code (a string or list of chunks) in a Ghostscript
+    subprocess and returns its stdout, without blocking loop.
+    """
+    _require_asyncio()
+    if isinstance(ps_code, basestring):
+        ps_code = [ps_code]
+    args = [gs_binary or gsworker.GS_BINARY] + list(gs_options) + ['-']
+    devnull = open(os.devnull, 'wb')
+    try:
+        process = yield From(asyncio.create_subprocess_exec(
+            *args, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=devnull, close_fds=True, loop=loop))
+    finally:
+        devnull.close()
+    reader = asyncio.ensure_future(process.stdout.read(), loop=loop)
+    try:
+        for chunk in ps_code:
+            process.stdin.write(chunk)
+            yield From(process.stdin.drain())
+        process.stdin.close()
+    except (IOError, OSError):
+        # interpreter quit early; its output tells what happened.
+        pass
+    output = yield From(reader)
+    yield From(process.wait())
+    raise Return(output)
+
+
+@coroutine
+def render_batch_async(jobs, gs_binary=None, gs_options=None, errors='raise',
+                       loop=None, semaphore=None):
+    """Renders (renderer, codestring) jobs in one Ghostscript run.
+
+    Asynchronous counterpart of batch.render_batch(); the run waits for
+    a slot of semaphore (default: get_semaphore(loop)).
+    """
+    jobs = list(jobs)
+    if not jobs:
+        raise Return([])
+    semaphore = semaphore or get_semaphore(loop)
+    spool_dir = tempfile.mkdtemp(prefix='elaphe-batch-')
+    try:
+        output_file = os.path.join(spool_dir, 'page-%08d.png')
+        with (yield From(semaphore)):
+            output = yield From(run_ghostscript_async(
+                batch.build_batch_ps_chunks(jobs),
+                list(gs_options or batch.DEFAULT_BATCH_GS_OPTIONS)
+                + ['-sOutputFile=%s' %output_file], gs_binary, loop=loop))
+        raise Return(batch.collect_results(len(jobs), output, output_file, errors))
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+@coroutine
+def barcode_async(codetype, codestring, options=None, loop=None, **kw):
+    """Renders codestring as a codetype symbol; returns a loaded PIL image.
+
+    Takes the render options of elaphe.barcode().  With the pool option
+    the job runs on the worker pool in the loop's default executor,
+    otherwise in a Ghostscript subprocess.
+
+    >>> loop = asyncio.new_event_loop()
+    >>> loop.run_until_complete(barcode_async('nonexistent', '1', loop=loop))
+    Traceback (most recent call last):
+    ...
+    ValueError: No renderer for codetype nonexistent
+    >>> loop.close()
+    """
+    _require_asyncio()
+    subclass = Barcode.resolve_codetype(codetype)
+    if not subclass:
+        raise ValueError(u'No renderer for codetype %s' %codetype)
+    render_cache = cache.get_cache(kw.pop('cache', None))
+    if render_cache is not None:
+        key = Barcode.render_key(codetype, codestring, options, kw)
+        image = render_cache.get(key)
+        if image is not None:
+            raise Return(image.copy())
+    renderer = subclass().get_renderer(options, **kw)
+    pool = gsworker.get_pool(kw.get('pool'))
+    if pool is not None:
+        loop = loop or asyncio.get_event_loop()
+        image = yield From(loop.run_in_executor(
+            None, pool.render, renderer.build_params(codestring)))
+    else:
+        images = yield From(render_batch_async([(renderer, codestring)], loop=loop))
+        image = images[0]
+    if render_cache is not None:
+        render_cache.put(key, image.copy())
+    raise Return(image)
+
+
+@coroutine
+def barcode_batch_async(items, chunk_size=DEFAULT_CHUNK_SIZE,
+                        concurrency=None, loop=None, **kw):
+    """Renders many symbols in concurrent Ghostscript runs.
+
+    items are as in elaphe.barcode_batch().  Each run renders a chunk of
+    chunk_size items; at most concurrency runs (default: those of
+    get_semaphore(loop)) go at a time.  Returns a list in order of
+    items holding PIL images or the exception each item raised.
+
+    >>> loop = asyncio.new_event_loop()
+    >>> loop.run_until_complete(barcode_batch_async([('nonexistent', '1')], loop=loop))
+    [ValueError(u'No renderer for codetype nonexistent',)]
+    >>> loop.close()
+    """
+    _require_asyncio()
+    semaphore = None
+    if concurrency is not None:
+        semaphore = asyncio.Semaphore(concurrency, loop=loop)
+    results = {}
+
+    @coroutine
+    def render_chunk(chunk):
+        jobs, indexes = [], []
+        for index, item in chunk:
+            codetype, codestring, options = (tuple(item)+(None,))[:3]
+            subclass = Barcode.resolve_codetype(codetype)
+            if not subclass:
+                results[index] = ValueError(
+                    u'No renderer for codetype %s' %codetype)
+                continue
+            jobs.append((subclass().get_renderer(options, **kw), codestring))
+            indexes.append(index)
+        try:
+            images = yield From(render_batch_async(
+                jobs, errors='return', loop=loop, semaphore=semaphore))
+        except Exception, e:
+            images = [e]*len(jobs)
+        results.update(zip(indexes, images))
+
+    chunks = list(_chunks(items, chunk_size))
+    yield From(asyncio.gather(*[render_chunk(chunk) for chunk in chunks], loop=loop))
+    raise Return([results[index] for index in range(len(results))])
+
+
+if __name__=="__main__":
+    from doctest import testmod
+    testmod()
@@ -1,5 +1,73 @@
 # coding: utf-8
 from base import Barcode, LinearCodeRenderer, DPI
+from postal import BAR_WIDTH, SPACE_WIDTH, PostalCodeRenderer, states
+from reedsolomon import get_field, rs_generator, rs_encode
+
+
+# BWIPP bar digits: 0 full, 1 ascender, 2 descender, 3 tracker.
+AUSPOST_CHARS = ('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+                 'abcdefghijklmnopqrstuvwxyz #')
+AUSPOST_C_ENCODINGS = (
+    '000 001 002 010 011 012 020 021 022 100 101 102 110 111 112 120 '
+    '121 122 200 201 202 210 211 212 220 221 222 300 301 302 310 311 '
+    '312 320 321 322 023 030 031 032 033 103 113 123 130 131 132 133 '
+    '203 213 223 230 231 232 233 303 313 323 330 331 332 333 003 013').split()
+AUSPOST_N_ENCODINGS = '00 01 02 10 11 12 20 21 22 30'.split()
+AUSPOST_START_STOP, AUSPOST_FILLER = '13', '3'
+# symbol length in bars by format control code
+AUSPOST_LENGTHS = {'11': 37, '45': 37, '59': 52, '62': 67}
+AUSPOST_FIELD = 0x43
+
+
+def _base4(value):
+    return ''.join(str(value >> shift & 3) for shift in (4, 2, 0))
+
+
+def encode_auspost(codestring, custinfoenc='character'):
+    """Returns bar states and text positions of an Australia Post symbol.
+
+    Format control code and DPID are encoded by the N table, customer
+    information by the C table (or N for numeric custinfoenc); filler
+    bars pad the data and four Reed-Solomon symbols over GF(64) follow.
+
+    >>> bar_states, text = encode_auspost('5956439111ABA 9')
+    >>> len(bar_states), bar_states[:10].tolist()
+    (52, [2, 0, 2, 1, 0, 3, 2, 1, 1, 3])
+    >>> text[0], len(text)
+    (('5', 19.872), 13)
+    """
+    codelen = AUSPOST_LENGTHS.get(codestring[:2])
+    if codelen is None:
+        raise ValueError(u'Invalid AusPost format control code.')
+    if not codestring[:10].isdigit():
+        raise ValueError(u'AusPost FCC and DPID must contain only digits.')
+    pitch = BAR_WIDTH+SPACE_WIDTH
+    bars = [AUSPOST_START_STOP]
+    bars.extend(AUSPOST_N_ENCODINGS[int(c)] for c in codestring[:10])
+    text = [(c, (2*i+6)*pitch) for i, c in enumerate(codestring[2:10])]
+    x = 22
+    for c in codestring[10:]:
+        if custinfoenc=='numeric':
+            if not c.isdigit():
+                raise ValueError(u'AusPost numeric customer information '
+                                 u'must contain only digits.')
+            enc = AUSPOST_N_ENCODINGS[int(c)]
+        else:
+            if c not in AUSPOST_CHARS:
+                raise ValueError(u'AusPost cannot encode %r.' %c)
+            enc = AUSPOST_C_ENCODINGS[AUSPOST_CHARS.index(c)]
+        bars.append(enc)
+        text.append((c, x*pitch))
+        x += len(enc)
+    data = ''.join(bars)
+    if len(data)>codelen-14:
+        raise ValueError(u'AusPost customer information is too long.')
+    data += AUSPOST_FILLER*(codelen-14-len(data))
+    field = get_field(AUSPOST_FIELD)
+    symbols = [int(data[i:i+3], 4) for i in range(2, len(data), 3)]
+    checks = rs_encode(field, symbols, rs_generator(field, 4))
+    digits = data+''.join(_base4(c) for c in checks)+AUSPOST_START_STOP
+    return states(''.join(str(3-int(d)) for d in digits)), text
 
 
 class AusPost(Barcode):
@@ -37,7 +105,7 @@ class AusPost(Barcode):
     codetype = 'auspost'
     aliases = ()
 
-    class _Renderer(LinearCodeRenderer):
+    class _Renderer(PostalCodeRenderer):
         default_options = dict(
             LinearCodeRenderer.default_options,
             height=0.175,
@@ -84,6 +152,9 @@ class AusPost(Barcode):
                 tbbox = cbbox
             params['bbox'] = "%d %d %d %d" %self._boundingbox(cbbox, tbbox)
             return params
+
+        def native_symbol(self, codestring):
+            return encode_auspost(codestring, self.lookup_option('custinfoenc'))
     renderer = _Renderer
 
 if __name__=="__main__":
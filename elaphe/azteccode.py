@@ -1,7 +1,10 @@
 # coding: utf-8
 import itertools, math
+from collections import deque
 from base import Barcode, MatrixCodeRenderer, DPI
-from util import zf_bin, cap_unescape
+from geometry import MatrixGeometry
+from reedsolomon import get_field, rs_generator, rs_encode
+from util import cap_unescape
         
 
 AZTEC_CODE_METRICS = [
@@ -45,6 +48,396 @@ AZTEC_CODE_METRICS = [
     ["full",    32,  0,   1664, 12]]
 
 
+# --- native encoder --------------------------------------------------------
+
+# primitive polynomials of data codewords by bits per codeword, and of
+# the mode message
+AZTEC_FIELDS = {6: 0x43, 8: 0x12D, 10: 0x409, 12: 0x1069}
+AZTEC_MODE_FIELD = 0x13
+UPPER, LOWER, MIXED, PUNCT, DIGIT = range(5)
+AZTEC_MODE_BITS = (5, 5, 5, 5, 4)
+# characters of each mode by value; NULs hold values of shifts and pairs
+AZTEC_MODE_CHARS = (
+    '\0 ABCDEFGHIJKLMNOPQRSTUVWXYZ',
+    '\0 abcdefghijklmnopqrstuvwxyz',
+    '\0 \x01\x02\x03\x04\x05\x06\x07\x08\t\n\x0b\x0c\r\x1b\x1c\x1d\x1e\x1f@\\^_`|~\x7f',
+    '\0\r\0\0\0\0!"#$%&\'()*+,-./:;<=>?[]{}',
+    '\0 0123456789,.')
+# two-character values of the punctuation mode
+AZTEC_PAIRS = {'\r\n': 2, '. ': 3, ', ': 4, ': ': 5}
+# (from, to, value) of latches, and of shifts for a single character
+AZTEC_LATCHES = [(UPPER, LOWER, 28), (UPPER, MIXED, 29), (UPPER, DIGIT, 30),
+                 (LOWER, MIXED, 29), (LOWER, DIGIT, 30), (MIXED, LOWER, 28),
+                 (MIXED, UPPER, 29), (MIXED, PUNCT, 30), (PUNCT, UPPER, 31),
+                 (DIGIT, UPPER, 14)]
+AZTEC_SHIFTS = [(UPPER, PUNCT, 0), (LOWER, PUNCT, 0), (MIXED, PUNCT, 0),
+                (DIGIT, PUNCT, 0), (LOWER, UPPER, 28), (DIGIT, UPPER, 15)]
+# binary shift, the modes having it, and the longest run it takes
+BINARY_SHIFT = 31
+AZTEC_BINARY_MODES = (UPPER, LOWER, MIXED)
+AZTEC_MAX_BINARY = 2047+31
+_AZTEC_VALUES = [dict((c, i) for i, c in enumerate(chars) if c!='\0')
+                 for chars in AZTEC_MODE_CHARS]
+_INFINITY = 1<<62
+
+
+def _latch_sequences():
+    # shortest (value, bits) sequences latching from a mode to another
+    sequences = [[[] if source==target else None for target in range(5)]
+                 for source in range(5)]
+    for round_ in range(3):
+        for source, target, value in AZTEC_LATCHES:
+            for start in range(5):
+                head, current = sequences[start][source], sequences[start][target]
+                if head is None:
+                    continue
+                path = head+[(value, AZTEC_MODE_BITS[source])]
+                if current is None or sum(b for v, b in path)<sum(b for v, b in current):
+                    sequences[start][target] = path
+    return sequences
+
+AZTEC_LATCH_SEQUENCES = _latch_sequences()
+_LATCH_COSTS = [[sum(b for v, b in sequence) for sequence in row]
+                for row in AZTEC_LATCH_SEQUENCES]
+
+
+def _push_start(starts, value, start):
+    # keeps starts increasing in value, so the first is the cheapest
+    while starts and starts[-1][0]>=value:
+        starts.pop()
+    starts.append((value, start))
+
+
+def aztec_message_bits(data):
+    """Returns the bit string of data (a string) in the fewest bits,
+    latching and shifting between the five character modes and binary
+    shifting runs of bytes.  Symbols start in the upper mode.
+
+    The search keeps the cost of each prefix of data in each mode; a
+    binary run ending at a position starts where it is cheapest among the
+    positions a short (up to 31 bytes) or long length prefix reaches.
+
+    >>> aztec_message_bits('Code 2D!')
+    '00100111001000000101001101111000010100111100101000000110'
+    >>> len(aztec_message_bits('\\xe9t\\xe9 2024')), len(aztec_message_bits('. \\r\\n'))
+    (59, 20)
+
+    Digits amid upper case take a digit latch and upper shifts (8VN0),
+    and binary runs past 31 bytes may split into short ones:
+
+    >>> len(aztec_message_bits('2EIHJBFPPCV8VN0QGs9786679173'))
+    163
+    >>> len(aztec_message_bits('X8YZ0W')), len(aztec_message_bits('\\xe9'*40))
+    (45, 340)
+    """
+    n = len(data)
+    costs = [[_INFINITY]*5 for i in range(n+1)]
+    costs[0][UPPER] = 0
+    # entries[i][mode] is (start, mode at start, [(value, bits)]), or
+    # (start, mode, None) for a binary run; latches[i][mode] is the mode
+    # latched from at i
+    entries = [[None]*5 for i in range(n+1)]
+    latches = [[None]*5 for i in range(n+1)]
+    # (cost-8*start, start) of binary runs of short and long prefixes
+    short = dict((mode, deque()) for mode in AZTEC_BINARY_MODES)
+    long_ = dict((mode, deque()) for mode in AZTEC_BINARY_MODES)
+    for i in range(n+1):
+        cost = costs[i]
+        for mode in AZTEC_BINARY_MODES:
+            if i>=1:
+                _push_start(short[mode], costs[i-1][mode]-8*(i-1), i-1)
+            if i>=32:
+                _push_start(long_[mode], costs[i-32][mode]-8*(i-32), i-32)
+            for starts, first, header in ((short[mode], i-31, 10),
+                                          (long_[mode], i-AZTEC_MAX_BINARY, 21)):
+                while starts and starts[0][1]<first:
+                    starts.popleft()
+                if starts and starts[0][0]+8*i+header<cost[mode]:
+                    cost[mode] = starts[0][0]+8*i+header
+                    entries[i][mode] = (starts[0][1], mode, None)
+        closed = cost[:]
+        for target in range(5):
+            for source in range(5):
+                if cost[source]+_LATCH_COSTS[source][target]<closed[target]:
+                    closed[target] = cost[source]+_LATCH_COSTS[source][target]
+                    latches[i][target] = source
+        costs[i] = closed
+        if i<n:
+            _aztec_steps(data, i, closed, costs, entries)
+    mode = min(range(5), key=lambda m: costs[n][m])
+    return _aztec_bits(data, mode, entries, latches)
+
+
+def _aztec_steps(data, i, closed, costs, entries):
+    """Relaxes costs of encoding the character (or pair) at i."""
+    values = [table.get(data[i]) for table in _AZTEC_VALUES]
+    pair = AZTEC_PAIRS.get(data[i:i+2])
+
+    def relax(end, mode, cost, entry):
+        if cost<costs[end][mode]:
+            costs[end][mode] = cost
+            entries[end][mode] = entry
+
+    for mode in range(5):
+        cost, bits = closed[mode], AZTEC_MODE_BITS[mode]
+        if cost==_INFINITY:
+            continue
+        if values[mode] is not None:
+            relax(i+1, mode, cost+bits, (i, mode, [(values[mode], bits)]))
+        if pair and mode==PUNCT:
+            relax(i+2, mode, cost+5, (i, mode, [(pair, 5)]))
+    for source, target, shift in AZTEC_SHIFTS:
+        cost, bits = closed[source], AZTEC_MODE_BITS[source]
+        if cost==_INFINITY:
+            continue
+        if values[target] is not None:
+            relax(i+1, source, cost+bits+5,
+                  (i, source, [(shift, bits), (values[target], 5)]))
+        if pair and target==PUNCT:
+            relax(i+2, source, cost+bits+5, (i, source, [(shift, bits), (pair, 5)]))
+
+
+def _aztec_bits(data, mode, entries, latches):
+    tokens, i = [], len(data)
+    while True:
+        source = latches[i][mode]
+        if source is not None:
+            tokens.extend(reversed(AZTEC_LATCH_SEQUENCES[source][mode]))
+            mode = source
+        if entries[i][mode] is None:
+            break
+        start, mode, values = entries[i][mode]
+        if values is None:
+            run = data[start:i]
+            values = [(BINARY_SHIFT, 5)]
+            if len(run)<=31:
+                values.append((len(run), 5))
+            else:
+                values.extend([(0, 5), (len(run)-31, 11)])
+            values.extend((ord(c), 8) for c in run)
+        tokens.extend(reversed(values))
+        i = start
+    return ''.join(format(value, '0%db' %bits) for value, bits in reversed(tokens))
+
+
+def aztec_codewords(msgbits, bpcw):
+    """Splits msgbits into codewords of bpcw bits, stuffing a bit into
+    codewords that would be all zeros or all ones and padding the last
+    with ones.
+
+    >>> aztec_codewords('0000000000011111', 6)
+    [1, 1, 31]
+    """
+    codewords, m, n = [], 0, len(msgbits)
+    zeros, ones = '0'*(bpcw-1), '1'*(bpcw-1)
+    while m<n:
+        if n-m>=bpcw:
+            head = msgbits[m:m+bpcw-1]
+            if head==zeros:
+                word, m = head+'1', m+bpcw-1
+            elif head==ones:
+                word, m = head+'0', m+bpcw-1
+            else:
+                word, m = msgbits[m:m+bpcw], m+bpcw
+        else:
+            word, m = (msgbits[m:]+'1'*bpcw)[:bpcw], n
+            if word=='1'*bpcw:
+                word = word[:-1]+'0'
+        codewords.append(int(word, 2))
+    return codewords
+
+
+def aztec_metric(msgbits, format_=None, layers=-1, eclevel=23, ecaddchars=3,
+                 readerinit=False):
+    """Returns (metric, data codewords) of the smallest symbol holding
+    msgbits with eclevel percent and ecaddchars more codewords for error
+    correction, as in AZTEC_CODE_METRICS.
+
+    >>> aztec_metric('0'*60)[0]
+    ['full', 1, 1, 21, 6]
+
+    163 bits stuff into 28 codewords; 19x19 compact symbols keep 27 of
+    their 40 after 13 for error correction, one too few at the defaults:
+
+    >>> msgbits = aztec_message_bits('2EIHJBFPPCV8VN0QGs9786679173')
+    >>> aztec_metric(msgbits)[0], aztec_metric(msgbits, ecaddchars=2)[0]
+    (['full', 2, 1, 48, 6], ['compact', 2, 0, 40, 6])
+    """
+    stuffed = {}
+    for metric in AZTEC_CODE_METRICS[1:]:
+        frmt, mlyr, icap, ncws, bpcw = metric
+        if (format_ and format_!=frmt or readerinit and icap!=1
+            or layers!=-1 and layers!=mlyr):
+            continue
+        if bpcw not in stuffed:
+            stuffed[bpcw] = aztec_codewords(msgbits, bpcw)
+        codewords = stuffed[bpcw]
+        numecw = int(math.ceil(ncws*eclevel/100.0+ecaddchars))
+        if len(codewords)<=min(ncws-numecw, 64 if frmt=='compact' else 2048):
+            return metric, codewords
+    raise ValueError(u'Aztec Code data does not fit in any symbol size.')
+
+
+def aztec_mode_message(format_, layers, ndata, readerinit=False):
+    """Returns the mode message of the symbol as its 4-bit words, with
+    error correction; for runes, ndata is the value of the rune.
+
+    >>> aztec_mode_message('compact', 1, 4)
+    [0, 3, 14, 12, 10, 6, 3]
+    """
+    if format_=='full':
+        mode = (layers-1)<<11 | ndata-1 | (readerinit and 1024)
+        words, nsym = [mode>>12, mode>>8 & 15, mode>>4 & 15, mode & 15], 6
+    elif format_=='compact':
+        mode = (layers-1)<<6 | ndata-1 | (readerinit and 32)
+        words, nsym = [mode>>4, mode & 15], 5
+    else:
+        words, nsym = [ndata>>4, ndata & 15], 5
+    field = get_field(AZTEC_MODE_FIELD)
+    words += rs_encode(field, words, rs_generator(field, nsym))
+    if format_=='rune':
+        words = [word^10 for word in words]
+    return words
+
+
+def _layer_xy(fw, layer, position):
+    # BWIPP's lmv: coordinates (y up) of bit position of a layer
+    width = fw+layer*4
+    side, along, ring = position//2//width, position//2%width, 2*layer+position%2
+    if side==0:
+        return -((width-1)//2)+1+along, (fw-1)//2+ring
+    if side==1:
+        return fw//2+ring, (width-1)//2-1-along
+    if side==2:
+        return width//2-1-along, -(fw//2+ring)
+    return -((fw-1)//2+ring), along+1-width//2
+
+
+_layouts = {}
+
+def aztec_layout(format_, layers):
+    """Returns (size, modules, data, mode) of the symbol of format_ and
+    layers, computed once: modules is a bytearray of '0' and '1' with
+    finder, orientation and reference patterns drawn, and data and mode
+    the indexes of its data bits (innermost first) and mode message bits.
+
+    >>> size, modules, data, mode = aztec_layout('compact', 1)
+    >>> size, len(data), len(mode), str(modules[7*size:8*size])
+    (15, 104, 28, '000101010101000')
+    >>> aztec_layout('full', 5)[0]
+    37
+    """
+    key = (format_, layers)
+    layout = _layouts.get(key)
+    if layout is not None:
+        return layout
+    fw = 12 if format_=='full' else 9
+    size = fw+layers*4+2
+    mid = (size-1)//2*(size+1)
+    data = [mid+x-y*size for layer in range(1, layers+1)
+            for x, y in (_layer_xy(fw, layer, position)
+                         for position in range(8*(fw+layer*4)))]
+    modules = bytearray('0'*size*size)
+    if format_=='full':
+        # reference grid lines every 16 modules from the centre
+        size = 15+layers*4+int((layers+10.5)/7.5-1)*2
+        mid, half = size*size//2, size//2
+        grid = {}
+        for i in range(0, half+1, 16):
+            for j in range(size):
+                bit = '01'[(half+j+i+1)%2]
+                for x, y in ((j-half, i), (j-half, -i), (i, j-half), (-i, j-half)):
+                    grid[mid+x-y*size] = bit
+        free = [k for k in range(size*size) if k not in grid]
+        data = [free[k] for k in data]
+        modules = bytearray('0'*size*size)
+        for k, bit in grid.items():
+            modules[k] = bit
+    def put(x, y, bit):
+        modules[mid+x-y*size] = bit
+    fw //= 2
+    for x in range(-fw, fw+1):
+        for y in range(-fw, fw+1):
+            put(x, y, '01'[(max(abs(x), abs(y))+1)%2])
+    f = fw+1
+    for x, y in ((-f, fw), (-f, f), (-fw, f), (f, f), (f, fw), (f, -fw)):
+        put(x, y, '1')
+    for x, y in ((fw, f), (f, -f), (fw, -f), (-fw, -f), (-f, -f), (-f, -fw)):
+        put(x, y, '0')
+    # mode message clockwise from the top left, around the reference lines
+    side = [t for t in range(1-fw, fw) if t or format_!='full']
+    mode = ([mid+t-f*size for t in side]+[mid+f-t*size for t in reversed(side)]
+            +[mid+t+f*size for t in reversed(side)]+[mid-f-t*size for t in side])
+    layout = _layouts[key] = (size, modules, data, mode)
+    return layout
+
+
+def _aztec_modules(codestring, format_=None, layers=-1, eclevel=23, ecaddchars=3,
+                   readerinit=False, raw=False, parse=False):
+    if parse:
+        codestring = cap_unescape(codestring)
+    if format_=='rune':
+        value = int(codestring)
+        if not 0<=value<=255:
+            raise ValueError(u'Aztec runes take values from 0 to 255.')
+        layers, codewords, bpcw = 0, [], 6
+        words = aztec_mode_message(format_, layers, value)
+    else:
+        msgbits = codestring if raw else aztec_message_bits(codestring)
+        if not msgbits:
+            raise ValueError(u'Aztec Code needs some data.')
+        metric, codewords = aztec_metric(msgbits, format_, layers, eclevel,
+                                         ecaddchars, readerinit)
+        format_, layers, icap, ncws, bpcw = metric
+        words = aztec_mode_message(format_, layers, len(codewords), readerinit)
+        field = get_field(AZTEC_FIELDS[bpcw])
+        codewords = codewords+rs_encode(
+            field, codewords, rs_generator(field, ncws-len(codewords)))
+    size, modules, data, mode = aztec_layout(format_, layers)
+    modules = modules[:]
+    bits = ''.join(format(codeword, '0%db' %bpcw) for codeword in codewords)
+    # the last bit goes innermost
+    for index, bit in itertools.izip(data, reversed(bits)):
+        modules[index] = bit
+    for index, bit in zip(mode, ''.join(format(word, '04b') for word in words)):
+        modules[index] = bit
+    return size, modules
+
+
+def aztec_symbol(codestring, format_=None, layers=-1, eclevel=23, ecaddchars=3,
+                 readerinit=False, raw=False, parse=False):
+    """Encodes codestring into a bit-packed Aztec Code symbol: returns its
+    size and its rows from the top as integers, bit size-1-x holding
+    module x (1 for dark).
+
+    format_ is 'compact', 'full' or 'rune' (codestring being the value of
+    the rune), or the smallest fitting one if None.  raw takes codestring
+    as a string of message bits.
+
+    >>> size, rows = aztec_symbol('Code 2D!')
+    >>> size, format(rows[0], '015b')
+    (15, '000110001100000')
+    """
+    size, modules = _aztec_modules(codestring, format_, layers, eclevel,
+                                   ecaddchars, readerinit, raw, parse)
+    return size, [int(str(modules[i:i+size]), 2) for i in range(0, size*size, size)]
+
+
+def encode_azteccode(codestring, format_=None, layers=-1, eclevel=23,
+                     ecaddchars=3, readerinit=False, raw=False, parse=False):
+    """Encodes codestring into MatrixGeometry of an Aztec Code symbol,
+    taking the options of aztec_symbol().
+
+    >>> g = encode_azteccode('25', format_='rune')
+    >>> g.pixx, g.rows()[0]
+    (11, [1, 1, 1, 0, 1, 1, 0, 0, 1, 0, 1])
+    """
+    size, modules = _aztec_modules(codestring, format_, layers, eclevel,
+                                   ecaddchars, readerinit, raw, parse)
+    return MatrixGeometry([module-48 for module in modules], size, size,
+                          size*2/72.0, size*2/72.0)
+
+
 class AztecCode(Barcode):
     """
     >>> bc = AztecCode()
@@ -86,6 +479,8 @@ class AztecCode(Barcode):
     >>> bc.render('This is Aztec Code') # doctest: +ELLIPSIS
     <PIL.EpsImagePlugin.EpsImageFile ... at ...>
     >>> # _.show()
+    >>> bc.encode('This is Aztec Code', options=dict(format='full')).pixx
+    23
     """
     codetype = 'azteccode'
     aliases = ('aztec code', 'aztec-code', 'aztec_code', 'aztec')
@@ -100,20 +495,14 @@ class AztecCode(Barcode):
             parse = self.lookup_option('parse')
             if parse==True:
                 codestring = cap_unescape(codestring)
-            msgbits = ''
+            # BWIPP binary shifts the whole codestring
+            nbits = 0
             if format_!='rune':
                 if raw==True:
-                    msgbits = codestring
+                    nbits = len(codestring)
                 else:
                     barlen = len(codestring)
-                    if barlen<32:
-                        cc = zf_bin(barlen, 5)
-                    else:
-                        cc = zf_bin(barlen-31, 16)
-                    msgbits = '11111'
-                    msgbits += cc
-                    for ch in codestring:
-                        msgbits+=zf_bin(ord(ch), 8)
+                    nbits = 5+(5 if barlen<32 else 16)+8*barlen
             readerinit = self.lookup_option('readerinit')
             layers = self.lookup_option('layers')
             eclevel = self.lookup_option('eclevel')
@@ -121,7 +510,7 @@ class AztecCode(Barcode):
             for frmt, mlyr, icap, ncws, bpcw in AZTEC_CODE_METRICS:
                 ok = True
                 numecw = int(math.ceil(ncws*eclevel/100.0+ecaddchars))
-                if len(msgbits)==0:
+                if nbits==0:
                     numecw = 0
                 numdcw = ncws-numecw
                 if format_ and format_!=frmt:
@@ -130,7 +519,7 @@ class AztecCode(Barcode):
                     ok = False
                 if layers!=-1 and layers!=mlyr:
                     ok = False
-                if math.ceil(len(msgbits)/bpcw)>numdcw:
+                if math.ceil(nbits/bpcw)>numdcw:
                     ok = False
                 if ok:
                     break
@@ -155,6 +544,14 @@ class AztecCode(Barcode):
             cbbox = self._code_bbox(codestring)
             params['bbox'] = '%d %d %d %d' %(self._boundingbox(cbbox, cbbox))
             return params
+
+        def native_encode(self, codestring):
+            return encode_azteccode(
+                codestring, self.lookup_option('format'), self.lookup_option('layers'),
+                self.lookup_option('eclevel'), self.lookup_option('ecaddchars'),
+                bool(self.lookup_option('readerinit')), bool(self.lookup_option('raw')),
+                bool(self.lookup_option('parse')))
+
     renderer = _Renderer
 
 
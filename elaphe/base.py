@@ -1,11 +1,8 @@
 # coding: utf-8
 
-try:
-    import cStringIO as StringIO
-except ImportError:
-    import StringIO
-from PIL.EpsImagePlugin import EpsImageFile
 import util
+# gsworker, batch, geometry, raster, cache and store are imported by the
+# methods using them, so that importing elaphe stays cheap.
 
 __all__=['DPI', 'Renderer', 'LinearCodeRenderer',
          'MatrixCodeRenderer', 'Barcode']
@@ -145,15 +142,67 @@ class Renderer(object):
         showpage
         <BLANKLINE>
         """
-        return util.PS_CODE_TEMPLATE %(self.build_params(codestring))
+        return ''.join(self.render_ps_chunks(codestring))
+
+    def render_ps_chunks(self, codestring):
+        """Returns postscript code as chunks sharing the constant prelude.
+
+        >>> chunks = Renderer('ean13').render_ps_chunks('977147396801')
+        >>> chunks[1] is Renderer('ean13').render_ps_chunks('977147396802')[1]
+        True
+        """
+        return util.build_ps_chunks(self.build_params(codestring), self.codetype)
 
     def render(self, codestring):
         """
         >>> Renderer('foo').render('977147396801') # doctest: +ELLIPSIS
         <PIL.EpsImagePlugin.EpsImageFile ... at ...>
+
+        With the pool render option (True for the shared pool, or a
+        gsworker.WorkerPool instance) the job is sent to a long-lived
+        Ghostscript worker and a loaded image is returned instead.
         """
-        ps_code_buf = self.render_ps_code(codestring)
-        return EpsImageFile(StringIO.StringIO(ps_code_buf))
+        import gsworker
+        pool = gsworker.get_pool(self.render_options.get('pool'))
+        if pool is not None:
+            return pool.render(self.build_params(codestring))
+        from PIL.EpsImagePlugin import EpsImageFile
+        return EpsImageFile(util.ChunkedFile(self.render_ps_chunks(codestring)))
+
+    def native_encode(self, codestring):
+        """Returns geometry of codestring computed in Python, or None.
+
+        Renderers of codetypes having a native encoder override this.
+        """
+        return None
+
+    def encode(self, codestring):
+        """Returns symbol geometry of codestring.
+
+        See geometry module for the returned objects.  Codetypes with a
+        native encoder are encoded in Python unless the native render
+        option is False; others run the BWIPP encoder with dontdraw,
+        honoring the pool render option as in render().
+        """
+        if self.render_options.get('native', True):
+            symbol = self.native_encode(codestring)
+            if symbol is not None:
+                return symbol
+        encoder = type(self)(self.codetype, dict(self.options or {}, dontdraw=True),
+                             **self.render_options)
+        params = encoder.build_params(codestring)
+        import geometry, gsworker
+        pool = gsworker.get_pool(self.render_options.get('pool'))
+        return geometry.encode(params, pool=pool)
+
+    def rasterize(self, codestring, as_array=False):
+        """Encodes codestring and paints the geometry with NumPy.
+
+        Honors scale and margin render options; returns a grayscale PIL
+        image or, with as_array=True, the uint8 array it wraps.
+        """
+        import raster
+        return raster.rasterize(self.encode(codestring), self, as_array)
 
 
 class LinearCodeRenderer(Renderer):
@@ -238,6 +287,8 @@ class Barcode(object):
     codetype = ''
     aliases = ()
     registry = {}
+    # codetypes and aliases of plugins not imported yet, to module name.
+    plugins = {}
     renderer = Renderer
     @classmethod
     def update_codetype_registry(cls):
@@ -248,9 +299,42 @@ class Barcode(object):
                 cls.registry.update(
                     dict((alias.lower(), subclass) for alias in subclass.aliases))
 
+    @classmethod
+    def register_plugin(cls, module_name, codetypes):
+        """Registers codetypes (and aliases) implemented by a plugin module.
+
+        The module is imported when one of codetypes is resolved first.
+        """
+        cls.plugins.update((codetype.lower(), module_name) for codetype in codetypes)
+
+    @classmethod
+    def load_plugin(cls, module_name):
+        try:
+            __import__(module_name, fromlist=[module_name])
+        except ImportError, e:
+            import sys
+            sys.stdout.write(u'Warning: %s\n' %e)
+        for codetype, name in cls.plugins.items():
+            if name==module_name:
+                del cls.plugins[codetype]
+        cls.update_codetype_registry()
+
     @classmethod
     def resolve_codetype(cls, codetype):
-        return cls.registry.get(codetype.lower())
+        """Returns Barcode subclass for codetype, loading its plugin if needed.
+
+        >>> import elaphe
+        >>> Barcode.resolve_codetype('Data-Matrix').codetype
+        'datamatrix'
+        >>> Barcode.resolve_codetype('nonexistent') is None
+        True
+        """
+        codetype = codetype.lower()
+        subclass = cls.registry.get(codetype)
+        if subclass is None and codetype in cls.plugins:
+            cls.load_plugin(cls.plugins[codetype])
+            subclass = cls.registry.get(codetype)
+        return subclass
 
     def get_renderer(self, options=None, **kw):
         return self.renderer(self.codetype, options, **kw)
@@ -259,9 +343,91 @@ class Barcode(object):
         renderer = self.get_renderer(options, **kw)
         return renderer.render_ps_code(codestring)
 
+    @classmethod
+    def render_key(cls, codetype, codestring, options=None, render_options=None):
+        """Returns canonical cache key with codetype aliases resolved.
+
+        >>> import elaphe
+        >>> Barcode.render_key('QRCode', 'bar') == Barcode.render_key('qr', 'bar')
+        True
+        """
+        subclass = cls.resolve_codetype(codetype)
+        if subclass is not None:
+            codetype = subclass.codetype
+        import cache
+        return cache.render_key(codetype, codestring, options, render_options)
+
     def render(self, codestring, options=None, **kw):
+        """Renders codestring, consulting the render cache and store.
+
+        The cache render option selects the cache: True for
+        cache.DEFAULT_CACHE, None or False (default) for no caching, or a
+        RenderCache.  Cached renders are handed out as copies, so callers
+        may modify them.  The store render option gives a store.DiskStore
+        (or its directory) shared with other processes; renders are kept
+        there as PNG.
+
+        >>> import elaphe
+        >>> from PIL import Image
+        >>> from cache import RenderCache
+        >>> render_cache = RenderCache()
+        >>> render_cache.put(Barcode.render_key('qrcode', 'x', None, {}),
+        ...                  Image.new('L', (2, 2), 255))
+        >>> bc = Barcode.resolve_codetype('qrcode')()
+        >>> a = bc.render('x', cache=render_cache)
+        >>> a.paste(0, (0, 0, 1, 1))
+        >>> b = bc.render('x', cache=render_cache)
+        >>> b is a, a.getpixel((0, 0)), b.getpixel((0, 0))
+        (False, 0, 255)
+        """
+        import cache, store
+        render_cache = cache.get_cache(kw.pop('cache', None))
+        disk_store = store.get_store(kw.pop('store', None))
+        if render_cache is not None or disk_store is not None:
+            key = self.render_key(self.codetype, codestring, options, kw)
+        if render_cache is not None:
+            image = render_cache.get(key)
+            if image is not None:
+                return image.copy()
+        if disk_store is not None:
+            data = disk_store.get(key)
+            if data is not None:
+                image = store.load_image(data)
+                if render_cache is not None:
+                    render_cache.put(key, image.copy())
+                return image
+        renderer = self.get_renderer(options, **kw)
+        image = renderer.render(codestring)
+        if disk_store is not None:
+            disk_store.put(key, store.dump_image(image))
+        if render_cache is not None:
+            render_cache.put(key, image.copy())
+        return image
+
+    def encode(self, codestring, options=None, **kw):
+        renderer = self.get_renderer(options, **kw)
+        return renderer.encode(codestring)
+
+    def rasterize(self, codestring, options=None, as_array=False, **kw):
         renderer = self.get_renderer(options, **kw)
-        return renderer.render(codestring)
+        return renderer.rasterize(codestring, as_array)
+
+    def render_many(self, items, **kw):
+        """Renders many symbols in a single Ghostscript run.
+
+        items are codestrings or (codestring, options) tuples; render
+        options given as keywords apply to all items.  Returns a list of
+        PIL images.
+        """
+        jobs = []
+        for item in items:
+            if isinstance(item, tuple):
+                codestring, options = item
+            else:
+                codestring, options = item, None
+            jobs.append((self.get_renderer(options, **kw), codestring))
+        import batch
+        return batch.render_batch(jobs)
 
     # for debug
     def _get_build_params(self, codestring='', options=None, **kw):
@@ -0,0 +1,156 @@
+# coding: utf-8
+"""Renders many barcodes with a single Ghostscript invocation.
+
+The batch program holds the barcode.ps resources needed by all the
+items once, followed by one page per item.  Pages are sized to each
+symbol's bounding box, so every page becomes one image.
+"""
+import os, shutil, tempfile
+import util, gsworker
+from gsworker import GhostscriptError
+
+__all__ = ['DEFAULT_BATCH_GS_OPTIONS', 'build_batch_ps_code',
+           'build_batch_ps_chunks', 'get_batch_prelude', 'collect_results',
+           'render_batch']
+
+
+DEFAULT_BATCH_GS_OPTIONS = gsworker.DEFAULT_GS_OPTIONS + ['-dBATCH']
+DEFAULT_BATCH_HEADER = """%!PS-Adobe-2.0
+%%Creator: Elaphe powered by barcode.ps
+%%LanguageLevel: 2
+%%EndComments
+"""
+
+
+_batch_preludes = {}
+def get_batch_prelude(codetypes):
+    """Returns (cached) barcode.ps resources for all of codetypes.
+
+    Preludes are kept per set of codetypes, so batches mixing the same
+    symbologies share one pruned copy of barcode.ps.
+
+    >>> prelude = get_batch_prelude(['ean13', 'qrcode'])
+    >>> prelude is get_batch_prelude(['qrcode', 'ean13'])
+    True
+    >>> get_batch_prelude(['ean13']) is util.get_ps_prelude('ean13')
+    True
+    """
+    if len(codetypes)==1:
+        return util.get_ps_prelude(codetypes[0])
+    key = frozenset(codetypes)
+    prelude = _batch_preludes.get(key)
+    if prelude is None:
+        prelude = _batch_preludes.setdefault(key, util.prune_ps_code(
+            util.distill_ps_code(escape=False), codetypes))
+    return prelude
+
+
+def build_batch_ps_chunks(jobs, header=DEFAULT_BATCH_HEADER):
+    """Builds a multi-page postscript program for (renderer, codestring) jobs.
+
+    Returns the program as a list of chunks: header, the resources for
+    all the codetypes, then one page per job.  Each page reports its job
+    index with a done or error marker.
+
+    >>> from base import Renderer
+    >>> chunks = build_batch_ps_chunks(
+    ...     [(Renderer('ean13'), '977147396801'), (Renderer('ean8'), '01335583')])
+    >>> len(chunks)
+    4
+    >>> 'ELAPHE-DONE 0' in chunks[2], 'ELAPHE-DONE 1' in chunks[3]
+    (True, True)
+    >>> build_batch_ps_chunks([(Renderer('ean13'), '1')])[1] is util.get_ps_prelude('ean13')
+    True
+    """
+    codetypes, pages = [], []
+    for index, (renderer, codestring) in enumerate(jobs):
+        if renderer.codetype not in codetypes:
+            codetypes.append(renderer.codetype)
+        pages.append(gsworker.build_job(
+            renderer.build_params(codestring),
+            done='%s %d' %(gsworker.DONE_MARKER, index),
+            error='%s %d' %(gsworker.ERROR_MARKER, index)))
+    return [header, get_batch_prelude(codetypes)] + pages
+
+
+def build_batch_ps_code(jobs, header=DEFAULT_BATCH_HEADER):
+    """Builds a multi-page postscript program for (renderer, codestring) jobs.
+
+    >>> from base import Renderer
+    >>> ps_code = build_batch_ps_code(
+    ...     [(Renderer('ean13'), '977147396801'), (Renderer('ean8'), '01335583')])
+    >>> ps_code.count('% --BEGIN ENCODER ean13--'), ps_code.count('showpage')
+    (1, 2)
+    """
+    return ''.join(build_batch_ps_chunks(jobs, header))
+
+
+def _parse_markers(output):
+    """Returns dict of job index to None (done) or error name.
+
+    >>> _parse_markers('ELAPHE-DONE 0\\nfoo\\nELAPHE-ERROR 1 rangecheck\\nELAPHE-DONE 2\\n')
+    {0: None, 1: 'rangecheck', 2: None}
+    """
+    results = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0]==gsworker.DONE_MARKER:
+            results[int(fields[1])] = None
+        elif fields[0]==gsworker.ERROR_MARKER:
+            results[int(fields[1])] = ' '.join(fields[2:])
+    return results
+
+
+def collect_results(count, output, output_file, errors='raise'):
+    """Loads pages of a finished batch run of count jobs.
+
+    output is the interpreter's stdout and output_file the page path
+    pattern it wrote to.  See render_batch() for errors.
+    """
+    from PIL import Image
+    markers = _parse_markers(output)
+    results, page = [], 0
+    for index in range(count):
+        if index not in markers:
+            result = GhostscriptError(
+                u'Ghostscript stopped before job %d.' %index)
+        elif markers[index] is not None:
+            result = GhostscriptError(
+                u'Ghostscript error in job %d: %s' %(index, markers[index]))
+        else:
+            page += 1
+            result = Image.open(output_file %page)
+            result.load()
+        if isinstance(result, GhostscriptError) and errors=='raise':
+            raise result
+        results.append(result)
+    return results
+
+
+def render_batch(jobs, gs_binary=None, gs_options=None, errors='raise'):
+    """Renders (renderer, codestring) jobs in one Ghostscript run.
+
+    Returns a list of loaded PIL images in order of jobs.  When errors is
+    'raise', the first failing job raises GhostscriptError; with 'return'
+    the GhostscriptError takes the place of the image.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    spool_dir = tempfile.mkdtemp(prefix='elaphe-batch-')
+    try:
+        output_file = os.path.join(spool_dir, 'page-%08d.png')
+        output = gsworker.run_ghostscript(
+            build_batch_ps_chunks(jobs),
+            list(gs_options or DEFAULT_BATCH_GS_OPTIONS)
+            + ['-sOutputFile=%s' %output_file], gs_binary)
+        return collect_results(len(jobs), output, output_file, errors)
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+if __name__=="__main__":
+    from doctest import testmod
+    testmod()
@@ -0,0 +1,161 @@
+# coding: utf-8
+"""In-memory LRU cache of rendered symbols.
+
+Entries are keyed by a canonical form of (codetype, codestring, options,
+render options), see render_key().  Caching is opt-in with the cache
+render option; Barcode.render() keeps copies of images and hands out
+copies, so callers may modify what they get.
+"""
+import sys, threading
+from collections import OrderedDict
+
+__all__ = ['DEFAULT_MAX_BYTES', 'NON_RENDER_OPTIONS', 'RenderCache',
+           'render_key', 'estimate_size', 'DEFAULT_CACHE', 'get_cache']
+
+
+DEFAULT_MAX_BYTES = 64*1024*1024
+# keyword arguments which select how to render, not what is rendered.
+NON_RENDER_OPTIONS = ('pool', 'cache', 'store')
+
+
+def _canonical(value):
+    """Converts option value into hashable, order-independent form.
+
+    >>> _canonical(dict(b=[1, 2], a=(3, 'x')))
+    (('a', (3, 'x')), ('b', (1, 2)))
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _canonical(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_canonical(v) for v in value)
+    return value
+
+
+def render_key(codetype, codestring, options=None, render_options=None):
+    """Returns canonical render key as a string.
+
+    codetype should already be resolved (see Barcode.render_key).  None
+    and empty options are equivalent, and render options that do not
+    change the output are ignored.
+
+    >>> render_key('qrcode', 'hello', dict(version=9, eclevel='M'), dict(scale=2, pool=True))
+    "('qrcode', 'hello', (('eclevel', 'M'), ('version', 9)), (('scale', 2),))"
+    >>> render_key('qrcode', 'hello', {}, {}) == render_key('qrcode', 'hello')
+    True
+    """
+    render_options = dict(
+        (k, v) for k, v in (render_options or {}).items()
+        if k not in NON_RENDER_OPTIONS)
+    return repr((codetype, codestring, _canonical(options or {}),
+                 _canonical(render_options)))
+
+
+def estimate_size(value):
+    """Estimates memory held by a cached value, in bytes.
+
+    >>> from PIL import Image
+    >>> estimate_size(Image.new('RGB', (10, 20)))
+    600
+    >>> estimate_size('x'*100)
+    100
+    """
+    if hasattr(value, 'size') and hasattr(value, 'getbands'):
+        width, height = value.size
+        return width*height*len(value.getbands())
+    if isinstance(value, str):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class RenderCache(object):
+    """LRU cache bounded by estimated byte size of the entries.
+
+    >>> cache = RenderCache(max_bytes=10)
+    >>> cache.put('a', 'xxxx'); cache.put('b', 'yyyy')
+    >>> cache.get('a')
+    'xxxx'
+    >>> cache.put('c', 'zzzz') # evicts 'b', the least recently used
+    >>> cache.get('b') is None, sorted(cache.keys())
+    (True, ['a', 'c'])
+    >>> sorted(cache.stats().items())
+    [('bytes', 8), ('entries', 2), ('evictions', 1), ('hits', 1), ('max_bytes', 10), ('misses', 1)]
+    >>> cache.put('d', 'x'*11) # larger than the cache itself
+    >>> 'd' in cache
+    False
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                entry = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        if size is None:
+            size = estimate_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            if size>self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size>self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    entries=len(self._entries), bytes=self.size,
+                    max_bytes=self.max_bytes)
+
+
+DEFAULT_CACHE = RenderCache()
+
+def get_cache(cache):
+    """Resolves the cache render option into an enabled RenderCache or None.
+
+    >>> get_cache(True) is DEFAULT_CACHE, get_cache(False), get_cache(None)
+    (True, None, None)
+    >>> get_cache(RenderCache(enabled=False)) is None
+    True
+    """
+    if cache is True:
+        cache = DEFAULT_CACHE
+    if cache is None or cache is False or not cache.enabled:
+        return None
+    return cache
+
+
+if __name__=="__main__":
+    from doctest import testmod
+    testmod()
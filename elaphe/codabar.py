@@ -1,5 +1,52 @@
 # coding: utf-8
 from base import Barcode, LinearCodeRenderer, DPI
+from linear import widths, linear_options, LinearBuilder
+
+
+CODABAR_CHARS = '0123456789-$:/.+ABCD'
+CODABAR_ALT_CHARS = '0123456789-$:/.+TN*E'
+CODABAR_PATTERNS = (
+    '11111331 11113311 11131131 33111111 11311311 31111311 13111131 '
+    '13113111 13311111 31131111 11133111 11331111 31113131 31311131 '
+    '31313111 11313131 11331311 13131131 11131331 11133311').split()
+
+
+def encode_codabar(codestring, altstartstop=False, includecheck=False,
+                   validatecheck=False, includecheckintext=False,
+                   includetext=False, height=1.0, textsize=10, textyoffset=-7):
+    """Encodes Codabar data between start and stop characters into
+    LinearGeometry; the modulo 16 check character precedes the stop.
+
+    >>> g = encode_codabar('A0123456789B', includecheck=True, includetext=True)
+    >>> g.width, len(g.bhs), g.text[-1]
+    (160.0, 52, ('B', 146, -7, 10))
+    >>> encode_codabar('A01234567892B', validatecheck=True).width
+    160.0
+    """
+    chars = CODABAR_ALT_CHARS if altstartstop else CODABAR_CHARS
+    if (len(codestring)<2 or codestring[0] not in chars[16:]
+        or codestring[-1] not in chars[16:]):
+        raise ValueError(u'Codabar start and stop characters must be one of %s.'
+                         %' '.join(chars[16:]))
+    if any(c not in chars[:16] for c in codestring[1:-1]):
+        raise ValueError(u'Codabar body must contain only digits and '
+                         u'symbols - $ : / . +')
+    if validatecheck:
+        codestring, check = codestring[:-2]+codestring[-1], codestring[-2]
+        includecheck = True
+    values = [chars.index(c) for c in codestring]
+    checksum = (16-sum(values)%16)%16
+    if validatecheck and check!=chars[checksum]:
+        raise ValueError(u'Incorrect Codabar check digit provided.')
+    if includecheck:
+        values.insert(-1, checksum)
+    builder = LinearBuilder()
+    for i, value in enumerate(values):
+        shown = not (includecheck and i==len(values)-2) or includecheckintext
+        if includetext and shown:
+            builder.add_text(chars[value], builder.x, textyoffset, textsize)
+        builder.add(widths(CODABAR_PATTERNS[value]), height)
+    return builder.geometry()
 
 
 class RationalizedCodabar(Barcode):
@@ -29,7 +76,7 @@ class RationalizedCodabar(Barcode):
     >>> # _.show()
     """
     codetype = 'rationalizedCodabar'
-    aliases = ('rationalized codabar')
+    aliases = ('rationalized codabar',)
     class _Renderer(LinearCodeRenderer):
         default_options = dict(
             LinearCodeRenderer.default_options,
@@ -70,6 +117,14 @@ class RationalizedCodabar(Barcode):
                 tbbox = cbbox
             params['bbox'] = "%d %d %d %d" %self._boundingbox(cbbox, tbbox)
             return params
+
+        def native_encode(self, codestring):
+            return encode_codabar(
+                codestring, bool(self.lookup_option('altstartstop')),
+                bool(self.lookup_option('includecheck')),
+                bool(self.lookup_option('validatecheck')),
+                bool(self.lookup_option('includecheckintext')),
+                **linear_options(self))
     renderer = _Renderer
 
 
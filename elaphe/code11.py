@@ -1,5 +1,67 @@
 # coding: utf-8
 from base import Barcode, LinearCodeRenderer, DPI
+from linear import widths, linear_options, LinearBuilder
+
+
+CODE11_CHARS = '0123456789-'
+CODE11_PATTERNS = ('111131 311131 131131 331111 113131 313111 '
+                   '133111 111331 311311 311111 113111').split()
+CODE11_START_STOP = '113311'
+
+
+def code11_check_chars(codestring):
+    """Returns the C check character of Code 11 data, followed by the K
+    check character when the data is 10 characters or longer.
+
+    >>> code11_check_chars('0123456789')
+    '03'
+    >>> code11_check_chars('123-45')
+    '5'
+    """
+    values = [CODE11_CHARS.index(c) for c in codestring]
+    n = len(values)
+    check1 = sum(((n-i-1)%10+1)*v for i, v in enumerate(values))%11
+    if n<10:
+        return CODE11_CHARS[check1]
+    check2 = (sum(((n-i)%9+1)*v for i, v in enumerate(values))+check1)%11
+    return CODE11_CHARS[check1]+CODE11_CHARS[check2]
+
+
+def encode_code11(codestring, includecheck=False, validatecheck=False,
+                  includecheckintext=False, includetext=False, height=1.0,
+                  textsize=10, textyoffset=-7):
+    """Encodes digits and dashes into LinearGeometry of a Code 11 symbol.
+
+    >>> g = encode_code11('0123456789', includecheck=True, includetext=True)
+    >>> g.width, len(g.bhs), g.text[:2]
+    (134.0, 42, [('0', 8, -7, 10), ('1', 16, -7, 10)])
+    >>> encode_code11('012345678903', validatecheck=True).width
+    134.0
+    """
+    if any(c not in CODE11_CHARS for c in codestring):
+        raise ValueError(u'Code 11 must contain only digits and dashes.')
+    checks = ''
+    if validatecheck:
+        if len(codestring)==11:
+            raise ValueError(u'Code 11 cannot be 11 characters using check digits.')
+        count = 1 if len(codestring)<=10 else 2
+        codestring, checks = codestring[:-count], codestring[-count:]
+        if checks!=code11_check_chars(codestring):
+            raise ValueError(u'Incorrect Code 11 check digits provided.')
+    elif includecheck:
+        checks = code11_check_chars(codestring)
+    shown = codestring+checks if includecheckintext else codestring
+    builder = LinearBuilder()
+    builder.add(widths(CODE11_START_STOP), height)
+    x = 8
+    for i, c in enumerate(codestring+checks):
+        if includetext and i<len(shown):
+            builder.add_text(c, x, textyoffset, textsize)
+        pattern = widths(CODE11_PATTERNS[CODE11_CHARS.index(c)])
+        builder.add(pattern, height)
+        x += sum(pattern)
+    builder.add(widths(CODE11_START_STOP), height)
+    return builder.geometry()
 
 
 class Code11(Barcode):
@@ -70,6 +132,13 @@ class Code11(Barcode):
                 tbbox = cbbox
             params['bbox'] = "%d %d %d %d" %self._boundingbox(cbbox, tbbox)
             return params
+
+        def native_encode(self, codestring):
+            return encode_code11(
+                codestring, bool(self.lookup_option('includecheck')),
+                bool(self.lookup_option('validatecheck')),
+                bool(self.lookup_option('includecheckintext')),
+                **linear_options(self))
     renderer = _Renderer
 
 
@@ -1,10 +1,214 @@
 # coding: utf-8
 import re
 from base import Barcode, LinearCodeRenderer, DPI
+from linear import widths, LinearBuilder
 
 
 CODE128_ESCAPE_RE = re.compile(r'\^\d{3}')
 CODE128_CHARS =" !\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~"
+CODE128_PATTERNS = (
+    '212222 222122 222221 121223 121322 131222 122213 122312 132212 221213 '
+    '221312 231212 112232 122132 122231 113222 123122 123221 223211 221132 '
+    '221231 213212 223112 312131 311222 321122 321221 312212 322112 322211 '
+    '212123 212321 232121 111323 131123 131321 112313 132113 132311 211313 '
+    '231113 231311 112133 112331 132131 113123 113321 133121 313121 211331 '
+    '231131 213113 213311 213131 311123 311321 331121 312113 312311 332111 '
+    '314111 221411 431111 111224 111422 121124 121421 141122 141221 112214 '
+    '112412 122114 122411 142112 142211 241211 221114 413111 241112 134111 '
+    '111242 121142 121241 114212 124112 124211 411212 421112 421211 212141 '
+    '214121 412121 111143 111341 131141 114113 114311 411113 411311 113141 '
+    '114131 311141 411131 211412 211214 211232 2331112').split()
+
+# code sets, with their start codes and the codes switching to them
+CODE_A, CODE_B, CODE_C = range(3)
+START_CODES = (103, 104, 105)
+SWITCH_CODES = (101, 100, 99)
+SHIFT, STOP = 98, 106
+FNC_CODES = dict(FNC1=102, FNC2=97, FNC3=96)
+FNC_RE = re.compile(r'\^(FNC[123])')
+# preferred code sets when encodings are equally short
+SET_PREFERENCE = (CODE_B, CODE_C, CODE_A)
+
+
+def _value(item, code_set):
+    """Returns value of item (ordinal or FNC name) in code_set, or None.
+    """
+    if not isinstance(item, int):
+        if code_set==CODE_C and item!='FNC1':
+            return None
+        return FNC_CODES[item]
+    if code_set==CODE_A:
+        return item+64 if item<32 else (item-32 if item<96 else None)
+    if code_set==CODE_B:
+        return item-32 if 32<=item<128 else None
+
+
+def _is_digit(item):
+    return isinstance(item, int) and 48<=item<58
+
+
+def code128_codewords(items):
+    """Returns the shortest codewords encoding items, from start code to
+    last data codeword.
+
+    items are ordinals of ASCII characters, or FNC1..FNC3 as names.  The
+    shortest sequence of code sets, code set switches and shifts is
+    found by dynamic programming over positions and current code sets.
+
+    >>> code128_codewords(map(ord, 'Count0123456789!'))
+    [104, 35, 79, 85, 78, 84, 99, 1, 23, 45, 67, 89, 100, 1]
+    >>> code128_codewords(['FNC1']+map(ord, '0112345678901231'))
+    [105, 102, 1, 12, 34, 56, 78, 90, 12, 31]
+    >>> code128_codewords(map(ord, 'a\\tb'))
+    [104, 65, 98, 73, 66]
+    """
+    n = len(items)
+    if not n:
+        raise ValueError(u'Nothing to encode.')
+    infinity = 4*n+4
+    # cost[i][s]: codewords needed for items[i:] starting in code set s;
+    # step[i][s]: (code set to switch to or None, codewords, next position)
+    cost = [[infinity]*3 for i in range(n+1)]
+    cost[n] = [0, 0, 0]
+    step = [[None]*3 for i in range(n)]
+    for i in range(n-1, -1, -1):
+        item = items[i]
+        consume = [(infinity, None)]*3
+        for code_set in (CODE_A, CODE_B):
+            value = _value(item, code_set)
+            if value is not None:
+                consume[code_set] = (1+cost[i+1][code_set], ([value], i+1))
+            else:
+                value = _value(item, 1-code_set)
+                if value is not None:
+                    consume[code_set] = (2+cost[i+1][code_set], ([SHIFT, value], i+1))
+        if i+1<n and _is_digit(item) and _is_digit(items[i+1]):
+            consume[CODE_C] = (1+cost[i+2][CODE_C],
+                               ([(item-48)*10+items[i+1]-48], i+2))
+        elif item=='FNC1':
+            consume[CODE_C] = (1+cost[i+1][CODE_C], ([FNC_CODES[item]], i+1))
+        for code_set in SET_PREFERENCE:
+            best, target = consume[code_set][0], None
+            for other in SET_PREFERENCE:
+                if other!=code_set and 1+consume[other][0]<best:
+                    best, target = 1+consume[other][0], other
+            cost[i][code_set] = best
+            if best<infinity:
+                codewords, next_i = consume[code_set if target is None else target][1]
+                step[i][code_set] = (target, codewords, next_i)
+        if min(cost[i])>=infinity:
+            raise ValueError(u'Cannot encode %r in Code 128.' %(item,))
+    code_set = min(SET_PREFERENCE, key=lambda s: cost[0][s])
+    result, i = [START_CODES[code_set]], 0
+    while i<n:
+        target, codewords, next_i = step[i][code_set]
+        if target is not None:
+            result.append(SWITCH_CODES[target])
+            code_set = target
+        result.extend(codewords)
+        i = next_i
+    return result
+
+
+def raw_codewords(codestring):
+    """Parses explicit codewords given as ^NNN escapes and characters of
+    the current code set, starting with a start code.
+
+    Returns codewords and the text they encode.
+
+    >>> raw_codewords('^104^102Count^0990123456789^101!')
+    ([104, 102, 35, 79, 85, 78, 84, 99, 1, 23, 45, 67, 89, 101, 1], 'Count0123456789!')
+    """
+    codewords, text = [], []
+    mode, idx = None, 0
+    while idx<len(codestring):
+        if codestring[idx]=='^':
+            code_i = int(codestring[idx+1:idx+4])
+            idx += 4
+        elif mode==CODE_C:
+            code_i = int(codestring[idx:idx+2])
+            text.append(codestring[idx:idx+2])
+            idx += 2
+        else:
+            code_i = CODE128_CHARS.find(codestring[idx])
+            text.append(codestring[idx])
+            idx += 1
+        if not codewords and code_i not in START_CODES:
+            raise ValueError(u'Raw Code 128 must begin with a start code.')
+        if code_i<0 or code_i>105:
+            raise ValueError(u'Bad Code 128 codeword in %r.' %codestring)
+        if code_i in START_CODES:
+            mode = START_CODES.index(code_i)
+        elif code_i in SWITCH_CODES and not (mode==CODE_A and code_i==101
+                                              or mode==CODE_B and code_i==100):
+            mode = SWITCH_CODES.index(code_i)
+        codewords.append(code_i)
+    return codewords, ''.join(text)
+
+
+def parse_items(codestring, parsefnc=False):
+    """Converts codestring into items for code128_codewords(); with
+    parsefnc, ^FNC1..^FNC3 escapes become function characters.
+
+    >>> parse_items('A^FNC1', parsefnc=True)
+    [65, 'FNC1']
+    """
+    items = []
+    parts = FNC_RE.split(codestring) if parsefnc else [codestring]
+    for i, part in enumerate(parts):
+        if i%2:
+            items.append(part)
+        else:
+            items.extend(ord(c) for c in part)
+    return items
+
+
+def encode_codewords(codewords, text='', height=1.0, includetext=False,
+                     textsize=10, textyoffset=-7):
+    """Appends check symbol and stop code to codewords and returns the
+    LinearGeometry of the symbol.
+
+    >>> g = encode_codewords([104, 35, 79, 85, 78, 84, 99, 1, 23, 45, 67, 89, 100, 1])
+    >>> g.width, len(g.bhs)
+    (178.0, 49)
+    """
+    check = (codewords[0]+sum(i*c for i, c in enumerate(codewords)))%103
+    builder = LinearBuilder()
+    for codeword in codewords+[check, STOP]:
+        builder.add(widths(CODE128_PATTERNS[codeword]), height)
+    if includetext and text:
+        builder.add_text(text, 0, textyoffset, textsize)
+    return builder.geometry()
+
+
+def encode_code128(codestring, raw=False, parsefnc=False, **kw):
+    """Encodes codestring into LinearGeometry of a Code 128 symbol.
+
+    Codestrings beginning with a start code escape (^103, ^104 or ^105)
+    or given with raw are taken as explicit codewords, others are
+    encoded in the shortest way.
+
+    >>> encode_code128('Count0123456789!') == encode_code128('^104Count^0990123456789^100!')
+    True
+    """
+    if raw or codestring[:4] in ('^103', '^104', '^105'):
+        codewords, text = raw_codewords(codestring)
+    else:
+        items = parse_items(codestring, parsefnc)
+        codewords = code128_codewords(items)
+        text = ''.join(chr(c) for c in items if isinstance(c, int) and 32<=c<127)
+    return encode_codewords(codewords, text, **kw)
+
+
+def code128_options(renderer):
+    """Collects options of Code 128 native encoders from renderer.
+    """
+    return dict(
+        height=renderer.lookup_option('height') or 1.0,
+        includetext=renderer.lookup_option('includetext'),
+        textsize=renderer.lookup_option('textsize') or 10,
+        textyoffset=renderer.lookup_option('textyoffset', -7))
+
 class Code128(Barcode):
     """
     >>> bc = Code128()
@@ -100,6 +304,12 @@ class Code128(Barcode):
             params['bbox'] = "%d %d %d %d" %self._boundingbox(cbbox, tbbox)
             return params
 
+        def native_encode(self, codestring):
+            return encode_code128(
+                codestring, raw=bool(self.lookup_option('raw')),
+                parsefnc=bool(self.lookup_option('parsefnc')),
+                **code128_options(self))
+
     renderer = _Renderer
 
 
@@ -1,5 +1,42 @@
 # coding: utf-8
 from base import Barcode, LinearCodeRenderer, DPI
+from linear import mod10_check_digit, text_x, LinearBuilder
+from i2of5 import (TWO_OF_FIVE_PATTERNS, two_of_five_widths,
+                   two_of_five_options, check_options)
+
+
+CODE2OF5_START, CODE2OF5_STOP = 'wnwnnn', 'wnnnw'
+
+
+def encode_code2of5(codestring, includecheck=False, includetext=False,
+                    includecheckintext=False, ratio=3, height=1.0,
+                    textsize=10, textyoffset=-7):
+    """Encodes digits into LinearGeometry of a Code 2 of 5 (industrial)
+    symbol; the data is carried by bars separated by narrow spaces.
+
+    >>> g = encode_code2of5('0123456789', includetext=True)
+    >>> g.width, len(g.bhs), len(g.text)
+    (159.0, 56, 10)
+    >>> encode_code2of5('01', ratio=2).sbs[6:16].tolist()
+    [1.0, 1.0, 1.0, 1.0, 2.0, 1.0, 2.0, 1.0, 1.0, 1.0]
+    """
+    if not codestring.isdigit():
+        raise ValueError(u'Code 2 of 5 takes digits only, got %r.' %codestring)
+    digits = codestring
+    if includecheck:
+        digits += str(mod10_check_digit(digits))
+    builder = LinearBuilder()
+    builder.add(two_of_five_widths(CODE2OF5_START, ratio), height)
+    shown = len(digits) if includecheckintext else len(codestring)
+    for i, digit in enumerate(digits):
+        x = builder.x
+        pattern = 'n'.join(TWO_OF_FIVE_PATTERNS[int(digit)])+'n'
+        builder.add(two_of_five_widths(pattern, ratio), height)
+        if includetext and i<shown:
+            builder.add_text(digit, text_x(x, builder.x-x, textsize),
+                             textyoffset, textsize)
+    builder.add(two_of_five_widths(CODE2OF5_STOP, ratio), height)
+    return builder.geometry()
 
 
 class Code2of5(Barcode):
@@ -72,6 +109,11 @@ class Code2of5(Barcode):
                 tbbox = cbbox
             params['bbox'] = "%d %d %d %d" %self._boundingbox(cbbox, tbbox)
             return params
+
+        def native_encode(self, codestring):
+            options = two_of_five_options(self)
+            options.update(check_options(self))
+            return encode_code2of5(codestring, **options)
     renderer = _Renderer
 
 
@@ -1,10 +1,102 @@
 # coding: utf-8
 import re
 from base import Barcode, LinearCodeRenderer, DPI
+from linear import LinearBuilder
 
 
 CODE39_ESCAPE_RE = re.compile(r'\^\d{3}')
 CODE39_CHARS ="0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ-. $/+%*"
+# narrow (n) and wide (w) bars and spaces of CODE39_CHARS
+CODE39_PATTERNS = (
+    'nnnwwnwnn wnnwnnnnw nnwwnnnnw wnwwnnnnn nnnwwnnnw wnnwwnnnn nnwwwnnnn '
+    'nnnwnnwnw wnnwnnwnn nnwwnnwnn wnnnnwnnw nnwnnwnnw wnwnnwnnn nnnnwwnnw '
+    'wnnnwwnnn nnwnwwnnn nnnnnwwnw wnnnnwwnn nnwnnwwnn nnnnwwwnn wnnnnnnww '
+    'nnwnnnnww wnwnnnnwn nnnnwnnww wnnnwnnwn nnwnwnnwn nnnnnnwww wnnnnnwwn '
+    'nnwnnnwwn nnnnwnwwn wwnnnnnnw nwwnnnnnw wwwnnnnnn nwnnwnnnw wwnnwnnnn '
+    'nwwnwnnnn nwnnnnwnw wwnnnnwnn nwwnnnwnn nwnwnwnnn nwnwnnnwn nwnnnwnwn '
+    'nnnwnwnwn nwnnwnwnn').split()
+# Full ASCII: characters 0 to 127 as pairs of Code 39 characters
+CODE39EXT_CHARS = (
+    ['%U'] + ['$'+chr(c) for c in range(65, 91)] + ['%'+c for c in 'ABCDE']
+    + [' '] + ['/'+c for c in 'ABCDEFGHIJKL'] + ['-', '.', '/O']
+    + list('0123456789') + ['/Z'] + ['%'+c for c in 'FGHIJ'] + ['%V']
+    + [chr(c) for c in range(65, 91)] + ['%'+c for c in 'KLMNO'] + ['%W']
+    + ['+'+chr(c) for c in range(65, 91)] + ['%'+c for c in 'PQRST'])
+
+
+def code39_check_char(data, chars=CODE39_CHARS):
+    """Returns the modulo 43 check character of data.
+
+    >>> code39_check_char('CODE39')
+    'W'
+    """
+    return chars[sum(chars.index(c) for c in data)%43]
+
+
+def code39_full_ascii(codestring):
+    """Converts ASCII codestring into Code 39 characters.
+
+    >>> code39_full_ascii('Code39!')
+    'C+O+D+E39/A'
+    """
+    try:
+        return ''.join(CODE39EXT_CHARS[ord(c)] for c in codestring)
+    except IndexError:
+        raise ValueError(u'Code 39 Extended takes ASCII only, got %r.' %codestring)
+
+
+def encode_code39(codestring, includecheck=False, includetext=False,
+                  includecheckintext=False, hidestars=False, text=None,
+                  height=1.0, textsize=10, textyoffset=-7, ratio=3):
+    """Encodes codestring into LinearGeometry of a Code 39 symbol.
+
+    Wide elements are ratio times as wide as narrow ones, and a narrow
+    space separates characters.  text replaces codestring as the human
+    readable text, printed as a whole below the symbol.
+
+    >>> g = encode_code39('CODE39')
+    >>> g.width, len(g.bhs)
+    (127.0, 40)
+    >>> g = encode_code39('CODE39', includecheck=True, includetext=True,
+    ...                   includecheckintext=True, hidestars=True)
+    >>> g.width, ''.join(t[0] for t in g.text)
+    (143.0, 'CODE39W')
+    """
+    if any(c not in CODE39_CHARS[:43] for c in codestring):
+        raise ValueError(u'Code 39 cannot encode %r.' %codestring)
+    check = code39_check_char(codestring) if includecheck else ''
+    builder = LinearBuilder()
+    for i, c in enumerate('*'+codestring+check+'*'):
+        if i:
+            builder.add([1], height)
+        builder.add([ratio if e=='w' else 1
+                     for e in CODE39_PATTERNS[CODE39_CHARS.index(c)]], height)
+    if includetext:
+        if text is not None:
+            builder.add_text(text, 0, textyoffset, textsize)
+        else:
+            shown = codestring+(check if includecheckintext else '')
+            if not hidestars:
+                shown = '*'+shown+'*'
+            start = -1 if hidestars else 0
+            for i, c in enumerate(shown):
+                builder.add_text(c, (ratio*3+7)*(i-start), textyoffset, textsize)
+    return builder.geometry()
+
+
+def code39_options(renderer):
+    """Collects options of Code 39 native encoders from renderer.
+    """
+    return dict(
+        includecheck=bool(renderer.lookup_option('includecheck')),
+        includetext=bool(renderer.lookup_option('includetext')),
+        includecheckintext=bool(renderer.lookup_option('includecheckintext')),
+        hidestars=bool(renderer.lookup_option('hidestars')),
+        height=renderer.lookup_option('height') or 1.0,
+        textsize=renderer.lookup_option('textsize') or 10,
+        textyoffset=renderer.lookup_option('textyoffset', -7))
+
+
 class Code39(Barcode):
     """
     >>> bc = Code39()
@@ -84,6 +176,32 @@ class Code39(Barcode):
             params['bbox'] = "%d %d %d %d" %self._boundingbox(cbbox, tbbox)
             return params
 
+        def native_encode(self, codestring):
+            return encode_code39(codestring, **code39_options(self))
+
+    renderer = _Renderer
+
+
+class Code39Ext(Barcode):
+    """Code 39 Extended encodes full ASCII as pairs of Code 39 characters.
+
+    >>> g = Code39Ext().get_renderer(None).encode('Code39!')
+    >>> g == encode_code39('C+O+D+E39/A')
+    True
+    """
+    codetype = 'code39ext'
+    aliases = ('code39 extended', 'code_39_extended', 'code-39-extended')
+
+    class _Renderer(Code39._Renderer):
+        def _codelen(self, codestring):
+            return super(Code39Ext._Renderer, self)._codelen(
+                code39_full_ascii(codestring))
+
+        def native_encode(self, codestring):
+            options = code39_options(self)
+            options['text'] = codestring
+            return encode_code39(code39_full_ascii(codestring), **options)
+
     renderer = _Renderer
 
 
@@ -1,10 +1,96 @@
 # coding: utf-8
 import re
 from base import Barcode, LinearCodeRenderer, DPI
+from linear import widths, LinearBuilder
+from code39 import CODE39EXT_CHARS
 
 
 CODE93_ESCAPE_RE = re.compile(r'\^\d{3}')
 CODE93_CHARS ="0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ-. $/+%*"
+# widths of the 43 characters, the shifts ($) (%) (/) (+) and start/stop
+CODE93_PATTERNS = (
+    '131112 111213 111312 111411 121113 121212 121311 111114 131211 141111 '
+    '211113 211212 211311 221112 221211 231111 112113 112212 112311 122112 '
+    '132111 111123 111222 111321 121122 131121 212112 212211 211122 211221 '
+    '221121 222111 112122 112221 122121 123111 121131 311112 311211 321111 '
+    '112131 113121 211131 121221 312111 311121 122211 111141').split()
+CODE93_SHIFTS = '$%/+'
+CODE93_START_STOP = 47
+
+
+def code93_values(codestring, extended=False):
+    """Returns values of characters of codestring; extended encodes
+    full ASCII with shift characters.
+
+    >>> code93_values('A-1')
+    [10, 36, 1]
+    >>> code93_values('a$', extended=True)
+    [46, 10, 39]
+    """
+    values = []
+    for c in codestring:
+        if extended and c not in CODE93_CHARS[:43]:
+            if ord(c)>127:
+                raise ValueError(u'Code 93 Extended takes ASCII only, got %r.'
+                                 %codestring)
+            shift, c = CODE39EXT_CHARS[ord(c)]
+            values.append(43+CODE93_SHIFTS.index(shift))
+        if c=='*' or c not in CODE93_CHARS:
+            raise ValueError(u'Code 93 cannot encode %r.' %codestring)
+        values.append(CODE93_CHARS.index(c))
+    return values
+
+
+def code93_check_values(values):
+    """Returns the C and K check values of values.
+
+    >>> code93_check_values(code93_values('TEST93'))
+    [41, 6]
+    """
+    checks = []
+    for max_weight in (20, 15):
+        total = sum(v*(i%max_weight+1) for i, v in enumerate(reversed(values+checks)))
+        checks.append(total%47)
+    return checks
+
+
+def encode_code93(codestring, includecheck=False, includetext=False,
+                  extended=False, height=1.0, textsize=10, textyoffset=-7):
+    """Encodes codestring into LinearGeometry of a Code 93 symbol.
+
+    includecheck appends the C and K check characters.
+
+    >>> g = encode_code93('TEST93', includecheck=True, includetext=True)
+    >>> g.width, len(g.bhs), g.text[0][:2]
+    (91.0, 31, ('T', 9))
+    """
+    values = code93_values(codestring, extended)
+    if includecheck:
+        values += code93_check_values(values)
+    builder = LinearBuilder()
+    for value in [CODE93_START_STOP]+values+[CODE93_START_STOP]:
+        builder.add(widths(CODE93_PATTERNS[value]), height)
+    builder.add([1], height)
+    if includetext:
+        if extended:
+            builder.add_text(codestring, 9, textyoffset, textsize)
+        else:
+            for i, c in enumerate(codestring):
+                builder.add_text(c, 9*(i+1), textyoffset, textsize)
+    return builder.geometry()
+
+
+def code93_options(renderer):
+    """Collects options of Code 93 native encoders from renderer.
+    """
+    return dict(
+        includecheck=bool(renderer.lookup_option('includecheck')),
+        includetext=bool(renderer.lookup_option('includetext')),
+        height=renderer.lookup_option('height') or 1.0,
+        textsize=renderer.lookup_option('textsize') or 10,
+        textyoffset=renderer.lookup_option('textyoffset', -7))
+
+
 class Code93(Barcode):
     """
     >>> bc = Code93()
@@ -83,6 +169,30 @@ class Code93(Barcode):
             params['bbox'] = "%d %d %d %d" %self._boundingbox(cbbox, tbbox)
             return params
 
+        def native_encode(self, codestring):
+            return encode_code93(codestring, **code93_options(self))
+
+    renderer = _Renderer
+
+
+class Code93Ext(Barcode):
+    """Code 93 Extended encodes full ASCII with shift characters.
+
+    >>> g = Code93Ext().get_renderer(None).encode('Code93')
+    >>> g.width
+    100.0
+    """
+    codetype = 'code93ext'
+    aliases = ('code93 extended', 'code_93_extended', 'code-93-extended')
+
+    class _Renderer(Code93._Renderer):
+        def _codelen(self, codestring):
+            return super(Code93Ext._Renderer, self)._codelen(
+                code93_values(codestring, extended=True))
+
+        def native_encode(self, codestring):
+            return encode_code93(codestring, extended=True, **code93_options(self))
+
     renderer = _Renderer
 
 
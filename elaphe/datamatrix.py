@@ -1,6 +1,8 @@
 # coding: utf-8
-import itertools
+import itertools, re
 from base import Barcode, MatrixCodeRenderer, DPI
+from geometry import MatrixGeometry
+from reedsolomon import get_field, rs_generator, rs_encode
 from util import cap_unescape
 
 metrics = (
@@ -19,16 +21,16 @@ metrics = (
     [ 40,  40,    2,    2,   48,  1],
     [ 44,  44,    2,    2,   56,  1],
     [ 48,  48,    2,    2,   68,  1],
-    [ 52,  52,    2,    2,   84,  1],
-    [ 64,  64,    4,    4,  112,  1],
-    [ 72,  72,    4,    4,  144,  1],
-    [ 80,  80,    4,    4,  192,  1],
-    [ 88,  88,    4,    4,  224,  1],
-    [ 96,  96,    4,    4,  272,  1],
-    [104, 104,    4,    4,  336,  1],
-    [120, 120,    6,    6,  408,  1],
-    [132, 132,    6,    6,  496,  1],
-    [144, 144,    6,    6,  620,  1],
+    [ 52,  52,    2,    2,   84,  2],
+    [ 64,  64,    4,    4,  112,  2],
+    [ 72,  72,    4,    4,  144,  4],
+    [ 80,  80,    4,    4,  192,  4],
+    [ 88,  88,    4,    4,  224,  4],
+    [ 96,  96,    4,    4,  272,  4],
+    [104, 104,    4,    4,  336,  6],
+    [120, 120,    6,    6,  408,  6],
+    [132, 132,    6,    6,  496,  8],
+    [144, 144,    6,    6,  620, 10],
     [  8,  18,    1,    1,    7,  1],
     [  8,  32,    1,    2,   11,  1],
     [ 12,  26,    1,    1,   14,  1],
@@ -38,6 +40,674 @@ metrics = (
     )
 
 
+DM_FIELD = 0x12D
+# encodation modes
+ASCII, C40, TEXT, X12, EDIFACT, BASE256 = range(6)
+DM_MODES = dict(ascii=ASCII, c40=C40, text=TEXT, x12=X12)
+LATCH_CODEWORDS = (None, 230, 239, 238, 240, 231)
+UNLATCH, PAD, UPPER_SHIFT, FNC1 = 254, 129, 235, 232
+PREFIX_CODEWORDS = dict(FNC1=[232], PROG=[234], MAC5=[236], MAC6=[237])
+FNC1_RE = re.compile(r'\^FNC1')
+# modules of a codeword: (row, column) offsets of bits 1 (MSB) to 8
+_UTAH = [(-2, -2), (-2, -1), (-1, -2), (-1, -1), (-1, 0), (0, -2), (0, -1), (0, 0)]
+DARK, LIGHT = -1, -2
+# search states beyond the modes: C40 and Text with one or two values
+# waiting for their triplet, and the mode of each state
+_PENDING = {(C40, 1): 6, (C40, 2): 7, (TEXT, 1): 8, (TEXT, 2): 9}
+_STATE_MODES = (ASCII, C40, TEXT, X12, EDIFACT, BASE256, C40, C40, TEXT, TEXT)
+_INFINITY = 1<<62
+
+
+def datamatrix_metric(count, rows=0, columns=0):
+    """Returns the first entry of metrics holding count data codewords,
+    restricted to rows and columns if given.
+
+    >>> datamatrix_metric(3), datamatrix_metric(3, 16, 48)
+    ([10, 10, 1, 1, 5, 1], [16, 48, 1, 2, 28, 1])
+    """
+    for metric in metrics:
+        if rows and rows!=metric[0] or columns and columns!=metric[1]:
+            continue
+        if count<=data_capacity(metric):
+            return metric
+    raise ValueError(u'Data Matrix data does not fit in any symbol size.')
+
+
+def data_capacity(metric):
+    """Returns the number of data codewords of metric.
+
+    >>> data_capacity(metrics[0]), data_capacity(metrics[-1])
+    (3, 49)
+    """
+    rows, cols, regh, regv, rscw, rsbl = metric
+    return (rows-2*regh)*(cols-2*regv)//8-rscw
+
+
+def datamatrix_items(codestring, parsefnc=False):
+    """Converts codestring into ordinals of its characters; with parsefnc,
+    ^FNC1 escapes become 'FNC1' items.
+
+    >>> datamatrix_items('A^FNC1B', parsefnc=True)
+    [65, 'FNC1', 66]
+    """
+    items = []
+    parts = FNC1_RE.split(codestring) if parsefnc else [codestring]
+    for i, part in enumerate(parts):
+        if i:
+            items.append('FNC1')
+        items.extend(ord(c) for c in part)
+    return items
+
+
+def _digit(c):
+    return c!='FNC1' and 48<=c<=57
+
+def _extended(c):
+    return c!='FNC1' and c>127
+
+def _native_c40(c):
+    return c==32 or _digit(c) or c!='FNC1' and 65<=c<=90
+
+def _native_text(c):
+    return c==32 or _digit(c) or c!='FNC1' and 97<=c<=122
+
+def _native_x12(c):
+    return c in (13, 42, 62) or _native_c40(c)
+
+def _native_edifact(c):
+    return c!='FNC1' and 32<=c<=94
+
+
+def c40_values(c, text=False):
+    """Returns the C40 (or Text) values of item c, shifts included.
+
+    >>> c40_values(65), c40_values(97), c40_values(97, text=True)
+    ([14], [2, 1], [14])
+    >>> c40_values(200), c40_values('FNC1')
+    ([1, 30, 21], [1, 27])
+    """
+    if c=='FNC1':
+        return [1, 27]
+    if c>127:
+        return [1, 30]+c40_values(c-128, text)
+    if c==32:
+        return [3]
+    if 48<=c<=57:
+        return [c-44]
+    if text:
+        if 97<=c<=122:
+            return [c-83]
+        if 65<=c<=90 or c==96 or c>=123:
+            return [2, c-64 if c<=90 else c-96]
+    elif 65<=c<=90:
+        return [c-51]
+    elif c>=96:
+        return [2, c-96]
+    if c<32:
+        return [0, c]
+    return [1, c-33 if c<=47 else (c-43 if c<=64 else c-69)]
+
+
+def x12_value(c):
+    """Returns the X12 value of item c.
+
+    >>> x12_value(13), x12_value(32), x12_value(48), x12_value(65)
+    (0, 3, 4, 14)
+    """
+    if not _native_x12(c):
+        raise ValueError(u'X12 cannot encode %r.' %(chr(c) if c!='FNC1' else c))
+    if c in (13, 42, 62):
+        return (13, 42, 62).index(c)
+    return c40_values(c)[0]
+
+
+def triplet_codewords(values):
+    """Packs C40, Text or X12 values, a multiple of three of them, into
+    codewords.
+
+    >>> triplet_codewords([14, 15, 16])
+    [89, 233]
+    """
+    codewords = []
+    for i in range(0, len(values), 3):
+        value = 1600*values[i]+40*values[i+1]+values[i+2]+1
+        codewords.extend((value>>8, value & 0xFF))
+    return codewords
+
+
+def edifact_codewords(values):
+    """Packs up to four EDIFACT values into codewords; fewer than four
+    leave out the codewords they do not reach.
+
+    >>> edifact_codewords([1, 2, 3, 4]), edifact_codewords([31])
+    ([4, 32, 196], [124])
+    """
+    padded = values+[0]*(4-len(values))
+    value = padded[0]<<18 | padded[1]<<12 | padded[2]<<6 | padded[3]
+    return [value>>16, value>>8 & 0xFF, value & 0xFF][:min(len(values), 3)]
+
+
+def _randomize_255(value, position):
+    pseudo = (149*position)%255+1
+    return (value+pseudo)%256
+
+
+def _randomize_253(value, position):
+    value += (149*position)%253+1
+    return value if value<=254 else value-254
+
+
+class _Encodation(object):
+    """Encodation of items into data codewords in a single mode.
+
+    Each mode method encodes from self.pos on and returns the mode to
+    continue with; capacity is the data capacity of the smallest
+    candidate symbol holding what is encoded so far.  Characters left at
+    the end of data go to ASCII.
+    """
+    def __init__(self, items, codewords, capacities):
+        self.items, self.pos = items, 0
+        self.codewords = list(codewords)
+        self.capacities, self.capacity = capacities, None
+
+    def more(self):
+        return self.pos<len(self.items)
+
+    def update_capacity(self, count):
+        if self.capacity is None or count>self.capacity:
+            self.capacity = _capacity(self.capacities, count)
+
+    def available(self, count):
+        """Returns the capacity left beyond count codewords."""
+        self.update_capacity(count)
+        return self.capacity-count
+
+    def encode(self, mode=ASCII):
+        if mode!=ASCII and self.more():
+            self.codewords.append(LATCH_CODEWORDS[mode])
+        methods = {ASCII: self.ascii, C40: self.c40, TEXT: self.text, X12: self.x12}
+        while self.more():
+            mode = methods[mode]()
+        return self.codewords
+
+    def ascii(self):
+        items, pos = self.items, self.pos
+        size = 2 if pos+1<len(items) and _digit(items[pos]) and _digit(items[pos+1]) else 1
+        self.codewords.extend(ascii_codewords(items[pos:pos+size]))
+        self.pos += size
+        return ASCII
+
+    def c40(self, mode=C40):
+        values, sizes = [], []
+        while self.more():
+            sizes.append(len(c40_values(self.items[self.pos], mode==TEXT)))
+            values.extend(c40_values(self.items[self.pos], mode==TEXT))
+            self.pos += 1
+            available = self.available(len(self.codewords)+len(values)//3*2)
+            if not self.more():
+                # avoid a single value in the last triplet
+                if len(values)%3==2 and available!=2:
+                    self._c40_backtrack(values, sizes)
+                while len(values)%3==1 and (sizes and sizes[-1]>3 or available!=1):
+                    self._c40_backtrack(values, sizes)
+                break
+        self._c40_end(values, sizes)
+        return ASCII
+
+    def text(self):
+        return self.c40(TEXT)
+
+    def _c40_backtrack(self, values, sizes):
+        del values[len(values)-sizes.pop():]
+        self.pos -= 1
+        self.capacity = None
+
+    def _c40_end(self, values, sizes):
+        rest = len(values)%3
+        count = len(self.codewords)+len(values)//3*2
+        available = self.available(count)
+        if rest==1 and available==1 and sizes[-1]==1 and not self.more():
+            # the last character goes in ASCII, unlatching implicitly
+            self.codewords.extend(triplet_codewords(values[:-1]))
+            self.pos -= 1
+            return
+        if rest==2:
+            # a Shift 1 fills the last triplet
+            values.append(0)
+        while len(values)%3:
+            self._c40_backtrack(values, sizes)
+        self.codewords.extend(triplet_codewords(values))
+        if self.more() or self.available(len(self.codewords))>0:
+            self.codewords.append(UNLATCH)
+
+    def x12(self):
+        values = []
+        while self.more():
+            values.append(x12_value(self.items[self.pos]))
+            self.pos += 1
+            if len(values)==3:
+                self.codewords.extend(triplet_codewords(values))
+                values = []
+        available = self.available(len(self.codewords))
+        self.pos -= len(values)
+        remaining = len(self.items)-self.pos
+        if remaining>1 or available>1 or remaining!=available:
+            self.codewords.append(UNLATCH)
+        return ASCII
+
+
+def _capacity(capacities, count):
+    # the first of capacities holding count codewords
+    for capacity in capacities:
+        if count<=capacity:
+            return capacity
+    raise ValueError(u'Data Matrix data does not fit in any symbol size.')
+
+
+def ascii_codewords(items):
+    """Returns the ASCII codewords of items, digits paired.
+
+    >>> ascii_codewords([49, 50, 51, 200, 'FNC1'])
+    [142, 52, 235, 73, 232]
+    """
+    codewords, i = [], 0
+    while i<len(items):
+        c = items[i]
+        if i+1<len(items) and _digit(c) and _digit(items[i+1]):
+            codewords.append(130+10*(c-48)+items[i+1]-48)
+            i += 2
+            continue
+        if c=='FNC1':
+            codewords.append(FNC1)
+        elif c>127:
+            codewords.extend((UPPER_SHIFT, c-127))
+        else:
+            codewords.append(c+1)
+        i += 1
+    return codewords
+
+
+def _shortest_encodation(items, count):
+    """Returns the cost and the steps of the encodation of items in the
+    fewest data codewords, count codewords preceding them.
+
+    The search runs over positions and modes, C40 and Text states also
+    telling how many values wait for their triplet; steps encode single
+    characters, whole X12 triplets and EDIFACT quadruplets.  End of data
+    steps are costed so that a symbol fits them if and only if its
+    capacity is at least the cost, implied unlatches included.
+    Steps are (start, end, mode, kind) tuples, kind being 'latch' (into
+    mode), 'data', 'unlatch' (from mode, with the EDIFACT values left) or,
+    last, 'end', 'pad' (a Shift 1 filling the last C40 or Text triplet)
+    or 'ascii' (the rest of data in ASCII, unlatching implicitly if the
+    symbol allows).
+    """
+    n = len(items)
+    states = len(_STATE_MODES)
+    costs = [[_INFINITY]*states for i in range(n+1)]
+    steps = [[None]*states for i in range(n+1)]
+    # lengths of the open Base 256 segments, whose header grows at 250
+    segments = [0]*(n+1)
+    costs[0][ASCII] = count
+    ends = []
+
+    def relax(end, mode, cost, step):
+        if cost<costs[end][mode]:
+            costs[end][mode] = cost
+            steps[end][mode] = step
+            return True
+        return False
+
+    for i in range(n+1):
+        cost = costs[i]
+        for mode in (C40, TEXT, X12, EDIFACT):
+            relax(i, ASCII, cost[mode]+1, (i, mode, 'unlatch'))
+        relax(i, ASCII, cost[BASE256], (i, BASE256, 'unlatch'))
+        for mode in (C40, TEXT, X12, EDIFACT):
+            relax(i, mode, cost[ASCII]+1, (i, ASCII, 'latch'))
+        # the latch and the length of a Base 256 segment
+        if relax(i, BASE256, cost[ASCII]+2, (i, ASCII, 'latch')):
+            segments[i] = 0
+        if i==n:
+            ends.extend((cost[mode], (i, mode, 'end')) for mode in range(6))
+            ends.extend((cost[_PENDING[mode, 2]]+2, (i, _PENDING[mode, 2], 'pad'))
+                        for mode in (C40, TEXT))
+            break
+        if n-i<=4:
+            tail = len(ascii_codewords(items[i:]))
+            if tail==1:
+                ends.extend((cost[mode]+1, (i, mode, 'ascii')) for mode in (C40, TEXT, X12))
+            if tail<=2 and all(_native_edifact(c) or c!='FNC1' and c<128 for c in items[i:]):
+                ends.append((cost[EDIFACT]+tail, (i, EDIFACT, 'ascii')))
+        c = items[i]
+        if i+1<n and _digit(c) and _digit(items[i+1]):
+            relax(i+2, ASCII, cost[ASCII]+1, (i, ASCII, 'data'))
+        relax(i+1, ASCII, cost[ASCII]+(2 if _extended(c) else 1), (i, ASCII, 'data'))
+        for mode in (C40, TEXT):
+            size = len(c40_values(c, mode==TEXT))
+            for waiting in range(3):
+                state = _PENDING.get((mode, waiting), mode)
+                total = waiting+size
+                relax(i+1, _PENDING.get((mode, total%3), mode),
+                      cost[state]+total//3*2, (i, state, 'data'))
+        if i+3<=n and all(_native_x12(c) for c in items[i:i+3]):
+            relax(i+3, X12, cost[X12]+2, (i, X12, 'data'))
+        native = 0
+        while native<4 and i+native<n and _native_edifact(items[i+native]):
+            native += 1
+        if native==4:
+            relax(i+4, EDIFACT, cost[EDIFACT]+3, (i, EDIFACT, 'data'))
+        for size in range(1, min(native, 3)+1):
+            relax(i+size, ASCII, cost[EDIFACT]+len(edifact_codewords([0]*(size+1))),
+                  (i, EDIFACT, 'unlatch'))
+        if c!='FNC1' and segments[i]<1555:
+            if relax(i+1, BASE256, cost[BASE256]+(2 if segments[i]==249 else 1),
+                     (i, BASE256, 'data')):
+                segments[i+1] = segments[i]+1
+    cost, (i, mode, kind) = min(ends, key=lambda end: end[0])
+    path = [(i, n, _STATE_MODES[mode], kind)]
+    while steps[i][mode] is not None:
+        start, previous, kind = steps[i][mode]
+        if kind=='latch':
+            path.append((i, i, mode, kind))
+        else:
+            path.append((start, i, _STATE_MODES[previous], kind))
+        i, mode = start, previous
+    path.reverse()
+    return cost, path
+
+
+def _encode_shortest(items, prefix, capacities):
+    """Encodes items along _shortest_encodation() into the smallest
+    candidate symbol.
+    """
+    cost, path = _shortest_encodation(items, len(prefix))
+    capacity = _capacity(capacities, cost)
+    codewords = list(prefix)
+    segment, values = None, []
+
+    def end_segment(last):
+        data = codewords[segment:]
+        if last and segment+1+len(data)==capacity:
+            # the segment runs to the end of the symbol
+            header = [0]
+        elif len(data)<=249:
+            header = [len(data)]
+        else:
+            header = [len(data)//250+249, len(data)%250]
+        codewords[segment:] = [_randomize_255(c, segment+k+1)
+                               for k, c in enumerate(header+data)]
+
+    def unlatch(mode, values=()):
+        if mode==EDIFACT:
+            codewords.extend(edifact_codewords(list(values)+[31]))
+        else:
+            codewords.append(UNLATCH)
+
+    for start, end, mode, kind in path:
+        chunk = items[start:end]
+        if kind=='latch':
+            codewords.append(LATCH_CODEWORDS[mode])
+            if mode==BASE256:
+                segment = len(codewords)
+        elif kind=='data':
+            if mode==ASCII:
+                codewords.extend(ascii_codewords(chunk))
+            elif mode in (C40, TEXT):
+                values.extend(c40_values(chunk[0], mode==TEXT))
+                codewords.extend(triplet_codewords(values[:len(values)//3*3]))
+                del values[:len(values)//3*3]
+            elif mode==X12:
+                codewords.extend(triplet_codewords(map(x12_value, chunk)))
+            elif mode==EDIFACT:
+                codewords.extend(edifact_codewords([c & 0x3F for c in chunk]))
+            else:
+                codewords.extend(chunk)
+        elif kind=='unlatch':
+            if mode==BASE256:
+                end_segment(end==len(items))
+            else:
+                unlatch(mode, [c & 0x3F for c in chunk])
+        elif kind=='pad':
+            codewords.extend(triplet_codewords(values+[0]))
+            if len(codewords)<capacity:
+                codewords.append(UNLATCH)
+        elif kind=='ascii':
+            tail = ascii_codewords(chunk)
+            room = capacity-len(codewords)
+            if not (room<=2 if mode==EDIFACT else room==len(tail)):
+                unlatch(mode)
+            codewords.extend(tail)
+        elif mode==BASE256:
+            end_segment(True)
+        elif mode!=ASCII and len(codewords)<capacity-(2 if mode==EDIFACT else 0):
+            # decoders read the last two codewords after EDIFACT as ASCII
+            unlatch(mode)
+    return codewords
+
+
+def datamatrix_codewords(items, encoding=None, prefix=(), capacities=None):
+    """Returns data codewords of items, prefix codewords first.
+
+    Without encoding, items are encoded in the fewest codewords,
+    switching between the ASCII, C40, Text, X12, EDIFACT and Base 256
+    modes; 'ascii', 'c40', 'text' and 'x12' keep to one mode, as in
+    BWIPP, save for characters left to ASCII at the end of data.
+    capacities are data capacities of candidate symbols in the order
+    datamatrix_metric() tries them; they settle how encodation ends.
+
+    >>> datamatrix_codewords(map(ord, '123456'))
+    [142, 164, 186]
+    >>> datamatrix_codewords(map(ord, 'ABCDEFGHIJKL'))
+    [230, 89, 233, 109, 36, 128, 95, 147, 154, 254]
+    >>> datamatrix_codewords(map(ord, 'A@B@C@D@E@F@G@H@'))
+    [240, 4, 0, 128, 12, 1, 0, 20, 1, 128, 28, 2, 0, 124]
+    >>> datamatrix_codewords([0xE9]*6)
+    [231, 44, 170, 64, 213, 107, 1, 150]
+    >>> datamatrix_codewords(map(ord, 'abcd'), encoding='text')
+    [239, 89, 233, 254, 101]
+    >>> datamatrix_codewords(['FNC1']+map(ord, '01'), prefix=[234])
+    [234, 232, 131]
+    """
+    prefix = list(prefix)
+    if capacities is None:
+        capacities = [data_capacity(metric) for metric in metrics]
+    if not encoding or encoding=='auto':
+        return _encode_shortest(items, prefix, capacities)
+    mode = DM_MODES.get(encoding)
+    if mode is None:
+        raise ValueError(u'Invalid Data Matrix encoding (%s).' %encoding)
+    return _Encodation(items, prefix, capacities).encode(mode)
+
+
+def pad_codewords(codewords, capacity):
+    """Fills data codewords up to capacity with pad codewords, all but
+    the first randomized.
+
+    >>> pad_codewords([66], 5)
+    [66, 129, 70, 220, 115]
+    """
+    codewords = list(codewords)
+    if len(codewords)<capacity:
+        codewords.append(PAD)
+    while len(codewords)<capacity:
+        codewords.append(_randomize_253(PAD, len(codewords)+1))
+    return codewords
+
+
+def datamatrix_ecc(codewords, metric):
+    """Appends interleaved Reed-Solomon codewords to the data codewords
+    of metric.
+
+    >>> datamatrix_ecc([142, 164, 186], metrics[0])
+    [142, 164, 186, 114, 25, 5, 88, 102]
+    """
+    rsbl, rscw = metric[5], metric[4]
+    field = get_field(DM_FIELD)
+    generator = rs_generator(field, rscw//rsbl)
+    blocks = [rs_encode(field, codewords[i::rsbl], generator) for i in range(rsbl)]
+    if rsbl==10:
+        # 144x144 symbols start with the two shorter blocks
+        blocks = blocks[8:]+blocks[:8]
+    return codewords+[blocks[i%rsbl][i//rsbl] for i in range(rscw)]
+
+
+def datamatrix_placement(nrow, ncol):
+    """Returns the module placement of ISO/IEC 16022 Annex F: for each
+    module of the nrow by ncol mapping matrix, row by row, the index of
+    its bit (eight per codeword, MSB first), or DARK or LIGHT.
+
+    >>> datamatrix_placement(8, 8)[:8]
+    [8, 9, 21, 22, 23, 26, 27, 28]
+    """
+    placement = [None]*(nrow*ncol)
+
+    def module(row, col, bit):
+        if row<0:
+            row += nrow
+            col += 4-((nrow+4)%8)
+        if col<0:
+            col += ncol
+            row += 4-((ncol+4)%8)
+        placement[row*ncol+col] = bit
+
+    def modules(positions, chr_):
+        for bit, (row, col) in enumerate(positions):
+            module(row, col, chr_*8+bit)
+
+    def utah(row, col, chr_):
+        modules([(row+r, col+c) for r, c in _UTAH], chr_)
+
+    corners = [
+        [(nrow-1, 0), (nrow-1, 1), (nrow-1, 2), (0, ncol-2), (0, ncol-1),
+         (1, ncol-1), (2, ncol-1), (3, ncol-1)],
+        [(nrow-3, 0), (nrow-2, 0), (nrow-1, 0), (0, ncol-4), (0, ncol-3),
+         (0, ncol-2), (0, ncol-1), (1, ncol-1)],
+        [(nrow-3, 0), (nrow-2, 0), (nrow-1, 0), (0, ncol-2), (0, ncol-1),
+         (1, ncol-1), (2, ncol-1), (3, ncol-1)],
+        [(nrow-1, 0), (nrow-1, ncol-1), (0, ncol-3), (0, ncol-2), (0, ncol-1),
+         (1, ncol-3), (1, ncol-2), (1, ncol-1)]]
+    chr_, row, col = 0, 4, 0
+    while True:
+        if row==nrow and col==0:
+            modules(corners[0], chr_)
+            chr_ += 1
+        if row==nrow-2 and col==0 and ncol%4:
+            modules(corners[1], chr_)
+            chr_ += 1
+        if row==nrow-2 and col==0 and ncol%8==4:
+            modules(corners[2], chr_)
+            chr_ += 1
+        if row==nrow+4 and col==2 and not ncol%8:
+            modules(corners[3], chr_)
+            chr_ += 1
+        # sweep upward diagonally
+        while True:
+            if row<nrow and col>=0 and placement[row*ncol+col] is None:
+                utah(row, col, chr_)
+                chr_ += 1
+            row -= 2
+            col += 2
+            if row<0 or col>=ncol:
+                break
+        row += 1
+        col += 3
+        # sweep downward diagonally
+        while True:
+            if row>=0 and col<ncol and placement[row*ncol+col] is None:
+                utah(row, col, chr_)
+                chr_ += 1
+            row += 2
+            col -= 2
+            if row>=nrow or col<0:
+                break
+        row += 3
+        col += 1
+        if row>=nrow and col>=ncol:
+            break
+    if placement[-1] is None:
+        placement[-1] = placement[-ncol-2] = DARK
+        placement[-2] = placement[-ncol-1] = LIGHT
+    return placement
+
+
+_layouts = {}
+
+def datamatrix_layout(metric):
+    """Returns the modules of the symbol of metric, row by row from the
+    top: bit indexes of codewords, or DARK or LIGHT for finder and
+    alignment patterns.  Layouts are cached per size.
+
+    >>> layout = datamatrix_layout(metrics[0])
+    >>> layout[:10] == [DARK, LIGHT]*5, layout[-10:] == [DARK]*10
+    (True, True)
+    """
+    key = tuple(metric[:4])
+    layout = _layouts.get(key)
+    if layout is None:
+        rows, cols, regh, regv = key
+        mrows, mcols = rows-2*regh, cols-2*regv
+        rrows, rcols = mrows//regh, mcols//regv
+        placement = iter(datamatrix_placement(mrows, mcols))
+        mapping = [[next(placement) for j in range(mcols)] for i in range(mrows)]
+        layout = []
+        for i in range(rows):
+            if i%(rrows+2)==0:
+                layout.extend([DARK, LIGHT][j%2] for j in range(cols))
+            elif i%(rrows+2)==rrows+1:
+                layout.extend([DARK]*cols)
+            else:
+                region_row = mapping[i//(rrows+2)*rrows+i%(rrows+2)-1]
+                for j in range(cols):
+                    if j%(rcols+2)==0:
+                        layout.append(DARK)
+                    elif j%(rcols+2)==rcols+1:
+                        layout.append(DARK if i%2 else LIGHT)
+                    else:
+                        layout.append(region_row[j//(rcols+2)*rcols+j%(rcols+2)-1])
+        _layouts[key] = layout
+    return layout
+
+
+def encode_datamatrix(codestring, rows=0, columns=0, encoding=None, prefix='',
+                      raw=False, parse=False, parsefnc=False):
+    """Encodes codestring into MatrixGeometry of a Data Matrix ECC200
+    symbol, the smallest one fitting unless rows and columns are given.
+
+    raw (or the raw encoding) takes codestring as ^NNN data codewords.
+
+    >>> g = encode_datamatrix('123456')
+    >>> g.pixx, g.pixy, g.rows()[0], round(g.width*72)
+    (10, 10, [1, 0, 1, 0, 1, 0, 1, 0, 1, 0], 20.0)
+    >>> g = encode_datamatrix('Rectangular', rows=16, columns=48)
+    >>> g.pixx, g.pixy
+    (48, 16)
+    >>> [encode_datamatrix('This is Data Matrix', encoding=encoding).pixx
+    ...  for encoding in (None, 'ascii', 'c40')]
+    [18, 20, 22]
+    >>> [encode_datamatrix(s).pixx for s in (
+    ...     'DA35>C4I2DG219\\r', 'bb(B2*3BA x hccntmWY15YE5KUN12185339')]
+    [16, 22]
+    """
+    if parse:
+        codestring = cap_unescape(codestring)
+    prefix = PREFIX_CODEWORDS.get(prefix, [])
+    candidates = [metric for metric in metrics
+                  if not (rows and rows!=metric[0] or columns and columns!=metric[1])]
+    if raw or encoding=='raw':
+        codewords = prefix+[int(n) for n in re.findall(r'\^(\d{3})', codestring)]
+    else:
+        codewords = datamatrix_codewords(
+            datamatrix_items(codestring, parsefnc), encoding, prefix,
+            [data_capacity(metric) for metric in candidates])
+    metric = datamatrix_metric(len(codewords), rows, columns)
+    codewords = datamatrix_ecc(pad_codewords(codewords, data_capacity(metric)), metric)
+    values = [cw>>(7-bit) & 1 for cw in codewords for bit in range(8)]+[0, 1]
+    pixs = [values[index] for index in datamatrix_layout(metric)]
+    return MatrixGeometry(pixs, metric[1], metric[0],
+                          metric[1]*2/72.0, metric[0]*2/72.0)
+
+
 class DataMatrix(Barcode):
     """
     >>> bc = DataMatrix()
@@ -76,13 +746,16 @@ class DataMatrix(Barcode):
     ...     options=dict(raw=True)) # doctest: +ELLIPSIS
     <PIL.EpsImagePlugin.EpsImageFile ... at ...>
     >>> # _.show()
+    >>> g = bc.encode('Rectangular', options=dict(rows=12, columns=36))
+    >>> g.pixx, g.pixy
+    (36, 12)
     """
     codetype = 'datamatrix'
     aliases = ('data matrix', 'data-matrix', 'data_matrix')
     class _Renderer(MatrixCodeRenderer):
         default_options = dict(
             MatrixCodeRenderer.default_options,
-            rows=0, columns=0, prefix='', encoding='ascii', raw=False, parse=False,
+            rows=0, columns=0, prefix='', encoding=None, raw=False, parse=False,
             parsefnc=False)
 
         def _code_bbox(self, codestring):
@@ -90,6 +763,8 @@ class DataMatrix(Barcode):
             columns = self.lookup_option('columns')
             prefix = self.lookup_option('prefix')
             encoding = self.lookup_option('encoding')
+            if encoding in (None, 'auto'):
+                encoding = 'ascii'
             raw = self.lookup_option('raw')
             parse = self.lookup_option('parse')
             parsefnc = self.lookup_option('parse')
@@ -221,6 +896,14 @@ class DataMatrix(Barcode):
             params['bbox'] = '%d %d %d %d' %(self._boundingbox(
                 self._code_bbox(codestring), self._code_bbox(codestring)))
             return params
+
+        def native_encode(self, codestring):
+            return encode_datamatrix(
+                codestring, self.lookup_option('rows'), self.lookup_option('columns'),
+                self.lookup_option('encoding'), self.lookup_option('prefix'),
+                bool(self.lookup_option('raw')), bool(self.lookup_option('parse')),
+                bool(self.lookup_option('parsefnc')))
+
     renderer = _Renderer
 
     
@@ -1,5 +1,271 @@
 # coding: utf-8
 from base import *
+from linear import widths, mod10_check_digit, text_x, LinearBuilder
+
+
+# Widths of digits in L (odd parity) encoding, starting with a space.  R
+# encoding has the same widths starting with a bar; G is L reversed.
+EAN_L = ['3211', '2221', '2122', '1411', '1132',
+         '1231', '1114', '1312', '1213', '3112']
+EAN_PATTERNS = dict(L=EAN_L, R=EAN_L, G=[p[::-1] for p in EAN_L])
+EAN13_PARITIES = ['LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG',
+                  'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL']
+EAN5_PARITIES = ['GGLLL', 'GLGLL', 'GLLGL', 'GLLLG', 'LGGLL',
+                 'LLGGL', 'LLLGG', 'LGLGL', 'LGLLG', 'LLGLG']
+EAN2_PARITIES = ['LL', 'LG', 'GL', 'GG']
+NORMAL_GUARD, CENTER_GUARD = '111', '11111'
+ADDON_START, ADDON_DELINEATOR = '112', '11'
+# inches by which guard bars reach below the digit bars.
+GUARD_EXTENSION = 0.075
+
+
+def split_addon(codestring):
+    """Splits codestring into main part and add-on digits.
+
+    >>> split_addon('977147396801 05')
+    ('977147396801', '05')
+    >>> split_addon('01335583')
+    ('01335583', '')
+    """
+    parts = codestring.split()
+    if len(parts)>2 or not parts:
+        raise ValueError(u'Expected data and an optional add-on: %r' %codestring)
+    return parts[0], (parts[1] if len(parts)==2 else '')
+
+
+def complete_gtin(digits, length):
+    """Appends check digit to length-1 digits, or verifies it.
+
+    >>> complete_gtin('97714739680', 12)
+    '977147396801'
+    >>> complete_gtin('977147396802', 12)
+    Traceback (most recent call last):
+    ...
+    ValueError: Bad check digit in 977147396802.
+    """
+    if not digits.isdigit() or len(digits) not in (length-1, length):
+        raise ValueError(u'Expected %d or %d digits, got %r.'
+                         %(length-1, length, digits))
+    check = str(mod10_check_digit(digits[:length-1]))
+    if len(digits)==length and digits[-1]!=check:
+        raise ValueError(u'Bad check digit in %s.' %digits)
+    return digits[:length-1]+check
+
+
+def ean_options(renderer, height=1.0):
+    """Collects options of EAN/UPC native encoders from renderer.
+    """
+    return dict(
+        height=renderer.lookup_option('height') or height,
+        includetext=renderer.lookup_option('includetext'),
+        textsize=renderer.lookup_option('textsize') or 12,
+        textyoffset=renderer.lookup_option('textyoffset', -4),
+        addongap=renderer.lookup_option('addongap', 12),
+        addontextsize=renderer.lookup_option('addontextsize') or 12)
+
+
+def add_digits(builder, digits, parities, height, bottom, text_y=None, textsize=12):
+    """Appends digits encoded with parities (L, G or R each) to builder,
+    with digit text at text_y if given.
+    """
+    for digit, parity in zip(digits, parities):
+        x = builder.x
+        builder.add(widths(EAN_PATTERNS[parity][int(digit)]), height, bottom)
+        if text_y is not None:
+            builder.add_text(digit, text_x(x, 7, textsize), text_y, textsize)
+
+
+def add_addon(builder, digits, height, bottom=0.0, includetext=False, textsize=12):
+    """Appends EAN-2 or EAN-5 add-on symbol to builder.
+
+    Text goes above the bars, as add-ons carry it.
+    """
+    if len(digits)==2 and digits.isdigit():
+        parities = EAN2_PARITIES[int(digits)%4]
+    elif len(digits)==5 and digits.isdigit():
+        parities = EAN5_PARITIES[(10-mod10_check_digit(digits, (3, 9)))%10]
+    else:
+        raise ValueError(u'Add-on must be 2 or 5 digits, got %r.' %digits)
+    text_y = (bottom+height)*DPI+1 if includetext else None
+    builder.add(widths(ADDON_START), height, bottom)
+    for i, (digit, parity) in enumerate(zip(digits, parities)):
+        if i:
+            builder.add(widths(ADDON_DELINEATOR), height, bottom)
+        add_digits(builder, digit, parity, height, bottom, text_y, textsize)
+
+
+def _add_main_addon(builder, addon, height, includetext, addongap=12,
+                    addontextsize=12, **kw):
+    if addon:
+        builder.add([addongap], 0)
+        bottom = GUARD_EXTENSION
+        addon_height = height-bottom
+        if includetext:
+            addon_height -= addontextsize/DPI
+        add_addon(builder, addon, addon_height, bottom, includetext, addontextsize)
+
+
+def encode_ean13(codestring, height=1.0, includetext=False, textsize=12,
+                 textyoffset=-4, **kw):
+    """Encodes EAN-13 with optional add-on into LinearGeometry.
+
+    >>> g = encode_ean13('977147396801')
+    >>> g.width, len(g.bhs)
+    (95.0, 30)
+    >>> g.sbs[:7].tolist(), g.bbs[:3].tolist()
+    ([1.0, 1.0, 1.0, 1.0, 3.0, 1.0, 2.0], [0.0, 0.0, 0.075])
+    >>> g = encode_ean13('977147396801 05', includetext=True)
+    >>> g.width, len(g.bhs), [t[0] for t in g.text]
+    (127.0, 37, ['9', '7', '7', '1', '4', '7', '3', '9', '6', '8', '0', '1', '2', '0', '5'])
+    """
+    main, addon = split_addon(codestring)
+    digits = complete_gtin(main, 13)
+    guard, digit = (height, 0.0), (height-GUARD_EXTENSION, GUARD_EXTENSION)
+    text_y = textyoffset if includetext else None
+    builder = LinearBuilder()
+    if includetext:
+        builder.add_text(digits[0], -0.6*textsize-1, textyoffset, textsize)
+    builder.add(widths(NORMAL_GUARD), *guard)
+    add_digits(builder, digits[1:7], EAN13_PARITIES[int(digits[0])],
+               *digit, text_y=text_y, textsize=textsize)
+    builder.add(widths(CENTER_GUARD), *guard)
+    add_digits(builder, digits[7:], 'RRRRRR', *digit, text_y=text_y, textsize=textsize)
+    builder.add(widths(NORMAL_GUARD), *guard)
+    _add_main_addon(builder, addon, height, includetext, **kw)
+    return builder.geometry()
+
+
+def encode_ean8(codestring, height=1.0, includetext=False, textsize=12,
+                textyoffset=-4, **kw):
+    """Encodes EAN-8 with optional add-on into LinearGeometry.
+
+    >>> g = encode_ean8('01335583')
+    >>> g.width, len(g.bhs)
+    (67.0, 22)
+    >>> encode_ean8('0133558') == g
+    True
+    """
+    main, addon = split_addon(codestring)
+    digits = complete_gtin(main, 8)
+    guard, digit = (height, 0.0), (height-GUARD_EXTENSION, GUARD_EXTENSION)
+    text_y = textyoffset if includetext else None
+    builder = LinearBuilder()
+    builder.add(widths(NORMAL_GUARD), *guard)
+    add_digits(builder, digits[:4], 'LLLL', *digit, text_y=text_y, textsize=textsize)
+    builder.add(widths(CENTER_GUARD), *guard)
+    add_digits(builder, digits[4:], 'RRRR', *digit, text_y=text_y, textsize=textsize)
+    builder.add(widths(NORMAL_GUARD), *guard)
+    _add_main_addon(builder, addon, height, includetext, **kw)
+    return builder.geometry()
+
+
+def encode_addon(codestring, height=0.7, includetext=False, textsize=12, **kw):
+    """Encodes standalone EAN-2 or EAN-5 symbol into LinearGeometry.
+
+    >>> g = encode_addon('90200')
+    >>> g.width, len(g.bhs)
+    (47.0, 16)
+    >>> encode_addon('05').width
+    20.0
+    """
+    builder = LinearBuilder()
+    add_addon(builder, codestring.strip(), height, 0.0, includetext, textsize)
+    return builder.geometry()
+
+
+def _book_number(codestring, prefixes, name):
+    """Returns (main digits, add-on) of ISBN/ISMN codestring for EAN-13.
+
+    10-character forms are converted to their 13-digit form.
+    """
+    main, addon = split_addon(codestring)
+    chars = [c for c in main.upper() if c not in '- ']
+    if len(chars) in (12, 13) and ''.join(chars[:3]) in prefixes:
+        return ''.join(chars), addon
+    if name=='ISMN' and chars and chars[0]=='M' and len(chars) in (9, 10):
+        return '9790'+''.join(chars[1:9]), addon
+    if name=='ISBN' and len(chars) in (9, 10):
+        return '978'+''.join(chars[:9]), addon
+    raise ValueError(u'Invalid %s: %r' %(name, codestring))
+
+
+def _book_text(name, main, digits):
+    """Returns text above ISBN/ISMN symbols: the 13 digits, hyphenated as
+    in main.
+
+    >>> _book_text('ISBN', '1-56592-479-7', '9781565924796')
+    'ISBN 978-1-56592-479-6'
+    >>> _book_text('ISMN', 'M-2306-7118-7', '9790230671187')
+    'ISMN 979-0-2306-7118-7'
+    """
+    groups = [group for group in main.upper().split('-') if group]
+    length = len(''.join(groups))
+    if length in (10, 13):
+        groups[-1] = groups[-1][:-1]
+        if not groups[-1]:
+            groups.pop()
+    if length in (9, 10):
+        if groups[0].startswith('M'):
+            groups[0] = groups[0][1:] or '0'
+            if groups[0]!='0':
+                groups.insert(0, '0')
+        groups.insert(0, digits[:3])
+    return '%s %s-%s' %(name, '-'.join(groups), digits[-1])
+
+
+def encode_book_number(codestring, name, prefixes, height=1.0, includetext=False,
+                       textsize=12, textyoffset=-4, **kw):
+    """Encodes ISBN or ISMN as EAN-13, with the number above it as text.
+
+    >>> g = encode_isbn('978-1-56592-479', includetext=True)
+    >>> g == encode_isbn('1-56592-479-7', includetext=True), g.text[-1][0]
+    (True, 'ISBN 978-1-56592-479-6')
+    >>> encode_ismn('M-2306-7118-7') == encode_ismn('979-0-2306-7118-7')
+    True
+    """
+    digits, addon = _book_number(codestring, prefixes, name)
+    digits = complete_gtin(digits, 13)
+    main = split_addon(codestring)[0]
+    geometry = encode_ean13(' '.join([digits, addon]), height, includetext,
+                            textsize, textyoffset, **kw)
+    if includetext:
+        geometry.text.append((_book_text(name, main, digits), 0, height*DPI+3,
+                              textsize*0.75))
+    return geometry
+
+
+def encode_isbn(codestring, **kw):
+    return encode_book_number(codestring, 'ISBN', ('978', '979'), **kw)
+
+
+def encode_ismn(codestring, **kw):
+    return encode_book_number(codestring, 'ISMN', ('979',), **kw)
+
+
+def encode_issn(codestring, height=1.0, includetext=False, textsize=12,
+                textyoffset=-4, **kw):
+    """Encodes ISSN, with optional sequence variant and add-on, as EAN-13.
+
+    >>> g = encode_issn('0317-8129 00 17', includetext=True)
+    >>> [t[0] for t in g.text][:13], g.text[-1][0]
+    (['9', '7', '7', '0', '3', '1', '7', '8', '1', '2', '0', '0', '9'], 'ISSN 0317-8129')
+    """
+    parts = codestring.split()
+    if not 1<=len(parts)<=3:
+        raise ValueError(u'Invalid ISSN: %r' %codestring)
+    issn = parts[0].upper().replace('-', '')
+    variant = parts[1] if len(parts)>1 else '00'
+    addon = parts[2] if len(parts)>2 else ''
+    if len(issn) not in (7, 8) or not issn[:7].isdigit():
+        raise ValueError(u'Invalid ISSN: %r' %codestring)
+    digits = complete_gtin('977'+issn[:7]+variant, 13)
+    geometry = encode_ean13(' '.join([digits, addon]), height, includetext,
+                            textsize, textyoffset, **kw)
+    if includetext:
+        check = (11-sum(int(d)*(8-i) for i, d in enumerate(issn[:7]))%11)%11
+        text = 'ISSN %s-%s%s' %(issn[:4], issn[4:7], 'X' if check==10 else check)
+        geometry.text.append((text, 0, height*DPI+3, textsize*0.75))
+    return geometry
 
 
 class Ean13(Barcode):
@@ -46,6 +312,9 @@ class Ean13(Barcode):
                 return [-10, textyoffset, (12-1)*7+8+textsize*0.5, textmaxh]
             else:
                 return self.code_bbox
+
+        def native_encode(self, codestring):
+            return encode_ean13(codestring, **ean_options(self))
     renderer = _Renderer
 
 
@@ -98,6 +367,57 @@ class ISBN(Barcode):
             """
             cs = "%s%s%s-%s-%s%s%s%s%s-%s%s%s" %tuple(c for c in  codestring if c in '0123456789')
             return super(ISBN._Renderer, self).build_codestring(cs)
+
+        def native_encode(self, codestring):
+            return encode_isbn(codestring, **ean_options(self))
+    renderer = _Renderer
+
+
+class ISMN(Barcode):
+    """
+    >>> bc = ISMN()
+    >>> print bc.render_ps_code('979-0-2605-3211-3') # doctest: +ELLIPSIS
+    %!PS-Adobe-2.0
+    ...
+    /ismn /uk.co.terryburton.bwipp findresource exec
+    grestore
+    showpage
+    <BLANKLINE>
+    >>> bc.encode('979-0-2605-3211-3').width
+    95.0
+    """
+    codetype = 'ismn'
+    aliases = ()
+    class _Renderer(ISBN._Renderer):
+        def build_codestring(self, codestring):
+            return LinearCodeRenderer.build_codestring(self, codestring)
+
+        def native_encode(self, codestring):
+            return encode_ismn(codestring, **ean_options(self))
+    renderer = _Renderer
+
+
+class ISSN(Barcode):
+    """
+    >>> bc = ISSN()
+    >>> print bc.render_ps_code('0317-8129 00') # doctest: +ELLIPSIS
+    %!PS-Adobe-2.0
+    ...
+    /issn /uk.co.terryburton.bwipp findresource exec
+    grestore
+    showpage
+    <BLANKLINE>
+    >>> bc.encode('0317-8129 00').width
+    95.0
+    """
+    codetype = 'issn'
+    aliases = ()
+    class _Renderer(ISBN._Renderer):
+        def build_codestring(self, codestring):
+            return LinearCodeRenderer.build_codestring(self, codestring)
+
+        def native_encode(self, codestring):
+            return encode_issn(codestring, **ean_options(self))
     renderer = _Renderer
 
 
@@ -143,6 +463,9 @@ class Ean8(Barcode):
                 return [4, textyoffset, 7*7+8+textsize*0.5, textmaxh]
             else:
                 return self.code_bbox
+
+        def native_encode(self, codestring):
+            return encode_ean8(codestring, **ean_options(self))
     renderer = _Renderer
 
 
@@ -196,6 +519,9 @@ class Ean5(Barcode):
                 return [-9+13, textminy, 3*9+13+textsize*0.5, textmaxy]
             else:
                 return self.code_bbox
+
+        def native_encode(self, codestring):
+            return encode_addon(codestring, **ean_options(self, 0.7))
     renderer = _Renderer
 
 
@@ -249,6 +575,9 @@ class Ean2(Barcode):
                 return [-9+13, textminy, 13+textsize*0.5, textmaxy]
             else:
                 return self.code_bbox
+
+        def native_encode(self, codestring):
+            return encode_addon(codestring, **ean_options(self, 0.7))
     renderer = _Renderer
 
 
@@ -0,0 +1,240 @@
+# coding: utf-8
+"""Symbol geometry extracted from BWIPP encoders.
+
+BWIPP encoders given the dontdraw option leave a dictionary of the
+symbol's geometry on the stack instead of painting it.  The encode job
+prints the interesting entries of that dictionary, which are parsed
+into LinearGeometry (sbs/bhs/bbs), MatrixGeometry (pixs/pixx/pixy) or
+MaxiCodeGeometry (pixs of renmaximatrix).
+"""
+from array import array
+import util, gsworker
+from gsworker import GhostscriptError
+
+__all__ = ['Geometry', 'LinearGeometry', 'MatrixGeometry', 'MaxiCodeGeometry',
+           'DEFAULT_ENCODE_COMMAND_TEMPLATE', 'DEFAULT_ENCODE_JOB_TEMPLATE',
+           'GEOMETRY_KEYS', 'build_encode_job', 'parse_geometry', 'encode']
+
+
+class Geometry(object):
+    """Base class of symbol geometries.
+    """
+    def __eq__(self, other):
+        return (type(self) is type(other)
+                and self.__dict__==other.__dict__)
+
+    def __ne__(self, other):
+        return not self==other
+
+
+class LinearGeometry(Geometry):
+    """Geometry of linear and postal symbols.
+
+    sbs holds widths of bars and spaces in turn starting with a bar, in
+    points.  bhs and bbs hold height and bottom position of each bar in
+    inches, as renlinear takes them.  Native encoders also give text as
+    (string, x, y, size) tuples, and solid rectangles such as bearer bars
+    as (x, bottom, width, height) tuples, in points.
+
+    >>> g = LinearGeometry([1, 1, 2, 3, 1], [0.5, 0.5, 0.25])
+    >>> g.width, g.bbs.tolist()
+    (8.0, [0.0, 0.0, 0.0])
+    >>> list(g.bars())
+    [(0.0, 1.0, 0.0, 36.0), (2.0, 2.0, 0.0, 36.0), (7.0, 1.0, 0.0, 18.0)]
+    """
+    def __init__(self, sbs, bhs, bbs=None, text=None, rects=None):
+        self.sbs = array('d', sbs)
+        self.bhs = array('d', bhs)
+        self.bbs = array('d', bbs or [0]*len(self.bhs))
+        self.text = list(text or [])
+        self.rects = list(rects or [])
+
+    @property
+    def width(self):
+        return sum(self.sbs)
+
+    @property
+    def height(self):
+        """Height of the symbol in points.
+        """
+        return max([0.0]+[(b+h)*72 for b, h in zip(self.bbs, self.bhs)])
+
+    def bars(self):
+        """Yields (x, width, bottom, height) of each bar, in points.
+        """
+        x = 0.0
+        for i, w in enumerate(self.sbs):
+            if i%2==0 and i//2<len(self.bhs):
+                yield (x, w, self.bbs[i//2]*72, self.bhs[i//2]*72)
+            x += w
+
+
+class MatrixGeometry(Geometry):
+    """Geometry of 2D matrix symbols.
+
+    pixs holds pixy rows of pixx modules from the top row down, 1 for dark
+    modules.  width and height give symbol size in inches if the encoder
+    returned them.
+
+    >>> g = MatrixGeometry([1, 0, 1, 0, 1, 0], 3, 2)
+    >>> g.rows()
+    [[1, 0, 1], [0, 1, 0]]
+    >>> g[2, 0], g[2, 1]
+    (1, 0)
+    """
+    def __init__(self, pixs, pixx, pixy, width=None, height=None):
+        self.pixs = array('B', pixs)
+        self.pixx = int(pixx)
+        self.pixy = int(pixy)
+        self.width = width
+        self.height = height
+        if len(self.pixs)!=self.pixx*self.pixy:
+            raise ValueError(u'Expected %dx%d modules, got %d.'
+                             %(self.pixx, self.pixy, len(self.pixs)))
+
+    def __getitem__(self, xy):
+        x, y = xy
+        return self.pixs[y*self.pixx+x]
+
+    def rows(self):
+        return [self.pixs[i:i+self.pixx].tolist()
+                for i in range(0, len(self.pixs), self.pixx)]
+
+
+class MaxiCodeGeometry(Geometry):
+    """Geometry of MaxiCode symbols.
+
+    pixs holds indexes of dark modules in the 33 rows of 30 hexagonal
+    modules (row-major from the top row down), as renmaximatrix takes them.
+
+    >>> MaxiCodeGeometry([0, 34, 989]).pixs.tolist()
+    [0, 34, 989]
+    """
+    pixx, pixy = 30, 33
+
+    def __init__(self, pixs):
+        self.pixs = array('H', sorted(pixs))
+
+
+GEOMETRY_KEYS = ['sbs', 'bhs', 'bbs', 'pixs', 'pixx', 'pixy', 'width', 'height']
+DEFAULT_ENCODE_COMMAND_TEMPLATE = """
+%(codestring)s
+%(options)s
+/%(codetype)s /uk.co.terryburton.bwipp findresource exec
+[ %(keys)s ] {
+  2 copy known {
+    dup =only 2 copy get
+    dup type /arraytype eq { { ( ) print =only } forall } { ( ) print =only } ifelse
+    (\\n) print pop
+  } { pop } ifelse
+} forall pop
+"""
+DEFAULT_ENCODE_JOB_TEMPLATE = """
+/elaphe-job-save save def
+{
+%(encode_command)s
+} stopped
+{ (%(error)s ) print $error /errorname get =only (\\n) print }
+{ (%(done)s\\n) print } ifelse flush
+clear elaphe-job-save restore
+"""
+
+
+def build_encode_job(params, template=DEFAULT_ENCODE_JOB_TEMPLATE,
+                     encode_command_template=DEFAULT_ENCODE_COMMAND_TEMPLATE,
+                     done=gsworker.DONE_MARKER, error=gsworker.ERROR_MARKER):
+    """Builds job code printing geometry of the symbol.
+
+    params are renderer params (see Renderer.build_params) whose options
+    include dontdraw.
+
+    >>> print build_encode_job(dict(codestring='<41>', options='<646f6e7464726177>',
+    ...                             codetype='code39')) # doctest: +ELLIPSIS
+    <BLANKLINE>
+    /elaphe-job-save save def
+    {
+    <BLANKLINE>
+    <41>
+    <646f6e7464726177>
+    /code39 /uk.co.terryburton.bwipp findresource exec
+    [ /sbs /bhs /bbs /pixs /pixx /pixy /width /height ] {
+    ...
+    } forall pop
+    <BLANKLINE>
+    } stopped
+    ...
+    """
+    keys = ' '.join('/'+key for key in GEOMETRY_KEYS)
+    return template %dict(
+        encode_command=encode_command_template %dict(params, keys=keys),
+        done=done, error=error)
+
+
+def _number(s):
+    if '.' in s or 'e' in s or 'E' in s:
+        return float(s)
+    return int(s)
+
+
+def parse_geometry(lines):
+    """Parses output lines of an encode job into a geometry.
+
+    >>> parse_geometry(['sbs 1 1 2 1.5 1\\n', 'bhs 0.5 0.5 0.5\\n', 'bbs 0 0 0.1\\n'])
+    ... # doctest: +ELLIPSIS
+    <...LinearGeometry object at ...>
+    >>> g = parse_geometry(['pixs 1 0 0 1\\n', 'pixx 2\\n', 'pixy 2\\n'])
+    >>> g.rows(), g.width
+    ([[1, 0], [0, 1]], None)
+    >>> parse_geometry(['pixs 3 45 999\\n']).pixs.tolist()
+    [3, 45, 999]
+    >>> parse_geometry([])
+    Traceback (most recent call last):
+    ...
+    ValueError: No geometry in encoder output.
+    """
+    fields = {}
+    for line in lines:
+        values = line.split()
+        if values and values[0] in GEOMETRY_KEYS:
+            fields[values[0]] = [_number(v) for v in values[1:]]
+    if 'sbs' in fields:
+        return LinearGeometry(fields['sbs'], fields.get('bhs', []), fields.get('bbs'))
+    if 'pixs' in fields and 'pixx' in fields:
+        width, height = fields.get('width'), fields.get('height')
+        return MatrixGeometry(
+            fields['pixs'], fields['pixx'][0], fields.get('pixy', fields['pixx'])[0],
+            width and width[0], height and height[0])
+    if 'pixs' in fields:
+        return MaxiCodeGeometry(fields['pixs'])
+    raise ValueError(u'No geometry in encoder output.')
+
+
+DEFAULT_ENCODE_GS_OPTIONS = ['-q', '-dSAFER', '-dNODISPLAY', '-dBATCH', '-dNOPAUSE']
+
+def encode(params, pool=None, gs_binary=None, gs_options=None):
+    """Runs BWIPP encoder for renderer params and returns geometry.
+
+    params are renderer params whose options include dontdraw.  The job
+    runs on pool if given, otherwise in a one-shot Ghostscript process
+    loaded with the resources of the codetype only.
+    """
+    job = build_encode_job(params)
+    if pool is not None:
+        return parse_geometry(pool.execute(job))
+    output = gsworker.run_ghostscript(
+        [util.get_ps_prelude(params['codetype']), job],
+        gs_options or DEFAULT_ENCODE_GS_OPTIONS, gs_binary)
+    lines = []
+    for line in output.splitlines():
+        if line.startswith(gsworker.ERROR_MARKER):
+            raise GhostscriptError(u'Ghostscript error: %s'
+                                   %line[len(gsworker.ERROR_MARKER):].strip())
+        if line.startswith(gsworker.DONE_MARKER):
+            return parse_geometry(lines)
+        lines.append(line)
+    raise GhostscriptError(u'Ghostscript stopped before the job completed.')
+
+
+if __name__=="__main__":
+    from doctest import testmod
+    testmod()
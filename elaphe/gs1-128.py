@@ -1,10 +1,69 @@
 # coding: utf-8
 import re
 from base import Barcode, LinearCodeRenderer, DPI
+from code128 import code128_codewords, encode_codewords, code128_options
 
 
 GS1_128_ESCAPE_RE = re.compile(r'\^\d{3}')
 GS1_128_CHARS =" !\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~"
+GS1_AI_RE = re.compile(r'\((\d{2,4})\)([^(]+)')
+# lengths of element strings (AI and data) of AIs with predefined
+# length, by first two digits of AI; no FNC1 follows them.
+GS1_PREDEFINED_LENGTHS = {
+    '00': 20, '01': 16, '02': 16, '03': 16, '04': 18,
+    '11': 8, '12': 8, '13': 8, '14': 8, '15': 8, '16': 8, '17': 8,
+    '18': 8, '19': 8, '20': 4, '31': 10, '32': 10, '33': 10, '34': 10,
+    '35': 10, '36': 10, '41': 16}
+
+
+def parse_ais(codestring):
+    """Splits codestring in bracketed AI syntax into (AI, data) pairs.
+
+    >>> parse_ais('(01)95012345678903(3103)000123')
+    [('01', '95012345678903'), ('3103', '000123')]
+    >>> parse_ais('0195012345678903')
+    Traceback (most recent call last):
+    ...
+    ValueError: Expected GS1 element strings as (AI)data, got '0195012345678903'.
+    """
+    pairs = GS1_AI_RE.findall(codestring)
+    if not pairs or ''.join('(%s)%s' %pair for pair in pairs)!=codestring:
+        raise ValueError(u'Expected GS1 element strings as (AI)data, got %r.'
+                         %codestring)
+    return pairs
+
+
+def gs1_items(pairs):
+    """Returns items for code128_codewords() encoding AI/data pairs,
+    with FNC1 leading and separating fields of variable length.
+
+    >>> gs1_items([('10', 'A1'), ('01', '95012345678903')])[:6]
+    ['FNC1', 49, 48, 65, 49, 'FNC1']
+    """
+    items = ['FNC1']
+    for i, (ai, data) in enumerate(pairs):
+        element = ai+data
+        length = GS1_PREDEFINED_LENGTHS.get(ai[:2])
+        if length is not None and len(element)!=length:
+            raise ValueError(u'AI (%s) takes %d digits of data, got %r.'
+                             %(ai, length-len(ai), data))
+        items.extend(ord(c) for c in element)
+        if length is None and i<len(pairs)-1:
+            items.append('FNC1')
+    return items
+
+
+def encode_gs1_128(codestring, **kw):
+    """Encodes codestring in bracketed AI syntax into LinearGeometry of
+    a GS1-128 symbol.
+
+    >>> g = encode_gs1_128('(01)95012345678903(3103)000123', includetext=True)
+    >>> g.width, g.text[0][0]
+    (189.0, '(01)95012345678903(3103)000123')
+    """
+    codewords = code128_codewords(gs1_items(parse_ais(codestring)))
+    return encode_codewords(codewords, codestring, **kw)
+
 class GS1128(Barcode):
     """
     >>> bc = GS1128()
@@ -33,7 +92,7 @@ class GS1128(Barcode):
     >>> # _.show()
     """
     codetype = 'gs1-128'
-    aliases = ('gs1128')
+    aliases = ('gs1128',)
     class _Renderer(LinearCodeRenderer):
         default_options = dict(
             LinearCodeRenderer.default_options,
@@ -100,6 +159,9 @@ class GS1128(Barcode):
             params['bbox'] = "%d %d %d %d" %self._boundingbox(cbbox, tbbox)
             return params
 
+        def native_encode(self, codestring):
+            return encode_gs1_128(codestring, **code128_options(self))
+
     renderer = _Renderer
 
 
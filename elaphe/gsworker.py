@@ -0,0 +1,395 @@
+# coding: utf-8
+"""Long-lived Ghostscript interpreters rendering barcode.ps jobs.
+
+A worker starts one Ghostscript process, feeds the distilled barcode.ps
+through its stdin once and then takes render jobs over the same pipe.
+Each job is wrapped in save/restore so that nothing leaks between jobs,
+and every page is written to a per-worker spool directory from where it
+is loaded as a PIL image.
+"""
+import os, shutil, subprocess, tempfile, threading, atexit
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+import util
+
+__all__ = ['GS_BINARY', 'DEFAULT_GS_OPTIONS', 'DEFAULT_JOB_TEMPLATE',
+           'GhostscriptError', 'build_job', 'write_chunks', 'run_ghostscript',
+           'GhostscriptWorker', 'WorkerPool',
+           'get_default_pool', 'configure_default_pool']
+
+
+GS_BINARY = 'gs'
+DEFAULT_GS_OPTIONS = [
+    '-q', '-dSAFER', '-dNOPAUSE', '-dNOPROMPT',
+    '-sDEVICE=png16m', '-r72', '-dTextAlphaBits=4', '-dGraphicsAlphaBits=4']
+
+# Marker lines are written to the interpreter's stdout after each chunk
+# of work so that the reader knows when a job has completed.
+MARKER_PREFIX = 'ELAPHE-'
+READY_MARKER = MARKER_PREFIX + 'READY'
+DONE_MARKER = MARKER_PREFIX + 'DONE'
+ERROR_MARKER = MARKER_PREFIX + 'ERROR'
+
+DEFAULT_READY_TEMPLATE = """
+(%(marker)s\\n) print flush
+"""
+DEFAULT_JOB_TEMPLATE = """
+<< /PageSize [%(width)d %(height)d] >> setpagedevice
+/elaphe-job-save save def
+{
+%(xoffset)d %(yoffset)d translate
+%(render_command)s
+} stopped
+{ (%(error)s ) print $error /errorname get =only (\\n) print }
+{ (%(done)s\\n) print } ifelse flush
+clear elaphe-job-save restore
+"""
+
+
+class GhostscriptError(Exception):
+    """Raised when Ghostscript fails on a job or dies unexpectedly.
+    """
+
+
+def build_job(params, template=DEFAULT_JOB_TEMPLATE,
+              render_command_template=util.DEFAULT_RENDER_COMMAND_TEMPLATE,
+              done=DONE_MARKER, error=ERROR_MARKER):
+    """Builds job code from renderer params (see Renderer.build_params).
+
+    The page is sized to the bounding box and the render command runs
+    inside save/restore; done or error marker is printed afterwards.
+
+    >>> print build_job(dict(bbox='0 -7 200 72', codestring='<41>', options='<>',
+    ...                      codetype='code128', xscale=1.0, yscale=1.0))
+    <BLANKLINE>
+    << /PageSize [200 79] >> setpagedevice
+    /elaphe-job-save save def
+    {
+    0 7 translate
+    <BLANKLINE>
+    gsave
+    0 0 moveto
+    1.000000 1.000000 scale
+    <41>
+    <>
+    /code128 /uk.co.terryburton.bwipp findresource exec
+    grestore
+    showpage
+    <BLANKLINE>
+    } stopped
+    { (ELAPHE-ERROR ) print $error /errorname get =only (\\n) print }
+    { (ELAPHE-DONE\\n) print } ifelse flush
+    clear elaphe-job-save restore
+    <BLANKLINE>
+    """
+    llx, lly, urx, ury = [int(v) for v in params['bbox'].split()]
+    return template %dict(
+        width=max(urx-llx, 1), height=max(ury-lly, 1),
+        xoffset=-llx, yoffset=-lly,
+        render_command=render_command_template %params,
+        done=done, error=error)
+
+
+# chunks shorter than this are joined into buffers of up to this size,
+# so that a job of many small pieces takes few write calls.
+WRITE_BUFFER_SIZE = 64*1024
+
+def write_chunks(fileobj, chunks):
+    """Writes string chunks to fileobj in order.
+
+    Small chunks are joined into buffers of at most WRITE_BUFFER_SIZE
+    bytes; larger ones, such as the barcode.ps prelude, are written as
+    they are, without copying.
+
+    >>> import tempfile
+    >>> f = tempfile.TemporaryFile()
+    >>> write_chunks(f, ['foo', '', 'bar\\n', 'x'*WRITE_BUFFER_SIZE, 'baz'])
+    >>> f.seek(0); data = f.read()
+    >>> data[:7], len(data), data[-3:]
+    ('foobar\\n', 65546, 'baz')
+    """
+    buf, buffered = [], 0
+    for chunk in chunks:
+        if buffered+len(chunk)>WRITE_BUFFER_SIZE and buf:
+            fileobj.write(''.join(buf))
+            buf, buffered = [], 0
+        if len(chunk)>=WRITE_BUFFER_SIZE:
+            fileobj.write(chunk)
+        elif chunk:
+            buf.append(chunk)
+            buffered += len(chunk)
+    if buf:
+        fileobj.write(''.join(buf))
+    fileobj.flush()
+
+
+def run_ghostscript(ps_code, gs_options, gs_binary=None):
+    """Runs ps_code in a one-shot Ghostscript process and returns its stdout.
+
+    ps_code is a string or a list of chunks, which are streamed to the
+    interpreter as they are.
+    """
+    args = [gs_binary or GS_BINARY] + list(gs_options) + ['-']
+    devnull = open(os.devnull, 'wb')
+    try:
+        process = subprocess.Popen(
+            args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=devnull, close_fds=True)
+    finally:
+        devnull.close()
+    if isinstance(ps_code, basestring):
+        ps_code = [ps_code]
+
+    def feed():
+        try:
+            write_chunks(process.stdin, ps_code)
+            process.stdin.close()
+        except (IOError, OSError):
+            # interpreter quit early; its output tells what happened.
+            pass
+    feeder = threading.Thread(target=feed)
+    feeder.daemon = True
+    feeder.start()
+    output = process.stdout.read()
+    feeder.join()
+    process.wait()
+    return output
+
+
+class GhostscriptWorker(object):
+    """A single Ghostscript process with barcode.ps preloaded.
+
+    Workers are not thread safe; WorkerPool hands each worker to one
+    thread at a time.
+    """
+    def __init__(self, gs_binary=None, gs_options=None, ps_code=None):
+        self.gs_binary = gs_binary or GS_BINARY
+        self.gs_options = list(gs_options or DEFAULT_GS_OPTIONS)
+        self.ps_code = ps_code
+        self.jobs = 0
+        self.pages = 0
+        self.process = None
+        self.spool_dir = None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        # a restarted worker spools to a new directory from page 1
+        self.close()
+        self.jobs = 0
+        self.pages = 0
+        self.spool_dir = tempfile.mkdtemp(prefix='elaphe-gs-')
+        output_file = os.path.join(self.spool_dir, 'page-%08d.png')
+        args = ([self.gs_binary] + self.gs_options
+                + ['-sOutputFile=%s' %output_file, '-'])
+        devnull = open(os.devnull, 'wb')
+        try:
+            self.process = subprocess.Popen(
+                args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=devnull, close_fds=True)
+        finally:
+            devnull.close()
+        ps_code = self.ps_code
+        if ps_code is None:
+            ps_code = util.get_ps_prelude()
+        self._write([ps_code, DEFAULT_READY_TEMPLATE %dict(marker=READY_MARKER)])
+        self._wait_for(READY_MARKER)
+
+    def close(self):
+        if self.process is not None:
+            try:
+                if self.alive:
+                    self.process.stdin.write('\nquit\n')
+                    self.process.stdin.close()
+                    self.process.wait()
+            except (IOError, OSError):
+                pass
+            self.process = None
+        if self.spool_dir is not None:
+            shutil.rmtree(self.spool_dir, ignore_errors=True)
+            self.spool_dir = None
+
+    def _write(self, code):
+        """Writes code, a string or list of chunks, to the interpreter.
+        """
+        if isinstance(code, basestring):
+            code = [code]
+        try:
+            write_chunks(self.process.stdin, code)
+        except (IOError, OSError), e:
+            raise GhostscriptError(u'Ghostscript process died: %s' %e)
+
+    def _wait_for(self, marker):
+        """Reads output up to the marker line and returns lines before it.
+        """
+        lines = []
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise GhostscriptError(u'Ghostscript process died.')
+            if line.startswith(ERROR_MARKER):
+                raise GhostscriptError(
+                    u'Ghostscript error: %s' %line[len(ERROR_MARKER):].strip())
+            if line.startswith(marker):
+                return lines
+            lines.append(line)
+
+    def execute(self, code):
+        """Runs job code which prints the done marker when completed.
+
+        Returns the output lines preceding the marker.
+        """
+        if not self.alive:
+            self.start()
+        self.jobs += 1
+        self._write(code)
+        return self._wait_for(DONE_MARKER)
+
+    def render(self, params):
+        """Renders a job and returns the page as a loaded PIL image.
+        """
+        from PIL import Image
+        self.execute(build_job(params))
+        self.pages += 1
+        path = os.path.join(self.spool_dir, 'page-%08d.png' %self.pages)
+        try:
+            image = Image.open(path)
+            image.load()
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        return image
+
+
+class WorkerPool(object):
+    """Pool of GhostscriptWorkers.
+
+    size is the maximum number of interpreters running at a time.
+    max_jobs is the number of jobs a worker takes before it is recycled,
+    0 keeps workers forever.
+
+    >>> pool = WorkerPool(size=2, max_jobs=100)
+    >>> pool.size, pool.max_jobs
+    (2, 100)
+    >>> pool.close()
+    """
+    worker_class = GhostscriptWorker
+
+    def __init__(self, size=None, max_jobs=1000, gs_binary=None, gs_options=None):
+        self.size = size or 4
+        self.max_jobs = max_jobs
+        self.gs_binary = gs_binary
+        self.gs_options = gs_options
+        self._idle = queue.LifoQueue()
+        self._slots = threading.Semaphore(self.size)
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            worker = self.worker_class(self.gs_binary, self.gs_options)
+            with self._lock:
+                self._workers.append(worker)
+            return worker
+
+    def _release(self, worker, recycle=False):
+        if recycle or (self.max_jobs and worker.jobs>=self.max_jobs):
+            worker.close()
+            with self._lock:
+                if worker in self._workers:
+                    self._workers.remove(worker)
+        else:
+            self._idle.put(worker)
+        self._slots.release()
+
+    def _run(self, method, *args):
+        worker = self._acquire()
+        try:
+            result = getattr(worker, method)(*args)
+        except:
+            # A failing job may leave the interpreter in a bad state.
+            self._release(worker, recycle=True)
+            raise
+        self._release(worker)
+        return result
+
+    def render(self, params):
+        """Renders a job on an idle worker (see GhostscriptWorker.render).
+        """
+        return self._run('render', params)
+
+    def execute(self, code):
+        """Runs job code on an idle worker (see GhostscriptWorker.execute).
+        """
+        return self._run('execute', code)
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+
+_default_pool = None
+_default_pool_params = {}
+_default_pool_lock = threading.Lock()
+
+def configure_default_pool(**kw):
+    """Sets WorkerPool arguments (size, max_jobs...) of the shared pool.
+
+    The running shared pool, if any, is closed and recreated on demand.
+    """
+    global _default_pool, _default_pool_params
+    with _default_pool_lock:
+        if _default_pool is not None:
+            _default_pool.close()
+            _default_pool = None
+        _default_pool_params = kw
+
+
+def get_default_pool():
+    """Returns the shared WorkerPool, starting it on first use.
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = WorkerPool(**_default_pool_params)
+        return _default_pool
+
+
+def get_pool(pool):
+    """Resolves the pool render option into a WorkerPool (or None).
+
+    >>> get_pool(None) is None, get_pool(False) is None
+    (True, True)
+    >>> get_pool(True) is get_default_pool()
+    True
+    """
+    if pool is None or pool is False:
+        return None
+    if pool is True:
+        return get_default_pool()
+    return pool
+
+
+def _close_default_pool():
+    if _default_pool is not None:
+        _default_pool.close()
+atexit.register(_close_default_pool)
+
+
+if __name__=="__main__":
+    from doctest import testmod
+    testmod()
@@ -1,5 +1,158 @@
 # coding: utf-8
 from base import Barcode, LinearCodeRenderer, DPI
+from linear import mod10_check_digit, text_x, LinearBuilder
+from ean import complete_gtin
+
+
+# narrow (n) and wide (w) elements of digits 0 to 9 in 2 of 5 codes
+TWO_OF_FIVE_PATTERNS = ['nnwwn', 'wnnnw', 'nwnnw', 'wwnnn', 'nnwnw',
+                        'wnwnn', 'nwwnn', 'nnnww', 'wnnwn', 'nwnwn']
+I2OF5_START, I2OF5_STOP = 'nnnn', 'wnn'
+
+
+def two_of_five_widths(pattern, ratio):
+    """Converts narrow and wide elements into widths.
+
+    >>> two_of_five_widths('nnwwn', 3)
+    [1, 1, 3, 3, 1]
+    """
+    return [ratio if e=='w' else 1 for e in pattern]
+
+
+def _digits(codestring, name):
+    if not codestring.isdigit():
+        raise ValueError(u'%s takes digits only, got %r.' %(name, codestring))
+    return codestring
+
+
+def encode_i2of5(codestring, includecheck=False, includetext=False,
+                 includecheckintext=False, text=None, ratio=3, height=1.0,
+                 textsize=10, textyoffset=-7):
+    """Encodes digits into LinearGeometry of an Interleaved 2 of 5
+    symbol, with a leading zero if their count is odd.
+
+    Wide elements are ratio times as wide as narrow ones.  text replaces
+    the digits as human readable text.
+
+    >>> g = encode_i2of5('24012345678905')
+    >>> g.width, len(g.bhs)
+    (135.0, 39)
+    >>> encode_i2of5('2401234567890', includecheck=True) == g
+    True
+    >>> encode_i2of5('123', ratio=2).sbs[4:9].tolist()
+    [1.0, 2.0, 1.0, 1.0, 2.0]
+    """
+    digits = _digits(codestring, 'Interleaved 2 of 5')
+    if includecheck:
+        digits += str(mod10_check_digit(digits))
+    if len(digits)%2:
+        digits = '0'+digits
+    builder = LinearBuilder()
+    builder.add(two_of_five_widths(I2OF5_START, ratio), height)
+    for i in range(0, len(digits), 2):
+        bars = TWO_OF_FIVE_PATTERNS[int(digits[i])]
+        spaces = TWO_OF_FIVE_PATTERNS[int(digits[i+1])]
+        pattern = ''.join(b+s for b, s in zip(bars, spaces))
+        builder.add(two_of_five_widths(pattern, ratio), height)
+    builder.add(two_of_five_widths(I2OF5_STOP, ratio), height)
+    if includetext:
+        if text is None:
+            text = codestring
+            if includecheck and includecheckintext:
+                text += digits[-1]
+        builder.add_text(text, text_x(0, builder.x, textsize*len(text)),
+                         textyoffset, textsize)
+    return builder.geometry()
+
+
+def encode_itf14(codestring, includetext=False, showborder=True,
+                 borderwidth=4, borderleft=10, borderright=10, height=0.5,
+                 textsize=10, textyoffset=-7, **kw):
+    """Encodes a GTIN-14 (13 digits, or 14 with check digit) into
+    LinearGeometry of an ITF-14 symbol.
+
+    The bearer bars frame the symbol and its quiet zones as a box of
+    borderwidth points.
+
+    >>> g = encode_itf14('1540014128876', includetext=True)
+    >>> g.width, g.text[0][0], len(g.rects)
+    (135.0, '1 54 00141 28876 3', 4)
+    >>> g.rects[0]
+    (-14, -4, 163.0, 4)
+    """
+    digits = complete_gtin(codestring.replace(' ', ''), 14)
+    geometry = encode_i2of5(digits, height=height, **kw)
+    if includetext:
+        text = ' '.join([digits[0], digits[1:3], digits[3:8], digits[8:13], digits[13]])
+        geometry.text = [(text, text_x(0, geometry.width, textsize*len(text)),
+                          textyoffset-borderwidth, textsize)]
+    if showborder:
+        left, right = -borderleft-borderwidth, geometry.width+borderright
+        outer = right+borderwidth-left
+        top = height*DPI
+        geometry.rects = [(left, -borderwidth, outer, borderwidth),
+                          (left, top, outer, borderwidth),
+                          (left, 0, borderwidth, top),
+                          (right, 0, borderwidth, top)]
+    return geometry
+
+
+def encode_deutschepost(codestring, name, template, **kw):
+    """Encodes Identcode or Leitcode: digits and a check digit weighted
+    4 and 9, shown as template with # replaced by digits.
+
+    >>> encode_deutschepost('56310243031', 'Identcode', '##.### ###.### #',
+    ...                     includetext=True).text[0][0]
+    '56.310 243.031 3'
+    """
+    length = template.count('#')-1
+    digits = _digits(codestring, name)
+    if len(digits) not in (length, length+1):
+        raise ValueError(u'%s takes %d or %d digits, got %r.'
+                         %(name, length, length+1, codestring))
+    check = str(mod10_check_digit(digits[:length], (4, 9)))
+    if len(digits)==length+1 and digits[-1]!=check:
+        raise ValueError(u'Bad check digit in %s.' %digits)
+    digits = digits[:length]+check
+    text = template.replace('#', '%s') %tuple(digits)
+    return encode_i2of5(digits, text=text, **kw)
+
+
+def encode_identcode(codestring, **kw):
+    """Encodes Deutsche Post Identcode of 11 digits.
+
+    >>> encode_identcode('563102430313') == encode_identcode('56310243031')
+    True
+    """
+    return encode_deutschepost(codestring, 'Identcode', '##.### ###.### #', **kw)
+
+
+def encode_leitcode(codestring, **kw):
+    """Encodes Deutsche Post Leitcode of 13 digits.
+
+    >>> encode_leitcode('2134807501640', includetext=True).text[0][0]
+    '21348.075.016.40 1'
+    """
+    return encode_deutschepost(codestring, 'Leitcode', '#####.###.###.## #', **kw)
+
+
+def two_of_five_options(renderer, height=1.0):
+    """Collects options of 2 of 5 native encoders from renderer.
+    """
+    return dict(
+        includetext=bool(renderer.lookup_option('includetext')),
+        ratio=renderer.lookup_option('ratio', 3),
+        height=renderer.lookup_option('height') or height,
+        textsize=renderer.lookup_option('textsize') or 10,
+        textyoffset=renderer.lookup_option('textyoffset', -7))
+
+
+def check_options(renderer):
+    """Collects check digit options of 2 of 5 native encoders.
+    """
+    return dict(
+        includecheck=bool(renderer.lookup_option('includecheck')),
+        includecheckintext=bool(renderer.lookup_option('includecheckintext')))
 
 
 class Interleaved2of5(Barcode):
@@ -63,6 +216,78 @@ class Interleaved2of5(Barcode):
             params['bbox'] = "%d %d %d %d" %self._boundingbox(
                 self._code_bbox(codestring), self._text_bbox(codestring))
             return params
+
+        def native_encode(self, codestring):
+            options = two_of_five_options(self)
+            options.update(check_options(self))
+            return encode_i2of5(codestring, **options)
+    renderer = _Renderer
+
+
+class ITF14(Barcode):
+    """ITF-14 encodes GTIN-14 as Interleaved 2 of 5 framed by bearer bars.
+
+    >>> r = ITF14().get_renderer(dict(includetext=True))
+    >>> r._code_bbox('1540014128876')
+    [-14, -4, 149, 40.0]
+    >>> r.encode('1540014128876').text[0][0]
+    '1 54 00141 28876 3'
+    """
+    codetype = 'itf14'
+    aliases = ('itf-14', 'itf_14', 'itf 14')
+    class _Renderer(Interleaved2of5._Renderer):
+        default_options = dict(
+            Interleaved2of5._Renderer.default_options, height=0.5,
+            showborder=True, borderwidth=4, borderleft=10, borderright=10)
+
+        def _code_bbox(self, codestring):
+            height = self.lookup_option('height')
+            border = self.lookup_option('borderwidth')
+            return [-self.lookup_option('borderleft')-border, -border,
+                    14*9+9+self.lookup_option('borderright')+border,
+                    height*DPI+border]
+
+        def _text_bbox(self, codestring):
+            return super(ITF14._Renderer, self)._text_bbox('0'*18)
+
+        def native_encode(self, codestring):
+            options = two_of_five_options(self, 0.5)
+            options.update(
+                showborder=self.lookup_option('showborder'),
+                borderwidth=self.lookup_option('borderwidth'),
+                borderleft=self.lookup_option('borderleft'),
+                borderright=self.lookup_option('borderright'))
+            return encode_itf14(codestring, **options)
+    renderer = _Renderer
+
+
+class Identcode(Barcode):
+    """Deutsche Post Identcode: 11 digits and a check digit as
+    Interleaved 2 of 5.
+
+    >>> Identcode().get_renderer(None).encode('56310243031').width
+    117.0
+    """
+    codetype = 'identcode'
+    aliases = ('ident code', 'ident_code', 'ident-code')
+    class _Renderer(Interleaved2of5._Renderer):
+        def native_encode(self, codestring):
+            return encode_identcode(codestring, **two_of_five_options(self))
+    renderer = _Renderer
+
+
+class Leitcode(Barcode):
+    """Deutsche Post Leitcode: 13 digits and a check digit as
+    Interleaved 2 of 5.
+
+    >>> Leitcode().get_renderer(None).encode('2134807501640').width
+    135.0
+    """
+    codetype = 'leitcode'
+    aliases = ('leit code', 'leit_code', 'leit-code')
+    class _Renderer(Interleaved2of5._Renderer):
+        def native_encode(self, codestring):
+            return encode_leitcode(codestring, **two_of_five_options(self))
     renderer = _Renderer
 
 
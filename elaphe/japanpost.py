@@ -1,5 +1,53 @@
 # coding: utf-8
 from base import Barcode, LinearCodeRenderer, DPI
+from postal import BAR_WIDTH, SPACE_WIDTH, PostalCodeRenderer, states
+
+
+JAPANPOST_CHARS = '0123456789-ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+# digits, hyphen and control codes CC1 to CC8, then start and stop
+JAPANPOST_ENCODINGS = (
+    '300 330 312 132 321 303 123 231 213 033 030 '
+    '120 102 210 012 201 021 003 333').split()
+JAPANPOST_START, JAPANPOST_STOP = '31', '13'
+JAPANPOST_CC1, JAPANPOST_CC4 = 11, 14
+JAPANPOST_LENGTH = 20
+
+
+def encode_japanpost(codestring, includecheckintext=False):
+    """Returns bar states and text positions of a Japan Post symbol.
+
+    Letters take a control code and a digit; the 20 characters are
+    padded with CC4 and followed by a modulo 19 check character.
+
+    >>> bar_states, text = encode_japanpost('6540123789-A-K-Z')
+    >>> len(bar_states), bar_states[:8].tolist()
+    (67, [3, 1, 1, 2, 3, 3, 0, 3])
+    >>> text[-1]
+    ('Z', 185.472)
+    """
+    values, text = [], []
+    pitch = BAR_WIDTH+SPACE_WIDTH
+    for c in codestring:
+        index = JAPANPOST_CHARS.find(c)
+        if index<0:
+            raise ValueError(u'Japan Post cannot encode %r.' %c)
+        if index>=JAPANPOST_CC1:
+            if len(values)>=JAPANPOST_LENGTH-1:
+                break
+            values.append((index-1)//10+10)
+            index = (index-1)%10
+        if len(values)>=JAPANPOST_LENGTH:
+            break
+        text.append((c, (3*len(values)+2)*pitch))
+        values.append(index)
+    values.extend([JAPANPOST_CC4]*(JAPANPOST_LENGTH-len(values)))
+    checksum = (19-sum(values)%19)%19
+    if includecheckintext:
+        text.append((JAPANPOST_CHARS[checksum], (3*JAPANPOST_LENGTH+2)*pitch))
+    bar_states = states(JAPANPOST_START+''.join(
+        JAPANPOST_ENCODINGS[v] for v in values+[checksum])+JAPANPOST_STOP)
+    return bar_states, text
+
 
 
 class JapanPost(Barcode):
@@ -30,7 +78,7 @@ class JapanPost(Barcode):
     """
     codetype = 'japanpost'
     aliases = ()
-    class _Renderer(LinearCodeRenderer):
+    class _Renderer(PostalCodeRenderer):
         default_options = dict(
             LinearCodeRenderer.default_options,
             height=0.175, includetext=False, includecheckintext=False,
@@ -61,6 +109,10 @@ class JapanPost(Barcode):
                 tbbox = cbbox
             params['bbox'] = "%d %d %d %d" %self._boundingbox(cbbox, tbbox)
             return params
+
+        def native_symbol(self, codestring):
+            return encode_japanpost(
+                codestring, bool(self.lookup_option('includecheckintext')))
     renderer = _Renderer
 
 if __name__=="__main__":
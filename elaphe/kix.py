@@ -1,5 +1,38 @@
 # coding: utf-8
 from base import Barcode, LinearCodeRenderer, DPI
+from postal import (BAR_WIDTH, SPACE_WIDTH, PostalCodeRenderer, states,
+                    char_indexes, state_table)
+from royalmail import ROYALMAIL_CHARS, ROYALMAIL_ENCODINGS
+
+
+KIX_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+KIX_ENCODINGS = [ROYALMAIL_ENCODINGS[ROYALMAIL_CHARS.index(c)] for c in KIX_CHARS]
+
+
+def encode_kix(codestring):
+    """Returns bar states and text positions of a KIX symbol: RM4SCC
+    characters without start, stop and check characters.
+
+    >>> bar_states, text = encode_kix('1231FZ13XHS')
+    >>> len(bar_states), bar_states[:8].tolist(), text[0]
+    (44, [0, 1, 2, 3, 0, 1, 3, 2], ('1', 0.0))
+    """
+    if any(c not in KIX_CHARS for c in codestring):
+        raise ValueError(u'KIX must contain only capital letters and digits.')
+    bar_states = states(''.join(KIX_ENCODINGS[KIX_CHARS.index(c)]
+                                for c in codestring))
+    return bar_states, [(c, 4*i*(BAR_WIDTH+SPACE_WIDTH))
+                        for i, c in enumerate(codestring)]
+
+
+def kix_states_bulk(codestrings):
+    """Vectorized encode_kix() of codestrings of the same length.
+
+    >>> kix_states_bulk(['1231FZ13XHS'])[0].tolist()==encode_kix('1231FZ13XHS')[0].tolist()
+    True
+    """
+    values = char_indexes(codestrings, KIX_CHARS, 'KIX')
+    return state_table(KIX_ENCODINGS)[values].reshape(len(values), -1)
 
 
 class Kix(Barcode):
@@ -31,7 +64,7 @@ class Kix(Barcode):
     codetype = 'kix'
     aliases = ('dutch kix', 'dutch-kix', 'dutch_kix')
 
-    class _Renderer(LinearCodeRenderer):
+    class _Renderer(PostalCodeRenderer):
         default_options = dict(
             LinearCodeRenderer.default_options,
             height=0.175, includetext=False, includecheckintext=False,
@@ -66,7 +99,13 @@ class Kix(Barcode):
                 tbbox = cbbox
             params['bbox'] = "%d %d %d %d" %self._boundingbox(cbbox, tbbox)
             return params
-        
+
+        def native_symbol(self, codestring):
+            return encode_kix(codestring)
+
+        def native_states_bulk(self, codestrings):
+            return kix_states_bulk(codestrings)
+
     renderer = _Renderer
 
 if __name__=="__main__":
@@ -0,0 +1,111 @@
+# coding: utf-8
+"""Helpers shared by the native encoders of linear symbols.
+
+Native encoders produce geometry.LinearGeometry the way BWIPP hands it to
+renlinear: widths of bars and spaces in points (a module is one point
+before scaling), and height and bottom position of each bar in inches.
+"""
+from geometry import LinearGeometry
+
+__all__ = ['widths', 'run_lengths', 'mod10_check_digit', 'text_x',
+           'linear_options', 'LinearBuilder']
+
+
+def widths(pattern):
+    """Converts a pattern of width digits into a list of widths.
+
+    >>> widths('3211')
+    [3, 2, 1, 1]
+    """
+    return [int(c) for c in pattern]
+
+
+def run_lengths(modules):
+    """Converts a string of dark (1) and light (0) modules into widths,
+    starting with a bar.
+
+    >>> run_lengths('1011000101')
+    [1, 1, 2, 3, 1, 1, 1]
+    """
+    runs, last = [], '1'
+    for module in modules:
+        if runs and module==last:
+            runs[-1] += 1
+        else:
+            runs.append(1)
+            last = module
+    return runs
+
+
+def mod10_check_digit(digits, weights=(3, 1)):
+    """Returns the modulo 10 check digit of digits.
+
+    weights repeat from the rightmost digit leftwards, as in GTINs.
+
+    >>> mod10_check_digit('97714739680')
+    1
+    >>> mod10_check_digit('400638133393')
+    1
+    """
+    total = sum(int(digit)*weights[i%len(weights)]
+                for i, digit in enumerate(reversed(digits)))
+    return (10-total%10)%10
+
+
+def text_x(x, width, size):
+    """Returns left position of a character centered on [x, x+width),
+    assuming the 0.6em advance of Courier.
+
+    >>> text_x(10, 7, 10)
+    10.5
+    """
+    return x+(width-0.6*size)/2.0
+
+
+def linear_options(renderer, height=1.0):
+    """Collects text and height options of native encoders from renderer.
+    """
+    return dict(
+        includetext=bool(renderer.lookup_option('includetext')),
+        height=renderer.lookup_option('height') or height,
+        textsize=renderer.lookup_option('textsize') or 10,
+        textyoffset=renderer.lookup_option('textyoffset', -7))
+
+
+class LinearBuilder(object):
+    """Accumulates bars and spaces of a linear symbol.
+
+    >>> b = LinearBuilder()
+    >>> b.add([1, 1, 1], 1.0)
+    >>> b.add([2, 3], 0.5, 0.25)
+    >>> b.x
+    8
+    >>> g = b.geometry()
+    >>> g.sbs.tolist(), g.bhs.tolist(), g.bbs.tolist()
+    ([1.0, 1.0, 1.0, 2.0, 3.0], [1.0, 1.0, 0.5], [0.0, 0.0, 0.25])
+    """
+    def __init__(self):
+        self.sbs, self.bhs, self.bbs, self.text = [], [], [], []
+        self.x = 0
+
+    def add(self, widths, height, bottom=0.0):
+        """Appends widths of bars and spaces continuing the alternation;
+        bars among them get height and bottom (in inches).
+        """
+        for width in widths:
+            if len(self.sbs)%2==0:
+                self.bhs.append(height)
+                self.bbs.append(bottom)
+            self.sbs.append(width)
+            self.x += width
+
+    def add_text(self, string, x, y, size):
+        self.text.append((string, x, y, size))
+
+    def geometry(self):
+        return LinearGeometry(self.sbs, self.bhs, self.bbs, self.text)
+
+
+if __name__=="__main__":
+    from doctest import testmod
+    testmod()
@@ -1,6 +1,346 @@
 # coding: utf-8
-import itertools
 from base import Barcode, MatrixCodeRenderer, DPI
+from geometry import MaxiCodeGeometry
+from reedsolomon import get_field, rs_generator, rs_encode
+from util import cap_unescape
+
+
+# special values of the character sets, numbered as BWIPP does
+(ECI, PAD, NS, LA, LB, SA, SB, SC, SD, SE, SA2, SA3, LKC, LKD, LKE,
+ PD2, PD3) = range(-1, -18, -1)
+SET_A, SET_B, SET_C, SET_D, SET_E = range(5)
+
+MAXICODE_CHARMAPS = [
+    # character codes or special values in sets A to E, by codeword value
+    #  A     B     C     D     E
+    (  13,   96,  192,  224,    0), # 0
+    (  65,   97,  193,  225,    1), # 1
+    (  66,   98,  194,  226,    2), # 2
+    (  67,   99,  195,  227,    3), # 3
+    (  68,  100,  196,  228,    4), # 4
+    (  69,  101,  197,  229,    5), # 5
+    (  70,  102,  198,  230,    6), # 6
+    (  71,  103,  199,  231,    7), # 7
+    (  72,  104,  200,  232,    8), # 8
+    (  73,  105,  201,  233,    9), # 9
+    (  74,  106,  202,  234,   10), # 10
+    (  75,  107,  203,  235,   11), # 11
+    (  76,  108,  204,  236,   12), # 12
+    (  77,  109,  205,  237,   13), # 13
+    (  78,  110,  206,  238,   14), # 14
+    (  79,  111,  207,  239,   15), # 15
+    (  80,  112,  208,  240,   16), # 16
+    (  81,  113,  209,  241,   17), # 17
+    (  82,  114,  210,  242,   18), # 18
+    (  83,  115,  211,  243,   19), # 19
+    (  84,  116,  212,  244,   20), # 20
+    (  85,  117,  213,  245,   21), # 21
+    (  86,  118,  214,  246,   22), # 22
+    (  87,  119,  215,  247,   23), # 23
+    (  88,  120,  216,  248,   24), # 24
+    (  89,  121,  217,  249,   25), # 25
+    (  90,  122,  218,  250,   26), # 26
+    ( ECI,  ECI,  ECI,  ECI,  ECI), # 27
+    (  28,   28,   28,   28,  PAD), # 28
+    (  29,   29,   29,   29,  PAD), # 29
+    (  30,   30,   30,   30,   27), # 30
+    (  NS,   NS,   NS,   NS,   NS), # 31
+    (  32,  123,  219,  251,   28), # 32
+    ( PAD,  PAD,  220,  252,   29), # 33
+    (  34,  125,  221,  253,   30), # 34
+    (  35,  126,  222,  254,   31), # 35
+    (  36,  127,  223,  255,  159), # 36
+    (  37,   59,  170,  161,  160), # 37
+    (  38,   60,  172,  168,  162), # 38
+    (  39,   61,  177,  171,  163), # 39
+    (  40,   62,  178,  175,  164), # 40
+    (  41,   63,  179,  176,  165), # 41
+    (  42,   91,  181,  180,  166), # 42
+    (  43,   92,  185,  183,  167), # 43
+    (  44,   93,  186,  184,  169), # 44
+    (  45,   94,  188,  187,  173), # 45
+    (  46,   95,  189,  191,  174), # 46
+    (  47,   32,  190,  138,  182), # 47
+    (  48,   44,  128,  139,  149), # 48
+    (  49,   46,  129,  140,  150), # 49
+    (  50,   47,  130,  141,  151), # 50
+    (  51,   58,  131,  142,  152), # 51
+    (  52,   64,  132,  143,  153), # 52
+    (  53,   33,  133,  144,  154), # 53
+    (  54,  124,  134,  145,  155), # 54
+    (  55,  PD2,  135,  146,  156), # 55
+    (  56,  SA2,  136,  147,  157), # 56
+    (  57,  SA3,  137,  148,  158), # 57
+    (  58,  PD3,   LA,   LA,   LA), # 58
+    (  SB,   SA,   32,   32,   32), # 59
+    (  SC,   SC,  LKC,   SC,   SC), # 60
+    (  SD,   SD,   SD,  LKD,   SD), # 61
+    (  SE,   SE,   SE,   SE,  LKE), # 62
+    (  LB,   LA,   LB,   LB,   LB), # 63
+    ]
+# codeword values of character codes and special values, by set
+MAXICODE_CHARVALS = [dict((row[cset], value)
+                          for value, row in enumerate(MAXICODE_CHARMAPS))
+                     for cset in range(5)]
+# shift and lock-in of sets C, D and E
+_SHIFTS = {SET_C: (SC, LKC), SET_D: (SD, LKD), SET_E: (SE, LKE)}
+
+# module indexes (row-major over 33 rows of 30) of the 864 codeword bits
+MAXICODE_MODULE_MAP = [
+    469, 529, 286, 316, 347, 346, 673, 672, 703, 702, 647, 676, 283, 282, 313, 312,
+    370, 610, 618, 379, 378, 409, 408, 439, 705, 704, 559, 589, 588, 619, 458, 518,
+    640, 701, 675, 674, 285, 284, 315, 314, 310, 340, 531, 289, 288, 319, 349, 348,
+    456, 486, 517, 516, 471, 470, 369, 368, 399, 398, 429, 428, 549, 548, 579, 578,
+    609, 608, 649, 648, 679, 678, 709, 708, 639, 638, 669, 668, 699, 698, 279, 278,
+    309, 308, 339, 338, 381, 380, 411, 410, 441, 440, 561, 560, 591, 590, 621, 620,
+    547, 546, 577, 576, 607, 606, 367, 366, 397, 396, 427, 426, 291, 290, 321, 320,
+    351, 350, 651, 650, 681, 680, 711, 710,   1,   0,  31,  30,  61,  60,   3,   2,
+     33,  32,  63,  62,   5,   4,  35,  34,  65,  64,   7,   6,  37,  36,  67,  66,
+      9,   8,  39,  38,  69,  68,  11,  10,  41,  40,  71,  70,  13,  12,  43,  42,
+     73,  72,  15,  14,  45,  44,  75,  74,  17,  16,  47,  46,  77,  76,  19,  18,
+     49,  48,  79,  78,  21,  20,  51,  50,  81,  80,  23,  22,  53,  52,  83,  82,
+     25,  24,  55,  54,  85,  84,  27,  26,  57,  56,  87,  86, 117, 116, 147, 146,
+    177, 176, 115, 114, 145, 144, 175, 174, 113, 112, 143, 142, 173, 172, 111, 110,
+    141, 140, 171, 170, 109, 108, 139, 138, 169, 168, 107, 106, 137, 136, 167, 166,
+    105, 104, 135, 134, 165, 164, 103, 102, 133, 132, 163, 162, 101, 100, 131, 130,
+    161, 160,  99,  98, 129, 128, 159, 158,  97,  96, 127, 126, 157, 156,  95,  94,
+    125, 124, 155, 154,  93,  92, 123, 122, 153, 152,  91,  90, 121, 120, 151, 150,
+    181, 180, 211, 210, 241, 240, 183, 182, 213, 212, 243, 242, 185, 184, 215, 214,
+    245, 244, 187, 186, 217, 216, 247, 246, 189, 188, 219, 218, 249, 248, 191, 190,
+    221, 220, 251, 250, 193, 192, 223, 222, 253, 252, 195, 194, 225, 224, 255, 254,
+    197, 196, 227, 226, 257, 256, 199, 198, 229, 228, 259, 258, 201, 200, 231, 230,
+    261, 260, 203, 202, 233, 232, 263, 262, 205, 204, 235, 234, 265, 264, 207, 206,
+    237, 236, 267, 266, 297, 296, 327, 326, 357, 356, 295, 294, 325, 324, 355, 354,
+    293, 292, 323, 322, 353, 352, 277, 276, 307, 306, 337, 336, 275, 274, 305, 304,
+    335, 334, 273, 272, 303, 302, 333, 332, 271, 270, 301, 300, 331, 330, 361, 360,
+    391, 390, 421, 420, 363, 362, 393, 392, 423, 422, 365, 364, 395, 394, 425, 424,
+    383, 382, 413, 412, 443, 442, 385, 384, 415, 414, 445, 444, 387, 386, 417, 416,
+    447, 446, 477, 476, 507, 506, 537, 536, 475, 474, 505, 504, 535, 534, 473, 472,
+    503, 502, 533, 532, 455, 454, 485, 484, 515, 514, 453, 452, 483, 482, 513, 512,
+    451, 450, 481, 480, 511, 510, 541, 540, 571, 570, 601, 600, 543, 542, 573, 572,
+    603, 602, 545, 544, 575, 574, 605, 604, 563, 562, 593, 592, 623, 622, 565, 564,
+    595, 594, 625, 624, 567, 566, 597, 596, 627, 626, 657, 656, 687, 686, 717, 716,
+    655, 654, 685, 684, 715, 714, 653, 652, 683, 682, 713, 712, 637, 636, 667, 666,
+    697, 696, 635, 634, 665, 664, 695, 694, 633, 632, 663, 662, 693, 692, 631, 630,
+    661, 660, 691, 690, 721, 720, 751, 750, 781, 780, 723, 722, 753, 752, 783, 782,
+    725, 724, 755, 754, 785, 784, 727, 726, 757, 756, 787, 786, 729, 728, 759, 758,
+    789, 788, 731, 730, 761, 760, 791, 790, 733, 732, 763, 762, 793, 792, 735, 734,
+    765, 764, 795, 794, 737, 736, 767, 766, 797, 796, 739, 738, 769, 768, 799, 798,
+    741, 740, 771, 770, 801, 800, 743, 742, 773, 772, 803, 802, 745, 744, 775, 774,
+    805, 804, 747, 746, 777, 776, 807, 806, 837, 836, 867, 866, 897, 896, 835, 834,
+    865, 864, 895, 894, 833, 832, 863, 862, 893, 892, 831, 830, 861, 860, 891, 890,
+    829, 828, 859, 858, 889, 888, 827, 826, 857, 856, 887, 886, 825, 824, 855, 854,
+    885, 884, 823, 822, 853, 852, 883, 882, 821, 820, 851, 850, 881, 880, 819, 818,
+    849, 848, 879, 878, 817, 816, 847, 846, 877, 876, 815, 814, 845, 844, 875, 874,
+    813, 812, 843, 842, 873, 872, 811, 810, 841, 840, 871, 870, 901, 900, 931, 930,
+    961, 960, 903, 902, 933, 932, 963, 962, 905, 904, 935, 934, 965, 964, 907, 906,
+    937, 936, 967, 966, 909, 908, 939, 938, 969, 968, 911, 910, 941, 940, 971, 970,
+    913, 912, 943, 942, 973, 972, 915, 914, 945, 944, 975, 974, 917, 916, 947, 946,
+    977, 976, 919, 918, 949, 948, 979, 978, 921, 920, 951, 950, 981, 980, 923, 922,
+    953, 952, 983, 982, 925, 924, 955, 954, 985, 984, 927, 926, 957, 956, 987, 986,
+     58,  89,  88, 118, 149, 148, 178, 209, 208, 238, 269, 268, 298, 329, 328, 358,
+    389, 388, 418, 449, 448, 478, 509, 508, 538, 569, 568, 598, 629, 628, 658, 689,
+    688, 718, 749, 748, 778, 809, 808, 838, 869, 868, 898, 929, 928, 958, 989, 988,
+    ]
+# dark orientation modules around the bullseye
+MAXICODE_ORIENTATION = [28, 29, 280, 281, 311, 457, 488, 500, 530, 670, 700,
+                        677, 707]
+MAXICODE_FIELD = 0x43
+MAXICODE_HEADER = '[)>\x1e01\x1d'
+
+
+def _prefix_in(cset, codes, start):
+    """Counts the characters from start, up to four, in cset.
+    """
+    values = MAXICODE_CHARVALS[cset]
+    count = 0
+    for code in codes[start:start+4]:
+        if code not in values:
+            break
+        count += 1
+    return count
+
+
+def maxicode_message(msg):
+    """Encodes msg into codeword values the way BWIPP does: returns them
+    and the set in force at the end, whose PAD fills the symbol.
+
+    Runs of nine digits go as a numeric shift; other characters latch
+    or shift to the set holding them.
+
+    >>> maxicode_message('Ab123456789')
+    ([1, 59, 2, 31, 7, 22, 60, 52, 21], 0)
+    >>> maxicode_message('\\xe9t\\xe9')
+    ([61, 9, 59, 20, 61, 9], 0)
+    """
+    codes = [ord(c) for c in msg]
+    n = len(codes)
+    # lengths of digit runs from each position
+    digits = [0]*(n+1)
+    for i in range(n-1, -1, -1):
+        if 48<=codes[i]<=57:
+            digits[i] = digits[i+1]+1
+    seta, setb = MAXICODE_CHARVALS[SET_A], MAXICODE_CHARVALS[SET_B]
+    out, cset, i = [], SET_A, 0
+    while i<n:
+        values = MAXICODE_CHARVALS[cset]
+        if digits[i]>=9:
+            number = int(msg[i:i+9])
+            out.append(values[NS])
+            out.extend((number>>shift)&63 for shift in (24, 18, 12, 6, 0))
+            i += 9
+            continue
+        code = codes[i]
+        if code in values:
+            out.append(values[code])
+            i += 1
+        elif cset==SET_A and code in setb:
+            if i+1<n and codes[i+1] in setb:
+                out.append(seta[LB])
+                cset = SET_B
+            else:
+                out.extend((seta[SB], setb[code]))
+                i += 1
+        elif cset==SET_B and code in seta:
+            count = _prefix_in(SET_A, codes, i)
+            if count>=4:
+                out.append(setb[LA])
+                cset = SET_A
+            else:
+                out.append(setb[(SA, SA2, SA3)[count-1]])
+                out.extend(seta[c] for c in codes[i:i+count])
+                i += count
+        elif code in seta:
+            out.append(values[LA])
+            cset = SET_A
+        elif code in setb:
+            out.append(values[LB])
+            cset = SET_B
+        else:
+            for setx in (SET_E, SET_D, SET_C):
+                if code in MAXICODE_CHARVALS[setx]:
+                    break
+            else:
+                raise ValueError(u'MaxiCode cannot encode character %d.' %code)
+            shift, lock = _SHIFTS[setx]
+            valuesx = MAXICODE_CHARVALS[setx]
+            count = _prefix_in(setx, codes, i)
+            if count>=4:
+                out.extend((values[shift], valuesx[lock]))
+                cset = setx
+            else:
+                for c in codes[i:i+count]:
+                    out.extend((values[shift], valuesx[c]))
+                i += count
+    if cset not in (SET_A, SET_B):
+        out.append(MAXICODE_CHARVALS[cset][LA])
+        cset = SET_A
+    return out, cset
+
+
+def maxicode_primary(mode, postcode, country, service):
+    """Returns the ten primary codewords of a structured carrier message
+    of mode 2 (numeric postcode) or 3 (postcode of six set A characters).
+
+    >>> maxicode_primary(2, '152382802', '840', '001')
+    [34, 20, 45, 20, 17, 18, 2, 18, 7, 0]
+    """
+    seta = MAXICODE_CHARVALS[SET_A]
+    try:
+        if mode==2:
+            if not postcode.isdigit() or len(postcode)>9:
+                raise ValueError
+            pcb = format(len(postcode), '06b')+format(int(postcode), '030b')
+        else:
+            pcb = ''.join(format(seta[ord(c)], '06b')
+                          for c in postcode[:6].ljust(6))
+        ccb = format(int(country), '010b')
+        scb = format(int(service), '010b')
+    except (ValueError, KeyError):
+        raise ValueError(u'Invalid structured carrier message of MaxiCode.')
+    if len(ccb)>10 or len(scb)>10:
+        raise ValueError(u'Invalid structured carrier message of MaxiCode.')
+    scm = (pcb[34:36]+format(mode, '04b')+pcb[28:34]+pcb[22:28]+pcb[16:22]
+           +pcb[10:16]+pcb[4:10]+ccb[8:10]+pcb[0:4]+ccb[2:8]+scb[6:10]
+           +ccb[0:2]+scb[0:6])
+    return [int(scm[i:i+6], 2) for i in range(0, 60, 6)]
+
+
+def _rs_check(data, nsym):
+    field = get_field(MAXICODE_FIELD)
+    return rs_encode(field, data, rs_generator(field, nsym))
+
+
+def maxicode_codewords(msg, mode=4, sam=-1):
+    """Returns the 144 codewords of msg in mode 2 to 6, or -1 for 5 if
+    msg fits and 4 otherwise, with error correction.
+
+    Modes 2 and 3 take a structured carrier message: postcode, country
+    and service class separated by GS, optionally after the
+    '[)>\\\\x1e01\\\\x1d' header and a two-digit year.  sam, if not -1,
+    gives the position and count of structured append as two digits.
+
+    >>> cws = maxicode_codewords('MaxiCode')
+    >>> len(cws), cws[:12]
+    (144, [4, 13, 63, 1, 24, 9, 59, 3, 15, 4, 50, 2])
+    >>> maxicode_codewords('ABC', mode=5)[:4]
+    [5, 1, 2, 3]
+    """
+    if mode in (2, 3):
+        fid = ''
+        if msg.startswith(MAXICODE_HEADER):
+            fid, msg = msg[:9], msg[9:]
+        fields = msg.split('\x1d', 3)
+        if len(fields)<4:
+            raise ValueError(u'Invalid structured carrier message of MaxiCode.')
+        postcode, country, service, msg = fields
+        primary = maxicode_primary(mode, postcode, country, service)
+        msg = fid+msg
+    elif mode not in (-1, 4, 5, 6):
+        raise ValueError(u'MaxiCode takes modes 2 to 6.')
+    encoded, cset = maxicode_message(msg)
+    padval = MAXICODE_CHARVALS[cset][PAD]
+    if sam!=-1:
+        encoded = [MAXICODE_CHARVALS[SET_A][PAD],
+                   (sam//10-1)*8+sam%10-1]+encoded
+    if mode in (2, 3):
+        capacity = 84
+    else:
+        if mode==-1:
+            mode = 5 if len(encoded)<=77 else 4
+        # the mode leads the primary codewords
+        capacity = 78 if mode==5 else 94
+        encoded = [mode]+encoded
+    if len(encoded)>capacity:
+        raise ValueError(u'Message is too long for MaxiCode.')
+    encoded = encoded+[padval]*(capacity-len(encoded))
+    if mode in (2, 3):
+        secondary = encoded
+    else:
+        primary, secondary = encoded[:10], encoded[10:]
+    nsym = 20 if len(secondary)==84 else 28
+    odd = _rs_check(secondary[0::2], nsym)
+    even = _rs_check(secondary[1::2], nsym)
+    check = [cw for pair in zip(odd, even) for cw in pair]
+    return primary+_rs_check(primary, 10)+secondary+check
+
+
+def encode_maxicode(codestring, mode=4, sam=-1, parse=False):
+    """Encodes codestring into MaxiCodeGeometry, taking the options of
+    maxicode_codewords().
+
+    >>> g = encode_maxicode('MaxiCode')
+    >>> len(g.pixs), g.pixs[:4].tolist()
+    (357, [3, 5, 7, 9])
+    """
+    if parse:
+        codestring = cap_unescape(codestring)
+    codewords = maxicode_codewords(codestring, mode, sam)
+    module_map = MAXICODE_MODULE_MAP
+    pixs = [module_map[6*i+bit] for i, codeword in enumerate(codewords)
+            for bit in range(6) if codeword&(32>>bit)]
+    return MaxiCodeGeometry(pixs+MAXICODE_ORIENTATION)
+
 
 class MaxiCode(Barcode):
     """
@@ -51,6 +391,10 @@ class MaxiCode(Barcode):
     ...     options=dict(mode=2, parse=True)) # doctest: +ELLIPSIS
     <PIL.EpsImagePlugin.EpsImageFile ... at ...>
     >>> # _.show()
+    >>> len(bc.encode('This is MaxiCode', options=dict(mode=5)).pixs)
+    396
+    >>> bc.rasterize('This is MaxiCode').size
+    (75, 72)
     """
     codetype = 'maxicode'
     aliases = ('maxi-code', 'maxi code', 'maxi_code', 'maxi')
@@ -63,6 +407,12 @@ class MaxiCode(Barcode):
         def code_bbox(self):
             col, row = [v*2.4945 for v in (29+0.5*2, 32*0.8661+0.5774*2)]
             return (0, 0, col, row) 
+
+        def native_encode(self, codestring):
+            return encode_maxicode(
+                codestring, self.lookup_option('mode'), self.lookup_option('sam'),
+                bool(self.lookup_option('parse')))
+
     renderer = _Renderer
 
 if __name__=="__main__":
@@ -1,5 +1,92 @@
 # coding: utf-8
 from base import Barcode, LinearCodeRenderer, DPI
+from linear import widths, linear_options, LinearBuilder
+
+
+MSI_PATTERNS = ('12121212 12121221 12122112 12122121 12211212 '
+                '12211221 12212112 12212121 21121212 21121221').split()
+MSI_START, MSI_STOP = '21', '121'
+
+
+def msi_mod10(digits):
+    """Appends the MSI modulo 10 (Luhn) check digit to digits.
+
+    >>> msi_mod10('0123456789')
+    '01234567897'
+    """
+    doubled = str(int(digits[-1::-2][::-1] or '0')*2)
+    total = sum(int(d) for d in doubled)+sum(int(d) for d in digits[-2::-2])
+    return digits+str((10-total%10)%10)
+
+
+def _mod11(digits, cycle, badmod11):
+    total = sum(int(d)*(i%cycle+2) for i, d in enumerate(reversed(digits)))
+    check = (11-total%11)%11
+    if check==10:
+        if not badmod11:
+            raise ValueError(u'MSI modulo 11 check digit is 10; '
+                             u'set badmod11 to encode it as "10".')
+        return digits+'10'
+    return digits+str(check)
+
+
+def msi_mod11(digits, badmod11=False):
+    """Appends the IBM modulo 11 check digit (weights 2 to 7) to digits.
+
+    >>> msi_mod11('0123456789')
+    '01234567892'
+    """
+    return _mod11(digits, 6, badmod11)
+
+
+def msi_ncrmod11(digits, badmod11=False):
+    """Appends the NCR modulo 11 check digit (weights 2 to 9) to digits.
+
+    >>> msi_ncrmod11('0123456789')
+    '01234567897'
+    """
+    return _mod11(digits, 8, badmod11)
+
+
+MSI_CHECKS = {
+    'mod10': lambda d, bad: msi_mod10(d),
+    'mod1010': lambda d, bad: msi_mod10(msi_mod10(d)),
+    'mod11': msi_mod11,
+    'ncrmod11': msi_ncrmod11,
+    'mod1110': lambda d, bad: msi_mod10(msi_mod11(d, bad)),
+    'ncrmod1110': lambda d, bad: msi_mod10(msi_ncrmod11(d, bad)),
+    }
+
+
+def encode_msi(codestring, includecheck=False, checktype='mod10',
+               badmod11=False, includecheckintext=False, includetext=False,
+               height=1.0, textsize=10, textyoffset=-7):
+    """Encodes digits into LinearGeometry of an MSI (modified Plessey)
+    symbol, with check digits of checktype if includecheck.
+
+    >>> g = encode_msi('0123456789', includecheck=True, includetext=True)
+    >>> g.width, len(g.bhs), len(g.text)
+    (139.0, 47, 10)
+    >>> encode_msi('0123456789', True, 'mod1110', includecheckintext=True,
+    ...            includetext=True).text[-1][:2]
+    ('9', 135)
+    """
+    if not codestring.isdigit():
+        raise ValueError(u'MSI must contain only digits.')
+    digits = codestring
+    if includecheck:
+        if checktype not in MSI_CHECKS:
+            raise ValueError(u'Unknown MSI check type %r.' %checktype)
+        digits = MSI_CHECKS[checktype](digits, badmod11)
+    shown = len(digits) if includecheck and includecheckintext else len(codestring)
+    builder = LinearBuilder()
+    builder.add(widths(MSI_START), height)
+    for i, digit in enumerate(digits):
+        builder.add(widths(MSI_PATTERNS[int(digit)]), height)
+        if includetext and i<shown:
+            builder.add_text(digit, 12*i+3, textyoffset, textsize)
+    builder.add(widths(MSI_STOP), height)
+    return builder.geometry()
 
 class MsiModifiedPlessey(Barcode):
     """
@@ -68,6 +155,14 @@ class MsiModifiedPlessey(Barcode):
                 tbbox = cbbox
             params['bbox'] = "%d %d %d %d" %self._boundingbox(cbbox, tbbox)
             return params
+
+        def native_encode(self, codestring):
+            return encode_msi(
+                codestring, bool(self.lookup_option('includecheck')),
+                self.lookup_option('checktype', 'mod10'),
+                bool(self.lookup_option('badmod11')),
+                bool(self.lookup_option('includecheckintext')),
+                **linear_options(self))
     renderer = _Renderer
 
 
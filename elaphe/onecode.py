@@ -1,5 +1,190 @@
 # coding: utf-8
 from base import Barcode, LinearCodeRenderer, DPI
+from postal import PostalCodeRenderer, states, char_indexes
+import postal
+
+
+def _n_of_13_table(n):
+    """Returns the USPS table of 13-bit characters with n bits set: pairs
+    of a character and its reversal, then palindromes from the end.
+
+    >>> table = _n_of_13_table(5)
+    >>> len(table), table[:4], table[-1]
+    (1287, [31, 7936, 47, 7808], 496)
+    >>> _n_of_13_table(2)[:6]
+    [3, 6144, 5, 5120, 6, 3072]
+    """
+    count = sum(1 for c in range(8192) if bin(c).count('1')==n)
+    table = [0]*count
+    low, high = 0, count-1
+    for c in range(8192):
+        if bin(c).count('1')!=n:
+            continue
+        reverse = int(bin(c)[2:].zfill(13)[::-1], 2)
+        if reverse<c:
+            continue
+        if reverse==c:
+            table[high] = c
+            high -= 1
+        else:
+            table[low:low+2] = [c, reverse]
+            low += 2
+    return table
+
+ONECODE_CHARACTERS = _n_of_13_table(5)+_n_of_13_table(2)
+# character and bit of the descender, then of the ascender, of each bar
+ONECODE_BARMAP = [
+    7, 2, 4, 3, 1, 10, 0, 0, 9, 12, 2, 8, 5, 5, 6, 11, 8, 9, 3, 1,
+    0, 1, 5, 12, 2, 5, 1, 8, 4, 4, 9, 11, 6, 3, 8, 10, 3, 9, 7, 6,
+    5, 11, 1, 4, 8, 5, 2, 12, 9, 10, 0, 2, 7, 1, 6, 7, 3, 6, 4, 9,
+    0, 3, 8, 6, 6, 4, 2, 7, 1, 1, 9, 9, 7, 10, 5, 2, 4, 0, 3, 8,
+    6, 2, 0, 4, 8, 11, 1, 0, 9, 8, 3, 12, 2, 6, 7, 7, 5, 1, 4, 10,
+    1, 12, 6, 9, 7, 3, 8, 0, 5, 8, 9, 7, 4, 6, 2, 10, 3, 4, 0, 5,
+    8, 4, 5, 7, 7, 11, 1, 9, 6, 0, 9, 6, 0, 6, 4, 8, 2, 1, 3, 2,
+    5, 9, 8, 12, 4, 11, 6, 1, 9, 5, 7, 4, 3, 3, 1, 2, 0, 7, 2, 0,
+    1, 3, 4, 1, 6, 10, 3, 5, 8, 7, 9, 4, 2, 11, 5, 6, 0, 8, 7, 12,
+    4, 2, 8, 1, 5, 10, 3, 0, 9, 3, 0, 9, 6, 5, 2, 4, 7, 8, 1, 7,
+    5, 0, 4, 5, 2, 3, 0, 10, 6, 12, 9, 2, 3, 11, 1, 6, 8, 8, 7, 9,
+    5, 4, 0, 11, 1, 5, 2, 2, 9, 1, 4, 12, 8, 3, 6, 6, 7, 0, 3, 7,
+    4, 7, 7, 5, 0, 12, 1, 11, 2, 9, 9, 0, 6, 8, 5, 3, 3, 10, 8, 2,
+    ]
+# added to routing codes of 0, 5, 9 and 11 digits
+ONECODE_ROUTING_OFFSETS = {0: 0, 5: 1, 9: 100001, 11: 1000100001}
+ONECODE_CRC_POLY = 0xF35
+# human readable text breaks before these digits
+ONECODE_TEXT_BREAKS = (2, 5, 20, 25, 29)
+
+
+def _onecode_fcs(data):
+    """Returns the 11-bit frame check sequence of 13 bytes of data.
+    """
+    fcs = 0x7FF
+    for i, byte in enumerate(data):
+        bits = 6 if i==0 else 8
+        byte <<= 11-bits
+        for _ in range(bits):
+            fcs = (fcs<<1)^(ONECODE_CRC_POLY if (fcs^byte)&0x400 else 0)
+            fcs &= 0x7FF
+            byte <<= 1
+    return fcs
+
+
+def onecode_text(codestring):
+    """Returns human readable text of an Intelligent Mail symbol.
+
+    >>> onecode_text('0123456709498765432101234567891')
+    '01 234 567094 987654321 01234 5678 91'
+    """
+    breaks = set(ONECODE_TEXT_BREAKS+((14 if codestring[5:6]=='9' else 11),))
+    return ''.join((' ' if i in breaks else '')+c for i, c in enumerate(codestring))
+
+
+def _check_onecode(codestring):
+    if len(codestring)-20 not in ONECODE_ROUTING_OFFSETS:
+        raise ValueError(u'USPS Intelligent Mail must be 20, 25, 29 or 31 digits.')
+    if not codestring.isdigit():
+        raise ValueError(u'USPS Intelligent Mail must contain only digits.')
+    if codestring[1]>'4':
+        raise ValueError(u'USPS Intelligent Mail barcode identifier must end in 0 to 4.')
+
+
+def encode_onecode(codestring):
+    """Returns bar states and text of a USPS Intelligent Mail symbol.
+
+    >>> bar_states, text = encode_onecode('0123456709498765432101234567891')
+    >>> ''.join('TDAF'[s] for s in bar_states)
+    'AADTFFDFTDADTAADAATFDTDDAAADDTDTTDAFADADDDTFFFDDTTTADFAAADFTDAADA'
+    >>> text
+    [('01 234 567094 987654321 01234 5678 91', 0)]
+    """
+    _check_onecode(codestring)
+    routing = codestring[20:]
+    value = (int(routing) if routing else 0)+ONECODE_ROUTING_OFFSETS[len(routing)]
+    value = (value*10+int(codestring[0]))*5+int(codestring[1])
+    value = value*10**18+int(codestring[2:20])
+    fcs = _onecode_fcs([value>>8*i & 0xFF for i in range(12, -1, -1)])
+    codewords = []
+    for base in [636]+[1365]*9:
+        value, codeword = divmod(value, base)
+        codewords.insert(0, codeword)
+    codewords[9] *= 2
+    if fcs&0x400:
+        codewords[0] += 659
+    chars = [ONECODE_CHARACTERS[c]^(8191 if fcs>>i & 1 else 0)
+             for i, c in enumerate(codewords)]
+    bar_states = states(''.join(
+        str((chars[ONECODE_BARMAP[4*i]]>>ONECODE_BARMAP[4*i+1] & 1)
+            +2*(chars[ONECODE_BARMAP[4*i+2]]>>ONECODE_BARMAP[4*i+3] & 1))
+        for i in range(65)))
+    return bar_states, [(onecode_text(codestring), 0)]
+
+
+def _divmod_limbs(limbs, divisor):
+    """Divides numbers given as arrays of base 10**9 limbs, most
+    significant first (the first one may exceed the base).
+    """
+    numpy = postal.numpy
+    remainder = numpy.zeros_like(limbs[0])
+    quotient = []
+    for limb in limbs:
+        current = remainder*10**9+limb
+        quotient.append(current//divisor)
+        remainder = current%divisor
+    return quotient, remainder
+
+
+def onecode_states_bulk(codestrings):
+    """Vectorized encode_onecode() of codestrings of the same length.
+
+    The 102-bit binary value of each symbol is kept in base 10**9 limbs
+    so that the whole run is divided at once.
+
+    >>> codestrings = ['0123456709498765432101234567891',
+    ...                '4499999999999999999999999999999']
+    >>> bulk = onecode_states_bulk(codestrings)
+    >>> [row.tolist() for row in bulk]==[
+    ...     encode_onecode(c)[0].tolist() for c in codestrings]
+    True
+    """
+    digits = char_indexes(codestrings, '0123456789', 'USPS Intelligent Mail')
+    numpy = postal.numpy
+    for codestring in codestrings:
+        _check_onecode(codestring)
+    digits = digits.astype(numpy.int64)
+    def number(columns):
+        value = numpy.zeros(len(digits), numpy.int64)
+        for column in columns.T:
+            value = value*10+column
+        return value
+    count, length = digits.shape
+    routing = number(digits[:, 20:])+ONECODE_ROUTING_OFFSETS.get(length-20, 0)
+    limbs = [(routing*10+digits[:, 0])*5+digits[:, 1],
+             number(digits[:, 2:11]), number(digits[:, 11:20])]
+    data = numpy.empty((13, count), numpy.int64)
+    quotient = limbs
+    for i in range(12, -1, -1):
+        quotient, data[i] = _divmod_limbs(quotient, 256)
+    fcs = numpy.empty(count, numpy.int64)
+    fcs.fill(0x7FF)
+    for i, byte in enumerate(data):
+        bits = 6 if i==0 else 8
+        byte = byte<<(11-bits)
+        for _ in range(bits):
+            fcs = ((fcs<<1)^numpy.where((fcs^byte)&0x400, ONECODE_CRC_POLY, 0))&0x7FF
+            byte = byte<<1
+    codewords = numpy.empty((count, 10), numpy.int64)
+    quotient = limbs
+    for i, base in zip(range(9, -1, -1), [636]+[1365]*9):
+        quotient, codewords[:, i] = _divmod_limbs(quotient, base)
+    codewords[:, 9] *= 2
+    codewords[:, 0] += numpy.where(fcs&0x400, 659, 0)
+    chars = numpy.array(ONECODE_CHARACTERS, numpy.int64)[codewords]
+    chars ^= numpy.where((fcs[:, None]>>numpy.arange(10)) & 1, 8191, 0)
+    barmap = numpy.array(ONECODE_BARMAP).reshape(65, 4)
+    descenders = chars[:, barmap[:, 0]]>>barmap[:, 1] & 1
+    ascenders = chars[:, barmap[:, 2]]>>barmap[:, 3] & 1
+    return (descenders+2*ascenders).astype(numpy.uint8)
+
 
 class OneCode(Barcode):
     """
@@ -29,7 +214,7 @@ class OneCode(Barcode):
     """
     codetype = 'onecode'
     aliases = ('usps onecode', 'uspsonecode', 'usps-onecode', 'usps_onecode')
-    class _Renderer(LinearCodeRenderer):
+    class _Renderer(PostalCodeRenderer):
         default_options = dict(
             LinearCodeRenderer.default_options,
             height=0.175, textyoffset=-7, textsize=12)
@@ -48,6 +233,12 @@ class OneCode(Barcode):
                 return [0, textyoffset, (12-1)*7+8+textsize*0.6, textyoffset+textsize]
             else:
                 return self.code_bbox
+
+        def native_symbol(self, codestring):
+            return encode_onecode(codestring)
+
+        def native_states_bulk(self, codestrings):
+            return onecode_states_bulk(codestrings)
     renderer = _Renderer
 
 if __name__=="__main__":
@@ -0,0 +1,95 @@
+# coding: utf-8
+"""Renders batches of symbols on a pool of processes.
+
+Items are split into chunks, and each chunk is rendered by one worker
+process in a single Ghostscript run (see batch module), so a batch
+keeps every core busy.  Failures are reported per item and do not stop
+the rest of the batch.
+"""
+import multiprocessing
+from itertools import islice
+import batch, cache
+from base import Barcode
+
+__all__ = ['DEFAULT_CHUNK_SIZE', 'render_parallel']
+
+
+DEFAULT_CHUNK_SIZE = 16
+
+
+def _chunks(items, chunk_size):
+    """Yields lists of (index, item) of at most chunk_size items.
+
+    >>> list(_chunks('abcde', 2))
+    [[(0, 'a'), (1, 'b')], [(2, 'c'), (3, 'd')], [(4, 'e')]]
+    """
+    items = enumerate(items)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _render_chunk(args):
+    """Renders a chunk in a worker process; returns [(index, result)].
+
+    result is a loaded PIL image or the exception raised for the item.
+    """
+    chunk, render_options = args
+    results, jobs, indexes = [], [], []
+    for index, item in chunk:
+        try:
+            codetype, codestring, options = (tuple(item)+(None,))[:3]
+            subclass = Barcode.resolve_codetype(codetype)
+            if not subclass:
+                raise ValueError(u'No renderer for codetype %s' %codetype)
+            jobs.append((subclass().get_renderer(options, **render_options),
+                         codestring))
+            indexes.append(index)
+        except Exception, e:
+            results.append((index, e))
+    try:
+        images = batch.render_batch(jobs, errors='return')
+    except Exception, e:
+        images = [e]*len(jobs)
+    results.extend(zip(indexes, images))
+    return results
+
+
+def render_parallel(items, max_workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                    ordered=True, errors='return', **kw):
+    """Renders items on max_workers processes (default: one per core).
+
+    items are (codetype, codestring) or (codetype, codestring, options)
+    tuples; render options given as keywords apply to all items.  Yields
+    (index, result) pairs as chunks complete, in order of items if
+    ordered is True.  result is a PIL image, or with errors='return'
+    the exception raised for the item; errors='raise' raises it instead.
+
+    >>> list(render_parallel([('nonexistent', '1')], max_workers=1))
+    [(0, ValueError(u'No renderer for codetype nonexistent',))]
+    """
+    render_options = dict((k, v) for k, v in kw.items()
+                          if k not in cache.NON_RENDER_OPTIONS)
+    pool = multiprocessing.Pool(max_workers)
+    try:
+        tasks = ((chunk, render_options) for chunk in _chunks(items, chunk_size))
+        if ordered:
+            chunk_results = pool.imap(_render_chunk, tasks)
+        else:
+            chunk_results = pool.imap_unordered(_render_chunk, tasks)
+        for results in chunk_results:
+            for index, result in sorted(results):
+                if isinstance(result, Exception) and errors=='raise':
+                    raise result
+                yield index, result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+if __name__=="__main__":
+    from doctest import testmod
+    testmod()
@@ -1,7 +1,773 @@
 # coding: utf-8
-import itertools, math
+import math, re
 from base import Barcode, MatrixCodeRenderer, DPI
+from geometry import MatrixGeometry
 from util import cap_unescape
+from reedsolomon import get_prime_field, rs_generator, rs_encode
+
+# bar/space patterns of codewords 0..928, as 17-module integers, in
+# clusters 0, 3 and 6
+PDF417_CLUSTERS = (
+    [
+     120256, 125680, 128380, 120032, 125560, 128318, 108736, 119920, 108640,
+      86080, 108592,  86048, 110016, 120560, 125820, 109792, 120440, 125758,
+      88256, 109680,  88160,  89536, 110320, 120700,  89312, 110200, 120638,
+      89200, 110140,  89840, 110460,  89720, 110398,  89980, 128506, 119520,
+     125304, 128190, 107712, 119408, 125244, 107616, 119352,  84032, 107568,
+     119324,  84000, 107544,  83984, 108256, 119672, 125374,  85184, 108144,
+     119612,  85088, 108088, 119582,  85040, 108060,  85728, 108408, 119742,
+      85616, 108348,  85560, 108318,  85880, 108478,  85820,  85790, 107200,
+     119152, 125116, 107104, 119096, 125086,  83008, 107056, 119068,  82976,
+     107032,  82960,  82952,  83648, 107376, 119228,  83552, 107320, 119198,
+      83504, 107292,  83480,  83468,  83824, 107452,  83768, 107422,  83740,
+      83900, 106848, 118968, 125022,  82496, 106800, 118940,  82464, 106776,
+     118926,  82448, 106764,  82440, 106758,  82784, 106936, 119006,  82736,
+     106908,  82712, 106894,  82700,  82694, 106974,  82830,  82240, 106672,
+     118876,  82208, 106648, 118862,  82192, 106636,  82184, 106630,  82180,
+      82352,  82328,  82316,  82080, 118830, 106572, 106566,  82050, 117472,
+     124280, 127678, 103616, 117360, 124220, 103520, 117304, 124190,  75840,
+     103472,  75808, 104160, 117624, 124350,  76992, 104048, 117564,  76896,
+     103992,  76848,  76824,  77536, 104312, 117694,  77424, 104252,  77368,
+      77340,  77688, 104382,  77628,  77758, 121536, 126320, 128700, 121440,
+     126264, 128670, 111680, 121392, 126236, 111648, 121368, 126222, 111632,
+     121356, 103104, 117104, 124092, 112320, 103008, 117048, 124062, 112224,
+     121656, 126366,  93248,  74784, 102936, 117006,  93216, 112152,  93200,
+      75456, 103280, 117180,  93888,  75360, 103224, 117150,  93792, 112440,
+     121758,  93744,  75288,  93720,  75632, 103356,  94064,  75576, 103326,
+      94008, 112542,  93980,  75708,  94140,  75678,  94110, 121184, 126136,
+     128606, 111168, 121136, 126108, 111136, 121112, 126094, 111120, 121100,
+     111112, 111108, 102752, 116920, 123998, 111456, 102704, 116892,  91712,
+      74272, 121244, 116878,  91680,  74256, 102668,  91664, 111372, 102662,
+      74244,  74592, 102840, 116958,  92000,  74544, 102812,  91952, 111516,
+     102798,  91928,  74508,  74502,  74680, 102878,  92088,  74652,  92060,
+      74638,  92046,  92126, 110912, 121008, 126044, 110880, 120984, 126030,
+     110864, 120972, 110856, 120966, 110852, 110850,  74048, 102576, 116828,
+      90944,  74016, 102552, 116814,  90912, 111000, 121038,  90896,  73992,
+     102534,  90888, 110982,  90884,  74160, 102620,  91056,  74136, 102606,
+      91032, 111054,  91020,  74118,  91014,  91100,  91086, 110752, 120920,
+     125998, 110736, 120908, 110728, 120902, 110724, 110722,  73888, 102488,
+     116782,  90528,  73872, 102476,  90512, 110796, 102470,  90504,  73860,
+      90500,  73858,  73944,  90584,  90572,  90566, 120876, 120870, 110658,
+     102444,  73800,  90312,  90308,  90306, 101056, 116080, 123580, 100960,
+     116024,  70720, 100912, 115996,  70688, 100888,  70672,  70664,  71360,
+     101232, 116156,  71264, 101176, 116126,  71216, 101148,  71192,  71180,
+      71536, 101308,  71480, 101278,  71452,  71612,  71582, 118112, 124600,
+     127838, 105024, 118064, 124572, 104992, 118040, 124558, 104976, 118028,
+     104968, 118022, 100704, 115896, 123486, 105312, 100656, 115868,  79424,
+      70176, 118172, 115854,  79392, 105240, 100620,  79376,  70152,  79368,
+      70496, 100792, 115934,  79712,  70448, 118238,  79664, 105372, 100750,
+      79640,  70412,  79628,  70584, 100830,  79800,  70556,  79772,  70542,
+      70622,  79838, 122176, 126640, 128860, 122144, 126616, 128846, 122128,
+     126604, 122120, 126598, 122116, 104768, 117936, 124508, 113472, 104736,
+     126684, 124494, 113440, 122264, 126670, 113424, 104712, 117894, 113416,
+     122246, 104706,  69952, 100528, 115804,  78656,  69920, 100504, 115790,
+      96064,  78624, 104856, 117966,  96032, 113560, 122318, 100486,  96016,
+      78600, 104838,  96008,  69890,  70064, 100572,  78768,  70040, 100558,
+      96176,  78744, 104910,  96152, 113614,  70022,  78726,  70108,  78812,
+      70094,  96220,  78798, 122016, 126552, 128814, 122000, 126540, 121992,
+     126534, 121988, 121986, 104608, 117848, 124462, 113056, 104592, 126574,
+     113040, 122060, 117830, 113032, 104580, 113028, 104578, 113026,  69792,
+     100440, 115758,  78240,  69776, 100428,  95136,  78224, 104652, 100422,
+      95120, 113100,  69764,  95112,  78212,  69762,  78210,  69848, 100462,
+      78296,  69836,  95192,  78284,  69830,  95180,  78278,  69870,  95214,
+     121936, 126508, 121928, 126502, 121924, 121922, 104528, 117804, 112848,
+     104520, 117798, 112840, 121958, 112836, 104514, 112834,  69712, 100396,
+      78032,  69704, 100390,  94672,  78024, 104550,  94664, 112870,  69698,
+      94660,  78018,  94658,  78060,  94700,  94694, 126486, 121890, 117782,
+     104484, 104482,  69672,  77928,  94440,  69666,  77922,  99680,  68160,
+      99632,  68128,  99608, 115342,  68112,  99596,  68104,  99590,  68448,
+      99768, 115422,  68400,  99740,  68376,  99726,  68364,  68358,  68536,
+      99806,  68508,  68494,  68574, 101696, 116400, 123740, 101664, 116376,
+     101648, 116364, 101640, 116358, 101636,  67904,  99504, 115292,  72512,
+      67872, 116444, 115278,  72480, 101784, 116430,  72464,  67848,  99462,
+      72456, 101766,  67842,  68016,  99548,  72624,  67992,  99534,  72600,
+     101838,  72588,  67974,  68060,  72668,  68046,  72654, 118432, 124760,
+     127918, 118416, 124748, 118408, 124742, 118404, 118402, 101536, 116312,
+     105888, 101520, 116300, 105872, 118476, 116294, 105864, 101508, 105860,
+     101506, 105858,  67744,  99416,  72096,  67728, 116334,  80800,  72080,
+     101580,  99398,  80784, 105932,  67716,  80776,  72068,  67714,  72066,
+      67800,  99438,  72152,  67788,  80856,  72140,  67782,  80844,  72134,
+      67822,  72174,  80878, 126800, 128940, 126792, 128934, 126788, 126786,
+     118352, 124716, 122576, 126828, 124710, 122568, 126822, 122564, 118338,
+     122562, 101456, 116268, 105680, 101448, 116262, 114128, 105672, 118374,
+     114120, 122598, 101442, 114116, 105666, 114114,  67664,  99372,  71888,
+      67656,  99366,  80336,  71880, 101478,  97232,  80328, 105702,  67650,
+      97224, 114150,  71874,  97220,  67692,  71916,  67686,  80364,  71910,
+      97260,  80358,  97254, 126760, 128918, 126756, 126754, 118312, 124694,
+     122472, 126774, 122468, 118306, 122466, 101416, 116246, 105576, 101412,
+     113896, 105572, 101410, 113892, 105570, 113890,  67624,  99350,  71784,
+     101430,  80104,  71780,  67618,  96744,  80100,  71778,  96740,  80098,
+      96738,  71798,  96758, 126738, 122420, 122418, 105524, 113780, 113778,
+      71732,  79988,  96500,  96498,  66880,  66848,  98968,  66832,  66824,
+      66820,  66992,  66968,  66956,  66950,  67036,  67022, 100000,  99984,
+     115532,  99976, 115526,  99972,  99970,  66720,  98904,  69024, 100056,
+      98892,  69008, 100044,  69000, 100038,  68996,  66690,  68994,  66776,
+      98926,  69080, 100078,  69068,  66758,  69062,  66798,  69102, 116560,
+     116552, 116548, 116546,  99920, 102096, 116588, 115494, 102088, 116582,
+     102084,  99906, 102082,  66640,  68816,  66632,  98854,  73168,  68808,
+      66628,  73160,  68804,  66626,  73156,  68802,  66668,  68844,  66662,
+      73196,  68838,  73190, 124840, 124836, 124834, 116520, 118632, 124854,
+     118628, 116514, 118626,  99880, 115478, 101992, 116534, 106216, 101988,
+      99874, 106212, 101986, 106210,  66600,  98838,  68712,  99894,  72936,
+      68708,  66594,  81384,  72932,  68706,  81380,  72930,  66614,  68726,
+      72950,  81398, 128980, 128978, 124820, 126900, 124818, 126898, 116500,
+     118580, 116498, 122740, 118578, 122738,  99860, 101940,  99858, 106100,
+     101938, 114420,
+     ],
+    [
+     128352, 129720, 125504, 128304, 129692, 125472, 128280, 129678, 125456,
+     128268, 125448, 128262, 125444, 125792, 128440, 129758, 120384, 125744,
+     128412, 120352, 125720, 128398, 120336, 125708, 120328, 125702, 120324,
+     120672, 125880, 128478, 110144, 120624, 125852, 110112, 120600, 125838,
+     110096, 120588, 110088, 120582, 110084, 110432, 120760, 125918,  89664,
+     110384, 120732,  89632, 110360, 120718,  89616, 110348,  89608, 110342,
+      89952, 110520, 120798,  89904, 110492,  89880, 110478,  89868,  90040,
+     110558,  90012,  89998, 125248, 128176, 129628, 125216, 128152, 129614,
+     125200, 128140, 125192, 128134, 125188, 125186, 119616, 125360, 128220,
+     119584, 125336, 128206, 119568, 125324, 119560, 125318, 119556, 119554,
+     108352, 119728, 125404, 108320, 119704, 125390, 108304, 119692, 108296,
+     119686, 108292, 108290,  85824, 108464, 119772,  85792, 108440, 119758,
+      85776, 108428,  85768, 108422,  85764,  85936, 108508,  85912, 108494,
+      85900,  85894,  85980,  85966, 125088, 128088, 129582, 125072, 128076,
+     125064, 128070, 125060, 125058, 119200, 125144, 128110, 119184, 125132,
+     119176, 125126, 119172, 119170, 107424, 119256, 125166, 107408, 119244,
+     107400, 119238, 107396, 107394,  83872, 107480, 119278,  83856, 107468,
+      83848, 107462,  83844,  83842,  83928, 107502,  83916,  83910,  83950,
+     125008, 128044, 125000, 128038, 124996, 124994, 118992, 125036, 118984,
+     125030, 118980, 118978, 106960, 119020, 106952, 119014, 106948, 106946,
+      82896, 106988,  82888, 106982,  82884,  82882,  82924,  82918, 124968,
+     128022, 124964, 124962, 118888, 124982, 118884, 118882, 106728, 118902,
+     106724, 106722,  82408, 106742,  82404,  82402, 124948, 124946, 118836,
+     118834, 106612, 106610, 124224, 127664, 129372, 124192, 127640, 129358,
+     124176, 127628, 124168, 127622, 124164, 124162, 117568, 124336, 127708,
+     117536, 124312, 127694, 117520, 124300, 117512, 124294, 117508, 117506,
+     104256, 117680, 124380, 104224, 117656, 124366, 104208, 117644, 104200,
+     117638, 104196, 104194,  77632, 104368, 117724,  77600, 104344, 117710,
+      77584, 104332,  77576, 104326,  77572,  77744, 104412,  77720, 104398,
+      77708,  77702,  77788,  77774, 128672, 129880,  93168, 128656, 129868,
+      92664, 128648, 129862,  92412, 128644, 128642, 124064, 127576, 129326,
+     126368, 124048, 129902, 126352, 128716, 127558, 126344, 124036, 126340,
+     124034, 126338, 117152, 124120, 127598, 121760, 117136, 124108, 121744,
+     126412, 124102, 121736, 117124, 121732, 117122, 121730, 103328, 117208,
+     124142, 112544, 103312, 117196, 112528, 121804, 117190, 112520, 103300,
+     112516, 103298, 112514,  75680, 103384, 117230,  94112,  75664, 103372,
+      94096, 112588, 103366,  94088,  75652,  94084,  75650,  75736, 103406,
+      94168,  75724,  94156,  75718,  94150,  75758, 128592, 129836,  91640,
+     128584, 129830,  91388, 128580,  91262, 128578, 123984, 127532, 126160,
+     123976, 127526, 126152, 128614, 126148, 123970, 126146, 116944, 124012,
+     121296, 116936, 124006, 121288, 126182, 121284, 116930, 121282, 102864,
+     116972, 111568, 102856, 116966, 111560, 121318, 111556, 102850, 111554,
+      74704, 102892,  92112,  74696, 102886,  92104, 111590,  92100,  74690,
+      92098,  74732,  92140,  74726,  92134, 128552, 129814,  90876, 128548,
+      90750, 128546, 123944, 127510, 126056, 128566, 126052, 123938, 126050,
+     116840, 123958, 121064, 116836, 121060, 116834, 121058, 102632, 116854,
+     111080, 121078, 111076, 102626, 111074,  74216, 102646,  91112,  74212,
+      91108,  74210,  91106,  74230,  91126, 128532,  90494, 128530, 123924,
+     126004, 123922, 126002, 116788, 120948, 116786, 120946, 102516, 110836,
+     102514, 110834,  73972,  90612,  73970,  90610, 128522, 123914, 125978,
+     116762, 120890, 102458, 110714, 123552, 127320, 129198, 123536, 127308,
+     123528, 127302, 123524, 123522, 116128, 123608, 127342, 116112, 123596,
+     116104, 123590, 116100, 116098, 101280, 116184, 123630, 101264, 116172,
+     101256, 116166, 101252, 101250,  71584, 101336, 116206,  71568, 101324,
+      71560, 101318,  71556,  71554,  71640, 101358,  71628,  71622,  71662,
+     127824, 129452,  79352, 127816, 129446,  79100, 127812,  78974, 127810,
+     123472, 127276, 124624, 123464, 127270, 124616, 127846, 124612, 123458,
+     124610, 115920, 123500, 118224, 115912, 123494, 118216, 124646, 118212,
+     115906, 118210, 100816, 115948, 105424, 100808, 115942, 105416, 118246,
+     105412, 100802, 105410,  70608, 100844,  79824,  70600, 100838,  79816,
+     105446,  79812,  70594,  79810,  70636,  79852,  70630,  79846, 129960,
+      95728, 113404, 129956,  95480, 113278, 129954,  95356,  95294, 127784,
+     129430,  78588, 128872, 129974,  95996,  78462, 128868, 127778,  95870,
+     128866, 123432, 127254, 124520, 123428, 126696, 128886, 123426, 126692,
+     124514, 126690, 115816, 123446, 117992, 115812, 122344, 117988, 115810,
+     122340, 117986, 122338, 100584, 115830, 104936, 100580, 113640, 104932,
+     100578, 113636, 104930, 113634,  70120, 100598,  78824,  70116,  96232,
+      78820,  70114,  96228,  78818,  96226,  70134,  78838, 129940,  94968,
+     113022, 129938,  94844,  94782, 127764,  78206, 128820, 127762,  95102,
+     128818, 123412, 124468, 123410, 126580, 124466, 126578, 115764, 117876,
+     115762, 122100, 117874, 122098, 100468, 104692, 100466, 113140, 104690,
+     113138,  69876,  78324,  69874,  95220,  78322,  95218, 129930,  94588,
+      94526, 127754, 128794, 123402, 124442, 126522, 115738, 117818, 121978,
+     100410, 104570, 112890,  69754,  78074,  94714,  94398, 123216, 127148,
+     123208, 127142, 123204, 123202, 115408, 123244, 115400, 123238, 115396,
+     115394,  99792, 115436,  99784, 115430,  99780,  99778,  68560,  99820,
+      68552,  99814,  68548,  68546,  68588,  68582, 127400, 129238,  72444,
+     127396,  72318, 127394, 123176, 127126, 123752, 123172, 123748, 123170,
+     123746, 115304, 123190, 116456, 115300, 116452, 115298, 116450,  99560,
+     115318, 101864,  99556, 101860,  99554, 101858,  68072,  99574,  72680,
+      68068,  72676,  68066,  72674,  68086,  72694, 129492,  80632, 105854,
+     129490,  80508,  80446, 127380,  72062, 127924, 127378,  80766, 127922,
+     123156, 123700, 123154, 124788, 123698, 124786, 115252, 116340, 115250,
+     118516, 116338, 118514,  99444, 101620,  99442, 105972, 101618, 105970,
+      67828,  72180,  67826,  80884,  72178,  80882,  97008, 114044,  96888,
+     113982,  96828,  96798, 129482,  80252, 130010,  97148,  80190,  97086,
+     127370, 127898, 128954, 123146, 123674, 124730, 126842, 115226, 116282,
+     118394, 122618,  99386, 101498, 105722, 114170,  67706,  71930,  80378,
+      96632, 113854,  96572,  96542,  80062,  96702,  96444,  96414,  96350,
+     123048, 123044, 123042, 115048, 123062, 115044, 115042,  99048, 115062,
+      99044,  99042,  67048,  99062,  67044,  67042,  67062, 127188,  68990,
+     127186, 123028, 123316, 123026, 123314, 114996, 115572, 114994, 115570,
+      98932, 100084,  98930, 100082,  66804,  69108,  66802,  69106, 129258,
+      73084,  73022, 127178, 127450, 123018, 123290, 123834, 114970, 115514,
+     116602,  98874,  99962, 102138,  66682,  68858,  73210,  81272, 106174,
+      81212,  81182,  72894,  81342,  97648, 114364,  97592, 114334,  97564,
+      97550,  81084,  97724,  81054,  97694,  97464, 114270,  97436,  97422,
+      80990,  97502,  97372,  97358,  97326, 114868, 114866,  98676,  98674,
+      66292,  66290, 123098, 114842, 115130,  98618,  99194,  66170,  67322,
+      69310,  73404,  73374,  81592, 106334,  81564,  81550,  73310,  81630,
+      97968, 114524,  97944, 114510,  97932,  97926,  81500,  98012,  81486,
+      97998,  97880, 114478,  97868,  97862,  81454,  97902,  97836,  97830,
+      69470,  73564,  73550,  81752, 106414,  81740,  81734,  73518,  81774,
+      81708,  81702,
+     ],
+    [
+     109536, 120312,  86976, 109040, 120060,  86496, 108792, 119934,  86256,
+     108668,  86136, 129744,  89056, 110072, 129736,  88560, 109820, 129732,
+      88312, 109694, 129730,  88188, 128464, 129772,  89592, 128456, 129766,
+      89340, 128452,  89214, 128450, 125904, 128492, 125896, 128486, 125892,
+     125890, 120784, 125932, 120776, 125926, 120772, 120770, 110544, 120812,
+     110536, 120806, 110532,  84928, 108016, 119548,  84448, 107768, 119422,
+      84208, 107644,  84088, 107582,  84028, 129640,  85488, 108284, 129636,
+      85240, 108158, 129634,  85116,  85054, 128232, 129654,  85756, 128228,
+      85630, 128226, 125416, 128246, 125412, 125410, 119784, 125430, 119780,
+     119778, 108520, 119798, 108516, 108514,  83424, 107256, 119166,  83184,
+     107132,  83064, 107070,  83004,  82974, 129588,  83704, 107390, 129586,
+      83580,  83518, 128116,  83838, 128114, 125172, 125170, 119284, 119282,
+     107508, 107506,  82672, 106876,  82552, 106814,  82492,  82462, 129562,
+      82812,  82750, 128058, 125050, 119034,  82296, 106686,  82236,  82206,
+      82366,  82108,  82078,  76736, 103920, 117500,  76256, 103672, 117374,
+      76016, 103548,  75896, 103486,  75836, 129384,  77296, 104188, 129380,
+      77048, 104062, 129378,  76924,  76862, 127720, 129398,  77564, 127716,
+      77438, 127714, 124392, 127734, 124388, 124386, 117736, 124406, 117732,
+     117730, 104424, 117750, 104420, 104418, 112096, 121592, 126334,  92608,
+     111856, 121468,  92384, 111736, 121406,  92272, 111676,  92216, 111646,
+      92188,  75232, 103160, 117118,  93664,  74992, 103036,  93424, 112252,
+     102974,  93304,  74812,  93244,  74782,  93214, 129332,  75512, 103294,
+     129908, 129330,  93944,  75388, 129906,  93820,  75326,  93758, 127604,
+      75646, 128756, 127602,  94078, 128754, 124148, 126452, 124146, 126450,
+     117236, 121844, 117234, 121842, 103412, 103410,  91584, 111344, 121212,
+      91360, 111224, 121150,  91248, 111164,  91192, 111134,  91164,  91150,
+      74480, 102780,  91888,  74360, 102718,  91768, 111422,  91708,  74270,
+      91678, 129306,  74620, 129850,  92028,  74558,  91966, 127546, 128634,
+     124026, 126202, 116986, 121338, 102906,  90848, 110968, 121022,  90736,
+     110908,  90680, 110878,  90652,  90638,  74104, 102590,  91000,  74044,
+      90940,  74014,  90910,  74174,  91070,  90480, 110780,  90424, 110750,
+      90396,  90382,  73916,  90556,  73886,  90526,  90296, 110686,  90268,
+      90254,  73822,  90334,  90204,  90190,  71136, 101112, 116094,  70896,
+     100988,  70776, 100926,  70716,  70686, 129204,  71416, 101246, 129202,
+      71292,  71230, 127348,  71550, 127346, 123636, 123634, 116212, 116210,
+     101364, 101362,  79296, 105200, 118140,  79072, 105080, 118078,  78960,
+     105020,  78904, 104990,  78876,  78862,  70384, 100732,  79600,  70264,
+     100670,  79480, 105278,  79420,  70174,  79390, 129178,  70524, 129466,
+      79740,  70462,  79678, 127290, 127866, 123514, 124666, 115962, 118266,
+     100858, 113376, 122232, 126654,  95424, 113264, 122172,  95328, 113208,
+     122142,  95280, 113180,  95256, 113166,  95244,  78560, 104824, 117950,
+      95968,  78448, 104764,  95856, 113468, 104734,  95800,  78364,  95772,
+      78350,  95758,  70008, 100542,  78712,  69948,  96120,  78652,  69918,
+      96060,  78622,  96030,  70078,  78782,  96190,  94912, 113008, 122044,
+      94816, 112952, 122014,  94768, 112924,  94744, 112910,  94732,  94726,
+      78192, 104636,  95088,  78136, 104606,  95032, 113054,  95004,  78094,
+      94990,  69820,  78268,  69790,  95164,  78238,  95134,  94560, 112824,
+     121950,  94512, 112796,  94488, 112782,  94476,  94470,  78008, 104542,
+      94648,  77980,  94620,  77966,  94606,  69726,  78046,  94686,  94384,
+     112732,  94360, 112718,  94348,  94342,  77916,  94428,  77902,  94414,
+      94296, 112686,  94284,  94278,  77870,  94318,  94252,  94246,  68336,
+      99708,  68216,  99646,  68156,  68126,  68476,  68414, 127162, 123258,
+     115450,  99834,  72416, 101752, 116414,  72304, 101692,  72248, 101662,
+      72220,  72206,  67960,  99518,  72568,  67900,  72508,  67870,  72478,
+      68030,  72638,  80576, 105840, 118460,  80480, 105784, 118430,  80432,
+     105756,  80408, 105742,  80396,  80390,  72048, 101564,  80752,  71992,
+     101534,  80696,  71964,  80668,  71950,  80654,  67772,  72124,  67742,
+      80828,  72094,  80798, 114016, 122552, 126814,  96832, 113968, 122524,
+      96800, 113944, 122510,  96784, 113932,  96776, 113926,  96772,  80224,
+     105656, 118366,  97120,  80176, 105628,  97072, 114076, 105614,  97048,
+      80140,  97036,  80134,  97030,  71864, 101470,  80312,  71836,  97208,
+      80284,  71822,  97180,  80270,  97166,  67678,  71902,  80350,  97246,
+      96576, 113840, 122460,  96544, 113816, 122446,  96528, 113804,  96520,
+     113798,  96516,  96514,  80048, 105564,  96688,  80024, 105550,  96664,
+     113870,  96652,  80006,  96646,  71772,  80092,  71758,  96732,  80078,
+      96718,  96416, 113752, 122414,  96400, 113740,  96392, 113734,  96388,
+      96386,  79960, 105518,  96472,  79948,  96460,  79942,  96454,  71726,
+      79982,  96494,  96336, 113708,  96328, 113702,  96324,  96322,  79916,
+      96364,  79910,  96358,  96296, 113686,  96292,  96290,  79894,  96310,
+      66936,  99006,  66876,  66846,  67006,  68976, 100028,  68920,  99998,
+      68892,  68878,  66748,  69052,  66718,  69022,  73056, 102072, 116574,
+      73008, 102044,  72984, 102030,  72972,  72966,  68792,  99934,  73144,
+      68764,  73116,  68750,  73102,  66654,  68830,  73182,  81216, 106160,
+     118620,  81184, 106136, 118606,  81168, 106124,  81160, 106118,  81156,
+      81154,  72880, 101980,  81328,  72856, 101966,  81304, 106190,  81292,
+      72838,  81286,  68700,  72924,  68686,  81372,  72910,  81358, 114336,
+     122712, 126894, 114320, 122700, 114312, 122694, 114308, 114306,  81056,
+     106072, 118574,  97696,  81040, 106060,  97680, 114380, 106054,  97672,
+      81028,  97668,  81026,  97666,  72792, 101934,  81112,  72780,  97752,
+      81100,  72774,  97740,  81094,  97734,  68654,  72814,  81134,  97774,
+     114256, 122668, 114248, 122662, 114244, 114242,  80976, 106028,  97488,
+      80968, 106022,  97480, 114278,  97476,  80962,  97474,  72748,  81004,
+      72742,  97516,  80998,  97510, 114216, 122646, 114212, 114210,  80936,
+     106006,  97384,  80932,  97380,  80930,  97378,  72726,  80950,  97398,
+     114196, 114194,  80916,  97332,  80914,  97330,  66236,  66206,  67256,
+      99166,  67228,  67214,  66142,  67294,  69296, 100188,  69272, 100174,
+      69260,  69254,  67164,  69340,  67150,  69326,  73376, 102232, 116654,
+      73360, 102220,  73352, 102214,  73348,  73346,  69208, 100142,  73432,
+     102254,  73420,  69190,  73414,  67118,  69230,  73454, 106320, 118700,
+     106312, 118694, 106308, 106306,  73296, 102188,  81616, 106348, 102182,
+      81608,  73284,  81604,  73282,  81602,  69164,  73324,  69158,  81644,
+      73318,  81638, 122792, 126934, 122788, 122786, 106280, 118678, 114536,
+     106276, 114532, 106274, 114530,  73256, 102166,  81512,  73252,  98024,
+      81508,  73250,  98020,  81506,  98018,  69142,  73270,  81526,  98038,
+     122772, 122770, 106260, 114484, 106258, 114482,  73236,  81460,  73234,
+      97908,  81458,  97906, 122762, 106250, 114458,  73226,  81434,  97850,
+      66396,  66382,  67416,  99246,  67404,  67398,  66350,  67438,  69456,
+     100268,  69448, 100262,  69444,  69442,  67372,  69484,  67366,  69478,
+     102312, 116694, 102308, 102306,  69416, 100246,  73576, 102326,  73572,
+      69410,  73570,  67350,  69430,  73590, 118740, 118738, 102292, 106420,
+     102290, 106418,  69396,  73524,  69394,  81780,  73522,  81778, 118730,
+     102282, 106394,  69386,  73498,  81722,  66476,  66470,  67496,  99286,
+      67492,  67490,  66454,  67510, 100308, 100306,  67476,  69556,  67474,
+      69554, 116714,
+     ],
+    )
+# 10-module row address patterns of MicroPDF417: left and right, centre
+MICRO_PDF417_RAPS = (
+    [
+     802, 930, 946, 818, 882, 890, 826, 954, 922, 986, 970, 906, 778,
+     794, 786, 914, 978, 982, 980, 916, 948, 932, 934, 942, 940, 936,
+     808, 812, 814, 806, 822, 950, 918, 790, 788, 820, 884, 868, 870,
+     878, 876, 872, 840, 856, 860, 862, 846, 844, 836, 838, 834, 866,
+     ],
+    [
+     718, 590, 622, 558, 550, 566, 534, 530, 538, 570, 562, 546, 610,
+     626, 634, 762, 754, 758, 630, 628, 612, 614, 582, 578, 706, 738,
+     742, 740, 748, 620, 556, 552, 616, 744, 712, 716, 708, 710, 646,
+     654, 652, 668, 664, 696, 688, 656, 720, 592, 600, 604, 732, 734,
+     ],
+    )
+PDF417_START = '11111111010101000'
+PDF417_STOP = '111111101000101001'
+# (columns, rows, ecc codewords, left, centre and right RAP starts)
+MICRO_PDF417_METRICS = [
+    (1, 11, 7, 1, 0, 9), (1, 14, 7, 8, 0, 8), (1, 17, 7, 36, 0, 36),
+    (1, 20, 8, 19, 0, 19), (1, 24, 8, 9, 0, 17), (1, 28, 8, 25, 0, 33),
+    (2, 8, 8, 1, 0, 1), (2, 11, 9, 1, 0, 9), (2, 14, 9, 8, 0, 8),
+    (2, 17, 10, 36, 0, 36), (2, 20, 11, 19, 0, 19), (2, 23, 13, 9, 0, 17),
+    (2, 26, 15, 27, 0, 35), (3, 6, 12, 1, 1, 1), (3, 8, 14, 7, 7, 7),
+    (3, 10, 16, 15, 15, 15), (3, 12, 18, 25, 25, 25), (3, 15, 21, 37, 37, 37),
+    (3, 20, 26, 1, 17, 33), (3, 26, 32, 1, 9, 17), (3, 32, 38, 21, 29, 37),
+    (3, 38, 44, 15, 31, 47), (3, 44, 50, 1, 25, 49), (4, 4, 8, 47, 19, 43),
+    (4, 6, 12, 1, 1, 1), (4, 8, 14, 7, 7, 7), (4, 10, 16, 15, 15, 15),
+    (4, 12, 18, 25, 25, 25), (4, 15, 21, 37, 37, 37), (4, 20, 26, 1, 17, 33),
+    (4, 26, 32, 1, 9, 17), (4, 32, 38, 21, 29, 37), (4, 38, 44, 15, 31, 47),
+    (4, 44, 50, 1, 25, 49)]
+# metrics of MicroPDF417 symbols in CC-A composites
+MICRO_PDF417_CCA_METRICS = [
+    (2, 5, 4, 39, 0, 19), (2, 6, 4, 1, 0, 33), (2, 7, 5, 32, 0, 12),
+    (2, 8, 5, 8, 0, 40), (2, 9, 6, 14, 0, 46), (2, 10, 6, 43, 0, 23),
+    (2, 12, 7, 20, 0, 52), (3, 4, 4, 11, 43, 23), (3, 5, 5, 1, 33, 13),
+    (3, 6, 6, 5, 37, 17), (3, 7, 7, 15, 47, 27), (3, 8, 7, 21, 1, 33),
+    (4, 3, 4, 40, 20, 52), (4, 4, 5, 43, 23, 3), (4, 5, 6, 46, 26, 6),
+    (4, 6, 7, 34, 14, 46), (4, 7, 8, 29, 9, 41)]
+
+PDF417_FIELD = 929
+TEXT_LATCH, BYTE_LATCH, BYTE_LATCH_6, NUMERIC_LATCH, BYTE_SHIFT = 900, 901, 924, 902, 913
+PAD, LINKAGE = 900, 920
+# text compaction submodes, their characters by value, and latches between them
+ALPHA, LOWER, MIXED, PUNCT = range(4)
+TEXT_SUBMODE_CHARS = (
+    'ABCDEFGHIJKLMNOPQRSTUVWXYZ ',
+    'abcdefghijklmnopqrstuvwxyz ',
+    '0123456789&\r\t,:#-.$/+%*=^',
+    ';<>@[\\]_`~!\r\t,:\n-.$/"|*()?{}\'')
+TEXT_LATCHES = [((ALPHA, LOWER), 27), ((ALPHA, MIXED), 28), ((LOWER, MIXED), 28),
+                ((MIXED, ALPHA), 28), ((MIXED, LOWER), 27), ((MIXED, PUNCT), 25),
+                ((PUNCT, ALPHA), 29)]
+PUNCT_SHIFT, ALPHA_SHIFT = 29, 27
+_TEXT_VALUES = [dict((ord(c), i) for i, c in enumerate(chars))
+                for chars in TEXT_SUBMODE_CHARS]
+_TEXT_VALUES[MIXED][32] = 26
+# states of the compaction search: text submodes with the parity of text
+# values so far, phases of byte groups of 6 and of numeric groups of 44
+_BYTE, _NUMERIC = 8, 14
+_STATES = _NUMERIC+44
+# cost of a text value, half a codeword; latches cost one more unit so
+# that ties go to the fewest of them
+_HALF = 1<<16
+_INFINITY = 1<<62
+
+
+def byte_codewords(data):
+    """Returns byte compaction codewords of data (ordinals), groups of six
+    bytes in five codewords and the rest one by one.
+
+    >>> byte_codewords([1, 2, 3, 4, 5, 6, 7])
+    [1, 620, 89, 74, 846, 7]
+    """
+    codewords = []
+    for i in range(0, len(data)-len(data)%6, 6):
+        value = 0
+        for byte in data[i:i+6]:
+            value = value<<8 | byte
+        group = []
+        for j in range(5):
+            value, digit = divmod(value, 900)
+            group.append(digit)
+        codewords.extend(reversed(group))
+    return codewords+list(data[len(data)-len(data)%6:])
+
+
+def numeric_codewords(digits):
+    """Returns numeric compaction codewords of a string of digits, in
+    groups of 44 digits.
+
+    >>> numeric_codewords('000213298174000')
+    [1, 624, 434, 632, 282, 200]
+    """
+    codewords = []
+    for i in range(0, len(digits), 44):
+        value, group = int('1'+digits[i:i+44]), []
+        while value:
+            value, digit = divmod(value, 900)
+            group.append(digit)
+        codewords.extend(reversed(group))
+    return codewords
+
+
+def text_codewords(values):
+    """Pairs text compaction values into codewords, padding with a
+    punctuation shift.
+
+    >>> text_codewords([15, 3, 5])
+    [453, 179]
+    """
+    if len(values)%2:
+        values = values+[PUNCT_SHIFT]
+    return [30*values[i]+values[i+1] for i in range(0, len(values), 2)]
+
+
+def pdf417_codewords(data):
+    """Returns data codewords of data (a string), switching between text,
+    byte and numeric compaction for the fewest codewords.
+
+    The search runs over positions and states of a text submode with the
+    parity of text values, or a phase of byte or numeric groups; costs
+    are counted in text values, half codewords.  Symbols start in the
+    alpha submode of text compaction.
+
+    >>> pdf417_codewords('PDF417')
+    [453, 178, 121, 239]
+    >>> pdf417_codewords('000213298174000')
+    [902, 1, 624, 434, 632, 282, 200]
+    >>> pdf417_codewords('Shipment 00021329817400012 (3 cartons)')[4:13]
+    [596, 902, 169, 348, 270, 231, 322, 212, 900]
+    >>> pdf417_codewords('\\x01\\x02\\xfe')
+    [901, 1, 2, 254]
+    """
+    data = [ord(c) for c in data]
+    costs = [_INFINITY]*_STATES
+    costs[ALPHA*2] = 0
+    # back[i][state] is (previous position, previous state, action)
+    back = [[None]*_STATES for i in range(len(data)+1)]
+    for i in range(len(data)):
+        _latches(costs, back[i], i)
+        costs = _consume(costs, data[i], back[i+1], i)
+    end = min(range(_STATES),
+              key=lambda s: costs[s]+(_HALF*(s%2) if s<_BYTE else 0))
+    actions = []
+    i, state = len(data), end
+    while back[i][state] is not None:
+        i, state, action = back[i][state]
+        actions.append(action)
+    return _compaction_codewords(reversed(actions))
+
+
+def _relax(costs, back, position, source, target, cost, action):
+    if costs[source]+cost<costs[target]:
+        costs[target] = costs[source]+cost
+        back[target] = (position, source, action)
+
+
+def _text_latches(costs, back, position):
+    for round_ in range(3):
+        for (source, target), value in TEXT_LATCHES:
+            for parity in (0, 1):
+                _relax(costs, back, position, source*2+parity, target*2+1-parity,
+                       _HALF+1, ('text', value))
+
+
+def _latches(costs, back, position):
+    """Relaxes mode and submode latches at position, in place."""
+    _text_latches(costs, back, position)
+    for state in range(_BYTE, _STATES):
+        _relax(costs, back, position, state, ALPHA*2, 2*_HALF+1,
+               ('latch', TEXT_LATCH))
+    _text_latches(costs, back, position)
+    for state in range(_STATES):
+        cost = _HALF*(2+state%2 if state<_BYTE else 2)+1
+        if not _BYTE<=state<_NUMERIC:
+            _relax(costs, back, position, state, _BYTE, cost, ('latch', BYTE_LATCH))
+        if state<_NUMERIC:
+            _relax(costs, back, position, state, _NUMERIC, cost, ('latch', NUMERIC_LATCH))
+
+
+def _consume(costs, c, back, position):
+    """Returns costs of states after encoding character c."""
+    result = [_INFINITY]*_STATES
+    punct = _TEXT_VALUES[PUNCT].get(c)
+    for submode in range(4):
+        value = _TEXT_VALUES[submode].get(c)
+        for parity in (0, 1):
+            state = submode*2+parity
+            if costs[state]==_INFINITY:
+                continue
+            if value is not None:
+                _relax2(result, back, position, costs, state, state^1, _HALF,
+                        ('text', value))
+            if punct is not None and submode!=PUNCT:
+                _relax2(result, back, position, costs, state, state, 2*_HALF+1,
+                        ('text', PUNCT_SHIFT, punct))
+            if submode==LOWER and 65<=c<=90:
+                _relax2(result, back, position, costs, state, state, 2*_HALF+1,
+                        ('text', ALPHA_SHIFT, c-65))
+            _relax2(result, back, position, costs, state, submode*2,
+                    _HALF*(4+parity)+1, ('shift', c))
+    for phase in range(6):
+        _relax2(result, back, position, costs, _BYTE+phase, _BYTE+(phase+1)%6,
+                2*_HALF if phase<5 else 0, ('byte', c))
+    if 48<=c<=57:
+        for phase in range(44):
+            _relax2(result, back, position, costs, _NUMERIC+phase, _NUMERIC+(phase+1)%44,
+                    2*_HALF if phase%3==2 or not phase else 0, ('digit', c))
+    return result
+
+
+def _relax2(result, back, position, costs, source, target, cost, action):
+    if costs[source]+cost<result[target]:
+        result[target] = costs[source]+cost
+        back[target] = (position, source, action)
+
+
+def _compaction_codewords(actions):
+    codewords, text, run, latch = [], [], [], None
+
+    def flush():
+        if text:
+            codewords.extend(text_codewords(text))
+            del text[:]
+        if latch==BYTE_LATCH:
+            codewords.append(BYTE_LATCH_6 if not len(run)%6 else BYTE_LATCH)
+            codewords.extend(byte_codewords(run))
+        elif latch==NUMERIC_LATCH:
+            codewords.append(NUMERIC_LATCH)
+            codewords.extend(numeric_codewords(''.join(map(chr, run))))
+        del run[:]
+
+    for action in actions:
+        kind = action[0]
+        if kind=='text':
+            text.extend(action[1:])
+        elif kind=='shift':
+            flush()
+            codewords.extend((BYTE_SHIFT, action[1]))
+        elif kind=='latch':
+            flush()
+            latch = action[1]
+            if latch==TEXT_LATCH:
+                codewords.append(TEXT_LATCH)
+        else:
+            run.append(action[1])
+    flush()
+    return codewords
+
+
+def pdf417_ecc(codewords, k):
+    """Returns the k error correction codewords of codewords, over the
+    prime field of 929 elements with generator roots 3^1..3^k.
+
+    >>> pdf417_ecc([5, 453, 178, 121, 239], 8)
+    [807, 896, 604, 841, 445, 798, 896, 674]
+    """
+    field = get_prime_field(PDF417_FIELD, 3)
+    return rs_encode(field, codewords, rs_generator(field, k))
+
+
+def pdf417_dimensions(m, columns=0, rows=0, eclevel=-1):
+    """Returns (columns, rows, eclevel) of a PDF417 symbol of m data
+    codewords, the way BWIPP picks them: eclevel grows with m unless given
+    and fills up the rows, and columns default to a roughly 1:3 grid.
+
+    >>> pdf417_dimensions(4), pdf417_dimensions(4, columns=4, rows=10)
+    ((2, 7, 2), (4, 10, 4))
+    """
+    if eclevel==-1:
+        eclevel = 2 if m<=40 else (3 if m<=160 else (4 if m<=320 else 5))
+    if m>=927:
+        raise ValueError(u'PDF417 holds up to 926 data codewords.')
+    # floor(log2(x))-1 as BWIPP takes it, exact at powers of two
+    eclevel = min(eclevel, (928-1-m).bit_length()-2)
+    k = 2**(eclevel+1)
+    if not columns:
+        columns = int(round(math.sqrt((m+k)/3.0)))
+    if not 1<=columns<=30:
+        raise ValueError(u'Column out of bound: %d.' %columns)
+    r = int(math.ceil((m+k+1)/float(columns)))
+    if r<rows<=90:
+        r = rows
+    r = max(r, 3)
+    if r>90 or columns*r>928:
+        raise ValueError(u'PDF417 data does not fit in %d columns.' %columns)
+    eclevel = max(eclevel, min((columns*r-1-m).bit_length()-2, 8))
+    return columns, r, eclevel
+
+
+_patterns = []
+
+def _codeword_bits(cluster, codeword):
+    """Returns the 17 modules of codeword in cluster (0 to 2)."""
+    if not _patterns:
+        _patterns.extend([[int(b) for b in '{0:017b}'.format(v)] for v in patterns]
+                         for patterns in PDF417_CLUSTERS)
+    return _patterns[cluster][codeword]
+
+
+def pdf417_symbol(codewords, columns, rows, eclevel, compact=False):
+    """Returns modules of the PDF417 symbol of codewords, row by row:
+    start pattern, left row indicator, data, right row indicator and stop
+    pattern, or a single bar for truncated (compact) symbols.
+
+    >>> len(pdf417_symbol(range(6), 2, 3, 0)), len(pdf417_symbol(range(6), 2, 3, 0, True))
+    (309, 207)
+    """
+    start = [int(b) for b in PDF417_START]
+    stop = [int(b) for b in PDF417_STOP]
+    pixs = []
+    for i in range(rows):
+        base, cluster = i//3*30, i%3
+        indicators = ((rows-1)//3, eclevel*3+(rows-1)%3, columns-1)
+        left, right = indicators[cluster], indicators[(cluster+2)%3]
+        pixs.extend(start)
+        pixs.extend(_codeword_bits(cluster, base+left))
+        for codeword in codewords[i*columns:(i+1)*columns]:
+            pixs.extend(_codeword_bits(cluster, codeword))
+        if compact:
+            pixs.append(1)
+        else:
+            pixs.extend(_codeword_bits(cluster, base+right))
+            pixs.extend(stop)
+    return pixs
+
+
+def _data_codewords(codestring, raw, parse):
+    if parse:
+        codestring = cap_unescape(codestring)
+    if raw:
+        return [int(n) for n in re.findall(r'\^(\d{3})', codestring)]
+    return pdf417_codewords(codestring)
+
+
+def encode_pdf417(codestring, columns=0, rows=0, eclevel=-1, compact=False,
+                  rowmult=3, raw=False, parse=False, ccc=False):
+    """Encodes codestring into MatrixGeometry of a PDF417 symbol.
+
+    raw takes codestring as ^NNN data codewords; ccc marks the symbol as
+    the CC-C component of a composite.  Rows are rowmult modules high.
+
+    >>> g = encode_pdf417('PDF417')
+    >>> g.pixx, g.pixy, round(g.height*72)
+    (103, 7, 21.0)
+    >>> g.rows()[0][:17] == map(int, PDF417_START)
+    True
+    >>> encode_pdf417('A truncated PDF417', columns=4, compact=True).pixx
+    103
+    """
+    codewords = _data_codewords(codestring, raw, parse)
+    if ccc and not raw:
+        codewords = [LINKAGE]+codewords
+    m = len(codewords)
+    columns, rows, eclevel = pdf417_dimensions(m, columns, rows, eclevel)
+    n = columns*rows-2**(eclevel+1)
+    codewords = [n]+codewords+[PAD]*(n-m-1)
+    codewords += pdf417_ecc(codewords, 2**(eclevel+1))
+    width = 17*columns+(35 if compact else 69)
+    return MatrixGeometry(pdf417_symbol(codewords, columns, rows, eclevel, compact),
+                          width, rows, width/72.0, rows*rowmult/72.0)
+
+
+def micropdf417_metric(m, columns=0, rows=0, cca=False):
+    """Returns the first MicroPDF417 metric holding m data codewords,
+    restricted to columns and rows if given.
+
+    >>> micropdf417_metric(5), micropdf417_metric(5, columns=4)
+    ((1, 14, 7, 8, 0, 8), (4, 4, 8, 47, 19, 43))
+    """
+    for metric in MICRO_PDF417_CCA_METRICS if cca else MICRO_PDF417_METRICS:
+        c, r, k = metric[:3]
+        if m<=c*r-k and not (columns and columns!=c or rows and rows!=r):
+            return metric
+    raise ValueError(u'MicroPDF417 data does not fit in any symbol size.')
+
+
+def micropdf417_width(columns, cca=False):
+    """Returns the width in modules of MicroPDF417 symbols of columns.
+
+    >>> micropdf417_width(1), micropdf417_width(3, cca=True)
+    (38, 72)
+    """
+    return 72 if columns==3 and cca else [38, 55, 82, 99][columns-1]
+
+
+def _rap_bits(pattern):
+    return [int(b) for b in '{0:010b}'.format(pattern)]
+
+
+def micropdf417_symbol(codewords, metric, cca=False):
+    """Returns modules of the MicroPDF417 symbol of metric holding
+    codewords, row by row, with row address patterns around and (for
+    three or four columns) amid the codewords.
+
+    >>> len(micropdf417_symbol(range(11), MICRO_PDF417_METRICS[0]))
+    418
+    """
+    columns, rows, k, rapl, rapc, rapr = metric
+    left_right, centre = MICRO_PDF417_RAPS
+    pixs = []
+    for i in range(rows):
+        cluster = (i+rapl-1)%3
+        row = [_codeword_bits(cluster, cw) for cw in codewords[i*columns:(i+1)*columns]]
+        if columns>=3:
+            row.insert(columns-2, _rap_bits(centre[(i+rapc-1)%52]))
+        if columns!=3 or not cca:
+            row.insert(0, _rap_bits(left_right[(i+rapl-1)%52]))
+        row.append(_rap_bits(left_right[(i+rapr-1)%52]))
+        for bits in row:
+            pixs.extend(bits)
+        pixs.append(1)
+    return pixs
+
+
+def encode_micropdf417(codestring, columns=0, rows=0, rowmult=2, raw=False,
+                       parse=False, cca=False, ccb=False):
+    """Encodes codestring into MatrixGeometry of a MicroPDF417 symbol.
+
+    cca (which implies raw) and ccb mark the symbol as the CC-A or CC-B
+    component of a composite.
+
+    >>> g = encode_micropdf417('MicroPDF417')
+    >>> g.pixx, g.pixy, round(g.height*72)
+    (38, 17, 34.0)
+    >>> encode_micropdf417('MicroPDF417', columns=4).pixy
+    4
+    """
+    codewords = _data_codewords(codestring, raw or cca, parse)
+    if ccb and not (raw or cca):
+        codewords = [LINKAGE]+codewords
+    metric = micropdf417_metric(len(codewords), columns, rows, cca)
+    columns, rows, k = metric[:3]
+    n = columns*rows-k
+    codewords = codewords+[PAD]*(n-len(codewords))
+    codewords += pdf417_ecc(codewords, k)
+    width = micropdf417_width(columns, cca)
+    return MatrixGeometry(micropdf417_symbol(codewords, metric, cca),
+                          width, rows, width/72.0, rows*rowmult/72.0)
+
 
 class Pdf417(Barcode):
     """
@@ -50,7 +816,7 @@ class Pdf417(Barcode):
     class _Renderer(MatrixCodeRenderer):
         default_options = dict(
             MatrixCodeRenderer.default_options,
-            dontdraw=False, compact=False, eclevel=-1, columns=2, rows=0, rowmult=3,
+            dontdraw=False, compact=False, eclevel=-1, columns=0, rows=0, rowmult=3,
             ccc=False, raw=False, parse=False)
             
         def _code_bbox(self, codestring):
@@ -113,8 +879,70 @@ class Pdf417(Barcode):
             cbbox = self._code_bbox(codestring)
             params['bbox'] = '%d %d %d %d' %self._boundingbox(cbbox, cbbox)
             return params
+
+        def native_encode(self, codestring):
+            return encode_pdf417(
+                codestring, self.lookup_option('columns'), self.lookup_option('rows'),
+                self.lookup_option('eclevel'), bool(self.lookup_option('compact')),
+                self.lookup_option('rowmult'), bool(self.lookup_option('raw')),
+                bool(self.lookup_option('parse')), bool(self.lookup_option('ccc')))
+
     renderer = _Renderer
-    
+
+
+class MicroPdf417(Barcode):
+    """
+    >>> bc = MicroPdf417()
+    >>> bc # doctest: +ELLIPSIS
+    <....MicroPdf417 object at ...>
+    >>> bc.render('MicroPDF417') # doctest: +ELLIPSIS
+    <PIL.EpsImagePlugin.EpsImageFile ... at ...>
+    >>> # _.show()
+    >>> g = bc.encode('MicroPDF417', options=dict(columns=2))
+    >>> g.pixx, g.pixy
+    (55, 8)
+    """
+    codetype = 'micropdf417'
+    aliases = ('micro pdf417', 'micro-pdf417', 'micro_pdf417')
+    class _Renderer(MatrixCodeRenderer):
+        default_options = dict(
+            MatrixCodeRenderer.default_options,
+            dontdraw=False, columns=0, rows=0, rowmult=2, cca=False, ccb=False,
+            raw=False, parse=False)
+
+        def _code_bbox(self, codestring):
+            # BWIPP byte-compacts the data it renders
+            if self.lookup_option('parse'):
+                codestring = cap_unescape(codestring)
+            cca = self.lookup_option('cca')
+            if self.lookup_option('raw') or cca:
+                m = len(re.findall(r'\^\d{3}', codestring))
+            else:
+                m = len(codestring)//6*5+len(codestring)%6+1+bool(self.lookup_option('ccb'))
+            columns, rows = micropdf417_metric(
+                m, self.lookup_option('columns'), self.lookup_option('rows'), cca)[:2]
+            return (0, 0, DPI*micropdf417_width(columns, cca)/72.0,
+                    DPI*rows*self.lookup_option('rowmult')/72.0)
+
+        def build_params(self, codestring):
+            """
+            >>> MicroPdf417._Renderer({}).build_params('abcd')['bbox']
+            '0 0 38 28'
+            """
+            params = super(MicroPdf417._Renderer, self).build_params(codestring)
+            cbbox = self._code_bbox(codestring)
+            params['bbox'] = '%d %d %d %d' %self._boundingbox(cbbox, cbbox)
+            return params
+
+        def native_encode(self, codestring):
+            return encode_micropdf417(
+                codestring, self.lookup_option('columns'), self.lookup_option('rows'),
+                self.lookup_option('rowmult'), bool(self.lookup_option('raw')),
+                bool(self.lookup_option('parse')), bool(self.lookup_option('cca')),
+                bool(self.lookup_option('ccb')))
+
+    renderer = _Renderer
+
 
 if __name__=="__main__":
     from doctest import testmod
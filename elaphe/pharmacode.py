@@ -1,6 +1,40 @@
 # coding: utf-8
 import re, math
 from base import Barcode, LinearCodeRenderer, DPI
+from linear import LinearBuilder
+
+# BWIPP default height: 8mm, in inches
+PHARMACODE_HEIGHT = 8*2.835/72
+
+
+def encode_pharmacode(codestring, nwidth=0.5*2.835, wwidth=1.5*2.835,
+                      swidth=1.0*2.835, includetext=False,
+                      height=PHARMACODE_HEIGHT, textsize=10, textyoffset=-7):
+    """Encodes a value of 3 to 131070 into LinearGeometry of a Pharmacode
+    symbol: bits of value+1 below the leading one, read as narrow (0) and
+    wide (1) bars.  Widths are in points.
+
+    >>> g = encode_pharmacode('117480', includetext=True)
+    >>> len(g.bhs), round(g.width, 3)
+    (16, 93.555)
+    >>> [(string, round(x, 2)) for string, x, y, size in g.text]
+    [('117480', 28.78)]
+    >>> encode_pharmacode('2')
+    Traceback (most recent call last):
+    ...
+    ValueError: Pharmacode value must be between 3 and 131070.
+    """
+    if not 1<=len(codestring)<=6 or not codestring.isdigit():
+        raise ValueError(u'Pharmacode must be 1 to 6 digits.')
+    if not 3<=int(codestring)<=131070:
+        raise ValueError(u'Pharmacode value must be between 3 and 131070.')
+    builder = LinearBuilder()
+    for bit in bin(int(codestring)+1)[3:]:
+        builder.add([wwidth if bit=='1' else nwidth, swidth], height)
+    if includetext:
+        builder.add_text(codestring, (builder.x-0.6*textsize*len(codestring))/2.0,
+                         textyoffset, textsize)
+    return builder.geometry()
 
 class Phamacode(Barcode):
     """
@@ -68,6 +102,16 @@ class Phamacode(Barcode):
             params['bbox'] = "%d %d %d %d" %self._boundingbox(cbbox, tbbox)
             return params
 
+        def native_encode(self, codestring):
+            # height defaults to points here, while BWIPP takes inches
+            options = self.options or {}
+            return encode_pharmacode(
+                codestring, self.lookup_option('nwidth'),
+                self.lookup_option('wwidth'), self.lookup_option('swidth'),
+                bool(self.lookup_option('includetext')),
+                options.get('height', PHARMACODE_HEIGHT),
+                self.lookup_option('textsize'), self.lookup_option('textyoffset'))
+
     renderer = _Renderer
 
 
@@ -1,5 +1,69 @@
 # coding: utf-8
 from base import Barcode, LinearCodeRenderer, DPI
+from linear import widths, linear_options, LinearBuilder
+
+
+PLESSEY_CHARS = '0123456789ABCDEF'
+PLESSEY_PATTERNS = (
+    '14141414 32141414 14321414 32321414 14143214 32143214 14323214 32323214 '
+    '14141432 32141432 14321432 32321432 14143232 32143232 14323232 32323232'
+    ).split()
+PLESSEY_START = '32321432'
+# termination bar of bidirectional and unidirectional symbols
+PLESSEY_END, PLESSEY_END_UNIDIRECTIONAL = '541412323', '323'
+PLESSEY_CRC_POLY = [1, 1, 1, 1, 0, 1, 0, 0, 1]
+
+
+def plessey_check_chars(codestring):
+    """Returns the two check characters of Plessey data: the 8-bit CRC of
+    its bits, least significant bit of each character first.
+
+    >>> plessey_check_chars('01234ABCD')
+    'DC'
+    """
+    bits = []
+    for c in codestring:
+        value = PLESSEY_CHARS.index(c)
+        bits.extend(value >> i & 1 for i in range(4))
+    bits.extend([0]*8)
+    for i in range(len(bits)-8):
+        if bits[i]:
+            for j, p in enumerate(PLESSEY_CRC_POLY):
+                bits[i+j] ^= p
+    check = sum(bit << i for i, bit in enumerate(bits[-8:]))
+    return PLESSEY_CHARS[check&15]+PLESSEY_CHARS[check>>4]
+
+
+def encode_plessey(codestring, validatecheck=False, includecheckintext=False,
+                   unidirectional=False, includetext=False, height=1.0,
+                   textsize=10, textyoffset=-7):
+    """Encodes hexadecimal digits into LinearGeometry of a Plessey symbol
+    followed by its two check characters.
+
+    >>> g = encode_plessey('01234ABCD', includetext=True)
+    >>> g.width, len(g.bhs), g.text[0]
+    (265.0, 53, ('0', 20, -7, 10))
+    >>> encode_plessey('01234ABCDDC', validatecheck=True).width
+    265.0
+    """
+    if any(c not in PLESSEY_CHARS for c in codestring):
+        raise ValueError(u'Plessey must contain only digits and letters A B C D E F.')
+    if validatecheck:
+        codestring, checks = codestring[:-2], codestring[-2:]
+    check_chars = plessey_check_chars(codestring)
+    if validatecheck and checks!=check_chars:
+        raise ValueError(u'Incorrect Plessey check digits provided.')
+    shown = codestring+check_chars if includecheckintext else codestring
+    builder = LinearBuilder()
+    builder.add(widths(PLESSEY_START), height)
+    for c in codestring+check_chars:
+        builder.add(widths(PLESSEY_PATTERNS[PLESSEY_CHARS.index(c)]), height)
+    if includetext:
+        for i, c in enumerate(shown):
+            builder.add_text(c, 20*i+20, textyoffset, textsize)
+    builder.add(widths(PLESSEY_END_UNIDIRECTIONAL if unidirectional
+                       else PLESSEY_END), height)
+    return builder.geometry()
 
 class Plessey(Barcode):
     """
@@ -70,6 +134,13 @@ class Plessey(Barcode):
             params['bbox'] = "%d %d %d %d" %self._boundingbox(
                 self._code_bbox(codestring), self._text_bbox(codestring))
             return params
+
+        def native_encode(self, codestring):
+            return encode_plessey(
+                codestring, bool(self.lookup_option('validatecheck')),
+                bool(self.lookup_option('includecheckintext')),
+                bool(self.lookup_option('unidirectional')),
+                **linear_options(self))
     renderer = _Renderer
 
 
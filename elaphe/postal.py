@@ -0,0 +1,198 @@
+# coding: utf-8
+"""Bar states of postal symbols and their native encoders.
+
+Postal symbols are rows of equally spaced bars, each in one of a few
+states.  Native encoders give the states as compact arrays of bytes;
+states_geometry() turns them into LinearGeometry the way BWIPP lays
+them out, and rasterize_states() paints one symbol or a whole stack of
+them (say, a mailing run) at once with NumPy.
+"""
+from array import array
+from base import Barcode, LinearCodeRenderer
+from geometry import LinearGeometry
+from raster import DARK, LIGHT
+# NumPy is imported on first use; see _require_numpy().
+numpy = None
+
+__all__ = ['BAR_WIDTH', 'SPACE_WIDTH', 'TRACKER', 'DESCENDER', 'ASCENDER',
+           'FULL', 'FOUR_STATE_SHAPES', 'TWO_STATE_SHAPES', 'states',
+           'char_indexes', 'state_table', 'states_geometry',
+           'rasterize_states', 'PostalCodeRenderer', 'encode_states_bulk']
+
+
+BAR_WIDTH, SPACE_WIDTH = 1.44, 1.872
+# states of four-state bars, numbered as BWIPP encoders write them
+TRACKER, DESCENDER, ASCENDER, FULL = range(4)
+# (bottom, height) of bars by state, in fractions of symbol height
+FOUR_STATE_SHAPES = [(3/8.0, 2/8.0), (0.0, 5/8.0), (3/8.0, 5/8.0), (0.0, 1.0)]
+# short and tall bars of POSTNET and PLANET
+TWO_STATE_SHAPES = [(0.0, 2/5.0), (0.0, 1.0)]
+
+
+def _require_numpy():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError(u'NumPy is required for bulk encoding.')
+
+
+def states(codes):
+    """Converts a string of state digits into an array of states.
+
+    >>> states('0123').tolist()
+    [0, 1, 2, 3]
+    """
+    return array('B', [int(c) for c in codes])
+
+
+def char_indexes(codestrings, chars, name):
+    """Returns (symbols, length) array of indexes in chars of the
+    characters of codestrings of the same length.
+
+    >>> char_indexes(['AB', 'BA'], 'AB', 'Test').tolist()
+    [[0, 1], [1, 0]]
+    """
+    _require_numpy()
+    lengths = set(len(codestring) for codestring in codestrings)
+    if len(lengths)>1:
+        raise ValueError(u'Symbols of a bulk run must have the same length.')
+    table = numpy.empty(256, numpy.intp)
+    table.fill(-1)
+    table[numpy.frombuffer(chars, numpy.uint8)] = numpy.arange(len(chars))
+    indexes = table[numpy.frombuffer(''.join(codestrings), numpy.uint8)]
+    if (indexes<0).any():
+        raise ValueError(u'%s cannot encode some of the codestrings.' %name)
+    return indexes.reshape(len(codestrings), lengths.pop() if lengths else 0)
+
+
+def state_table(encodings):
+    """Converts a list of strings of state digits into a uint8 array.
+
+    >>> state_table(['01', '32']).tolist()
+    [[0, 1], [3, 2]]
+    """
+    _require_numpy()
+    return numpy.array([[int(c) for c in e] for e in encodings], numpy.uint8)
+
+
+def states_geometry(bar_states, height, shapes=FOUR_STATE_SHAPES, text=None):
+    """Returns LinearGeometry of bars in bar_states; height in inches.
+
+    >>> g = states_geometry(states('0123'), 0.16)
+    >>> g.bhs.tolist(), g.bbs.tolist()
+    ([0.04, 0.1, 0.1, 0.16], [0.06, 0.0, 0.06, 0.0])
+    >>> round(g.width, 3)
+    11.376
+    """
+    sbs = [BAR_WIDTH, SPACE_WIDTH]*len(bar_states)
+    return LinearGeometry(sbs[:-1], [height*shapes[s][1] for s in bar_states],
+                          [height*shapes[s][0] for s in bar_states], text)
+
+
+def rasterize_states(bar_states, height, shapes=FOUR_STATE_SHAPES,
+                     x_scale=1.0, y_scale=1.0, margins=(0, 0, 0, 0)):
+    """Paints bar states into uint8 array, as rasterize_linear() would
+    paint their geometry.
+
+    bar_states is an array of states of one symbol, or a 2D array of
+    symbols of the same length, which yields a stack of rasters.
+
+    >>> a = rasterize_states([[3, 0], [1, 2]], 8/72.0, x_scale=1/1.44,
+    ...                      y_scale=0.25)
+    >>> a.shape
+    (2, 2, 3)
+    >>> a.tolist()
+    [[[0, 255, 255], [0, 255, 255]], [[255, 255, 0], [0, 255, 255]]]
+    """
+    _require_numpy()
+    left, bottom, right, top = margins
+    bar_states = numpy.asarray(bar_states, dtype=numpy.uint8)
+    nbars = bar_states.shape[-1]
+    symbol_height = height*72
+    width = int(round(x_scale*(left+nbars*(BAR_WIDTH+SPACE_WIDTH)-SPACE_WIDTH+right)))
+    raster_height = int(round(y_scale*(top+symbol_height+bottom)))
+    # bar index at each pixel column; nbars marks spaces and margins.
+    x = (numpy.arange(width)+0.5)/x_scale-left
+    bars = numpy.floor(x/(BAR_WIDTH+SPACE_WIDTH)).astype(numpy.intp)
+    in_bar = (x>=0) & (bars<nbars) & (x-bars*(BAR_WIDTH+SPACE_WIDTH)<BAR_WIDTH)
+    bars[~in_bar] = nbars
+    # dark rows of each state; the extra state is never dark.
+    y = symbol_height+top-(numpy.arange(raster_height)+0.5)/y_scale
+    dark = numpy.zeros((len(shapes)+1, raster_height), dtype=bool)
+    for state, (shape_bottom, shape_height) in enumerate(shapes):
+        dark[state] = ((y>=shape_bottom*symbol_height)
+                       & (y<(shape_bottom+shape_height)*symbol_height))
+    padded = numpy.concatenate(
+        [bar_states, numpy.empty(bar_states.shape[:-1]+(1,), numpy.uint8)], axis=-1)
+    padded[..., nbars] = len(shapes)
+    columns = padded[..., bars]
+    return numpy.where(numpy.swapaxes(dark[columns], -1, -2),
+                       DARK, LIGHT).astype(numpy.uint8)
+
+
+class PostalCodeRenderer(LinearCodeRenderer):
+    """Renderer of postal symbols whose native encoders give bar states.
+    """
+    state_shapes = FOUR_STATE_SHAPES
+
+    def native_symbol(self, codestring):
+        """Returns (states, text) of codestring, or None without native
+        encoder; text is a list of (string, x) in points.
+        """
+        return None
+
+    def native_encode(self, codestring):
+        symbol = self.native_symbol(codestring)
+        if symbol is None:
+            return None
+        bar_states, text = symbol
+        if self.lookup_option('includetext'):
+            y, size = self.lookup_option('textyoffset'), self.lookup_option('textsize')
+            text = [(string, x, y, size) for string, x in text]
+        else:
+            text = None
+        return states_geometry(bar_states, self.lookup_option('height'),
+                               self.state_shapes, text)
+
+    def native_states_bulk(self, codestrings):
+        """Returns uint8 array of bar states, a row per codestring.
+
+        Symbologies override this with vectorized encoders; rows must
+        have the same length.
+        """
+        _require_numpy()
+        rows = [self.native_symbol(codestring)[0] for codestring in codestrings]
+        if len(set(len(row) for row in rows))>1:
+            raise ValueError(u'Symbols of a bulk run must have the same length.')
+        result = numpy.empty((len(rows), len(rows[0]) if rows else 0), numpy.uint8)
+        for i, row in enumerate(rows):
+            result[i] = numpy.frombuffer(row, numpy.uint8)
+        return result
+
+
+def encode_states_bulk(codetype, codestrings, options=None):
+    """Encodes many codestrings of a postal codetype into a uint8 array
+    of bar states, a row per codestring.
+
+    Returns the array and the renderer, whose state_shapes and height
+    option rasterize_states() takes.
+
+    >>> import elaphe
+    >>> a, r = encode_states_bulk('kix', ['1231FZ13XHS', '1234AB56CDE'])
+    >>> a.shape, a.dtype.name, r.codetype
+    ((2, 44), 'uint8', 'kix')
+    """
+    subclass = Barcode.resolve_codetype(codetype)
+    if not subclass:
+        raise ValueError(u'No renderer for codetype %s' %codetype)
+    renderer = subclass().get_renderer(options)
+    if not isinstance(renderer, PostalCodeRenderer):
+        raise ValueError(u'%s is not a postal codetype.' %codetype)
+    return renderer.native_states_bulk(list(codestrings)), renderer
+
+
+if __name__=="__main__":
+    from doctest import testmod
+    testmod()
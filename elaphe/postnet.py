@@ -1,5 +1,80 @@
 # coding: utf-8
 from base import Barcode, LinearCodeRenderer, DPI
+from postal import (BAR_WIDTH, SPACE_WIDTH, TWO_STATE_SHAPES,
+                    PostalCodeRenderer, states, char_indexes, state_table)
+import postal
+
+
+# bar states of digits; 1 is a tall bar and 0 a short one.
+POSTNET_ENCODINGS = ('11000 00011 00101 00110 01001 '
+                     '01010 01100 10001 10010 10100').split()
+PLANET_ENCODINGS = ('00111 11100 11010 11001 10110 '
+                    '10101 10011 01110 01101 01011').split()
+
+
+def _lengths_text(lengths):
+    return ' or '.join([', '.join(str(l) for l in lengths[:-1]), str(lengths[-1])])
+
+
+def encode_postnet(codestring, validatecheck=False, includecheckintext=False,
+                   encodings=POSTNET_ENCODINGS, lengths=(5, 9, 11),
+                   name='USPS POSTNET'):
+    """Returns bar states and text positions of a POSTNET symbol, or of
+    PLANET with its encodings and lengths; tall frame bars enclose the
+    digits and the check digit.
+
+    >>> bar_states, text = encode_postnet('01234', includecheckintext=True)
+    >>> len(bar_states), bar_states[:6].tolist(), text[-1][0]
+    (32, [1, 1, 1, 0, 0, 0], '0')
+    >>> encode_postnet('123451', validatecheck=True)
+    Traceback (most recent call last):
+    ...
+    ValueError: Incorrect USPS POSTNET check digit provided.
+    """
+    if validatecheck:
+        codestring, check = codestring[:-1], codestring[-1:]
+    if len(codestring) not in lengths:
+        raise ValueError(u'%s must be %s digits excluding check digit.'
+                         %(name, _lengths_text(lengths)))
+    if not codestring.isdigit():
+        raise ValueError(u'%s must contain only digits.' %name)
+    checksum = (10-sum(int(c) for c in codestring)%10)%10
+    if validatecheck and check!=str(checksum):
+        raise ValueError(u'Incorrect %s check digit provided.' %name)
+    bar_states = states('1'+''.join(encodings[int(c)]
+                                    for c in codestring+str(checksum))+'1')
+    pitch = BAR_WIDTH+SPACE_WIDTH
+    text = [(c, (5*i+1)*pitch) for i, c in enumerate(codestring)]
+    if includecheckintext:
+        text.append((str(checksum), (5*len(codestring)+1)*pitch))
+    return bar_states, text
+
+
+def postnet_states_bulk(codestrings, validatecheck=False,
+                        encodings=POSTNET_ENCODINGS, lengths=(5, 9, 11),
+                        name='USPS POSTNET'):
+    """Vectorized encode_postnet() of codestrings of the same length.
+
+    >>> bulk = postnet_states_bulk(['01234', '98765'])
+    >>> bulk[1].tolist()==encode_postnet('98765')[0].tolist()
+    True
+    """
+    digits = char_indexes(codestrings, '0123456789', name)
+    numpy = postal.numpy
+    if validatecheck:
+        digits, checks = digits[:, :-1], digits[:, -1]
+    if len(codestrings) and digits.shape[1] not in lengths:
+        raise ValueError(u'%s must be %s digits excluding check digit.'
+                         %(name, _lengths_text(lengths)))
+    checksums = (10-digits.sum(axis=1)%10)%10
+    if validatecheck and (checksums!=checks).any():
+        raise ValueError(u'Incorrect %s check digit provided.' %name)
+    count = digits.shape[0]
+    data = state_table(encodings)[
+        numpy.concatenate([digits, checksums[:, None]], axis=1)]
+    frame = numpy.ones((count, 1), numpy.uint8)
+    return numpy.concatenate([frame, data.reshape(count, -1), frame], axis=1)
+
 
 class PostNet(Barcode):
     """
@@ -29,7 +104,8 @@ class PostNet(Barcode):
     """
     codetype = 'postnet'
     aliases = ('post net', 'post-net', 'post_net', 'us-postnet', 'us postnet', 'us_postnet')
-    class _Renderer(LinearCodeRenderer):
+    class _Renderer(PostalCodeRenderer):
+        state_shapes = TWO_STATE_SHAPES
         default_options = dict(
             LinearCodeRenderer.default_options,
             includetext=False, includecheckintext=False,
@@ -65,6 +141,42 @@ class PostNet(Barcode):
                 tbbox = cbbox
             params['bbox'] = "%d %d %d %d" %self._boundingbox(cbbox, tbbox)
             return params
+
+        def native_symbol(self, codestring):
+            return encode_postnet(
+                codestring, bool(self.lookup_option('validatecheck')),
+                bool(self.lookup_option('includecheckintext')))
+
+        def native_states_bulk(self, codestrings):
+            return postnet_states_bulk(
+                codestrings, bool(self.lookup_option('validatecheck')))
+    renderer = _Renderer
+
+
+class Planet(Barcode):
+    """
+    >>> bc = Planet()
+    >>> bc # doctest: +ELLIPSIS
+    <....Planet object at ...>
+    >>> g = bc.get_renderer({}).native_encode('01234567890')
+    >>> len(g.bhs), g.bhs[:3].tolist()
+    (62, [0.125, 0.05, 0.05])
+    >>> bc.render('01234567890', options=dict(includetext=True), scale=2, margin=1) # doctest: +ELLIPSIS
+    <PIL.EpsImagePlugin.EpsImageFile ... at ...>
+    """
+    codetype = 'planet'
+    aliases = ('usps planet', 'usps-planet', 'usps_planet')
+    class _Renderer(PostNet._Renderer):
+        def native_symbol(self, codestring):
+            return encode_postnet(
+                codestring, bool(self.lookup_option('validatecheck')),
+                bool(self.lookup_option('includecheckintext')),
+                PLANET_ENCODINGS, (11, 13), 'USPS PLANET')
+
+        def native_states_bulk(self, codestrings):
+            return postnet_states_bulk(
+                codestrings, bool(self.lookup_option('validatecheck')),
+                PLANET_ENCODINGS, (11, 13), 'USPS PLANET')
     renderer = _Renderer
 
 if __name__=="__main__":
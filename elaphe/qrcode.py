@@ -1,6 +1,11 @@
 # coding: utf-8
 import codecs, itertools
 from base import Barcode, MatrixCodeRenderer, DPI
+from geometry import MatrixGeometry
+from util import cap_unescape
+from reedsolomon import get_field, rs_generator, rs_encode_batch
+# NumPy is imported on first use; see _require_numpy().
+numpy = None
 # import logging
 # logging.basicConfig(level=logging.DEBUG)
 
@@ -319,6 +324,646 @@ def decode_n_base(s, digits=1, mode='digits'):
     return
 
 
+# --- native encoder --------------------------------------------------------
+
+QR_FIELD = 0x11D
+QR_MODES = ('numeric', 'alphanumeric', 'byte', 'kanji')
+QR_MODE_INDICATORS = dict(numeric='0001', alphanumeric='0010', byte='0100', kanji='1000')
+# character count bits by mode, for versions up to 9, 26 and 40
+QR_COUNT_BITS = [(9, (10, 9, 8, 8)), (26, (12, 11, 16, 10)), (40, (14, 13, 16, 12))]
+# data bits of a mode per character, in sixths of a bit
+QR_CHAR_COSTS = dict(numeric=20, alphanumeric=33, byte=48, kanji=78)
+QR_PAD_CODEWORDS = (0xEC, 0x11)
+QR_EC_BITS = dict(L=1, M=0, Q=3, H=2)
+QR_FORMAT_POLY, QR_FORMAT_MASK = 0x537, 0x5412
+QR_VERSION_POLY = 0x1F25
+# (mode indicator, character count bits) by mode of Micro QR versions
+MICRO_QR_HEADERS = dict(
+    M1=dict(numeric=('', 3)),
+    M2=dict(numeric=('0', 4), alphanumeric=('1', 3)),
+    M3=dict(numeric=('00', 5), alphanumeric=('01', 4), byte=('10', 4), kanji=('11', 3)),
+    M4=dict(numeric=('000', 6), alphanumeric=('001', 5), byte=('010', 5), kanji=('011', 4)))
+MICRO_QR_TERMINATORS = dict(M1='000', M2='00000', M3='0000000', M4='000000000')
+# symbol numbers of Micro QR format information
+MICRO_QR_SYMBOLS = [('M1', 'L'), ('M2', 'L'), ('M2', 'M'), ('M3', 'L'),
+                    ('M3', 'M'), ('M4', 'L'), ('M4', 'M'), ('M4', 'Q')]
+MICRO_QR_FORMAT_MASK = 0x4445
+QR_FINDER = [[1, 1, 1, 1, 1, 1, 1, 0], [1, 0, 0, 0, 0, 0, 1, 0],
+             [1, 0, 1, 1, 1, 0, 1, 0], [1, 0, 1, 1, 1, 0, 1, 0],
+             [1, 0, 1, 1, 1, 0, 1, 0], [1, 0, 0, 0, 0, 0, 1, 0],
+             [1, 1, 1, 1, 1, 1, 1, 0], [0, 0, 0, 0, 0, 0, 0, 0]]
+QR_ALIGNMENT = [[1, 1, 1, 1, 1], [1, 0, 0, 0, 1], [1, 0, 1, 0, 1],
+                [1, 0, 0, 0, 1], [1, 1, 1, 1, 1]]
+
+
+def _require_numpy():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError(u'NumPy is required for native QR Code encoding.')
+
+
+def qr_mode_headers(version):
+    """Returns (mode indicator, character count bits) by mode of the modes
+    a version takes.
+
+    >>> qr_mode_headers('10')['byte']
+    ('0100', 16)
+    >>> sorted(qr_mode_headers('M2').items())
+    [('alphanumeric', ('1', 3)), ('numeric', ('0', 4))]
+    """
+    if version in MICRO_QR_HEADERS:
+        return MICRO_QR_HEADERS[version]
+    for last, count_bits in QR_COUNT_BITS:
+        if int(version)<=last:
+            return dict((mode, (QR_MODE_INDICATORS[mode], bits))
+                        for mode, bits in zip(QR_MODES, count_bits))
+
+
+def qr_symbol(version, eclevel):
+    """Returns (size, data bits, data codewords, EC codewords per block,
+    blocks of the short and long groups) of version at eclevel.
+
+    The last data codeword of M1 and M3 has four bits only.
+
+    >>> qr_symbol('5', 'Q')
+    (37, 496, 62, 18, 2, 2)
+    >>> qr_symbol('M3', 'M')
+    (15, 68, 9, 8, 1, 0)
+    """
+    for frmt, vers, size, asp2, asp3, nmod, ecws_list, ecb_list in QRCODE_METRIC:
+        if vers==version:
+            break
+    else:
+        raise ValueError(u'Unknown QR Code version %s.' %version)
+    level = 'LMQH'.index(eclevel)
+    if ecws_list[level]==99:
+        raise ValueError(u'QR Code version %s has no error correction level %s.'
+                         %(version, eclevel))
+    short_last = size in (11, 15)
+    ncws = nmod//8+short_last
+    dcws = ncws-ecws_list[level]
+    ecb1, ecb2 = ecb_list[2*level], ecb_list[2*level+1]
+    ecpb = ncws//(ecb1+ecb2)-dcws//(ecb1+ecb2)
+    return size, dcws*8-4*short_last, dcws, ecpb, ecb1, ecb2
+
+
+def _kanji_value(data, i):
+    """Returns the 13-bit value of the Shift JIS character at data[i:i+2],
+    or None if there is none.
+
+    >>> _kanji_value('\\x93\\x5f', 0), _kanji_value('\\x83\\x13', 0)
+    (3487, None)
+    """
+    if i+1>=len(data):
+        return None
+    low = ord(data[i+1])
+    if not 0x40<=low<=0xFC or low==0x7F:
+        return None
+    code = ord(data[i])<<8 | low
+    if 0x8140<=code<=0x9FFC:
+        code -= 0x8140
+    elif 0xE040<=code<=0xEBBF:
+        code -= 0xC140
+    else:
+        return None
+    return (code>>8)*0xC0+(code & 0xFF)
+
+
+def _mode_chars(data, mode):
+    """Returns lengths (1, or 2 for kanji) of units of data encodable in
+    mode starting at each position, 0 where there is none.
+    """
+    if mode=='numeric':
+        return [int(c.isdigit()) for c in data]
+    if mode=='alphanumeric':
+        return [int(c in ALNUM) for c in data]
+    if mode=='kanji':
+        return [2 if _kanji_value(data, i) is not None else 0
+                for i in range(len(data))]
+    return [1]*len(data)
+
+
+def qr_segments(data, headers):
+    """Splits data into (mode, string) segments taking the fewest bits,
+    given mode headers of a version (see qr_mode_headers()).
+
+    Costs are kept in sixths of a bit; rounding them up to whole bits at
+    the end of a segment gives the exact length of numeric and
+    alphanumeric groups.
+
+    >>> qr_segments('ABCDEF0123456789012', qr_mode_headers('1'))
+    [('alphanumeric', 'ABCDEF'), ('numeric', '0123456789012')]
+    >>> qr_segments('a1', qr_mode_headers('1'))
+    [('byte', 'a1')]
+    >>> qr_segments('\\x83\\x13\\x8e!\\x83\\x13', qr_mode_headers('1'))
+    [('byte', '\\x83\\x13\\x8e!\\x83\\x13')]
+    >>> qr_segments('A1', qr_mode_headers('M1'))
+    Traceback (most recent call last):
+    ...
+    ValueError: QR Code modes numeric cannot encode the data.
+    """
+    n = len(data)
+    modes = [m for m in QR_MODES if m in headers]
+    units = dict((m, _mode_chars(data, m)) for m in modes)
+    heads = dict((m, (len(headers[m][0])+headers[m][1])*6) for m in modes)
+    infinity = 1<<62
+    # cost[i][m]: fewest sixths encoding data[:i] with a segment of mode m
+    # open at i; back[i][m] gives the previous state.
+    cost = [dict.fromkeys(modes, infinity) for i in range(n+1)]
+    back = [dict.fromkeys(modes) for i in range(n+1)]
+    for m in modes:
+        cost[0][m] = heads[m]
+    for i in range(n+1):
+        # closing a segment rounds it up to whole bits
+        closed = min((-(-cost[i][m]//6)*6, m) for m in modes)
+        for m in modes:
+            if closed[0]+heads[m]<cost[i][m] and i>0:
+                cost[i][m] = closed[0]+heads[m]
+                back[i][m] = (i, closed[1])
+        if i==n:
+            break
+        for m in modes:
+            length = units[m][i]
+            if length and cost[i][m]+QR_CHAR_COSTS[m]<cost[i+length][m]:
+                cost[i+length][m] = cost[i][m]+QR_CHAR_COSTS[m]
+                back[i+length][m] = (i, m)
+    mode = min(modes, key=lambda m: (-(-cost[n][m]//6), modes.index(m)))
+    if cost[n][mode]>=infinity:
+        raise ValueError(u'QR Code modes %s cannot encode the data.'
+                         %', '.join(modes))
+    segments, i, end = [], n, n
+    while i>0:
+        j, previous = back[i][mode]
+        if j==i:
+            segments.append((mode, data[i:end]))
+            end = i
+        i, mode = j, previous
+    segments.append((mode, data[:end]))
+    return [segment for segment in reversed(segments) if segment[1]]
+
+
+def qr_segment_bits(mode, data, headers):
+    """Returns the bit string of a segment, split in more segments if its
+    character count overflows.
+
+    >>> qr_segment_bits('numeric', '01234567', qr_mode_headers('1'))
+    '00010000001000000000110001010110011000011'
+    >>> qr_segment_bits('numeric', '01234567', qr_mode_headers('M2'))
+    '01000000000110001010110011000011'
+    """
+    indicator, bits = headers[mode]
+    chars_per_unit = 2 if mode=='kanji' else 1
+    limit = ((1<<bits)-1)*chars_per_unit
+    if len(data)>limit:
+        return (qr_segment_bits(mode, data[:limit], headers)
+                +qr_segment_bits(mode, data[limit:], headers))
+    out = [indicator, format(len(data)//chars_per_unit, '0%db' %bits)]
+    if mode=='numeric':
+        for i in range(0, len(data), 3):
+            group = data[i:i+3]
+            out.append(format(int(group), '0%db' %(len(group)*3+1)))
+    elif mode=='alphanumeric':
+        for i in range(0, len(data), 2):
+            pair = [ALNUM.index(c) for c in data[i:i+2]]
+            if len(pair)==2:
+                out.append(format(pair[0]*45+pair[1], '011b'))
+            else:
+                out.append(format(pair[0], '06b'))
+    elif mode=='kanji':
+        for i in range(0, len(data), 2):
+            value = _kanji_value(data, i)
+            if value is None:
+                raise ValueError(u'QR Code kanji mode takes Shift JIS characters.')
+            out.append(format(value, '013b'))
+    else:
+        out.extend(format(ord(c), '08b') for c in data)
+    return ''.join(out)
+
+
+def qr_message_bits(data, version, encoding=None):
+    """Returns the data bits of data in version, in segments of the given
+    encoding mode, or of mixed modes by default.
+    """
+    headers = qr_mode_headers(version)
+    if encoding in (None, 'unset'):
+        segments = qr_segments(data, headers)
+    elif encoding in headers:
+        if not all(_mode_chars(data, encoding)[::2 if encoding=='kanji' else 1]):
+            raise ValueError(u'QR Code %s mode cannot encode the data.' %encoding)
+        segments = [(encoding, data)]
+    elif encoding in QR_MODES:
+        raise ValueError(u'QR Code version %s has no %s mode.' %(version, encoding))
+    else:
+        raise ValueError(u'Unknown QR Code encoding %s.' %encoding)
+    return ''.join(qr_segment_bits(mode, part, headers) for mode, part in segments)
+
+
+def qr_data_codewords(msgbits, dcws, terminator='0000', dmod=None):
+    """Terminates and pads message bits into dcws codewords holding dmod
+    data bits (dcws*8 by default).
+
+    A last codeword of four bits, as in M1 and M3, is padded with zeros
+    and given in the high nibble.
+
+    >>> qr_data_codewords(qr_message_bits('HELLO WORLD', '1'), 16)
+    [32, 91, 11, 120, 209, 114, 220, 77, 67, 64, 236, 17, 236, 17, 236, 17]
+    >>> qr_data_codewords(qr_message_bits('12', 'M1'), 3, '000', 20)
+    [67, 0, 0]
+    """
+    if dmod is None:
+        dmod = dcws*8
+    bits = msgbits+terminator[:max(0, dmod-len(msgbits))]
+    bits += '0'*(-len(bits)%8)
+    pads = []
+    while len(bits)+8*(len(pads)+1)<=dmod:
+        pads.append(QR_PAD_CODEWORDS[len(pads)%2])
+    codewords = [int(bits[i:i+8], 2) for i in range(0, len(bits), 8)]+pads
+    return codewords+[0]*(dcws-len(codewords))
+
+
+def qr_interleave(codewords, ecpb, ecb1, ecb2):
+    """Splits data codewords into blocks, appends Reed-Solomon codewords
+    to each block and interleaves them.
+
+    >>> qr_interleave([32, 91, 11, 120, 209, 114, 220, 77, 67, 64, 236, 17,
+    ...                236, 17, 236, 17], 10, 1, 0)[16:]
+    [196, 35, 39, 119, 235, 215, 231, 226, 93, 23]
+    """
+    field = get_field(QR_FIELD)
+    generator = rs_generator(field, ecpb, 0)
+    dcpb = len(codewords)//(ecb1+ecb2)
+    blocks, start = [], 0
+    for i in range(ecb1+ecb2):
+        length = dcpb+(i>=ecb1)
+        blocks.append(codewords[start:start+length])
+        start += length
+    checks = rs_encode_batch(field, blocks, generator).tolist()
+    result = []
+    for i in range(dcpb+1):
+        result.extend(block[i] for block in blocks if i<len(block))
+    for i in range(ecpb):
+        result.extend(check[i] for check in checks)
+    return result
+
+
+def _bch(value, poly, bits):
+    remainder = value<<bits
+    for shift in range(remainder.bit_length()-poly.bit_length(), -1, -1):
+        if remainder>>(shift+poly.bit_length()-1) & 1:
+            remainder ^= poly<<shift
+    return value<<bits | remainder
+
+
+def qr_format_bits(eclevel, mask):
+    """Returns the 15-bit format information of eclevel and mask.
+
+    >>> qr_format_bits('M', 0), qr_format_bits('L', 4)
+    (21522, 26159)
+    """
+    return _bch(QR_EC_BITS[eclevel]<<3 | mask, QR_FORMAT_POLY, 10)^QR_FORMAT_MASK
+
+
+def qr_version_bits(version):
+    """Returns the 18-bit version information of versions 7 and up.
+
+    >>> qr_version_bits('7')
+    31892
+    """
+    return _bch(int(version), QR_VERSION_POLY, 12)
+
+
+def micro_qr_format_bits(version, eclevel, mask):
+    """Returns the 15-bit format information of a Micro QR symbol.
+
+    >>> micro_qr_format_bits('M1', 'L', 0), micro_qr_format_bits('M4', 'Q', 3)
+    (17477, 15290)
+    """
+    symbol = MICRO_QR_SYMBOLS.index((version, eclevel))
+    return _bch(symbol<<2 | mask, QR_FORMAT_POLY, 10)^MICRO_QR_FORMAT_MASK
+
+
+def _format_positions(size, format_='full'):
+    """Returns the (x, y) positions of each format bit, most significant
+    first; full-format symbols have two copies.
+    """
+    if format_=='micro':
+        return [((i, 8),) for i in range(1, 9)]+[((8, i),) for i in range(7, 0, -1)]
+    first = [(0, 8), (1, 8), (2, 8), (3, 8), (4, 8), (5, 8), (7, 8), (8, 8),
+             (8, 7), (8, 5), (8, 4), (8, 3), (8, 2), (8, 1), (8, 0)]
+    second = [(8, size-1-i) for i in range(7)]+[(size-8+i, 8) for i in range(8)]
+    return zip(first, second)
+
+
+def qr_function_patterns(version):
+    """Returns (modules, function) arrays of a version: values of finder,
+    alignment and timing patterns (format and version areas reserved as
+    light), and where they are.  Arrays are indexed [y, x].
+    """
+    _require_numpy()
+    for frmt, vers, size, asp2, asp3, nmod, ecws_list, ecb_list in QRCODE_METRIC:
+        if vers==version:
+            break
+    if frmt=='micro':
+        return _micro_function_patterns(size)
+    modules = numpy.zeros((size, size), numpy.uint8)
+    function = numpy.zeros((size, size), bool)
+    def put(x, y, pattern):
+        pattern = numpy.array(pattern, numpy.uint8)
+        h, w = pattern.shape
+        modules[y:y+h, x:x+w] = pattern
+        function[y:y+h, x:x+w] = True
+    finder = numpy.array(QR_FINDER, numpy.uint8)
+    put(0, 0, finder)
+    put(size-8, 0, finder[:, ::-1])
+    put(0, size-8, finder[::-1, :])
+    step = asp3-asp2
+    for i in range(asp2-2, size-12, step):
+        put(i, 4, QR_ALIGNMENT)
+        put(4, i, QR_ALIGNMENT)
+    for x in range(asp2-2, size-8, step):
+        for y in range(asp2-2, size-8, step):
+            put(x, y, QR_ALIGNMENT)
+    timing = (numpy.arange(8, size-8)+1)%2
+    modules[6, 8:size-8] = modules[8:size-8, 6] = timing
+    function[6, 8:size-8] = function[8:size-8, 6] = True
+    for positions in _format_positions(size):
+        for x, y in positions:
+            function[y, x] = True
+    if size>=45:
+        function[size-11:size-8, :6] = function[:6, size-11:size-8] = True
+    modules[size-8, 8] = 1
+    function[size-8, 8] = True
+    return modules, function
+
+
+def _micro_function_patterns(size):
+    modules = numpy.zeros((size, size), numpy.uint8)
+    function = numpy.zeros((size, size), bool)
+    modules[:8, :8] = QR_FINDER
+    function[:8, :8] = True
+    timing = (numpy.arange(8, size)+1)%2
+    modules[0, 8:] = modules[8:, 0] = timing
+    function[0, 8:] = function[8:, 0] = True
+    for (x, y), in _format_positions(size, 'micro'):
+        function[y, x] = True
+    return modules, function
+
+
+def qr_placement(function, skip_column=6):
+    """Returns (ys, xs) of data modules in placement order: upwards and
+    downwards in turn through column pairs from the right, skipping the
+    vertical timing pattern (column 0 of Micro QR).
+    """
+    size = function.shape[0]
+    lefts = [x for x in range(size-2, -1, -2) if x>=skip_column]
+    lefts += [x-2 for x in range(skip_column, 0, -2)]
+    ys, xs = [], []
+    rows = numpy.arange(size)
+    for k, left in enumerate(sorted(set(lefts), reverse=True)):
+        order = rows[::-1] if k%2==0 else rows
+        ys.append(numpy.repeat(order, 2))
+        xs.append(numpy.tile([left+1, left], size))
+    ys, xs = numpy.concatenate(ys), numpy.concatenate(xs)
+    free = ~function[ys, xs]
+    return ys[free], xs[free]
+
+
+def qr_masks(size, format_='full'):
+    """Returns boolean array (masks, size, size) of modules each mask
+    pattern inverts, indexed [mask, y, x].
+    """
+    _require_numpy()
+    y, x = numpy.indices((size, size))
+    patterns = [(y+x)%2, y%2, x%3, (y+x)%3, (y//2+x//3)%2,
+                (y*x)%2+(y*x)%3, ((y*x)%2+(y*x)%3)%2, ((y*x)%3+(y+x)%2)%2]
+    if format_=='micro':
+        patterns = [patterns[i] for i in (1, 4, 6, 7)]
+    return numpy.array(patterns)==0
+
+
+def _runs_penalty(symbols):
+    """N1 penalty of rows of symbols (masks, rows, columns): 3 points for
+    each run of five same-colored modules, plus one for each further one.
+    """
+    windows = numpy.ones(symbols[..., 4:].shape, bool)
+    for k in range(1, 5):
+        windows &= symbols[..., k:symbols.shape[-1]-4+k]==symbols[..., :symbols.shape[-1]-4]
+    starts = windows.copy()
+    starts[..., 1:] &= symbols[..., :-5]!=symbols[..., 1:-4]
+    return windows.sum(axis=(1, 2))+2*starts.sum(axis=(1, 2))
+
+
+def _finder_penalty(symbols):
+    """N3 penalty of rows of symbols: 40 points for each dark run of
+    1:1:3:1:1 proportions with a light run of four or more, or the
+    symbol edge, on either side.
+
+    Rows are padded with light modules and ended by a separator, so that
+    run lengths of the whole stack come out of one flat array.
+    """
+    masks, rows, columns = symbols.shape
+    stride = columns+9
+    lines = numpy.zeros((masks, rows, stride), numpy.int8)
+    lines[..., 4:columns+4] = symbols
+    lines[..., -1] = 2
+    flat = lines.ravel()
+    starts = numpy.flatnonzero(numpy.concatenate(([True], flat[1:]!=flat[:-1])))
+    lengths = numpy.diff(numpy.append(starts, flat.size))
+    values = flat[starts]
+    k = numpy.arange(3, len(starts)-3)
+    unit = lengths[k-2]
+    found = ((values[k]==1) & (values[k-1]==0) & (values[k+1]==0)
+             & (values[k-2]==1) & (values[k+2]==1) & (lengths[k]==3*unit)
+             & (lengths[k-1]==unit) & (lengths[k+1]==unit) & (lengths[k+2]==unit)
+             & (((values[k-3]==0) & (lengths[k-3]>=4))
+                | ((values[k+3]==0) & (lengths[k+3]>=4))))
+    return 40*numpy.bincount(starts[k[found]]//(rows*stride), minlength=masks)
+
+
+def qr_mask_scores(symbols):
+    """Returns penalty scores of full-format symbols stacked as (masks,
+    size, size) arrays of 0 and 1, all masks evaluated at once.
+
+    >>> import numpy
+    >>> qr_mask_scores(numpy.zeros((1, 5, 5), numpy.uint8)).tolist()
+    [178]
+    """
+    _require_numpy()
+    columns = symbols.transpose(0, 2, 1)
+    n1 = _runs_penalty(symbols)+_runs_penalty(columns)
+    square = symbols[:, :-1, :-1]
+    n2 = 3*((square==symbols[:, 1:, :-1]) & (square==symbols[:, :-1, 1:])
+            & (square==symbols[:, 1:, 1:])).sum(axis=(1, 2))
+    n3 = _finder_penalty(symbols)+_finder_penalty(columns)
+    total = symbols.shape[1]*symbols.shape[2]
+    dark = symbols.sum(axis=(1, 2)).astype(numpy.int64)
+    n4 = 10*(numpy.abs(20*dark-10*total)//total)
+    return n1+n2+n3+n4
+
+
+def micro_qr_mask_scores(symbols):
+    """Returns scores of Micro QR symbols stacked as (masks, size, size)
+    arrays from dark modules on the right and bottom edges; the highest
+    is best.
+
+    >>> import numpy
+    >>> micro_qr_mask_scores(numpy.ones((1, 11, 11), numpy.uint8)).tolist()
+    [170]
+    """
+    _require_numpy()
+    right = symbols[:, 1:, -1].sum(axis=1).astype(numpy.int64)
+    bottom = symbols[:, -1, 1:].sum(axis=1).astype(numpy.int64)
+    return numpy.where(right<=bottom, right*16+bottom, bottom*16+right)
+
+
+_layouts = {}
+
+def qr_layout(version):
+    """Returns (modules, function, ys, xs, masks) of version, computed
+    once: function pattern values and positions as qr_function_patterns()
+    gives them, data module coordinates in placement order, and uint8
+    array of data modules each mask pattern inverts.  modules is shared;
+    copy it before writing.
+    """
+    layout = _layouts.get(version)
+    if layout is None:
+        modules, function = qr_function_patterns(version)
+        format_ = 'micro' if version in MICRO_QR_HEADERS else 'full'
+        ys, xs = qr_placement(function, 0 if format_=='micro' else 6)
+        masks = (qr_masks(modules.shape[0], format_) & ~function).astype(numpy.uint8)
+        layout = _layouts[version] = (modules, function, ys, xs, masks)
+    return layout
+
+
+def qr_codeword_bits(codewords, dcws, dmod):
+    """Returns uint8 array of the bits of codewords as placed, leaving out
+    the four padding bits of a short last data codeword.
+    """
+    _require_numpy()
+    bits = numpy.unpackbits(numpy.array(codewords, numpy.uint8))
+    if dmod<dcws*8:
+        bits = numpy.delete(bits, numpy.arange(dmod, dcws*8))
+    return bits
+
+
+def qr_symbol_matrix(bits, version, eclevel, mask=None):
+    """Places bits in the modules of version and applies mask, or the
+    mask pattern scoring best.  Returns the (size, size) uint8 array of
+    modules, 1 for dark, indexed [y, x].
+    """
+    modules, function, ys, xs, masks = qr_layout(version)
+    size = modules.shape[0]
+    micro = version in MICRO_QR_HEADERS
+    modules = modules.copy()
+    count = min(len(bits), len(ys))
+    modules[ys[:count], xs[:count]] = bits[:count]
+    candidates = range(len(masks)) if mask is None else [int(mask)]
+    symbols = modules[None]^masks[candidates]
+    # masks are scored with format and version areas light, as BWIPP does
+    if len(candidates)==1:
+        best = 0
+    elif micro:
+        best = int(numpy.argmax(micro_qr_mask_scores(symbols)))
+    else:
+        best = int(numpy.argmin(qr_mask_scores(symbols)))
+    symbol = symbols[best]
+    if micro:
+        format_bits = micro_qr_format_bits(version, eclevel, candidates[best])
+    else:
+        format_bits = qr_format_bits(eclevel, candidates[best])
+    positions = _format_positions(size, 'micro' if micro else 'full')
+    for k, copies in enumerate(positions):
+        for x, y in copies:
+            symbol[y, x] = format_bits>>(14-k) & 1
+    if size>=45:
+        version_bits = qr_version_bits(version)
+        for k in range(18):
+            x, y = size-9-k%3, 5-k//3
+            symbol[y, x] = symbol[x, y] = version_bits>>(17-k) & 1
+    return symbol
+
+
+def encode_qrcode(codestring, version=None, eclevel=None, encoding=None,
+                  raw=False, parse=False, mask=None, format_='full'):
+    """Encodes codestring into MatrixGeometry of a QR Code symbol, or of a
+    Micro QR one if format_ is 'micro' or version one of M1 to M4.
+
+    Without version the smallest fitting one is taken.  Without eclevel
+    the level starts at M (L for Micro QR) and is raised while the data
+    still fits; a given eclevel is kept.  raw (or the raw encoding) takes codestring as a string
+    of data bits.
+
+    >>> g = encode_qrcode('HELLO WORLD', eclevel='M')
+    >>> g.pixx, g.rows()[0][:9], round(g.width*72)
+    (21, [1, 1, 1, 1, 1, 1, 1, 0, 0], 42.0)
+    >>> encode_qrcode('Kansai Python Users DevCamp 2009 Kyoto').pixx
+    29
+    >>> encode_qrcode('00010000001000000000110001010110011000011',
+    ...               encoding='raw').pixx
+    21
+    >>> [encode_qrcode(s, format_='micro').pixx for s in ('12345', 'AB12', 'ab')]
+    [11, 13, 15]
+    >>> encode_qrcode('01234567', version='M2', eclevel='L').rows()[-1]
+    [1, 1, 1, 0, 1, 0, 0, 1, 1, 0, 1, 1, 1]
+    """
+    micro = format_=='micro' or str(version).startswith('M')
+    raise_level = not eclevel
+    eclevel = eclevel or ('L' if micro else 'M')
+    if parse:
+        codestring = cap_unescape(codestring)
+    raw = raw or encoding=='raw'
+    if version:
+        versions = [str(version)]
+    elif micro:
+        versions = ['M1', 'M2', 'M3', 'M4']
+    else:
+        versions = [str(v) for v in range(1, 41)]
+    msgbits, error = None, None
+    for vers in versions:
+        try:
+            dmod = qr_symbol(vers, eclevel)[1]
+        except ValueError:
+            if version:
+                raise
+            continue
+        if raw:
+            msgbits = codestring
+        elif micro or vers in ('1', '10', '27') or version or vers==versions[0]:
+            # full-format segmentation changes with character count bits only
+            try:
+                msgbits = qr_message_bits(codestring, vers, encoding)
+            except ValueError, e:
+                # Micro QR versions take more modes as they grow
+                if not micro or vers=='M4':
+                    raise
+                msgbits, error = None, e
+                continue
+        if len(msgbits)<=dmod:
+            break
+    else:
+        if msgbits is None and error:
+            raise error
+        raise ValueError(u'QR Code data does not fit in version %s at level %s.'
+                         %(version or versions[-1], eclevel))
+    if raise_level:
+        for level in 'LMQH'['LMQH'.index(eclevel)+1:]:
+            try:
+                if len(msgbits)>qr_symbol(vers, level)[1]:
+                    break
+            except ValueError:
+                break
+            eclevel = level
+    size, dmod, dcws, ecpb, ecb1, ecb2 = qr_symbol(vers, eclevel)
+    codewords = qr_data_codewords(msgbits, dcws, MICRO_QR_TERMINATORS.get(vers, '0000'), dmod)
+    codewords = qr_interleave(codewords, ecpb, ecb1, ecb2)
+    matrix = qr_symbol_matrix(qr_codeword_bits(codewords, dcws, dmod), vers, eclevel, mask)
+    return MatrixGeometry(matrix.ravel().tolist(), size, size,
+                          size*2/72.0, size*2/72.0)
+
+
 class QrCode(Barcode):
     """
     >>> bc = QrCode()
@@ -400,7 +1045,18 @@ class QrCode(Barcode):
             cbbox = self._code_bbox(codestring)
             params['bbox'] = '%d %d %d %d' %(self._boundingbox(cbbox, cbbox))
             return params
-        
+
+        def native_encode(self, codestring):
+            try:
+                _require_numpy()
+            except ImportError:
+                return None
+            return encode_qrcode(
+                codestring, self.lookup_option('version'),
+                self.lookup_option('eclevel'), self.lookup_option('encoding'),
+                bool(self.lookup_option('raw')), bool(self.lookup_option('parse')),
+                self.lookup_option('mask'), self.lookup_option('format') or 'full')
+
     renderer = _Renderer
 
 
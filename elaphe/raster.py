@@ -0,0 +1,348 @@
+# coding: utf-8
+"""Rasterizes symbol geometry with NumPy, without Ghostscript.
+
+Geometry (see geometry module) is painted at 72 pixels per inch times
+the scale render option, with the margins of the render options around
+it, the same way EPS rendering lays out the bounding box.  Dark modules
+are 0 and light ones 255 in an 8-bit grayscale image.
+"""
+from geometry import LinearGeometry, MatrixGeometry, MaxiCodeGeometry
+# NumPy is imported on first use; see _require_numpy().
+numpy = None
+
+__all__ = ['DEFAULT_MODULE_SIZE', 'DARK', 'LIGHT', 'MAXICODE_PITCH', 'rasterize',
+           'rasterize_linear', 'rasterize_matrix', 'rasterize_maxicode',
+           'to_image']
+
+
+# points per module of matrix symbols without explicit width/height.
+DEFAULT_MODULE_SIZE = 2.0
+DARK, LIGHT = 0, 255
+# points between MaxiCode module centers; rows are 0.8661 pitches apart
+# and hexagons 0.5774 pitches in circumradius, as renmaximatrix draws them.
+MAXICODE_PITCH = 2.4945
+# bullseye center and (inner, outer) radii of its dark rings, in pitches
+# from the center of the top left module.
+MAXICODE_BULLSEYE = (14.0, 13.8576)
+MAXICODE_RINGS = [(0.5774, 1.3359), (2.1058, 2.8644), (3.6229, 4.3814)]
+# TrueType font of human readable text, standing in for the Helvetica of
+# barcode.ps; PIL's bitmap font is scaled instead where it is missing.
+TEXT_FONT = 'DejaVuSans.ttf'
+
+
+def _require_numpy():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError(u'NumPy is required for rasterizing geometry.')
+
+
+def _edges(starts, ends, length):
+    """Returns boolean mask of length with [starts, ends) spans set.
+
+    >>> _require_numpy(); import numpy
+    >>> _edges(numpy.array([1, 4]), numpy.array([3, 5]), 6).astype(int).tolist()
+    [0, 1, 1, 0, 1, 0]
+    """
+    counts = numpy.zeros(length+1, dtype=numpy.int32)
+    numpy.add.at(counts, numpy.clip(starts, 0, length), 1)
+    numpy.add.at(counts, numpy.clip(ends, 0, length), -1)
+    return numpy.cumsum(counts[:-1])>0
+
+
+_fonts = {}
+def _get_font(pixels):
+    """Returns (font, ascent, em) for text of pixels height.
+
+    em is the size of the font in pixels, which differs from pixels only
+    for the fixed-size bitmap font.
+    """
+    font = _fonts.get(pixels)
+    if font is None:
+        from PIL import ImageFont
+        try:
+            truetype = ImageFont.truetype(TEXT_FONT, pixels)
+            font = (truetype, truetype.getmetrics()[0], pixels)
+        except (IOError, ImportError):
+            bitmap = ImageFont.load_default()
+            height = bitmap.getsize('0')[1]
+            font = (bitmap, height, height)
+        font = _fonts.setdefault(pixels, font)
+    return font
+
+
+def _text_patch(string, size, x_scale, y_scale):
+    """Returns (uint8 array, baseline row) of string set in size points.
+
+    >>> patch, baseline = _text_patch('12', 10, 2, 2)
+    >>> 0 < baseline <= patch.shape[0], (patch<LIGHT).any()
+    (True, True)
+    """
+    from PIL import Image, ImageDraw
+    pixels = max(int(round(size*y_scale)), 1)
+    font, ascent, em = _get_font(pixels)
+    width, height = font.getsize(string)
+    image = Image.new('L', (max(width, 1), max(height, ascent, 1)), LIGHT)
+    ImageDraw.Draw(image).text((0, 0), string, fill=DARK, font=font)
+    # glyphs are pixels high; x_scale may stretch them sideways.
+    factor = float(pixels)/em
+    resized = (max(int(round(image.size[0]*factor*x_scale/y_scale)), 1),
+               max(int(round(image.size[1]*factor)), 1))
+    if resized!=image.size:
+        image = image.resize(resized, Image.BILINEAR)
+    return numpy.asarray(image), int(round(ascent*factor))
+
+
+def rasterize_linear(geometry, x_scale=1.0, y_scale=1.0, margins=(0, 0, 0, 0)):
+    """Paints LinearGeometry into uint8 array.
+
+    margins are (left, bottom, right, top) in points before scaling.
+    Rectangles of the geometry (bearer bars) and its text are painted as
+    well and may extend the symbol to the left of and below the first
+    bar.
+
+    >>> g = LinearGeometry([1, 1, 2, 1, 1], [0.5, 0.5, 0.25])
+    >>> a = rasterize_linear(g, x_scale=1, y_scale=1/36.0)
+    >>> a.shape, a.dtype.name
+    ((1, 6), 'uint8')
+    >>> a.tolist()
+    [[0, 255, 0, 0, 255, 0]]
+    >>> a = rasterize_linear(g, x_scale=2, y_scale=1/18.0, margins=(1, 0, 1, 0))
+    >>> a.tolist()
+    [[255, 255, 0, 0, 255, 255, 0, 0, 0, 0, 255, 255, 255, 255, 255, 255], [255, 255, 0, 0, 255, 255, 0, 0, 0, 0, 255, 255, 0, 0, 255, 255]]
+    >>> g = LinearGeometry([1, 1, 1], [2/72.0, 2/72.0], rects=[(-1, -1, 5, 1)])
+    >>> rasterize_linear(g).tolist()
+    [[255, 0, 255, 0, 255], [255, 0, 255, 0, 255], [0, 0, 0, 0, 0]]
+
+    Text hangs below the bars here, as with includetext:
+
+    >>> g = LinearGeometry([1, 1, 1], [0.5, 0.5], text=[('12', 0, -10, 10)])
+    >>> a = rasterize_linear(g, x_scale=2, y_scale=2)
+    >>> a.shape[0]>72, (a[:72, :6]==rasterize_linear(LinearGeometry(
+    ...     [1, 1, 1], [0.5, 0.5]), x_scale=2, y_scale=2)).all()
+    (True, True)
+    >>> (a[72:]<LIGHT).any()
+    True
+    """
+    _require_numpy()
+    left, bottom, right, top = margins
+    sbs = numpy.asarray(geometry.sbs, dtype=numpy.float64)
+    bhs = numpy.asarray(geometry.bhs, dtype=numpy.float64)*72
+    bbs = numpy.asarray(geometry.bbs, dtype=numpy.float64)*72
+    nbars = min(len(bhs), (len(sbs)+1)//2)
+    xs = numpy.concatenate([[0.0], numpy.cumsum(sbs)])
+    symbol_height = float((bbs[:nbars]+bhs[:nbars]).max()) if nbars else 0.0
+    rects = numpy.asarray(geometry.rects, dtype=numpy.float64).reshape(-1, 4)
+    texts = [(_text_patch(string, size, x_scale, y_scale), x, y)
+             for string, x, y, size in geometry.text if string]
+    # text boxes in points, as rects are
+    boxes = [(x, y-(patch.shape[0]-baseline)/float(y_scale),
+              patch.shape[1]/float(x_scale), patch.shape[0]/float(y_scale))
+             for (patch, baseline), x, y in texts]
+    boxes = numpy.concatenate([rects, numpy.asarray(boxes, numpy.float64).reshape(-1, 4)])
+    # extend the symbol over rectangles and text; origin moves to their
+    # lower left.
+    min_x = min(0.0, boxes[:, 0].min()) if len(boxes) else 0.0
+    min_y = min(0.0, boxes[:, 1].min()) if len(boxes) else 0.0
+    max_x = max([xs[-1]]+list(boxes[:, 0]+boxes[:, 2]))
+    symbol_height = max([symbol_height]+list(boxes[:, 1]+boxes[:, 3]))
+    left, bottom = left-min_x, bottom-min_y
+    width = int(round(x_scale*(left+max_x+right)))
+    height = int(round(y_scale*(top+symbol_height+bottom)))
+    raster = numpy.empty((height, width), dtype=numpy.uint8)
+    raster.fill(LIGHT)
+    for x, y, w, h in rects:
+        raster[max(int(round(y_scale*(top+symbol_height-y-h))), 0):
+               max(int(round(y_scale*(top+symbol_height-y))), 0),
+               max(int(round(x_scale*(left+x))), 0):
+               max(int(round(x_scale*(left+x+w))), 0)] = DARK
+    for (patch, baseline), x, y in texts:
+        row = int(round(y_scale*(top+symbol_height-y)))-baseline
+        column = int(round(x_scale*(left+x)))
+        target = raster[max(row, 0):row+patch.shape[0],
+                        max(column, 0):column+patch.shape[1]]
+        patch = patch[max(-row, 0):, max(-column, 0):][:target.shape[0], :target.shape[1]]
+        numpy.minimum(target, patch, target)
+    if not nbars:
+        return raster
+    x0 = numpy.rint(x_scale*(left+xs[0:2*nbars:2])).astype(numpy.intp)
+    x1 = numpy.rint(x_scale*(left+xs[1:2*nbars+1:2])).astype(numpy.intp)
+    y0 = numpy.rint(y_scale*(top+symbol_height-bbs[:nbars]-bhs[:nbars])).astype(numpy.intp)
+    y1 = numpy.rint(y_scale*(top+symbol_height-bbs[:nbars])).astype(numpy.intp)
+    # bars sharing vertical extent are painted as one row mask.
+    spans = numpy.stack([y0, y1], axis=1)
+    keys, groups = numpy.unique(spans, axis=0, return_inverse=True)
+    for group, (top_y, bottom_y) in enumerate(keys):
+        selected = groups==group
+        row = _edges(x0[selected], x1[selected], width)
+        raster[max(top_y, 0):max(bottom_y, 0), row] = DARK
+    return raster
+
+
+def rasterize_matrix(geometry, x_scale=1.0, y_scale=1.0, margins=(0, 0, 0, 0)):
+    """Paints MatrixGeometry into uint8 array.
+
+    Module size comes from geometry width/height (inches) if known,
+    otherwise DEFAULT_MODULE_SIZE points.
+
+    >>> g = MatrixGeometry([1, 0, 0, 1], 2, 2)
+    >>> rasterize_matrix(g, x_scale=0.5, y_scale=0.5).tolist()
+    [[0, 255], [255, 0]]
+    >>> rasterize_matrix(g, margins=(1, 0, 0, 0)).tolist()
+    [[255, 0, 0, 255, 255], [255, 0, 0, 255, 255], [255, 255, 255, 0, 0], [255, 255, 255, 0, 0]]
+    """
+    _require_numpy()
+    left, bottom, right, top = margins
+    module_w = (geometry.width*72.0/geometry.pixx if geometry.width
+                else DEFAULT_MODULE_SIZE)
+    module_h = (geometry.height*72.0/geometry.pixy if geometry.height
+                else DEFAULT_MODULE_SIZE)
+    width = int(round(x_scale*(left+module_w*geometry.pixx+right)))
+    height = int(round(y_scale*(top+module_h*geometry.pixy+bottom)))
+    modules = numpy.frombuffer(geometry.pixs, dtype=numpy.uint8).reshape(
+        geometry.pixy, geometry.pixx)
+    # map pixel centers to module indexes; -1 marks the quiet zone.
+    cols = numpy.floor(((numpy.arange(width)+0.5)/x_scale-left)/module_w).astype(numpy.intp)
+    rows = numpy.floor(((numpy.arange(height)+0.5)/y_scale-top)/module_h).astype(numpy.intp)
+    cols[(cols<0)|(cols>=geometry.pixx)] = -1
+    rows[(rows<0)|(rows>=geometry.pixy)] = -1
+    padded = numpy.zeros((geometry.pixy+1, geometry.pixx+1), dtype=numpy.uint8)
+    padded[:-1, :-1] = modules
+    return numpy.where(padded[rows[:, None], cols[None, :]], DARK, LIGHT).astype(numpy.uint8)
+
+
+_maxicode_templates = {}
+
+def _maxicode_template(x_scale, y_scale, margins):
+    """Returns (raster, sprites) for MaxiCode symbols at x_scale, y_scale
+    and margins, computed once: raster is the light symbol with its
+    bullseye, and sprites holds the flat raster indexes of the pixels of
+    each of the 990 hexagons (a row per module).
+    """
+    key = (x_scale, y_scale, margins)
+    template = _maxicode_templates.get(key)
+    if template is not None:
+        return template
+    left, bottom, right, top = margins
+    pitch, radius = MAXICODE_PITCH, 0.5774*MAXICODE_PITCH
+    symbol_width = 30*pitch
+    symbol_height = (32*0.8661+2*0.5774)*pitch
+    width = int(round(x_scale*(left+symbol_width+right)))
+    height = int(round(y_scale*(top+symbol_height+bottom)))
+    # sprites reach beyond the symbol by less than a pixel; the extra
+    # row and column are cut off.
+    raster = numpy.empty((height+1, width+1), dtype=numpy.uint8)
+    raster.fill(LIGHT)
+    # the hexagon as pixel offsets from the pixel holding its center
+    dx = numpy.arange(-int(x_scale*pitch/2.0), int(x_scale*pitch/2.0)+1)/x_scale
+    dy = numpy.arange(-int(y_scale*radius), int(y_scale*radius)+1)/y_scale
+    inside = ((numpy.abs(dx)[None, :]<=pitch/2.0)
+              & (numpy.abs(dy)[:, None]<=radius*(1-numpy.abs(dx)[None, :]/pitch)))
+    offset_y, offset_x = numpy.nonzero(inside)
+    offsets = ((offset_y-len(dy)//2)*(width+1)+offset_x-len(dx)//2)
+    # module centers, odd rows shifted right by half a pitch
+    modules = numpy.arange(990)
+    xs = (modules%30+0.5*(modules//30%2)+0.5)*pitch
+    ys = (modules//30*0.8661+0.5774)*pitch
+    centers = (numpy.floor(y_scale*(top+ys)).astype(numpy.intp)*(width+1)
+               + numpy.floor(x_scale*(left+xs)).astype(numpy.intp))
+    sprites = centers[:, None]+offsets[None, :]
+    # bullseye rings around the pixel centers of their bounding square
+    cx = x_scale*(left+(MAXICODE_BULLSEYE[0]+0.5)*pitch)
+    cy = y_scale*(top+symbol_height-(MAXICODE_BULLSEYE[1]+0.5774)*pitch)
+    outer = MAXICODE_RINGS[-1][1]*pitch
+    x0, x1 = int(cx-x_scale*outer), int(cx+x_scale*outer)+1
+    y0, y1 = int(cy-y_scale*outer), int(cy+y_scale*outer)+1
+    distance = numpy.hypot(
+        (numpy.arange(x0, x1)+0.5-cx)[None, :]/x_scale,
+        (numpy.arange(y0, y1)+0.5-cy)[:, None]/y_scale)/pitch
+    rings = numpy.zeros(distance.shape, dtype=bool)
+    for inner, outer in MAXICODE_RINGS:
+        rings |= (distance>=inner) & (distance<=outer)
+    raster[y0:y1, x0:x1][rings] = DARK
+    template = _maxicode_templates[key] = (raster, sprites)
+    return template
+
+
+def rasterize_maxicode(geometry, x_scale=1.0, y_scale=1.0, margins=(0, 0, 0, 0)):
+    """Paints MaxiCodeGeometry into uint8 array.
+
+    Hexagons are blitted from a sprite computed once per scale and
+    margins, together with the bullseye, so painting a symbol takes a
+    copy and a scatter of its dark pixels.
+
+    >>> a = rasterize_maxicode(MaxiCodeGeometry([0, 989]))
+    >>> a.shape
+    (72, 75)
+    >>> (a[:3, :4]==DARK).astype(int).tolist()
+    [[0, 1, 0, 0], [1, 1, 1, 0], [0, 1, 0, 0]]
+    >>> int((a==DARK).sum()) - int((rasterize_maxicode(MaxiCodeGeometry([]))==DARK).sum())
+    10
+    """
+    _require_numpy()
+    template, sprites = _maxicode_template(x_scale, y_scale, tuple(margins))
+    raster = template.copy()
+    pixs = numpy.frombuffer(geometry.pixs, dtype=numpy.uint16)
+    raster.ravel()[sprites[pixs.astype(numpy.intp)]] = DARK
+    height, width = template.shape
+    return numpy.ascontiguousarray(raster[:height-1, :width-1])
+
+
+def to_image(raster):
+    """Wraps uint8 array into PIL image sharing its memory.
+
+    >>> import numpy
+    >>> im = to_image(numpy.zeros((2, 3), dtype=numpy.uint8))
+    >>> im.mode, im.size
+    ('L', (3, 2))
+    """
+    from PIL import Image
+    raster = numpy.ascontiguousarray(raster)
+    height, width = raster.shape
+    return Image.frombuffer('L', (width, height), raster, 'raw', 'L', 0, 1)
+
+
+_RASTERIZERS = [
+    (LinearGeometry, rasterize_linear),
+    (MatrixGeometry, rasterize_matrix),
+    (MaxiCodeGeometry, rasterize_maxicode),
+    ]
+
+def rasterize(geometry, renderer=None, as_array=False):
+    """Rasterizes geometry with scale and margins of renderer.
+
+    renderer is a base.Renderer (or anything having x_scale, y_scale and
+    *_margin attributes); defaults to scale 1 and no margins.  Returns a
+    PIL image, or the uint8 array itself if as_array is True.
+
+    >>> from base import Renderer
+    >>> r = Renderer('qrcode', scale=2, margin=1, left_margin=2)
+    >>> rasterize(MatrixGeometry([1, 0, 0, 1], 2, 2), r).size
+    (14, 12)
+    >>> rasterize(MatrixGeometry([1, 0, 0, 1], 2, 2), as_array=True).shape
+    (4, 4)
+    """
+    _require_numpy()
+    if renderer is None:
+        x_scale = y_scale = 1.0
+        margins = (0, 0, 0, 0)
+    else:
+        x_scale, y_scale = renderer.x_scale, renderer.y_scale
+        margins = (renderer.left_margin, renderer.bottom_margin,
+                   renderer.right_margin, renderer.top_margin)
+    for geometry_class, rasterizer in _RASTERIZERS:
+        if isinstance(geometry, geometry_class):
+            raster = rasterizer(geometry, x_scale, y_scale, margins)
+            break
+    else:
+        raise TypeError(u'Unable to rasterize %s.' %type(geometry).__name__)
+    if as_array:
+        return raster
+    return to_image(raster)
+
+
+if __name__=="__main__":
+    from doctest import testmod
+    testmod()
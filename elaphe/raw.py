@@ -1,5 +1,32 @@
 # coding: utf-8
 from base import Barcode, LinearCodeRenderer, DPI
+from geometry import LinearGeometry
+
+
+def raw_widths(codestring):
+    """Returns widths of bars and spaces given as digits 1 to 9.
+
+    >>> raw_widths('3311')
+    [3, 3, 1, 1]
+    >>> raw_widths('301')
+    Traceback (most recent call last):
+    ...
+    ValueError: Raw must contain only digits 1 to 9.
+    """
+    if any(c not in '123456789' for c in codestring):
+        raise ValueError(u'Raw must contain only digits 1 to 9.')
+    return [int(c) for c in codestring]
+
+
+def encode_raw(codestring, height=1.0):
+    """Returns LinearGeometry of bars and spaces of the given widths.
+
+    >>> g = encode_raw('331132131313411122131311333213114131131221323')
+    >>> g.width, len(g.bhs)
+    (90.0, 23)
+    """
+    sbs = raw_widths(codestring)
+    return LinearGeometry(sbs, [height]*((len(sbs)+1)//2))
 
 class Raw(Barcode):
     """
@@ -42,13 +69,16 @@ class Raw(Barcode):
             [0, 0, 90, 72.0]
             """
             height = self.lookup_option('height')
-            return [0, 0, sum(int(c) for c in list(codestring)), height*DPI]
+            return [0, 0, sum(raw_widths(codestring)), height*DPI]
 
         def build_params(self, codestring):
             params = super(Raw._Renderer, self).build_params(codestring)
             params['bbox'] = "%d %d %d %d" %self._boundingbox(
                 self._code_bbox(codestring), self._code_bbox(codestring))
             return params
+
+        def native_encode(self, codestring):
+            return encode_raw(codestring, self.lookup_option('height') or 1.0)
     renderer = _Renderer
 
 
@@ -0,0 +1,253 @@
+# coding: utf-8
+"""Reed-Solomon error correction for native encoders.
+
+Fields are tabulated once: GF(2^m) per primitive polynomial (QR Code,
+Data Matrix, Aztec Code, MaxiCode, AusPost) and prime fields such as
+the GF(929) of PDF417.  Codewords are lists of field elements, highest
+degree first, as symbologies place them.
+
+Generator polynomials are cached by their fields.  rs_encode() checks
+one block; rs_encode_batch() checks many blocks at once with NumPy,
+which pays off for symbols of many blocks and bulk runs.
+"""
+# NumPy is imported on first use; see _require_numpy().
+numpy = None
+
+__all__ = ['GaloisField', 'PrimeField', 'get_field', 'get_prime_field',
+           'rs_generator', 'rs_encode', 'rs_encode_batch']
+
+
+def _require_numpy():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError(u'NumPy is required for batch encoding.')
+
+
+class GaloisField(object):
+    """GF(2^m) defined by primitive polynomial poly (with the x^m term).
+
+    exp holds powers of the primitive element twice over, so that sums of
+    two logarithms need no reduction, then zeros that _zero_log indexes.
+
+    >>> gf = GaloisField(0x43)
+    >>> gf.size, gf.exp[6], gf.mul(gf.exp[62], 2)
+    (64, 3, 1)
+    """
+    characteristic = 2
+
+    def __init__(self, poly):
+        self.poly = poly
+        self.size = 1 << (poly.bit_length()-1)
+        self.exp = [0]*(4*self.size+1)
+        self.log = [0]*self.size
+        x = 1
+        for i in range(self.size-1):
+            self.exp[i] = x
+            self.log[x] = i
+            x <<= 1
+            if x & self.size:
+                x ^= poly
+        for i in range(self.size-1, 2*self.size):
+            self.exp[i] = self.exp[i-self.size+1]
+        self._generators = {}
+        self._products = {}
+
+    @property
+    def _zero_log(self):
+        # stands for the logarithm of zero; adding any logarithm to it
+        # still indexes the zeros at the end of exp
+        return 2*self.size
+
+    def mul(self, a, b):
+        if not a or not b:
+            return 0
+        return self.exp[self.log[a]+self.log[b]]
+
+    def sub(self, a, b):
+        return a^b
+
+    def generator(self, nsym, first_root=1):
+        """Returns the cached generator polynomial of nsym check symbols;
+        see rs_generator().
+        """
+        key = nsym, first_root
+        generator = self._generators.get(key)
+        if generator is None:
+            generator = [1]
+            for i in range(first_root, first_root+nsym):
+                root = self.exp[i%(self.size-1)]
+                product = generator+[0]
+                for j, c in enumerate(generator):
+                    product[j+1] = self.sub(product[j+1], self.mul(c, root))
+                generator = product
+            generator = self._generators[key] = tuple(generator)
+        return generator
+
+    def products(self, generator):
+        """Returns (size, len(generator)-1) array of the amounts every
+        element adds to the remainder, one per generator coefficient; as
+        the remainder is built by subtracting, they are negated products.
+        """
+        generator = tuple(generator)
+        table = self._products.get(generator)
+        if table is None:
+            _require_numpy()
+            exp = numpy.array(self.exp, numpy.int32)
+            logs = numpy.array([self.log[c] if c else self._zero_log
+                                for c in generator[1:]])
+            elements = numpy.array([self._zero_log]+self.log[1:])
+            table = exp[elements[:, None]+logs[None, :]]
+            if self.characteristic!=2:
+                table = -table%self.size
+            table = self._products[generator] = table.astype(
+                numpy.uint8 if self.size<=256 else numpy.uint16)
+        return table
+
+
+class PrimeField(GaloisField):
+    """GF(prime) with primitive element primitive.
+
+    >>> gf = PrimeField(929, 3)
+    >>> gf.size, gf.exp[2], gf.mul(gf.exp[927], 3), gf.sub(1, 2)
+    (929, 9, 1, 928)
+    """
+    def __init__(self, prime, primitive):
+        self.characteristic = self.size = prime
+        self.primitive = primitive
+        self.exp = [0]*(4*prime+1)
+        self.log = [0]*prime
+        x = 1
+        for i in range(prime-1):
+            self.exp[i] = x
+            self.log[x] = i
+            x = x*primitive%prime
+        for i in range(prime-1, 2*prime):
+            self.exp[i] = self.exp[i-prime+1]
+        self._generators = {}
+        self._products = {}
+
+    def sub(self, a, b):
+        return (a-b)%self.size
+
+
+_fields = {}
+
+def get_field(poly):
+    """Returns the shared GaloisField of poly.
+
+    >>> get_field(0x43) is get_field(0x43)
+    True
+    """
+    field = _fields.get(poly)
+    if field is None:
+        field = _fields[poly] = GaloisField(poly)
+    return field
+
+
+def get_prime_field(prime, primitive):
+    """Returns the shared PrimeField of prime and primitive.
+
+    >>> get_prime_field(929, 3) is get_prime_field(929, 3)
+    True
+    """
+    key = prime, primitive
+    field = _fields.get(key)
+    if field is None:
+        field = _fields[key] = PrimeField(prime, primitive)
+    return field
+
+
+def rs_generator(field, nsym, first_root=1):
+    """Returns coefficients (highest degree first, monic) of the generator
+    polynomial with roots a^first_root .. a^(first_root+nsym-1).
+
+    The tuple is cached by field and shared among callers.
+
+    >>> rs_generator(get_field(0x43), 4)
+    (1, 30, 29, 17, 48)
+    >>> rs_generator(get_prime_field(929, 3), 2)
+    (1, 917, 27)
+    """
+    return field.generator(nsym, first_root)
+
+
+def rs_encode(field, data, generator):
+    """Returns the len(generator)-1 check symbols of data.
+
+    Check symbols of prime fields are negated remainders, as PDF417 takes
+    them.
+
+    >>> gf = get_field(0x43)
+    >>> rs_encode(gf, [1, 2, 3], rs_generator(gf, 4))
+    [1, 62, 32, 6]
+    >>> gf = get_prime_field(929, 3)
+    >>> rs_encode(gf, [5, 453, 178, 121, 239], rs_generator(gf, 8))
+    [807, 896, 604, 841, 445, 798, 896, 674]
+    """
+    nsym = len(generator)-1
+    exp, log, zero_log = field.exp, field.log, field._zero_log
+    logs = [log[c] if c else zero_log for c in generator[1:]]
+    remainder = [0]*nsym
+    if field.characteristic==2:
+        for symbol in data:
+            factor = symbol^remainder.pop(0)
+            remainder.append(0)
+            if factor:
+                factor = log[factor]
+                remainder = [r^exp[factor+l] for r, l in zip(remainder, logs)]
+        return remainder
+    prime = field.size
+    for symbol in data:
+        factor = (symbol+remainder.pop(0))%prime
+        remainder.append(0)
+        if factor:
+            factor = log[factor]
+            remainder = [r-exp[factor+l] for r, l in zip(remainder, logs)]
+    return [-r%prime for r in remainder]
+
+
+def rs_encode_batch(field, blocks, generator):
+    """Returns (len(blocks), len(generator)-1) array of the check symbols
+    of each of blocks, as rs_encode() gives them.
+
+    Blocks may differ in length: leading zeros do not change check
+    symbols, so shorter blocks are padded in front.
+
+    >>> gf = get_field(0x43)
+    >>> rs_encode_batch(gf, [[1, 2, 3], [2, 3]], rs_generator(gf, 4)).tolist()
+    [[1, 62, 32, 6], [46, 52, 61, 32]]
+    >>> gf = get_prime_field(929, 3)
+    >>> rs_encode_batch(gf, [[5, 453, 178, 121, 239]], rs_generator(gf, 8)).tolist()
+    [[807, 896, 604, 841, 445, 798, 896, 674]]
+    """
+    _require_numpy()
+    products = field.products(generator)
+    nblocks, nsym = len(blocks), len(generator)-1
+    length = max([len(block) for block in blocks]+[0])
+    data = numpy.zeros((nblocks, length), numpy.int32)
+    for i, block in enumerate(blocks):
+        if len(block):
+            data[i, length-len(block):] = block
+    # the remainder shifts through a window of a wider buffer, so that
+    # each step is one lookup and one sum
+    buf = numpy.zeros((nblocks, length+nsym), numpy.int32)
+    for i in range(length):
+        if field.characteristic==2:
+            factor = data[:, i]^buf[:, i]
+            buf[:, i+1:i+1+nsym] ^= products[factor]
+        else:
+            factor = (data[:, i]+buf[:, i])%field.size
+            buf[:, i+1:i+1+nsym] += products[factor]
+            buf[:, i+1] %= field.size
+    remainder = buf[:, length:]
+    if field.characteristic!=2:
+        remainder = -remainder%field.size
+    return remainder
+
+
+if __name__=="__main__":
+    from doctest import testmod
+    testmod()
@@ -1,5 +1,71 @@
 # coding: utf-8
 from base import Barcode, LinearCodeRenderer, DPI
+from postal import (BAR_WIDTH, SPACE_WIDTH, ASCENDER, FULL, PostalCodeRenderer,
+                    states, char_indexes, state_table)
+import postal
+
+
+# characters by value, and their bar states, as BWIPP tabulates them
+ROYALMAIL_CHARS = 'ZUVWXY501234B6789AHCDEFGNIJKLMTOPQRS'
+ROYALMAIL_ENCODINGS = (
+    '3300 2211 2301 2310 3201 3210 1122 0033 0123 0132 1023 1032 1302 0213 '
+    '0303 0312 1203 1212 1320 0231 0321 0330 1221 1230 3102 2013 2103 2112 '
+    '3003 3012 3120 2031 2121 2130 3021 3030').split()
+
+
+def _royalmail_checksum(values):
+    return sum(v//6 for v in values)%6*6+sum(v%6 for v in values)%6
+
+
+def encode_royalmail(codestring, validatecheck=False, includecheckintext=False):
+    """Returns bar states and text positions of an RM4SCC symbol.
+
+    The check character follows the data, between the start ascender
+    and the stop bar.
+
+    >>> bar_states, text = encode_royalmail('LE28HS9Z', includecheckintext=True)
+    >>> len(bar_states), bar_states[:9].tolist()
+    (38, [2, 3, 0, 0, 3, 0, 3, 3, 0])
+    >>> text[-1]
+    ('9', 109.296)
+    """
+    if validatecheck:
+        codestring, check = codestring[:-1], codestring[-1:]
+    if any(c not in ROYALMAIL_CHARS for c in codestring):
+        raise ValueError(u'RM4SCC must contain only capital letters and digits.')
+    values = [ROYALMAIL_CHARS.index(c) for c in codestring]
+    checksum = _royalmail_checksum(values)
+    if validatecheck and check!=ROYALMAIL_CHARS[checksum]:
+        raise ValueError(u'Incorrect RM4SCC check digit provided.')
+    bar_states = states(str(ASCENDER)+''.join(
+        ROYALMAIL_ENCODINGS[v] for v in values+[checksum])+str(FULL))
+    pitch = BAR_WIDTH+SPACE_WIDTH
+    text = [(c, (4*i+1)*pitch) for i, c in enumerate(codestring)]
+    if includecheckintext:
+        text.append((ROYALMAIL_CHARS[checksum], (4*len(values)+1)*pitch))
+    return bar_states, text
+
+
+def royalmail_states_bulk(codestrings, validatecheck=False):
+    """Vectorized encode_royalmail() of codestrings of the same length.
+
+    >>> bulk = royalmail_states_bulk(['LE28HS9Z', 'ZZ99ZZ99'])
+    >>> bulk[0].tolist()==encode_royalmail('LE28HS9Z')[0].tolist()
+    True
+    """
+    values = char_indexes(codestrings, ROYALMAIL_CHARS, 'RM4SCC')
+    if validatecheck:
+        values, checks = values[:, :-1], values[:, -1]
+    checksums = (values//6).sum(axis=1)%6*6+(values%6).sum(axis=1)%6
+    if validatecheck and (checksums!=checks).any():
+        raise ValueError(u'Incorrect RM4SCC check digit provided.')
+    table = state_table(ROYALMAIL_ENCODINGS)
+    count = values.shape[0]
+    data = table[postal.numpy.concatenate([values, checksums[:, None]], axis=1)]
+    return postal.numpy.concatenate(
+        [postal.numpy.full((count, 1), ASCENDER, postal.numpy.uint8),
+         data.reshape(count, -1),
+         postal.numpy.full((count, 1), FULL, postal.numpy.uint8)], axis=1)
 
 class RoyalMail(Barcode):
     """
@@ -29,7 +95,7 @@ class RoyalMail(Barcode):
     """
     codetype = 'royalmail'
     aliases = ('royal mail', 'royal-mail', 'royal_mail', 'rm4scc')
-    class _Renderer(LinearCodeRenderer):
+    class _Renderer(PostalCodeRenderer):
         default_options = dict(
             LinearCodeRenderer.default_options,
             includetext=False, includecheckintext=False,
@@ -64,6 +130,15 @@ class RoyalMail(Barcode):
             params['bbox'] = "%d %d %d %d" %self._boundingbox(
                 self._code_bbox(codestring), self._text_bbox(codestring))
             return params
+
+        def native_symbol(self, codestring):
+            return encode_royalmail(
+                codestring, bool(self.lookup_option('validatecheck')),
+                bool(self.lookup_option('includecheckintext')))
+
+        def native_states_bulk(self, codestrings):
+            return royalmail_states_bulk(
+                codestrings, bool(self.lookup_option('validatecheck')))
     renderer = _Renderer
 
 if __name__=="__main__":
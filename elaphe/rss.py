@@ -1,5 +1,694 @@
 # coding: utf-8
+"""GS1 DataBar family and its native encoders.
+
+Characters of GS1 DataBar are combinations of element widths, numbered
+by rss_widths() (getRSSwidths of ISO/IEC 24724) within groups of values.
+Omnidirectional, Truncated, Limited and Expanded symbols are linear;
+the stacked formats are MatrixGeometry of one point modules with the
+separator rows BWIPP draws between their rows.
+"""
 from base import Barcode, LinearCodeRenderer, DPI
+from geometry import MatrixGeometry
+from linear import LinearBuilder, mod10_check_digit, linear_options
+from util import cap_unescape
+
+
+# Character groups of GS1 DataBar, a row per group: (largest value, first
+# value, odd modules, even modules, widest odd element, widest even
+# element, odd combinations, even combinations).
+DATABAR_OUTSIDE_GROUPS = [
+    (160, 0, 12, 4, 8, 1, 161, 1),
+    (960, 161, 10, 6, 6, 3, 80, 10),
+    (2014, 961, 8, 8, 4, 5, 31, 34),
+    (2714, 2015, 6, 10, 3, 6, 10, 70),
+    (2840, 2715, 4, 12, 1, 8, 1, 126),
+    ]
+DATABAR_INSIDE_GROUPS = [
+    (335, 0, 5, 10, 2, 7, 4, 84),
+    (1035, 336, 7, 8, 4, 5, 20, 35),
+    (1515, 1036, 9, 6, 6, 3, 48, 10),
+    (1596, 1516, 11, 4, 8, 1, 81, 1),
+    ]
+DATABAR_LIMITED_GROUPS = [
+    (183063, 0, 17, 9, 6, 3, 6538, 28),
+    (820063, 183064, 13, 13, 5, 4, 875, 728),
+    (1000775, 820064, 9, 17, 3, 6, 28, 6454),
+    (1491020, 1000776, 15, 11, 5, 4, 2415, 203),
+    (1979844, 1491021, 11, 15, 4, 5, 203, 2408),
+    (1996938, 1979845, 19, 7, 8, 1, 17094, 1),
+    (2013570, 1996939, 7, 19, 1, 8, 1, 16632),
+    ]
+DATABAR_EXPANDED_GROUPS = [
+    (347, 0, 12, 5, 7, 2, 87, 4),
+    (1387, 348, 10, 7, 5, 4, 52, 20),
+    (2947, 1388, 8, 9, 4, 5, 30, 52),
+    (3987, 2948, 6, 11, 3, 6, 10, 104),
+    (4191, 3988, 4, 13, 1, 8, 1, 204),
+    ]
+
+# finder patterns of GS1 DataBar Omnidirectional, by value
+DATABAR_FINDERS = [
+    (3, 8, 2, 1, 1), (3, 5, 5, 1, 1), (3, 3, 7, 1, 1),
+    (3, 1, 9, 1, 1), (2, 7, 4, 1, 1), (2, 5, 6, 1, 1),
+    (2, 3, 8, 1, 1), (1, 5, 7, 1, 1), (1, 3, 9, 1, 1),
+    ]
+DATABAR_CHECK_WEIGHTS = [
+    1, 3, 9, 27, 2, 6, 18, 54, 58, 72, 24, 8, 29, 36, 12, 4,
+    74, 51, 17, 32, 37, 65, 48, 16, 64, 34, 23, 69, 49, 68, 46, 59]
+
+DATABAR_LIMITED_CHECK_WEIGHTS = [
+    1, 3, 9, 27, 81, 65, 17, 51, 64, 14, 42, 37, 22, 66,
+    20, 60, 2, 6, 18, 54, 73, 41, 34, 13, 39, 28, 84, 74]
+# values of the check character of GS1 DataBar Limited, by checksum
+DATABAR_LIMITED_CHECK_VALUES = (
+    range(0, 44)+[45, 52, 57]+range(63, 67)+range(73, 80)+[82]
+    +range(126, 131)+[132]+range(141, 147)+range(210, 218)+[220]
+    +range(316, 321)+[322, 323, 326, 337])
+
+# finder patterns of GS1 DataBar Expanded (A1, A1 reversed, B1, ...)
+DATABAR_EXPANDED_FINDERS = [
+    (1, 8, 4, 1, 1), (1, 1, 4, 8, 1), (3, 6, 4, 1, 1), (1, 1, 4, 6, 3),
+    (3, 4, 6, 1, 1), (1, 1, 6, 4, 3), (3, 2, 8, 1, 1), (1, 1, 8, 2, 3),
+    (2, 6, 5, 1, 1), (1, 1, 5, 6, 2), (2, 2, 9, 1, 1), (1, 1, 9, 2, 2),
+    ]
+# finder patterns of symbols by number of characters (two per pattern)
+DATABAR_EXPANDED_SEQUENCES = [
+    (0, 1), (0, 3, 2), (0, 5, 2, 7), (0, 9, 2, 7, 4), (0, 9, 2, 7, 6, 11),
+    (0, 9, 2, 7, 8, 11, 10), (0, 1, 2, 3, 4, 5, 6, 7),
+    (0, 1, 2, 3, 4, 5, 6, 9, 8), (0, 1, 2, 3, 4, 5, 6, 9, 10, 11),
+    (0, 1, 2, 3, 4, 7, 6, 9, 8, 11, 10),
+    ]
+# weights of the elements of the two characters beside each finder
+# pattern; the check character beside the first has none.
+DATABAR_EXPANDED_CHECK_WEIGHTS = [
+    None, None, None, None, None, None, None, None,
+    77, 96, 32, 81, 27, 9, 3, 1, 20, 60, 180, 118, 143, 7, 21, 63,
+    205, 209, 140, 117, 39, 13, 145, 189, 193, 157, 49, 147, 19, 57, 171, 91,
+    132, 44, 85, 169, 197, 136, 186, 62, 185, 133, 188, 142, 4, 12, 36, 108,
+    50, 87, 29, 80, 97, 173, 128, 113, 150, 28, 84, 41, 123, 158, 52, 156,
+    166, 196, 206, 139, 187, 203, 138, 46, 76, 17, 51, 153, 37, 111, 122, 155,
+    146, 119, 110, 107, 106, 176, 129, 43, 16, 48, 144, 10, 30, 90, 59, 177,
+    164, 125, 112, 178, 200, 137, 116, 109, 70, 210, 208, 202, 184, 130, 179, 115,
+    190, 204, 68, 93, 31, 151, 191, 134, 148, 22, 66, 198, 172, 94, 71, 2,
+    40, 154, 192, 64, 162, 54, 18, 6, 120, 149, 25, 75, 14, 42, 126, 167,
+    175, 199, 207, 69, 23, 78, 26, 79, 103, 98, 83, 38, 114, 131, 182, 124,
+    159, 53, 88, 170, 127, 183, 61, 161, 55, 165, 73, 8, 24, 72, 5, 15,
+    89, 100, 174, 58, 160, 194, 135, 45]
+
+# two-digit AIs of fixed length, which need no FNC1 after their data
+DATABAR_FIXED_AIS = (['%02d' %ai for ai in range(5)]
+                     +['%d' %ai for ai in range(11, 21)+[23]+range(31, 37)+[41]])
+# FNC1 and latches in the general purpose field, numbered as BWIPP does
+FNC1, LNUMERIC, LALPHANUMERIC, LISO646 = -1, -2, -3, -4
+DATABAR_ALPHANUMERIC = dict(
+    [(c, format(c-43, '05b')) for c in range(48, 58)]
+    +[(c, format(c-33, '06b')) for c in range(65, 91)]
+    +[(c, format(c+15, '06b')) for c in range(44, 48)]
+    +[(42, '111010'), (FNC1, '01111'), (LNUMERIC, '000'), (LISO646, '00100')])
+DATABAR_ISO646 = dict(
+    [(c, format(c-43, '05b')) for c in range(48, 58)]
+    +[(c, format(c-1, '07b')) for c in range(65, 91)]
+    +[(c, format(c-7, '07b')) for c in range(97, 123)]
+    +[(c, format(c+197, '08b')) for c in range(37, 48)]
+    +[(c, format(c+187, '08b')) for c in range(58, 64)]
+    +[(33, '11101000'), (34, '11101001'), (95, '11111011'), (32, '11111100'),
+      (FNC1, '01111'), (LNUMERIC, '000'), (LALPHANUMERIC, '00100')])
+
+
+def ncr(n, r):
+    """Returns the number of combinations of r out of n.
+
+    >>> ncr(12, 4), ncr(5, 0)
+    (495, 1)
+    """
+    r = min(r, n-r)
+    result = 1
+    for i in range(1, r+1):
+        result = result*(n-r+i)//i
+    return result
+
+
+def rss_widths(value, modules, elements, max_width, no_narrow):
+    """Returns the widths of the elements of value among the combinations
+    of elements widths summing up to modules, none wider than max_width
+    (getRSSwidths of the GS1 DataBar specification).
+
+    no_narrow excludes combinations without an element of one module.
+
+    >>> rss_widths(23, 12, 4, 8, True)
+    [1, 4, 2, 5]
+    >>> rss_widths(0, 4, 4, 1, False)
+    [1, 1, 1, 1]
+    """
+    widths = []
+    narrow_mask = 0
+    for bar in range(elements-1):
+        width = 1
+        narrow_mask |= 1<<bar
+        while True:
+            sub_value = ncr(modules-width-1, elements-bar-2)
+            if (not no_narrow and not narrow_mask
+                and modules-width-(elements-bar-1)>=elements-bar-1):
+                sub_value -= ncr(modules-width-(elements-bar), elements-bar-2)
+            if elements-bar-1>1:
+                less_value = 0
+                widest = modules-width-(elements-bar-2)
+                while widest>max_width:
+                    less_value += ncr(modules-width-widest-1, elements-bar-3)
+                    widest -= 1
+                sub_value -= less_value*(elements-1-bar)
+            elif modules-width>max_width:
+                sub_value -= 1
+            value -= sub_value
+            if value<0:
+                break
+            width += 1
+            narrow_mask &= ~(1<<bar)
+        value += sub_value
+        modules -= width
+        widths.append(width)
+    widths.append(modules)
+    return widths
+
+
+def _char_widths(value, groups, elements, inside, no_narrow):
+    """Returns odd and even widths of a character value in groups; inside
+    characters split value by odd combinations.
+    """
+    for (largest, first, odd_modules, even_modules, odd_widest, even_widest,
+         odd_count, even_count) in groups:
+        if value<=largest:
+            break
+    value -= first
+    if inside:
+        odd_value, even_value = value%odd_count, value//odd_count
+    else:
+        odd_value, even_value = value//even_count, value%even_count
+    return (rss_widths(odd_value, odd_modules, elements, odd_widest, no_narrow),
+            rss_widths(even_value, even_modules, elements, even_widest,
+                       not no_narrow))
+
+
+def _interleave(odd, even, reverse=False):
+    widths = [w for pair in zip(odd, even) for w in pair]
+    if reverse:
+        widths.reverse()
+    return widths
+
+
+def _modules(widths, dark=False):
+    """Expands widths of alternating light and dark elements (dark ones
+    first if dark) into a list of modules.
+
+    >>> _modules([1, 2, 0, 1])
+    [0, 1, 1, 1]
+    """
+    modules = []
+    for width in widths:
+        modules.extend([int(dark)]*width)
+        dark = not dark
+    return modules
+
+
+def gtin_digits(codestring, name, limited=False):
+    """Checks the (01) AI and GTIN of codestring; returns the 14 digits,
+    with the check digit appended if omitted.
+
+    >>> gtin_digits('(01)2401234567890', 'GS1 DataBar')
+    '24012345678905'
+    """
+    if codestring[:4]!='(01)':
+        raise ValueError(u'%s must begin with (01) application identifier.' %name)
+    digits = codestring[4:]
+    if len(digits) not in (13, 14):
+        raise ValueError(u'%s must be 13 or 14 digits.' %name)
+    if not digits.isdigit():
+        raise ValueError(u'%s must contain only digits.' %name)
+    if limited and digits[0] not in '01':
+        raise ValueError(u'%s must begin with 0 or 1.' %name)
+    check = str(mod10_check_digit(digits[:13]))
+    if len(digits)==14 and digits[13]!=check:
+        raise ValueError(u'Incorrect %s check digit provided.' %name)
+    return digits[:13]+check
+
+
+def databar_omni_widths(digits, linkage=False):
+    """Returns the widths of the two halves of a GS1 DataBar symbol of
+    14 digits: left character, left finder and second character, then
+    fourth character, right finder and third character.
+
+    >>> left, right = databar_omni_widths('24012345678905')
+    >>> left[:8], right[-8:]
+    ([1, 1, 4, 1, 2, 1, 3, 3], [1, 2, 1, 5, 1, 1, 1, 4])
+    """
+    value = int(linkage)*10**13+int(digits[:13])
+    left, right = divmod(value, 4537077)
+    chars = []
+    for value, groups, inside in ((left//1597, DATABAR_OUTSIDE_GROUPS, False),
+                                  (left%1597, DATABAR_INSIDE_GROUPS, True),
+                                  (right//1597, DATABAR_OUTSIDE_GROUPS, False),
+                                  (right%1597, DATABAR_INSIDE_GROUPS, True)):
+        chars.append(_char_widths(value, groups, 4, inside, not inside))
+    # the second and third characters read right to left
+    d1, d2, d3, d4 = [_interleave(odd, even, reverse=i in (1, 2))
+                      for i, (odd, even) in enumerate(chars)]
+    checksum = sum(w*weight for w, weight
+                   in zip(d1+d2+d3+d4, DATABAR_CHECK_WEIGHTS))%79
+    if checksum>=8:
+        checksum += 1
+    if checksum>=72:
+        checksum += 1
+    check_left = list(DATABAR_FINDERS[checksum//9])
+    check_right = list(reversed(DATABAR_FINDERS[checksum%9]))
+    return d1+check_left+d2, d4+check_right+d3
+
+
+def encode_databar_omni(codestring, format_='omni', linkage=False, height=33/72.0,
+                        includetext=False, textsize=10, textyoffset=-7):
+    """Encodes codestring, (01) and a GTIN, into GS1 DataBar geometry.
+
+    format_ is 'omni' or 'truncated' for LinearGeometry (height in
+    inches), 'stacked' or 'stackedomni' for MatrixGeometry of one point
+    modules.
+
+    >>> g = encode_databar_omni('(01)24012345678905')
+    >>> g.width, len(g.bhs)
+    (95.0, 23)
+    >>> g = encode_databar_omni('(01)24012345678905', 'stackedomni')
+    >>> g.pixx, g.pixy, g.rows()[34][:12]
+    (50, 69, [0, 0, 0, 0, 0, 1, 0, 1, 0, 1, 0, 1])
+    """
+    digits = gtin_digits(codestring, u'GS1 DataBar')
+    left, right = databar_omni_widths(digits, linkage)
+    if format_ in ('omni', 'truncated'):
+        builder = LinearBuilder()
+        builder.add([1]+left+right+[1, 1], height)
+        if includetext:
+            text = '(01)'+digits
+            builder.add_text(text, (builder.x-0.6*textsize*len(text))/2.0,
+                             textyoffset, textsize)
+        return builder.geometry()
+    top = _modules([1, 1]+left+[1, 1])
+    bottom = _modules([1, 1]+right+[1, 1], dark=True)
+    if format_=='stacked':
+        separator = [0]*50
+        for i in range(4, 46):
+            if top[i]==bottom[i]:
+                separator[i] = 1-top[i]
+            else:
+                separator[i] = 1-separator[i-1]
+        pixs = top*5+separator+bottom*7
+    elif format_=='stackedomni':
+        top_separator = _finder_separator(top, [18], 13)
+        bottom_separator = _finder_separator(bottom, [19], 13)
+        if bottom[19:32]==[1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 1, 1, 1]:
+            bottom_separator[19:32] = [0]*10+[1, 0, 0]
+        pixs = (top*33+top_separator+[0]*4+[0, 1]*21+[0]*4
+                +bottom_separator+bottom*33)
+    else:
+        raise ValueError(u'Unknown GS1 DataBar format %s.' %format_)
+    pixy = len(pixs)//50
+    return MatrixGeometry(pixs, 50, pixy, 50/72.0, pixy/72.0)
+
+
+def _finder_separator(row, starts, length):
+    """Returns the separator pattern of row: its complement but for four
+    modules at either end, alternating against the light modules of the
+    length modules of finder patterns from starts.
+    """
+    separator = [1-module for module in row]
+    separator[:4] = separator[-4:] = [0]*4
+    for start in starts:
+        for i in range(start, start+length):
+            if row[i]:
+                separator[i] = 0
+            else:
+                separator[i] = int(row[i-1]==1 or separator[i-1]==0)
+    return separator
+
+
+def encode_databar_limited(codestring, linkage=False, height=10/72.0,
+                           includetext=False, textsize=10, textyoffset=-7):
+    """Encodes codestring, (01) and a GTIN starting with 0 or 1, into
+    LinearGeometry of GS1 DataBar Limited.
+
+    >>> g = encode_databar_limited('(01)15012345678907')
+    >>> g.width, g.sbs[:8].tolist()
+    (73.0, [1.0, 3.0, 2.0, 2.0, 2.0, 3.0, 2.0, 1.0])
+    """
+    digits = gtin_digits(codestring, u'GS1 DataBar Limited', limited=True)
+    value = int(digits[:13])
+    if linkage:
+        value += 2015133531096
+    chars = [_interleave(*_char_widths(value, DATABAR_LIMITED_GROUPS, 7,
+                                       False, True))
+             for value in divmod(value, 2013571)]
+    checksum = sum(w*weight for w, weight
+                   in zip(chars[0]+chars[1], DATABAR_LIMITED_CHECK_WEIGHTS))%89
+    check_value = DATABAR_LIMITED_CHECK_VALUES[checksum]
+    check = _interleave(rss_widths(check_value//21, 8, 6, 3, True),
+                        rss_widths(check_value%21, 8, 6, 3, True))+[1, 1]
+    builder = LinearBuilder()
+    builder.add([1]+chars[0]+check+chars[1]+[1, 1], height)
+    if includetext:
+        text = '(01)'+digits
+        builder.add_text(text, (builder.x-0.6*textsize*len(text))/2.0,
+                         textyoffset, textsize)
+    return builder.geometry()
+
+
+def databar_ais(codestring):
+    """Splits codestring into its AIs and their values, ^NNN escapes of
+    the values expanded.
+
+    >>> ais, values = databar_ais('(01)95012345678903(3103)000123')
+    >>> ais, values['3103']
+    (['01', '3103'], '000123')
+    """
+    ais, values = [], {}
+    rest = codestring[1:]
+    while rest:
+        ai, _, rest = rest.partition(')')
+        value, _, rest = rest.partition('(')
+        ais.append(ai)
+        values[ai] = cap_unescape(value)
+    return ais, values
+
+
+def _databar_method(ais, values):
+    """Returns the encodation method of ais, as bits, and whether it has
+    a general purpose field.
+    """
+    variable = ais[0]=='01' and values['01'][:1]=='9'
+    if variable and len(ais)==2:
+        if ais[1]=='3103' and int(values['3103'])<=32767:
+            return '0100', False
+        if ais[1]=='3202' and int(values['3202'])<=9999:
+            return '0101', False
+        if ais[1]=='3203' and int(values['3203'])<=22767:
+            return '0101', False
+    weights = ['%d' %ai for ai in range(3100, 3110)+range(3200, 3210)]
+    dates = ['11', '13', '15', '17']
+    if variable and len(ais) in (2, 3) and ais[1] in weights:
+        # weight in kilograms (310x) or pounds (320x), and the kind of date
+        unit = '0' if ais[1][:3]=='310' else '1'
+        if len(ais)==2 and int(values[ais[1]])<=99999:
+            return '011100'+unit, False
+        if (len(ais)==3 and ais[2] in dates and int(values[ais[1]])<=99999
+            and int(values[ais[2]])<=999999):
+            return '0111'+format(dates.index(ais[2]), '02b')+unit, False
+    if variable and len(ais)>=2:
+        if ais[1] in ('3920', '3921', '3922', '3923'):
+            return '01100', True
+        if ais[1] in ('3930', '3931', '3932', '3933'):
+            return '01101', True
+    if ais[0]=='01':
+        return '1', True
+    return '00', True
+
+
+def _gtin_bits(digits):
+    """Converts 12 digits into 40 bits, 10 bits per three digits.
+    """
+    return ''.join(format(int(digits[i:i+3]), '010b') for i in range(0, 12, 3))
+
+
+def _rembits(used, segments):
+    """Returns the number of bits padding used bits to whole characters,
+    at least four, and avoiding a lone character in the last segment.
+    """
+    size = max(48, -(-used//12)*12)
+    if size//12%segments==1:
+        size += 12
+    return size-used
+
+
+def _numeric_pair(first, second):
+    """Returns the bits of a pair of digits or FNC1 in numeric mode, or
+    None if they do not make one.
+    """
+    values = []
+    for code in (first, second):
+        if 48<=code<=57:
+            values.append(code-48)
+        elif code==FNC1:
+            values.append(10)
+        else:
+            return None
+    if values==[10, 10]:
+        return None
+    return format(11*values[0]+values[1]+8, '07b')
+
+
+def _general_purpose_bits(gpf, used, segments):
+    """Encodes the characters of the general purpose field as BWIPP does,
+    switching among numeric, alphanumeric and ISO 646 modes; used is the
+    number of bits before it.  Returns the bits and the final mode.
+    """
+    n = len(gpf)
+    # lengths of runs of numeric pairs and alphanumeric characters, and
+    # distances to the next character only ISO 646 holds, from each one
+    numeric_runs = [0]*n+[0, -1]
+    alphanumeric_runs = [0]*(n+1)
+    iso646_next = [0]*n+[9999]
+    for i in range(n-1, -1, -1):
+        code = gpf[i]
+        if _numeric_pair(code, gpf[i+1] if i<n-1 else 48):
+            numeric_runs[i] = numeric_runs[i+2]+2
+        if code in DATABAR_ALPHANUMERIC:
+            alphanumeric_runs[i] = alphanumeric_runs[i+1]+1
+        if code not in DATABAR_ISO646 or code in DATABAR_ALPHANUMERIC:
+            iso646_next[i] = iso646_next[i+1]+1
+    bits, mode, i = [], 'numeric', 0
+    try:
+        while i<n:
+            code = gpf[i]
+            if mode=='numeric':
+                if i<n-1:
+                    pair = _numeric_pair(code, gpf[i+1])
+                    if pair:
+                        bits.append(pair)
+                        i += 2
+                    else:
+                        bits.append('0000')
+                        mode = 'alphanumeric'
+                elif not 48<=code<=57:
+                    bits.append('0000')
+                    mode = 'alphanumeric'
+                else:
+                    # a last digit goes alone if it fits the padding
+                    rem = _rembits(used+len(''.join(bits)), segments)
+                    if 4<=rem<=6:
+                        bits.append(format(code-47, '04b')+'0'*(rem-4))
+                    else:
+                        bits.append(_numeric_pair(code, FNC1))
+                    i += 1
+            elif mode=='alphanumeric':
+                if code==FNC1:
+                    bits.append(DATABAR_ALPHANUMERIC[FNC1])
+                    mode = 'numeric'
+                    i += 1
+                elif code in DATABAR_ISO646 and code not in DATABAR_ALPHANUMERIC:
+                    bits.append(DATABAR_ALPHANUMERIC[LISO646])
+                    mode = 'iso646'
+                elif (numeric_runs[i]>=6
+                      or numeric_runs[i]>=4 and i+numeric_runs[i]==n):
+                    bits.append(DATABAR_ALPHANUMERIC[LNUMERIC])
+                    mode = 'numeric'
+                else:
+                    bits.append(DATABAR_ALPHANUMERIC[code])
+                    i += 1
+            else:
+                if code==FNC1:
+                    bits.append(DATABAR_ISO646[FNC1])
+                    mode = 'numeric'
+                    i += 1
+                elif numeric_runs[i]>=4 and iso646_next[i]>=10:
+                    bits.append(DATABAR_ISO646[LNUMERIC])
+                    mode = 'numeric'
+                elif alphanumeric_runs[i]>=5 and iso646_next[i]>=10:
+                    bits.append(DATABAR_ISO646[LALPHANUMERIC])
+                    mode = 'alphanumeric'
+                else:
+                    bits.append(DATABAR_ISO646[code])
+                    i += 1
+    except KeyError:
+        raise ValueError(u'GS1 DataBar Expanded cannot encode character %d.'
+                         %gpf[i])
+    return ''.join(bits), mode
+
+
+def databar_expanded_bits(codestring, linkage=False, segments=22):
+    """Returns the binary string of the data characters of a GS1 DataBar
+    Expanded symbol of codestring, a string of bracketed AIs.
+
+    >>> databar_expanded_bits('(01)95012345678903(3103)000123')
+    '001000111110101001110101010001101111101111010000000001111011'
+    """
+    ais, values = databar_ais(codestring)
+    if not ais:
+        raise ValueError(u'GS1 DataBar Expanded needs some AIs.')
+    method, general = _databar_method(ais, values)
+    gtin = values.get('01', '')
+    gpf = []
+    if method=='1':
+        cdf = format(int(gtin[0]), '04b')+_gtin_bits(gtin[1:13])
+        ais = ais[1:]
+    elif method=='00':
+        cdf = ''
+    else:
+        cdf = _gtin_bits(gtin[1:13])
+        if method=='0100':
+            cdf += format(int(values['3103']), '015b')
+        elif method=='0101':
+            weight = int(values[ais[1]])
+            cdf += format(weight if ais[1]=='3202' else weight+10000, '015b')
+        elif len(method)==7:
+            cdf += format(int(ais[1][3]+values[ais[1]][1:6]), '020b')
+            if len(ais)==3:
+                date = values[ais[2]]
+                date = int(date[0:2])*384+(int(date[2:4])-1)*32+int(date[4:6])
+            else:
+                date = 38400
+            cdf += format(date, '016b')
+        else:
+            # price (392x) or price with currency (393x)
+            cdf += format(int(ais[1][3]), '02b')
+            value = values[ais[1]]
+            if method=='01101':
+                cdf += format(int(value[:3]), '010b')
+                value = value[3:]
+            gpf = [ord(c) for c in value]
+            if len(ais)>2:
+                # the price has variable length
+                gpf.append(FNC1)
+        ais = ais[2:] if general else []
+    for i, ai in enumerate(ais):
+        gpf.extend(ord(c) for c in ai+values[ai])
+        if i<len(ais)-1 and ai[:2] not in DATABAR_FIXED_AIS:
+            gpf.append(FNC1)
+    vlf = '00' if general else ''
+    used = 13+len(method)+len(vlf)+len(cdf)
+    gpf, mode = _general_purpose_bits(gpf, used, segments)
+    used += len(gpf)
+    rem = _rembits(used, segments)
+    if general:
+        # variable length field: parity of the symbol characters and
+        # whether there are more than 14 of them
+        nchars = (used+rem)//12
+        vlf = '%d%d' %(nchars%2, nchars>14)
+    pad = ('0000' if mode=='numeric' else '')+'00100'*(rem//5+1)
+    return str(int(linkage))+method+vlf+cdf+gpf+pad[:rem]
+
+
+def databar_expanded_chars(bits):
+    """Returns widths of the characters of bits, the check character
+    first, and of the finder patterns between them.
+
+    >>> chars, finders = databar_expanded_chars('0'*36)
+    >>> len(chars), finders
+    (4, [[1, 8, 4, 1, 1], [1, 1, 4, 8, 1]])
+    """
+    chars = []
+    for x in range(0, len(bits), 12):
+        odd, even = _char_widths(int(bits[x:x+12], 2), DATABAR_EXPANDED_GROUPS,
+                                 4, False, False)
+        # characters left of their finder pattern read right to left
+        chars.append(_interleave(odd, even, reverse=x//12%2==0))
+    sequence = DATABAR_EXPANDED_SEQUENCES[(len(chars)-2)//2]
+    weights = [w for finder in sequence
+               for w in DATABAR_EXPANDED_CHECK_WEIGHTS[16*finder:16*finder+16]][8:]
+    checksum = sum(w*weight for w, weight
+                   in zip([w for char in chars for w in char], weights))
+    checksum = checksum%211+(len(chars)-3)*211
+    odd, even = _char_widths(checksum, DATABAR_EXPANDED_GROUPS, 4, False, False)
+    return ([_interleave(odd, even)]+chars,
+            [list(DATABAR_EXPANDED_FINDERS[finder]) for finder in sequence])
+
+
+def encode_databar_expanded(codestring, format_='expanded', segments=-1,
+                            linkage=False, height=34/72.0, includetext=False,
+                            textsize=10, textyoffset=-7):
+    """Encodes codestring, a string of bracketed AIs, into GS1 DataBar
+    Expanded geometry: LinearGeometry (height in inches) if format_ is
+    'expanded', or MatrixGeometry of one point modules in rows of
+    segments characters if 'expandedstacked'.
+
+    >>> g = encode_databar_expanded('(01)95012345678903(3103)000123')
+    >>> g.width, len(g.bhs)
+    (150.0, 33)
+    >>> g = encode_databar_expanded('(01)95012345678903(3103)000123',
+    ...                             'expandedstacked', segments=2)
+    >>> g.pixx, g.pixy
+    (53, 108)
+    """
+    if segments==-1:
+        segments = 4 if format_=='expandedstacked' else 22
+    chars, finders = databar_expanded_chars(
+        databar_expanded_bits(codestring, linkage, segments))
+    if format_=='expanded':
+        widths = [1]
+        for i, char in enumerate(chars):
+            widths.extend(char)
+            if i%2==0:
+                widths.extend(finders[i//2])
+        builder = LinearBuilder()
+        builder.add(widths+[1, 1], height)
+        if includetext:
+            builder.add_text(codestring,
+                             (builder.x-0.6*textsize*len(codestring))/2.0,
+                             textyoffset, textsize)
+        return builder.geometry()
+    if format_!='expandedstacked':
+        raise ValueError(u'Unknown GS1 DataBar Expanded format %s.' %format_)
+    rows, separators = [], []
+    for r in range(0, -(-len(chars)//segments)):
+        # rows alternate their parity unless segments are a multiple of 4
+        widths = [0] if segments%4 and r%2 else []
+        widths += [1, 1]
+        for pos in range(r*segments, min((r+1)*segments, len(chars))):
+            widths.extend(chars[pos])
+            if pos%2==0:
+                widths.extend(finders[pos//2])
+        widths += [1, 1]
+        row = _modules(widths)
+        starts = (range(19, len(row)-12, 98)+range(68, len(row)-12, 98))
+        separator = _finder_separator(row, starts, 15)
+        if segments%4==0 and r%2:
+            # even rows read right to left, or shift if that would turn a
+            # short last row's finder patterns
+            if rows and len(widths)!=len(rows[0]) and len(starts)%2:
+                row, separator = [0]+row, [0]+separator
+            else:
+                row.reverse()
+                separator.reverse()
+        rows.append(row)
+        separators.append(separator)
+    pixx = len(rows[0])
+    for row in rows[-1], separators[-1]:
+        row.extend([0]*(pixx-len(row)))
+    middle = ([0, 1]*(pixx//2+1))[:pixx]
+    middle[:4] = middle[-4:] = [0]*4
+    pixs = []
+    for r, row in enumerate(rows):
+        if r:
+            pixs.extend(separators[r])
+        pixs.extend(row*34)
+        if r<len(rows)-1:
+            pixs.extend(separators[r]+middle)
+    pixy = len(pixs)//pixx
+    return MatrixGeometry(pixs, pixx, pixy, pixx/72.0, pixy/72.0)
+
+
+def geometry_bbox(geometry):
+    """Returns [0, 0, width, height] of geometry in points.
+
+    >>> geometry_bbox(encode_databar_limited('(01)15012345678907'))
+    [0, 0, 73.0, 10.0]
+    """
+    if isinstance(geometry, MatrixGeometry):
+        return [0, 0, geometry.width*DPI, geometry.height*DPI]
+    return [0, 0, geometry.width, round(geometry.height, 6)]
 
 
 class Rss14(Barcode):
@@ -11,7 +700,7 @@ class Rss14(Barcode):
     %!PS-Adobe-2.0
     %%Pages: (attend)
     %%Creator: Elaphe powered by barcode.ps
-    %%BoundingBox: 0 0 97 33
+    %%BoundingBox: 0 0 95 33
     %%LanguageLevel: 2
     %%EndComments
     ...
@@ -30,21 +719,23 @@ class Rss14(Barcode):
     >>> bc.render('(01)24012345678905', options=dict(linkage=True, includetext=True), scale=2, margin=1) # doctest: +ELLIPSIS
     <PIL.EpsImagePlugin.EpsImageFile ... at ...>
     >>> # _.show()
+    >>> bc.encode('(01)24012345678905').width
+    95.0
     """
     codetype = 'databaromni'
     aliases = ('rss14', 'rss-14', 'rss_14', 'rss 14')
     class _Renderer(LinearCodeRenderer):
         default_options = dict(
             LinearCodeRenderer.default_options,
-            height=33/72.0, textyoffset=-7, linkage=False)
-        # SP(1),LG(1),D1(16),LF(15),D2(15),D4(15),R5(16),D3(16),SP(1),RG(1)
-        _symbol_length = 1+1+16+15+15+15+16+16+1+1
+            height=33/72.0, textyoffset=-7, linkage=False, format='omni')
+        # format of the codetype, which its BWIPP encoder forces
+        databar_format = None
 
         def _text_bbox(self, codestring):
             """
             >>> r = Rss14._Renderer({})
-            >>> r._text_bbox('24012345678905')
-            [0, 0, 97, 33]
+            >>> r._text_bbox('(01)24012345678905')
+            [0, 0, 95.0, 33.0]
             """
             if self.lookup_option('includetext'):
                 cminx, cminy, cmaxx, cmaxy = self._code_bbox(codestring)
@@ -62,18 +753,102 @@ class Rss14(Barcode):
         def _code_bbox(self, codestring):
             """
             >>> r = Rss14._Renderer({})
+            >>> r._code_bbox('(01)24012345678905')
+            [0, 0, 95.0, 33.0]
+            >>> r = Rss14._Renderer('databaromni', dict(format='truncated'))
+            >>> r._code_bbox('(01)24012345678905')
+            [0, 0, 95.0, 13.0]
             >>> r._code_bbox('24012345678905')
-            [0, 0, 97, 33]
+            [0, 0, 0, 0]
             """
-            height = self.lookup_option('height')
-            return [0, 0, int(self._symbol_length/72.0*DPI), int(height*DPI)]
+            try:
+                return geometry_bbox(self.native_encode(codestring))
+            except ValueError:
+                # leave reporting bad input to the BWIPP encoder
+                return [0, 0, 0, 0]
 
         def build_params(self, codestring):
             params = super(Rss14._Renderer, self).build_params(codestring)
             params['bbox'] = "%d %d %d %d" %self._boundingbox(
                 self._code_bbox(codestring), self._text_bbox(codestring))
             return params
-        
+
+        def native_encode(self, codestring):
+            format_ = self.databar_format or self.lookup_option('format')
+            options = linear_options(self, 33/72.0)
+            if format_=='truncated':
+                options['height'] = 13/72.0
+            return encode_databar_omni(
+                codestring, format_, bool(self.lookup_option('linkage')),
+                **options)
+
+    renderer = _Renderer
+
+
+class Rss14Truncated(Barcode):
+    """
+    >>> bc = Rss14Truncated()
+    >>> print bc.render_ps_code('(01)24012345678905') # doctest: +ELLIPSIS
+    %!PS-Adobe-2.0
+    %%Pages: (attend)
+    %%Creator: Elaphe powered by barcode.ps
+    %%BoundingBox: 0 0 95 13
+    ...
+    /databartruncated /uk.co.terryburton.bwipp findresource exec
+    ...
+    """
+    codetype = 'databartruncated'
+    aliases = ('rss14truncated', 'rss14 truncated', 'rss14_truncated',
+               'rss14-truncated')
+    class _Renderer(Rss14._Renderer):
+        databar_format = 'truncated'
+    renderer = _Renderer
+
+
+class Rss14Stacked(Barcode):
+    """
+    >>> bc = Rss14Stacked()
+    >>> print bc.render_ps_code('(01)24012345678905') # doctest: +ELLIPSIS
+    %!PS-Adobe-2.0
+    %%Pages: (attend)
+    %%Creator: Elaphe powered by barcode.ps
+    %%BoundingBox: 0 0 50 13
+    ...
+    /databarstacked /uk.co.terryburton.bwipp findresource exec
+    ...
+    >>> bc.encode('(01)24012345678905').pixy
+    13
+    """
+    codetype = 'databarstacked'
+    aliases = ('rss14stacked', 'rss14 stacked', 'rss14_stacked',
+               'rss14-stacked')
+    class _Renderer(Rss14._Renderer):
+        databar_format = 'stacked'
+
+        def _text_bbox(self, codestring):
+            # stacked symbols have no human readable text
+            return self._code_bbox(codestring)
+
+    renderer = _Renderer
+
+
+class Rss14StackedOmni(Barcode):
+    """
+    >>> bc = Rss14StackedOmni()
+    >>> print bc.render_ps_code('(01)24012345678905') # doctest: +ELLIPSIS
+    %!PS-Adobe-2.0
+    %%Pages: (attend)
+    %%Creator: Elaphe powered by barcode.ps
+    %%BoundingBox: 0 0 50 69
+    ...
+    /databarstackedomni /uk.co.terryburton.bwipp findresource exec
+    ...
+    """
+    codetype = 'databarstackedomni'
+    aliases = ('rss14stackedomni', 'rss14 stacked omni', 'rss14_stacked_omni',
+               'rss14-stacked-omni')
+    class _Renderer(Rss14Stacked._Renderer):
+        databar_format = 'stackedomni'
     renderer = _Renderer
 
 
@@ -86,7 +861,7 @@ class RssLimited(Barcode):
     %!PS-Adobe-2.0
     %%Pages: (attend)
     %%Creator: Elaphe powered by barcode.ps
-    %%BoundingBox: 0 0 74 10
+    %%BoundingBox: 0 0 73 10
     %%LanguageLevel: 2
     %%EndComments
     ...
@@ -109,13 +884,16 @@ class RssLimited(Barcode):
     class _Renderer(Rss14._Renderer):
         default_options = dict(
             LinearCodeRenderer.default_options,
-            textyoffset=-7, height=10/72.0)
-        # SP(1),LG(1),LD(26),CC(18),RD(26),SP(1),RG(1)
-        _symbol_length = 1+1+26+18+26+1+1
+            textyoffset=-7, height=10/72.0, linkage=False)
+
+        def native_encode(self, codestring):
+            return encode_databar_limited(
+                codestring, bool(self.lookup_option('linkage')),
+                **linear_options(self, 10/72.0))
+
     renderer = _Renderer
 
 
-# EXPERIMENTAL
 class RssExpanded(Barcode):
     """
     >>> bc = RssExpanded()
@@ -125,7 +903,7 @@ class RssExpanded(Barcode):
     %!PS-Adobe-2.0
     %%Pages: (attend)
     %%Creator: Elaphe powered by barcode.ps
-    %%BoundingBox: 0 0 90 34
+    %%BoundingBox: 0 0 150 34
     %%LanguageLevel: 2
     %%EndComments
     ...
@@ -140,23 +918,53 @@ class RssExpanded(Barcode):
     <BLANKLINE>
     >>> bc.render('(01)95012345678903(3103)000123', options=dict(includetext=True), scale=2, margin=1) # doctest: +ELLIPSIS
     <PIL.EpsImagePlugin.EpsImageFile ... at ...>
-    >>> # _.show() # Broken!
+    >>> # _.show()
+    >>> g = bc.encode('(01)95012345678903(3103)000123')
+    >>> g.width, g.height
+    (150.0, 34.0)
     """
     codetype = 'databarexpanded'
     aliases = ('rssexpanded', 'rss expanded', 'rss_expanded', 'rss-expanded',
                'rss14expanded', 'rss14 expanded', 'rss14_expanded', 'rss14-expanded',)
     class _Renderer(Rss14._Renderer):
         default_options = dict(
-            LinearCodeRenderer.default_options, height=34/72.0)
-        def _code_bbox(self, codestring):
-            """
-            >>> r = RssExpanded._Renderer({})
-            >>> r._code_bbox('000000010011001010100001000000010000')
-            [0, 0, 105, 34]
-            """
-            height = self.lookup_option('height')
-            return [0, 0, int(DPI*15*(len(codestring)/8+3)/72.0), int(height*DPI)]
-        _text_bbox = _code_bbox
+            LinearCodeRenderer.default_options, height=34/72.0,
+            linkage=False, format='expanded', segments=-1)
+
+        def native_encode(self, codestring):
+            return encode_databar_expanded(
+                codestring,
+                self.databar_format or self.lookup_option('format'),
+                self.lookup_option('segments'),
+                bool(self.lookup_option('linkage')),
+                **linear_options(self, 34/72.0))
+
+    renderer = _Renderer
+
+
+class RssExpandedStacked(Barcode):
+    """
+    >>> bc = RssExpandedStacked()
+    >>> print bc.render_ps_code('(01)95012345678903(3103)000123') # doctest: +ELLIPSIS
+    %!PS-Adobe-2.0
+    %%Pages: (attend)
+    %%Creator: Elaphe powered by barcode.ps
+    %%BoundingBox: 0 0 102 71
+    ...
+    /databarexpandedstacked /uk.co.terryburton.bwipp findresource exec
+    ...
+    """
+    codetype = 'databarexpandedstacked'
+    aliases = ('rssexpandedstacked', 'rss expanded stacked',
+               'rss_expanded_stacked', 'rss-expanded-stacked',
+               'rss14expandedstacked', 'rss14 expanded stacked',
+               'rss14_expanded_stacked', 'rss14-expanded-stacked')
+    class _Renderer(RssExpanded._Renderer):
+        databar_format = 'expandedstacked'
+
+        def _text_bbox(self, codestring):
+            return self._code_bbox(codestring)
+
     renderer = _Renderer
 
 
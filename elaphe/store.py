@@ -0,0 +1,406 @@
+# coding: utf-8
+"""On-disk store of rendered outputs shared between processes.
+
+A store directory holds an append-only data file and a fixed-size hash
+index which every process maps into memory::
+
+  index        header (with counts of used slots and tombstones) +
+               open-addressing table of slots
+  data.<gen>   records appended by writers
+  lock         flock()ed by writers
+
+Records carry their key digest and a CRC, so readers take no lock: a
+slot caught in the middle of an update just reads as a miss.  When the
+data file outgrows max_bytes, the most recently used records are copied
+into a new generation, and a new index is renamed over the old one.
+Readers notice the new index by its inode and remap it.
+
+Keys are canonical render keys (see Barcode.render_key); values are
+byte strings such as PNG or EPS data.
+"""
+import os, mmap, struct, threading, time, zlib, hashlib
+try:
+    import cStringIO as StringIO
+except ImportError:
+    import StringIO
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+__all__ = ['DEFAULT_MAX_BYTES', 'DEFAULT_SLOTS', 'DiskStore', 'key_digest',
+           'get_store', 'dump_image', 'load_image']
+
+
+DEFAULT_MAX_BYTES = 256*1024*1024
+DEFAULT_SLOTS = 1<<16
+# fraction of max_bytes kept by compaction, and highest index load.
+COMPACT_RATIO = 0.5
+MAX_LOAD = 0.7
+
+INDEX_MAGIC = 'ELPHIDX1'
+# magic, nslots, generation, used slots, tombstones
+HEADER = struct.Struct('<8sIQII36x')
+COUNTS = struct.Struct('<II')
+COUNTS_OFFSET = 20
+SLOT = struct.Struct('<16sQII')      # digest, offset, length, atime
+RECORD = struct.Struct('<16sII')     # digest, length, crc32
+EMPTY_DIGEST = '\0'*16
+# marks deleted slots, which probing continues past
+TOMBSTONE_DIGEST = '\xff'*16
+
+
+def key_digest(key):
+    """Returns 16-byte digest of a key.
+
+    >>> len(key_digest("('qrcode', 'hello', (), ())"))
+    16
+    """
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    digest = hashlib.sha1(key).digest()[:16]
+    if digest in (EMPTY_DIGEST, TOMBSTONE_DIGEST):
+        digest = '\1'+digest[1:]
+    return digest
+
+
+class DiskStore(object):
+    """Content-addressed store of byte strings in directory path.
+
+    >>> import tempfile, shutil
+    >>> path = tempfile.mkdtemp()
+    >>> store = DiskStore(path, max_bytes=1000, nslots=8)
+    >>> store.put('a', 'x'*300)
+    >>> store.get('a')==('x'*300), store.get('b')
+    (True, None)
+    >>> other = DiskStore(path) # e.g. in another process
+    >>> other.get('a')==('x'*300)
+    True
+    >>> for key in 'bcd':
+    ...     store.put(key, key*300)
+    >>> store.generation>1, store.data_size<=1000
+    (True, True)
+    >>> other.get('d')=='d'*300
+    True
+    >>> store.delete('d'), store.delete('d'), 'd' in other
+    (True, False, False)
+    >>> sorted(store.stats().items()) # doctest: +ELLIPSIS
+    [('bytes', ...), ('entries', ...), ('generation', ...), ('hits', 1), ('max_bytes', 1000), ('misses', 1)]
+    >>> store.close(); other.close(); shutil.rmtree(path)
+    """
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, nslots=DEFAULT_SLOTS):
+        if fcntl is None:
+            raise ImportError(u'DiskStore requires fcntl.')
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._index = self._data = None
+        self._inode = None
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+        self._lockfile = open(os.path.join(path, 'lock'), 'ab')
+        self._acquire()
+        try:
+            if not os.path.exists(self._index_path):
+                self._write_index(self._index_path, nslots, 1, [])
+                open(self._data_path(1), 'ab').close()
+        finally:
+            self._release()
+        self._open()
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.path, 'index')
+
+    def _data_path(self, generation):
+        return os.path.join(self.path, 'data.%d' %generation)
+
+    def _acquire(self):
+        fcntl.flock(self._lockfile.fileno(), fcntl.LOCK_EX)
+
+    def _release(self):
+        fcntl.flock(self._lockfile.fileno(), fcntl.LOCK_UN)
+
+    def _write_index(self, path, nslots, generation, slots):
+        """Writes a fresh index file holding (digest, offset, length, atime) slots.
+        """
+        buf = bytearray(HEADER.size+SLOT.size*nslots)
+        HEADER.pack_into(buf, 0, INDEX_MAGIC, nslots, generation, len(slots), 0)
+        for digest, offset, length, atime in slots:
+            slot = self._probe(buf, nslots, digest)
+            SLOT.pack_into(buf, HEADER.size+SLOT.size*slot,
+                           digest, offset, length, atime)
+        with open(path, 'wb') as f:
+            f.write(buf)
+
+    def _close_files(self):
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+    def _open(self):
+        self._close_files()
+        with open(self._index_path, 'r+b') as f:
+            self._inode = os.fstat(f.fileno()).st_ino
+            self._index = mmap.mmap(f.fileno(), 0)
+        magic, self.nslots, self.generation = HEADER.unpack_from(self._index, 0)[:3]
+        if magic!=INDEX_MAGIC:
+            raise ValueError(u'%s is not an elaphe store index.' %self._index_path)
+        try:
+            self._data = open(self._data_path(self.generation), 'rb')
+        except IOError:
+            # compacted away between reading the index and opening data.
+            self._data = None
+
+    def _refresh(self):
+        """Remaps the index if another process replaced it.
+        """
+        try:
+            inode = os.stat(self._index_path).st_ino
+        except OSError:
+            return
+        if inode!=self._inode or self._data is None:
+            self._open()
+
+    @staticmethod
+    def _probe(index, nslots, digest):
+        """Returns slot number holding digest, or the free slot for it: the
+        first tombstone on the way, or else the empty slot ending it.
+        """
+        start = struct.unpack_from('<Q', digest)[0]%nslots
+        free = None
+        for i in xrange(nslots):
+            slot = (start+i)%nslots
+            found = index[HEADER.size+SLOT.size*slot:HEADER.size+SLOT.size*slot+16]
+            if found==digest:
+                return slot
+            if found==EMPTY_DIGEST:
+                return slot if free is None else free
+            if found==TOMBSTONE_DIGEST and free is None:
+                free = slot
+        return free
+
+    def _slots(self):
+        """Yields (digest, offset, length, atime) of used slots.
+        """
+        for slot in xrange(self.nslots):
+            entry = SLOT.unpack_from(self._index, HEADER.size+SLOT.size*slot)
+            if entry[0] not in (EMPTY_DIGEST, TOMBSTONE_DIGEST):
+                yield entry
+
+    def _counts(self):
+        """Returns numbers of used slots and tombstones from the header.
+        """
+        return COUNTS.unpack_from(self._index, COUNTS_OFFSET)
+
+    def _read_record(self, digest, offset, length):
+        self._data.seek(offset)
+        buf = self._data.read(RECORD.size+length)
+        if len(buf)!=RECORD.size+length:
+            return None
+        record_digest, record_length, crc = RECORD.unpack_from(buf, 0)
+        value = buf[RECORD.size:]
+        if (record_digest!=digest or record_length!=length
+            or zlib.crc32(value)&0xffffffff!=crc):
+            return None
+        return value
+
+    def get(self, key, default=None):
+        digest = key_digest(key)
+        with self._lock:
+            self._refresh()
+            value = None
+            slot = self._probe(self._index, self.nslots, digest)
+            if slot is not None and self._data is not None:
+                pos = HEADER.size+SLOT.size*slot
+                found, offset, length, atime = SLOT.unpack_from(self._index, pos)
+                if found==digest:
+                    value = self._read_record(digest, offset, length)
+                    if value is not None:
+                        # racy but harmless; atime only orders compaction.
+                        struct.pack_into('<I', self._index, pos+28, int(time.time()))
+            if value is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def __contains__(self, key):
+        with self._lock:
+            self._refresh()
+            slot = self._probe(self._index, self.nslots, key_digest(key))
+            if slot is None:
+                return False
+            pos = HEADER.size+SLOT.size*slot
+            return self._index[pos:pos+16]==key_digest(key)
+
+    @property
+    def data_size(self):
+        path = self._data_path(self.generation)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def put(self, key, value):
+        digest = key_digest(key)
+        record = RECORD.pack(digest, len(value), zlib.crc32(value)&0xffffffff)+value
+        if len(record)>self.max_bytes*COMPACT_RATIO:
+            return
+        with self._lock:
+            self._acquire()
+            try:
+                self._refresh()
+                used, tombstones = self._counts()
+                if (self.data_size+len(record)>self.max_bytes
+                    or used+tombstones+1>self.nslots*MAX_LOAD):
+                    self._compact(len(record))
+                    used, tombstones = self._counts()
+                with open(self._data_path(self.generation), 'ab') as f:
+                    offset = os.fstat(f.fileno()).st_size
+                    f.write(record)
+                slot = self._probe(self._index, self.nslots, digest)
+                pos = HEADER.size+SLOT.size*slot
+                found = self._index[pos:pos+16]
+                # digest goes last so that readers never see a half-made slot.
+                struct.pack_into('<QII', self._index, pos+16,
+                                 offset, len(value), int(time.time()))
+                self._index[pos:pos+16] = digest
+                if found!=digest:
+                    COUNTS.pack_into(self._index, COUNTS_OFFSET, used+1,
+                                     tombstones-(found==TOMBSTONE_DIGEST))
+            finally:
+                self._release()
+
+    def delete(self, key):
+        """Removes key; returns whether it was stored.
+        """
+        digest = key_digest(key)
+        with self._lock:
+            self._acquire()
+            try:
+                self._refresh()
+                slot = self._probe(self._index, self.nslots, digest)
+                if slot is None:
+                    return False
+                pos = HEADER.size+SLOT.size*slot
+                if self._index[pos:pos+16]!=digest:
+                    return False
+                self._index[pos:pos+16] = TOMBSTONE_DIGEST
+                used, tombstones = self._counts()
+                COUNTS.pack_into(self._index, COUNTS_OFFSET, used-1, tombstones+1)
+                return True
+            finally:
+                self._release()
+
+    def compact(self):
+        with self._lock:
+            self._acquire()
+            try:
+                self._refresh()
+                self._compact(0)
+            finally:
+                self._release()
+
+    def _compact(self, reserve):
+        """Copies most recently used records into a new generation.
+
+        Caller holds the writer lock.
+        """
+        budget = self.max_bytes*COMPACT_RATIO-reserve
+        kept, total = [], 0
+        for digest, offset, length, atime in sorted(
+                self._slots(), key=lambda entry: -entry[3]):
+            if total+RECORD.size+length>budget:
+                continue
+            value = self._read_record(digest, offset, length) if self._data else None
+            if value is None:
+                continue
+            kept.append((digest, atime, value))
+            total += RECORD.size+length
+        nslots = self.nslots
+        while len(kept)+1>nslots*MAX_LOAD/2:
+            nslots *= 2
+        generation = self.generation+1
+        slots, offset = [], 0
+        with open(self._data_path(generation), 'wb') as f:
+            for digest, atime, value in kept:
+                f.write(RECORD.pack(digest, len(value), zlib.crc32(value)&0xffffffff))
+                f.write(value)
+                slots.append((digest, offset, len(value), atime))
+                offset += RECORD.size+len(value)
+        tmp_path = self._index_path+'.tmp'
+        self._write_index(tmp_path, nslots, generation, slots)
+        os.rename(tmp_path, self._index_path)
+        old_data_path = self._data_path(self.generation)
+        self._open()
+        if os.path.exists(old_data_path):
+            os.remove(old_data_path)
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            entries = self._counts()[0]
+        return dict(hits=self.hits, misses=self.misses, entries=entries,
+                    bytes=self.data_size, max_bytes=self.max_bytes,
+                    generation=self.generation)
+
+    def close(self):
+        with self._lock:
+            self._close_files()
+            if self._lockfile is not None:
+                self._lockfile.close()
+                self._lockfile = None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(store):
+    """Resolves the store render option into a DiskStore or None.
+
+    store may be a DiskStore or a directory path; stores opened by path
+    are shared within the process.
+
+    >>> get_store(None), get_store(False)
+    (None, None)
+    """
+    if store is None or store is False:
+        return None
+    if isinstance(store, basestring):
+        with _stores_lock:
+            if store not in _stores:
+                _stores[store] = DiskStore(store)
+            return _stores[store]
+    return store
+
+
+def dump_image(image, format='PNG'):
+    """Serializes PIL image for storing.
+    """
+    buf = StringIO.StringIO()
+    image.save(buf, format)
+    return buf.getvalue()
+
+
+def load_image(data):
+    """Loads image serialized by dump_image().
+
+    >>> from PIL import Image
+    >>> load_image(dump_image(Image.new('L', (3, 2)))).size
+    (3, 2)
+    """
+    from PIL import Image
+    image = Image.open(StringIO.StringIO(data))
+    image.load()
+    return image
+
+
+if __name__=="__main__":
+    from doctest import testmod
+    testmod()
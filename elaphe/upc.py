@@ -1,5 +1,98 @@
 # coding: utf-8
 from base import Barcode, LinearCodeRenderer, DPI
+from linear import widths, mod10_check_digit, text_x, LinearBuilder
+from ean import (NORMAL_GUARD, CENTER_GUARD, GUARD_EXTENSION, split_addon,
+                 complete_gtin, ean_options, add_digits, _add_main_addon)
+
+
+# parities of UPC-E digits by check digit for number system 0; number
+# system 1 swaps them.
+UPCE_PARITIES = ['GGGLLL', 'GGLGLL', 'GGLLGL', 'GGLLLG', 'GLGGLL',
+                 'GLLGGL', 'GLLLGG', 'GLGLGL', 'GLGLLG', 'GLLGLG']
+UPCE_END_GUARD = '111111'
+
+
+def encode_upca(codestring, height=1.0, includetext=False, textsize=12,
+                textyoffset=-4, **kw):
+    """Encodes UPC-A with optional add-on into LinearGeometry.
+
+    Bars of the number system and check digits are as long as guards.
+
+    >>> g = encode_upca('78858101497')
+    >>> g.width, len(g.bhs), g.bbs[:5].tolist()
+    (95.0, 30, [0.0, 0.0, 0.0, 0.0, 0.075])
+    """
+    main, addon = split_addon(codestring)
+    digits = complete_gtin(main, 12)
+    guard, digit = (height, 0.0), (height-GUARD_EXTENSION, GUARD_EXTENSION)
+    text_y = textyoffset if includetext else None
+    builder = LinearBuilder()
+    builder.add(widths(NORMAL_GUARD), *guard)
+    add_digits(builder, digits[0], 'L', *guard)
+    add_digits(builder, digits[1:6], 'LLLLL', *digit, text_y=text_y, textsize=textsize)
+    builder.add(widths(CENTER_GUARD), *guard)
+    add_digits(builder, digits[6:11], 'RRRRR', *digit, text_y=text_y, textsize=textsize)
+    add_digits(builder, digits[11], 'R', *guard)
+    builder.add(widths(NORMAL_GUARD), *guard)
+    if includetext:
+        size = textsize*0.75
+        builder.add_text(digits[0], -0.6*size-1, textyoffset, size)
+        builder.add_text(digits[11], builder.x+1, textyoffset, size)
+    _add_main_addon(builder, addon, height, includetext, **kw)
+    return builder.geometry()
+
+
+def upce_to_upca(digits):
+    """Expands number system and six UPC-E digits into UPC-A digits
+    without check digit.
+
+    >>> upce_to_upca('0123456'), upce_to_upca('0123453'), upce_to_upca('0123450')
+    ('01234500006', '01230000045', '01200000345')
+    """
+    ns, data = digits[0], digits[1:7]
+    last = data[5]
+    if last in '012':
+        return ns+data[:2]+last+'0000'+data[2:5]
+    if last=='3':
+        return ns+data[:3]+'00000'+data[3:5]
+    if last=='4':
+        return ns+data[:4]+'00000'+data[4]
+    return ns+data[:5]+'0000'+last
+
+
+def encode_upce(codestring, height=1.0, includetext=False, textsize=12,
+                textyoffset=-4, **kw):
+    """Encodes UPC-E with optional add-on into LinearGeometry.
+
+    >>> g = encode_upce('0123456')
+    >>> g.width, len(g.bhs)
+    (51.0, 17)
+    >>> encode_upce('01234565') == g
+    True
+    """
+    main, addon = split_addon(codestring)
+    if not main.isdigit() or len(main) not in (7, 8) or main[0] not in '01':
+        raise ValueError(u'Expected number system 0 or 1 and 6 or 7 digits, got %r.'
+                         %main)
+    check = complete_gtin(upce_to_upca(main), 12)[-1]
+    if len(main)==8 and main[7]!=check:
+        raise ValueError(u'Bad check digit in %s.' %main)
+    parities = UPCE_PARITIES[int(check)]
+    if main[0]=='1':
+        parities = parities.replace('G', 'l').replace('L', 'G').replace('l', 'L')
+    guard, digit = (height, 0.0), (height-GUARD_EXTENSION, GUARD_EXTENSION)
+    text_y = textyoffset if includetext else None
+    builder = LinearBuilder()
+    builder.add(widths(NORMAL_GUARD), *guard)
+    add_digits(builder, main[1:7], parities, *digit, text_y=text_y, textsize=textsize)
+    builder.add(widths(UPCE_END_GUARD), *guard)
+    if includetext:
+        size = textsize*0.75
+        builder.add_text(main[0], -0.6*size-1, textyoffset, size)
+        builder.add_text(check, builder.x+1, textyoffset, size)
+    _add_main_addon(builder, addon, height, includetext, **kw)
+    return builder.geometry()
+
 
 
 class UpcA(Barcode):
@@ -49,6 +142,9 @@ class UpcA(Barcode):
                 return [-7, textyoffset, 96+textsize*0.5, textmaxh]
             else:
                 return self.code_bbox
+
+        def native_encode(self, codestring):
+            return encode_upca(codestring, **ean_options(self))
     renderer = _Renderer
 
 
@@ -99,6 +195,9 @@ class UpcE(Barcode):
                 return [-7, textyoffset, 6*7+11+textsize*0.6, textmaxh]
             else:
                 return self.code_bbox
+
+        def native_encode(self, codestring):
+            return encode_upce(codestring, **ean_options(self))
     renderer = _Renderer
 
 
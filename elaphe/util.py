@@ -2,18 +2,28 @@
 from os.path import abspath, dirname, join as pathjoin
 from binascii import hexlify
 from textwrap import TextWrapper
+from bisect import bisect_right
 import re
 
-__all__ = ['DEFAULT_PS_CODE_PATH', 'DEFAULT_DISTILL_RE',
+__all__ = ['DEFAULT_PS_CODE_PATH', 'DEFAULT_DISTILL_RE', 'DEFAULT_RESOURCE_RE',
            'to_ps', 'cap_unescape', 'dict_to_optstring', 'distill_ps_code',
+           'parse_ps_resources', 'resolve_ps_resources', 'prune_ps_code',
            'DEFAULT_EPSF_DSC_TEMPLATE', 'DEFAULT_RENDER_COMMAND_TEMPLATE',
-           'init_ps_code_template', 'BARCODE_PS_CODE_PATH', 'PS_CODE_TEMPLATE']
+           'init_ps_code_template', 'get_ps_code_template',
+           'get_ps_prelude', 'build_ps_chunks', 'ChunkedFile', 'LazyString',
+           'BARCODE_PS_CODE_PATH', 'PS_CODE_TEMPLATE']
 
 
 # default barcode.ps path and distiller regexp.
 DEFAULT_PS_CODE_PATH = pathjoin(
     dirname(abspath(__file__)), 'postscriptbarcode', 'barcode.ps')
 DEFAULT_DISTILL_RE = re.compile(r'% --BEGIN TEMPLATE--(.+)% --END TEMPLATE--', re.S)
+# resource blocks in distilled code and their dependency declarations.
+DEFAULT_RESOURCE_RE = re.compile(
+    r'^% --BEGIN (?:RESOURCE|RENDERER|ENCODER) (\S+)--$.*?'
+    r'^% --END (?:RESOURCE|RENDERER|ENCODER) \1--$', re.S|re.M)
+DEFAULT_REQUIRES_RE = re.compile(r'^% --REQUIRES (.*)--$', re.M)
+DEFAULT_RNDR_RE = re.compile(r'^% --RNDR: (.*)$', re.M)
 
 
 def _bin(n):
@@ -138,10 +148,13 @@ def dict_to_optstring(d, none=lambda x: '<>', empty=lambda x: '<>',
 
 
 def distill_ps_code(path_to_ps_code=DEFAULT_PS_CODE_PATH,
-                    distill_regexp=DEFAULT_DISTILL_RE):
+                    distill_regexp=DEFAULT_DISTILL_RE, escape=True):
     """
     Distills barcode procedure code blocks with given path and regexp.
 
+    With escape=True, '%' is doubled so that the code can be used as a
+    %-format template; escape=False returns the code as is.
+
     >>> print distill_ps_code() # doctest: +ELLIPSIS
     <BLANKLINE>
     <BLANKLINE>
@@ -155,8 +168,91 @@ def distill_ps_code(path_to_ps_code=DEFAULT_PS_CODE_PATH,
     <BLANKLINE>
     <BLANKLINE>
     """
-    return distill_regexp.findall(
-        open(path_to_ps_code, 'rb').read())[0].replace('%', '%%')
+    ps_code = distill_regexp.findall(open(path_to_ps_code, 'rb').read())[0]
+    if escape:
+        ps_code = ps_code.replace('%', '%%')
+    return ps_code
+
+
+def parse_ps_resources(ps_code, resource_regexp=DEFAULT_RESOURCE_RE):
+    """
+    Splits distilled code into resource blocks.
+
+    Returns list of (name, requirements, code) in order of appearance;
+    requirements are collected from both REQUIRES and RNDR lines.
+
+    >>> resources = parse_ps_resources(distill_ps_code(escape=False))
+    >>> [name for name, requires, code in resources][:5]
+    ['preamble', 'raiseerror', 'renlinear', 'renmatrix', 'renmaximatrix']
+    >>> dict((name, requires) for name, requires, code in resources)['isbn']
+    ['preamble', 'raiseerror', 'renlinear', 'ean5', 'ean2', 'ean13']
+    >>> print dict((name, code) for name, requires, code in resources)['ean2'] # doctest: +ELLIPSIS
+    % --BEGIN ENCODER ean2--
+    % --REQUIRES preamble raiseerror renlinear--
+    ...
+    % --END ENCODER ean2--
+    """
+    resources = []
+    for match in resource_regexp.finditer(ps_code):
+        name, code = match.group(1), match.group(0)
+        requires = []
+        for regexp in (DEFAULT_REQUIRES_RE, DEFAULT_RNDR_RE):
+            for line in regexp.findall(code):
+                requires.extend(r for r in line.split() if r not in requires)
+        resources.append((name, requires, code))
+    return resources
+
+
+def resolve_ps_resources(codetypes, resources):
+    """
+    Returns names of resources needed for codetypes in order of appearance.
+
+    Returns None if any of codetypes is not defined in resources.
+
+    >>> resources = parse_ps_resources(distill_ps_code(escape=False))
+    >>> resolve_ps_resources(['isbn'], resources)
+    ['preamble', 'raiseerror', 'renlinear', 'ean5', 'ean2', 'ean13', 'isbn']
+    >>> resolve_ps_resources(['qrcode', 'code39'], resources)
+    ['preamble', 'raiseerror', 'renlinear', 'renmatrix', 'code39', 'qrcode']
+    >>> resolve_ps_resources(['nonexistent'], resources) is None
+    True
+    """
+    requirements = dict((name, requires) for name, requires, code in resources)
+    needed, pending = set(), list(codetypes)
+    while pending:
+        name = pending.pop()
+        if name in needed:
+            continue
+        if name not in requirements:
+            return None
+        needed.add(name)
+        pending.extend(requirements[name])
+    return [name for name, requires, code in resources if name in needed]
+
+
+def prune_ps_code(ps_code, codetypes):
+    """
+    Strips distilled code down to the resources needed for codetypes.
+
+    ps_code is returned as is if some of codetypes are unknown.
+
+    >>> ps_code = distill_ps_code(escape=False)
+    >>> pruned = prune_ps_code(ps_code, ['ean13'])
+    >>> len(pruned) < len(ps_code)/10
+    True
+    >>> import re
+    >>> re.findall(r'% --BEGIN \w+ (\S+)--', pruned)
+    ['preamble', 'raiseerror', 'renlinear', 'ean5', 'ean2', 'ean13']
+    >>> prune_ps_code(ps_code, ['nonexistent']) is ps_code
+    True
+    """
+    resources = parse_ps_resources(ps_code)
+    names = resolve_ps_resources(codetypes, resources)
+    if names is None:
+        return ps_code
+    names = set(names)
+    return '\n\n%s\n\n' %'\n\n'.join(
+        code for name, requires, code in resources if name in names)
 
 
 DEFAULT_EPSF_DSC_TEMPLATE = """%%!PS-Adobe-2.0
@@ -179,14 +275,220 @@ showpage
 
 def init_ps_code_template(epsf_dsc_template=DEFAULT_EPSF_DSC_TEMPLATE,
                           render_command_template=DEFAULT_RENDER_COMMAND_TEMPLATE,
-                          ps_code_distiller=distill_ps_code):
+                          ps_code_distiller=distill_ps_code, codetype=None):
     """Initializes postscript code template.
+
+    If codetype is given, the template holds only resources required
+    by the codetype.
     """
-    return '\n'.join([epsf_dsc_template, ps_code_distiller(), render_command_template])
+    if codetype is None:
+        ps_code = ps_code_distiller()
+    else:
+        ps_code = prune_ps_code(
+            ps_code_distiller(escape=False), [codetype]).replace('%', '%%')
+    return '\n'.join([epsf_dsc_template, ps_code, render_command_template])
+
+
+class LazyString(object):
+    """String computed by factory on first use.
+
+    Stands for module constants whose computation would otherwise slow
+    down import.
+
+    >>> calls = []
+    >>> s = LazyString(lambda: calls.append(1) or 'x=%(x)d')
+    >>> calls
+    []
+    >>> s %dict(x=1), len(s), s=='x=%(x)d', str(s), calls
+    ('x=1', 7, True, 'x=%(x)d', [1])
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = None
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = self._factory()
+        return self._value
+
+    def __str__(self):
+        return self.value
+
+    def __repr__(self):
+        return repr(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __mod__(self, params):
+        return self.value %params
+
+    def __add__(self, other):
+        return self.value+other
+
+    def __radd__(self, other):
+        return other+self.value
+
+    def __eq__(self, other):
+        return self.value==other
+
+    def __ne__(self, other):
+        return self.value!=other
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __contains__(self, item):
+        return item in self.value
+
+    def __getitem__(self, index):
+        return self.value[index]
+
+    def __getattr__(self, name):
+        return getattr(self.value, name)
+
+
+# barcode.ps is read on first use, not at import.
+BARCODE_PS_CODE_PATH = LazyString(distill_ps_code)
+PS_CODE_TEMPLATE = LazyString(lambda: get_ps_code_template())
+
+_ps_code_templates = {}
+def get_ps_code_template(codetype=None):
+    """Returns (cached) postscript code template for codetype.
+
+    >>> template = get_ps_code_template('ean13')
+    >>> template is get_ps_code_template('ean13')
+    True
+    >>> len(template) < len(get_ps_code_template())/10
+    True
+    >>> get_ps_code_template('nonexistent') == PS_CODE_TEMPLATE
+    True
+    """
+    template = _ps_code_templates.get(codetype)
+    if template is None:
+        template = _ps_code_templates.setdefault(
+            codetype, init_ps_code_template(codetype=codetype))
+    return template
+
+
+_ps_preludes = {}
+def get_ps_prelude(codetype=None):
+    """Returns (cached) barcode.ps resources for codetype, unescaped.
+
+    The prelude is the constant part of every program; it is shared by
+    all renders of the codetype and never formatted.
+
+    >>> prelude = get_ps_prelude('ean13')
+    >>> prelude is get_ps_prelude('ean13')
+    True
+    >>> print prelude # doctest: +ELLIPSIS
+    <BLANKLINE>
+    <BLANKLINE>
+    <BLANKLINE>
+    % --BEGIN RESOURCE preamble--
+    %%BeginResource: Category uk.co.terryburton.bwipp 0.0 0 0 0
+    ...
+    """
+    prelude = _ps_preludes.get(codetype)
+    if prelude is None:
+        ps_code = distill_ps_code(escape=False)
+        if codetype is not None:
+            ps_code = prune_ps_code(ps_code, [codetype])
+        prelude = _ps_preludes.setdefault(codetype, '\n%s\n' %ps_code)
+    return prelude
+
+
+def build_ps_chunks(params, codetype=None,
+                    epsf_dsc_template=DEFAULT_EPSF_DSC_TEMPLATE,
+                    render_command_template=DEFAULT_RENDER_COMMAND_TEMPLATE):
+    """Returns postscript program for params as a list of chunks.
+
+    Only the DSC header and the render command are formatted; joined,
+    the chunks equal get_ps_code_template(codetype) %params.
+
+    >>> params = dict(bbox='0 0 72 72', codestring='<41>', options='<>',
+    ...               codetype='ean13', xscale=1.0, yscale=1.0)
+    >>> chunks = build_ps_chunks(params, 'ean13')
+    >>> chunks[1] is get_ps_prelude('ean13')
+    True
+    >>> ''.join(chunks) == get_ps_code_template('ean13') %params
+    True
+    """
+    return [epsf_dsc_template %params, get_ps_prelude(codetype),
+            render_command_template %params]
+
+
+class ChunkedFile(object):
+    """Read-only file object over string chunks, which are never joined.
+
+    >>> f = ChunkedFile(['ab', 'c\\nd', '', 'ef\\n'])
+    >>> f.readline(), f.read(2), f.tell()
+    ('abc\\n', 'de', 6)
+    >>> f.seek(0, 2); f.tell()
+    8
+    >>> f.seek(1); f.read()
+    'bc\\ndef\\n'
+    >>> f.read(), f.readline()
+    ('', '')
+    """
+    def __init__(self, chunks):
+        self.chunks = [chunk for chunk in chunks if chunk]
+        self.offsets = []
+        size = 0
+        for chunk in self.chunks:
+            self.offsets.append(size)
+            size += len(chunk)
+        self.size = size
+        self.pos = 0
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=0):
+        if whence==1:
+            offset += self.pos
+        elif whence==2:
+            offset += self.size
+        self.pos = max(offset, 0)
+
+    def _read(self, end):
+        """Returns data from the current position up to end.
+        """
+        end = min(end, self.size)
+        pieces = []
+        while self.pos<end:
+            index = bisect_right(self.offsets, self.pos)-1
+            chunk, start = self.chunks[index], self.offsets[index]
+            piece = chunk[self.pos-start:end-start]
+            pieces.append(piece)
+            self.pos += len(piece)
+        if len(pieces)==1:
+            return pieces[0]
+        return ''.join(pieces)
+
+    def read(self, size=-1):
+        if size is None or size<0:
+            return self._read(self.size)
+        return self._read(self.pos+size)
 
+    def readline(self, size=-1):
+        end = self.size
+        if size is not None and size>=0:
+            end = min(end, self.pos+size)
+        pos = self.pos
+        while pos<end:
+            index = bisect_right(self.offsets, pos)-1
+            start = self.offsets[index]
+            newline = self.chunks[index].find('\n', pos-start, end-start)
+            if newline>=0:
+                end = start+newline+1
+                break
+            pos = start+len(self.chunks[index])
+        return self._read(end)
 
-BARCODE_PS_CODE_PATH = distill_ps_code()
-PS_CODE_TEMPLATE = init_ps_code_template()
+    def close(self):
+        self.chunks = []
 
 
 if __name__=="__main__":
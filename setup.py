@@ -8,7 +8,7 @@ version = imp.load_source('_mod', abspath('elaphe/__version__.py')).VERSION
 version = '.'.join(map(str, version))
 install_requires = ['setuptools', 'Pillow']
 tests_require = ['pytest']
-extra_requires = {}
+extra_requires = {'raster': ['numpy'], 'async': ['trollius']}
 long_description = '\n'.join([
     open(pathjoin(dirname(abspath(__file__)), 'README')).read(),
     ])
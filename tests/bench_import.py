@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Measures import time of elaphe and the cost of the first render.
+
+Each measurement runs in a fresh interpreter, as short-lived jobs do.
+
+  python tests/bench_import.py [repeat]
+"""
+
+STATEMENTS = [
+    ('interpreter', 'pass'),
+    ('import elaphe', 'import elaphe'),
+    ('first resolve', 'import elaphe; elaphe.Barcode.resolve_codetype("qrcode")'),
+    ('first ps code', 'import elaphe; '
+     'elaphe.Barcode.resolve_codetype("qrcode")().render_ps_code("elaphe")'),
+    ('load all plugins', 'import elaphe; elaphe.load_plugins()'),
+    ]
+
+
+def bench(statement, repeat=10):
+    """Returns best wall time of running statement in a new interpreter.
+    """
+    import subprocess, sys, time
+    from os.path import dirname, abspath
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        subprocess.check_call(
+            [sys.executable, '-c', statement],
+            cwd=dirname(dirname(abspath(__file__))))
+        elapsed = time.time()-start
+        if best is None or elapsed<best:
+            best = elapsed
+    return best
+
+
+if __name__=="__main__":
+    import sys
+    repeat = int(sys.argv[1]) if len(sys.argv)>1 else 10
+    for name, statement in STATEMENTS:
+        print '%-20s %8.1f ms' %(name, bench(statement, repeat)*1000)